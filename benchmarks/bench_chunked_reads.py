@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_chunked_reads
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the reads of the plot drivers from a compressed and chunked
+    NETCDF4 file done directly with the reads aligned to the chunk
+    boundaries by netCDF4tools.read_hyperslab, with the default and with
+    an enlarged chunk cache.
+
+    Usage: python benchmarks/bench_chunked_reads.py --chunk 64 --repeat 5
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import os
+import tempfile
+import timeit
+
+import netCDF4
+import numpy as np
+
+from mslib.utils import netCDF4tools
+
+# reads as done by the vertical section, horizontal section and linear section drivers
+READS = [
+    ("vertical section window", (0, slice(None, None, -1), slice(100, 230), slice(200, 470))),
+    ("horizontal section level", (1, 10, slice(None, None, -1), slice(None))),
+    ("linear section field", (0, slice(None, None, -1), slice(None, None, -1), slice(None))),
+]
+
+
+def create_file(filename, chunk):
+    with netCDF4.Dataset(filename, "w", format="NETCDF4") as ncfile:
+        for name, size in [("time", 2), ("level", 40), ("lat", 361), ("lon", 720)]:
+            ncfile.createDimension(name, size)
+            ncfile.createVariable(name, "f8", (name,))[:] = np.arange(size)
+        var = ncfile.createVariable("air_temperature", "f4", ("time", "level", "lat", "lon"), zlib=True,
+                                    complevel=1, chunksizes=(1, 1, chunk, chunk))
+        var.standard_name = "air_temperature"
+        var[:] = np.random.default_rng(0).random(var.shape, dtype="f4")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk", type=int, default=64, help="horizontal chunk size")
+    parser.add_argument("--repeat", type=int, default=5, help="number of repetitions of each read")
+    args = parser.parse_args()
+
+    filename = os.path.join(tempfile.mkdtemp(), "chunked.nc")
+    create_file(filename, args.chunk)
+    for chunk_cache in [None, (2 ** 28, 10007, 0.75)]:
+        with netCDF4tools.MFDatasetCommonDims([filename], chunk_cache=chunk_cache) as ncfile:
+            var = ncfile.variables["air_temperature"]
+            print(f"chunk cache {var.get_var_chunk_cache()}")
+            for label, index in READS:
+                direct = min(timeit.repeat(lambda: var[index], number=1, repeat=args.repeat))
+                aligned = min(timeit.repeat(
+                    lambda: netCDF4tools.read_hyperslab(var, index), number=1, repeat=args.repeat))
+                print(f"  {label:25s} direct: {1000 * direct:8.1f} ms  aligned: {1000 * aligned:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
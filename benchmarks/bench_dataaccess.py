@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_dataaccess
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares cold-start and warm-start times of DefaultDataAccess.setup()
+    on a synthetic data directory with thousands of files, serial and
+    with parallel parsing of the files.
+
+    Usage: python benchmarks/bench_dataaccess.py --files 2000
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import timeit
+
+import fs
+import numpy as np
+
+from mslib.mswms.dataaccess import DefaultDataAccess
+from mslib.mswms.demodata import DataFiles
+
+
+def create_tree(path, number_of_files):
+    """
+    Writes number_of_files small surface files with demodata into path.
+    """
+    times, lats, lons = np.arange(0, 39, 6), np.arange(70, 30, -1), np.arange(-50, 50)
+    examples = DataFiles(data_fs=fs.open_fs(path))
+    for index in range(number_of_files):
+        examples.generate_file(
+            None, f"SFC{index:05d}", "sfc", (("time", times), ("latitude", lats), ("longitude", lons)),
+            ["air_pressure_at_sea_level"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2000, help="number of synthetic data files")
+    parser.add_argument("--path", default=None, help="existing directory to (re-)use for the synthetic data")
+    parser.add_argument("--workers", type=int, default=4, help="number of processes for parallel parsing")
+    args = parser.parse_args()
+    # all synthetic files share the same times and variables, so suppress the duplicate warnings
+    logging.basicConfig(level=logging.ERROR)
+
+    data_path = args.path or tempfile.mkdtemp()
+    if len(os.listdir(data_path)) < args.files:
+        print(f"creating {args.files} files in '{data_path}'")
+        create_tree(data_path, args.files)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        index_path = os.path.join(index_dir, "index.sqlite")
+        without_index = timeit.timeit(lambda: DefaultDataAccess(data_path, "EUR_LL015").setup(), number=1)
+        parallel = timeit.timeit(
+            lambda: DefaultDataAccess(data_path, "EUR_LL015", setup_workers=args.workers).setup(), number=1)
+        cold = timeit.timeit(
+            lambda: DefaultDataAccess(data_path, "EUR_LL015", index_path=index_path).setup(), number=1)
+        warm = timeit.timeit(
+            lambda: DefaultDataAccess(data_path, "EUR_LL015", index_path=index_path).setup(), number=1)
+
+    print(f"setup() without index:      {without_index:8.3f} s")
+    print(f"setup() with {args.workers:2d} workers:    {parallel:8.3f} s")
+    print(f"setup() cold start (index): {cold:8.3f} s")
+    print(f"setup() warm start (index): {warm:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_derived_variables
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Times the loading of the equivalent potential temperature, a derived
+    variable not stored in the demodata, by the horizontal section driver for
+    the first request of a bounding box and for repeated requests served by
+    the cache of derived fields, and compares it with reading the temperature,
+    pressure and specific humidity and computing it in a plotting style.
+
+    Usage: python benchmarks/bench_derived_variables.py --requests 100
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+import fs
+import numpy as np
+
+from mslib.mswms.demodata import DataFiles
+
+NAME = "equivalent_potential_temperature"
+DEPENDENCIES = ["air_pressure", "air_temperature", "specific_humidity"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="number of timed requests")
+    parser.add_argument("--path", default=None, help="existing directory with the demodata")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    data_path = args.path or tempfile.mkdtemp()
+    if len(os.listdir(data_path)) == 0:
+        print(f"creating demodata in '{data_path}'")
+        DataFiles(data_fs=fs.open_fs(data_path)).create_data()
+    if importlib.util.find_spec("mswms_settings") is None:
+        config_path = tempfile.mkdtemp()
+        DataFiles(data_fs=fs.open_fs(data_path), server_config_fs=fs.open_fs(config_path)).create_server_config(
+            detailed_information=True)
+        sys.path.insert(0, config_path)
+    mswms_settings = importlib.import_module("mswms_settings")
+    from mslib.mswms import mpl_hsec_styles
+    from mslib.mswms.mss_plot_driver import HorizontalSectionDriver
+    from mslib.utils import thermolib
+
+    data = next(iter(mswms_settings.data.values()))
+    data.setup()
+    time = datetime(2012, 10, 17, 12)
+    driver = HorizontalSectionDriver(data)
+
+    class DependenciesStyle(mpl_hsec_styles.HS_GenericStyle_PL_air_temperature):
+        required_datafields = [("pl", _name, None) for _name in DEPENDENCIES]
+
+    derived_style = getattr(mpl_hsec_styles, f"HS_GenericStyle_PL_{NAME}")(driver=driver)
+    dependencies_style = DependenciesStyle(driver=driver)
+
+    def load(plot_object):
+        driver.set_plot_parameters(
+            plot_object=plot_object, bbox=[-50, 30, 50, 70], level=300, crs="EPSG:4326",
+            init_time=time, valid_time=time, style="default", show=False)
+        return driver._load_timestep()
+
+    def load_and_compute():
+        fields = load(dependencies_style)
+        with np.errstate(all="ignore"):
+            return thermolib.eqpt_approx(*[fields[_name] for _name in DEPENDENCIES])
+
+    def load_derived():
+        return load(derived_style)[NAME]
+
+    def load_uncached():
+        driver.dataset_pool.derived_cache.clear()
+        return load_derived()
+
+    reference = load_and_compute()
+    derived = load_derived()
+    style = timeit.timeit(load_and_compute, number=args.requests) / args.requests
+    first = timeit.timeit(load_uncached, number=args.requests) / args.requests
+    load_derived()
+    repeated = timeit.timeit(load_derived, number=args.requests) / args.requests
+    print(f"read dependencies and compute in style: {1000 * style:8.2f} ms/request")
+    print(f"derived variable, first request:        {1000 * first:8.2f} ms/request")
+    print(f"derived variable, repeated request:     {1000 * repeated:8.2f} ms/request")
+    print(f"cache: {driver.dataset_pool.derived_cache.info()}")
+    print(f"maximum relative difference: {np.max(np.abs(derived / reference - 1)):.3g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_find_location
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the lookup of locations by computing and sorting the distances
+    to all configured locations (the former way of coordinate.find_location)
+    with the queries of the LocationIndex for many synthetic locations, and
+    times building the index.
+
+    Usage: python benchmarks/bench_find_location.py --locations 100000 --queries 1000
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from mslib.utils import coordinate
+
+
+def find_location_by_sorting(locations, lat, lon, tolerance=5):
+    distances = sorted([(coordinate.get_distance(lat, lon, loc_lat, loc_lon), loc)
+                        for loc, (loc_lat, loc_lon) in locations.items()])
+    if len(distances) > 0 and distances[0][0] <= tolerance:
+        return locations[distances[0][1]], distances[0][1]
+    else:
+        return None
+
+
+def find_location_by_index(index, lat, lon, tolerance=5):
+    distances = index.within(lat, lon, tolerance)
+    return (index.locations[distances[0][1]], distances[0][1]) if len(distances) > 0 else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locations", type=int, default=100000, help="number of locations")
+    parser.add_argument("--queries", type=int, default=1000, help="number of queries of the index")
+    parser.add_argument("--sorted-queries", type=int, default=3, help="number of queries sorting all distances")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lats = np.degrees(np.arcsin(rng.uniform(-1, 1, args.locations)))
+    lons = rng.uniform(-180, 180, args.locations)
+    locations = {f"location {_i}": [_x, _y] for _i, (_x, _y) in enumerate(zip(lats.tolist(), lons.tolist()))}
+    # half of the queries hit a location
+    queries = [(lats[_i], lons[_i]) if _i % 2 == 0 else (lats[_i] + 1, lons[_i])
+               for _i in rng.integers(0, args.locations, args.queries)]
+
+    build = timeit.timeit(lambda: coordinate.LocationIndex(locations), number=1)
+    index = coordinate.LocationIndex(locations)
+    by_sorting = timeit.timeit(
+        lambda: [find_location_by_sorting(locations, *_x) for _x in queries[:args.sorted_queries]], number=1)
+    within = timeit.timeit(lambda: [find_location_by_index(index, *_x) for _x in queries], number=1)
+    nearest = timeit.timeit(lambda: [index.nearest(*_x, 10) for _x in queries], number=1)
+    identical = all(find_location_by_sorting(locations, *_x) == find_location_by_index(index, *_x)
+                    for _x in queries[:args.sorted_queries])
+    print(f"building the index of {args.locations} locations:  {1000 * build:10.1f} ms")
+    print(f"find_location sorting all distances: {1000 * by_sorting / args.sorted_queries:10.3f} ms/query")
+    print(f"find_location by the index:          {1000 * within / args.queries:10.3f} ms/query")
+    print(f"index, 10 nearest locations:         {1000 * nearest / args.queries:10.3f} ms/query")
+    print(f"identical results: {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_gallery
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the time to create the gallery of the demodata with the plots
+    rendered one after another and by worker processes, and the time of
+    an update of the gallery, for which all images are current.
+
+    Usage: python benchmarks/bench_gallery.py --processes 4 --levels all
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import logging
+import importlib
+import os
+import sys
+import tempfile
+import timeit
+
+import fs
+
+from mslib.mswms.demodata import DataFiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4, help="number of worker processes")
+    parser.add_argument("--levels", default="", help="levels of the gallery, e.g. 'all'")
+    parser.add_argument("--path", default=None, help="existing directory with the demodata")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    data_path = args.path or tempfile.mkdtemp()
+    if len(os.listdir(data_path)) == 0:
+        print(f"creating demodata in '{data_path}'")
+        DataFiles(data_fs=fs.open_fs(data_path)).create_data()
+    if importlib.util.find_spec("mswms_settings") is None:
+        config_path = tempfile.mkdtemp()
+        DataFiles(data_fs=fs.open_fs(data_path), server_config_fs=fs.open_fs(config_path)).create_server_config(
+            detailed_information=True)
+        # the worker processes inherit sys.path and import the same settings
+        sys.path.insert(0, config_path)
+    importlib.import_module("mswms_settings")
+    import mslib.mswms.gallery_builder
+    import mslib.mswms.wms
+    logging.getLogger().setLevel(logging.ERROR)
+
+    results = []
+    for processes in [0, args.processes]:
+        gallery_path = tempfile.mkdtemp()
+        mslib.mswms.wms.STATIC_LOCATION = gallery_path
+        mslib.mswms.gallery_builder.STATIC_LOCATION = gallery_path
+        seconds = timeit.timeit(lambda: mslib.mswms.wms.server.generate_gallery(
+            create=True, levels=args.levels, processes=processes), number=1)
+        results.append((seconds, sorted(os.listdir(os.path.join(gallery_path, "plots")))))
+    update = timeit.timeit(lambda: mslib.mswms.wms.server.generate_gallery(
+        create=True, levels=args.levels, processes=args.processes), number=1)
+
+    plots = len(results[0][1])
+    print(f"gallery of {plots} plots, serial:        {results[0][0]:8.3f} s")
+    print(f"gallery of {plots} plots, {args.processes:2d} processes:  {results[1][0]:8.3f} s")
+    print(f"update of the current gallery:    {update:8.3f} s")
+    print(f"identical files: {results[0][1] == results[1][1]}")
+
+
+if __name__ == "__main__":
+    main()
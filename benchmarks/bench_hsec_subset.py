@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_hsec_subset
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Times regional horizontal section plots on a high-resolution synthetic
+    global grid, once reading the complete fields and once reading only the
+    part covering the bounding box. One of the bounding boxes crosses the
+    longitude seam of the grid (stored from 0 to 360 degrees).
+
+    Usage: python benchmarks/bench_hsec_subset.py --resolution 0.1
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import importlib
+import logging
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from unittest import mock
+
+import fs
+import numpy as np
+
+from mslib.mswms.dataaccess import DefaultDataAccess
+from mslib.mswms.demodata import DataFiles
+from mslib.mswms.mss_plot_driver import HorizontalSectionDriver
+
+
+def create_grid(path, resolution):
+    """
+    Writes one global surface file with the given grid spacing in degree.
+    """
+    lats, lons = np.arange(90, -90 - resolution / 2, -resolution), np.arange(0, 360, resolution)
+    DataFiles(data_fs=fs.open_fs(path)).generate_file(
+        None, "SFC", "sfc", (("time", [0, 6]), ("latitude", lats), ("longitude", lons)),
+        ["air_pressure_at_sea_level", "surface_eastward_wind", "surface_northward_wind"])
+
+
+def run(data_access, bbox, repeat):
+    # requires mswms_settings to be imported before, see main()
+    from mslib.mswms import mpl_hsec_styles
+
+    driver = HorizontalSectionDriver(data_access)
+    init_time = valid_time = datetime(2012, 10, 17, 12)
+    for _ in range(repeat):
+        driver.set_plot_parameters(
+            plot_object=mpl_hsec_styles.HS_MSLPStyle_01(driver=driver), bbox=bbox, crs="EPSG:4326",
+            init_time=init_time, valid_time=valid_time, figsize=(400, 300), show=False)
+        driver.plot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolution", type=float, default=0.1, help="grid spacing in degree")
+    parser.add_argument("--repeat", type=int, default=3, help="number of plots per bounding box")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    data_path = tempfile.mkdtemp()
+    print(f"creating {args.resolution} degree grid in '{data_path}'")
+    create_grid(data_path, args.resolution)
+    if importlib.util.find_spec("mswms_settings") is None:
+        config_path = tempfile.mkdtemp()
+        DataFiles(data_fs=fs.open_fs(data_path), server_config_fs=fs.open_fs(config_path)).create_server_config(
+            detailed_information=True)
+        sys.path.insert(0, config_path)
+    # the style modules import mswms_settings, which in turn imports them
+    importlib.import_module("mswms_settings")
+    data_access = DefaultDataAccess(data_path, "EUR_LL015")
+    data_access.setup()
+
+    # warm up caches of basemap and the operating system
+    run(data_access, [5, 45, 15, 55], 1)
+    for bbox in ([5, 45, 15, 55], [-10, 40, 20, 60], [170, -20, 200, 10]):
+        subset = timeit.timeit(lambda: run(data_access, bbox, args.repeat), number=1)
+        with mock.patch.object(HorizontalSectionDriver, "_get_bbox_window", return_value=None):
+            full = timeit.timeit(lambda: run(data_access, bbox, args.repeat), number=1)
+        print(f"bbox {str(bbox):22s} full fields: {1000 * full / args.repeat:8.1f} ms/plot, "
+              f"subset: {1000 * subset / args.repeat:8.1f} ms/plot")
+
+
+if __name__ == "__main__":
+    main()
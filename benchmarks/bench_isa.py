@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_isa
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Compares the conversions between flight levels and pressures of the
+    standard atmosphere by masking the array once per layer (the former way
+    of thermolib) with the vectorised conversions, which classify the whole
+    array at once, for arrays spanning 0 to 70 km.
+
+    Usage: python benchmarks/bench_isa.py --size 1000000 --repeat 5
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from mslib.utils import thermolib
+from mslib.utils.units import units
+
+
+def flightlevel2pressure_by_layer(height):
+    p = np.full_like(height.magnitude, np.nan, dtype=float) * units.Pa
+    for i, ((z0, t0, p0, gamma), (z1, t1, p1, _)) in enumerate(zip(thermolib._STANDARD_ATMOSPHERE[:-1],
+                                                                   thermolib._STANDARD_ATMOSPHERE[1:])):
+        indices = (height >= z0) & (height < z1)
+        if i == 0:
+            indices |= height < z0
+        if gamma != 0:
+            p[indices] = p0 * ((t0 - gamma * (height[indices] - z0)) / t0) ** (thermolib.g / (gamma * thermolib.Rd))
+        else:
+            p[indices] = p0 * np.exp(-thermolib.g * (height[indices] - z0) / (thermolib.Rd * t0))
+    return p
+
+
+def pressure2flightlevel_by_layer(pressure):
+    z = np.full_like(pressure.magnitude, np.nan, dtype=float) * units.hft
+    for i, ((z0, t0, p0, gamma), (z1, t1, p1, _)) in enumerate(zip(thermolib._STANDARD_ATMOSPHERE[:-1],
+                                                                   thermolib._STANDARD_ATMOSPHERE[1:])):
+        indices = (pressure > p1) & (pressure <= p0)
+        if i == 0:
+            indices |= (pressure >= p0)
+        if gamma != 0:
+            z[indices] = z0 + 1. / gamma * (
+                t0 - t0 * np.exp(gamma * thermolib.Rd / thermolib.g * np.log(pressure[indices] / p0)))
+        else:
+            z[indices] = z0 - (thermolib.Rd * t0) / thermolib.g * np.log(pressure[indices] / p0)
+    return z
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1000000, help="number of elements")
+    parser.add_argument("--repeat", type=int, default=5, help="number of repetitions")
+    args = parser.parse_args()
+
+    heights = np.random.default_rng(0).uniform(0, 70000, args.size) * units.m
+    pressures = thermolib.flightlevel2pressure(heights)
+    for name, by_layer, vectorised, values in [
+            ("flightlevel2pressure", flightlevel2pressure_by_layer, thermolib.flightlevel2pressure, heights),
+            ("pressure2flightlevel", pressure2flightlevel_by_layer, thermolib.pressure2flightlevel, pressures)]:
+        old = min(timeit.repeat(lambda: by_layer(values), number=1, repeat=args.repeat))
+        new = min(timeit.repeat(lambda: vectorised(values), number=1, repeat=args.repeat))
+        difference = np.nanmax(np.abs(by_layer(values).magnitude / vectorised(values).magnitude - 1))
+        print(f"{name} of {args.size} elements, by layer:   {1000 * old:8.1f} ms")
+        print(f"{name} of {args.size} elements, vectorised: {1000 * new:8.1f} ms")
+        print(f"{name} maximum relative difference: {difference:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_lsec_interpolation
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the vectorised vertical interpolation of linear sections with
+    the former implementation looping over all path points and levels.
+
+    Usage: python benchmarks/bench_lsec_interpolation.py --points 10000
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from mslib.utils import coordinate
+
+
+def interpolate_loop(curtain, pressures, alts):
+    """
+    Former implementation of LinearSectionDriver._load_interpolate_timestep.
+    """
+    result = []
+    for index_lonlat, alt in enumerate(alts):
+        column = pressures[:, index_lonlat]
+        closest = 0
+        direction = 1
+        for index_altitude, pressure in enumerate(column):
+            if abs(pressure - alt) < abs(column[closest] - alt):
+                closest = index_altitude
+                direction = 1 if pressure - alt > 0 else -1
+        next_closest = closest + direction
+        if next_closest >= len(column) or next_closest < 0:
+            next_closest = closest
+        if closest == next_closest:
+            factors = [[closest, 0.5], [closest, 0.5]]
+        else:
+            distance = abs(column[closest] - alt) + abs(column[next_closest] - alt)
+            factors = [[closest, 1 - (abs(column[closest] - alt) / distance)],
+                       [next_closest, 1 - (abs(column[next_closest] - alt) / distance)]]
+        result.append(curtain[factors[0][0], index_lonlat] * factors[0][1] +
+                      curtain[factors[1][0], index_lonlat] * factors[1][1])
+    return np.array(result)
+
+
+def interpolate_vectorised(curtain, pressures, alts):
+    return coordinate.interpolate_vertical(
+        curtain, *coordinate.get_vertical_interpolation_factors(pressures, alts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=10000, help="number of points along the path")
+    parser.add_argument("--levels", type=int, default=137, help="number of model levels")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed repetitions")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pressures = np.sort(rng.uniform(1000, 105000, (args.levels, args.points)), axis=0)[::-1]
+    curtain = rng.normal(250, 20, (args.levels, args.points))
+    alts = rng.uniform(500, 110000, args.points)
+
+    assert np.allclose(interpolate_loop(curtain, pressures, alts), interpolate_vectorised(curtain, pressures, alts))
+    loop = min(timeit.repeat(lambda: interpolate_loop(curtain, pressures, alts), number=1, repeat=args.repeat))
+    vectorised = min(timeit.repeat(
+        lambda: interpolate_vectorised(curtain, pressures, alts), number=1, repeat=args.repeat))
+
+    print(f"{args.points} points, {args.levels} levels")
+    print(f"loop:       {loop:8.4f} s")
+    print(f"vectorised: {vectorised:8.4f} s ({loop / vectorised:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_mfdataset_open
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares opening several files of a long time series as one
+    MFDatasetCommonDims with the element-wise comparison of all coordinate
+    variables and with the comparison spared by the coordinate hashes
+    recorded by the data access.
+
+    Usage: python benchmarks/bench_mfdataset_open.py --files 10 --times 20000 --repeat 5
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import os
+import tempfile
+import timeit
+
+import netCDF4
+import numpy as np
+
+from mslib.utils import netCDF4tools
+
+
+def create_files(path, files, times):
+    filenames = []
+    for index in range(files):
+        filenames.append(os.path.join(path, f"series_{index:04d}.pl.nc"))
+        with netCDF4.Dataset(filenames[-1], "w", format="NETCDF4_CLASSIC") as ncfile:
+            for name, values in [("time", np.arange(times) * 3600.), ("isobaric", np.linspace(100, 1000, 30)),
+                                 ("lat", np.linspace(-90, 90, 361)), ("lon", np.linspace(-180, 179.5, 720))]:
+                ncfile.createDimension(name, len(values))
+                ncfile.createVariable(name, "f8", (name,))[:] = values
+            ncfile.createVariable(f"var_{index}", "f4", ("time", "isobaric", "lat", "lon"))
+    return filenames
+
+
+def open_close(filenames, hashes):
+    netCDF4tools.MFDatasetCommonDims(filenames, coordinate_hashes=hashes).close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=10, help="number of files opened together")
+    parser.add_argument("--times", type=int, default=20000, help="number of time steps per file")
+    parser.add_argument("--repeat", type=int, default=5, help="number of repetitions")
+    args = parser.parse_args()
+
+    filenames = create_files(tempfile.mkdtemp(), args.files, args.times)
+    hashes = {}
+    for filename in filenames:
+        with netCDF4.Dataset(filename) as ncfile:
+            hashes[filename] = netCDF4tools.coordinate_hashes(ncfile)
+
+    checked = min(timeit.repeat(lambda: open_close(filenames, None), number=1, repeat=args.repeat))
+    hashed = min(timeit.repeat(lambda: open_close(filenames, hashes), number=1, repeat=args.repeat))
+    print(f"open of {args.files} files with {args.times} time steps")
+    print(f"  element-wise coordinate checks: {1000 * checked:8.1f} ms")
+    print(f"  recorded coordinate hashes:     {1000 * hashed:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
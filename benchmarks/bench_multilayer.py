@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_multilayer
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the time of GetMap requests with four layers rendered one
+    after another and by worker processes (setting render_processes).
+
+    Usage: python benchmarks/bench_multilayer.py --repeat 5 --processes 4
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import logging
+import importlib
+import os
+import sys
+import tempfile
+import timeit
+
+import fs
+from multidict import CIMultiDict
+
+from mslib.mswms.demodata import DataFiles
+
+QUERY = {
+    "LAYERS": "ecmwf_EUR_LL015.PLDiv01,ecmwf_EUR_LL015.PLTemp01,ecmwf_EUR_LL015.PLGeopWind,"
+              "ecmwf_EUR_LL015.PLRelHum01",
+    "STYLES": "default,default,default,default", "ELEVATION": "300", "SRS": "EPSG:4326", "FORMAT": "image/png",
+    "WIDTH": "900", "HEIGHT": "600",
+    "DIM_INIT_TIME": "2012-10-17T12:00:00Z", "TIME": "2012-10-17T12:00:00Z", "BBOX": "-50,20,20,75",
+    "TRANSPARENT": "FALSE", "VERSION": "1.1.1"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="number of GetMap requests")
+    parser.add_argument("--processes", type=int, default=4, help="number of worker processes")
+    parser.add_argument("--path", default=None, help="existing directory with the demodata")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    data_path = args.path or tempfile.mkdtemp()
+    if len(os.listdir(data_path)) == 0:
+        print(f"creating demodata in '{data_path}'")
+        DataFiles(data_fs=fs.open_fs(data_path)).create_data()
+    if importlib.util.find_spec("mswms_settings") is None:
+        config_path = tempfile.mkdtemp()
+        DataFiles(data_fs=fs.open_fs(data_path), server_config_fs=fs.open_fs(config_path)).create_server_config(
+            detailed_information=True)
+        # the worker processes inherit sys.path and import the same settings
+        sys.path.insert(0, config_path)
+    importlib.import_module("mswms_settings")
+    from mslib.mswms.wms import server
+    logging.getLogger().setLevel(logging.ERROR)
+
+    query = CIMultiDict(QUERY)
+    serial_image, _ = server.produce_plot(query, "getmap")
+    serial = timeit.timeit(lambda: server.produce_plot(query, "getmap"), number=args.repeat)
+
+    server.render_processes = args.processes
+    # the first request starts the workers, which set up a server of their own
+    parallel_image, _ = server.produce_plot(query, "getmap")
+    parallel = timeit.timeit(lambda: server.produce_plot(query, "getmap"), number=args.repeat)
+    server._render_executor.shutdown()
+
+    print(f"{args.repeat} requests with 4 layers, serial:        "
+          f"{serial:8.3f} s ({1000 * serial / args.repeat:7.1f} ms/request)")
+    print(f"{args.repeat} requests with 4 layers, {args.processes:2d} processes:  "
+          f"{parallel:8.3f} s ({1000 * parallel / args.repeat:7.1f} ms/request)")
+    print(f"identical output: {serial_image == parallel_image}")
+
+
+if __name__ == "__main__":
+    main()
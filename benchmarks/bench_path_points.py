@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_path_points
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the computation of the distances between the waypoints and of
+    the intermediate points of long paths by one geodesic computation per
+    segment (the former implementation) with the batch computation over all
+    segments at once.
+
+    Usage: python benchmarks/bench_path_points.py --waypoints 10000 --numpoints 100000
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from mslib.utils import coordinate
+
+
+def distances_per_segment(lats, lons):
+    return [coordinate.get_distance(lats[i], lons[i], lats[i + 1], lons[i + 1]) for i in range(len(lats) - 1)]
+
+
+def path_points_per_segment(lats, lons, numpoints, connection):
+    """
+    Former implementation of coordinate.path_points (without times and altitudes).
+    """
+    if connection == "linear":
+        lats, lons = np.asarray(lats), np.asarray(lons)
+        distances = np.hypot(lats[:-1] - lats[1:], lons[:-1] - lons[1:])
+    else:
+        distances = distances_per_segment(lats, lons)
+    length_point_segment = sum(distances) / (numpoints + len(lats) - 2)
+    r_lats, r_lons = [], []
+    startidx = 0
+    for i in range(len(lats) - 1):
+        segment_points = max(int(round(distances[i] / length_point_segment)), 2)
+        lats_, lons_ = coordinate.latlon_points(
+            lats[i], lons[i], lats[i + 1], lons[i + 1], numpoints=segment_points, connection=connection)
+        r_lons.extend(lons_[startidx:])
+        r_lats.extend(lats_[startidx:])
+        startidx = 1
+    return [r_lats, r_lons]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--waypoints", type=int, default=10000, help="number of waypoints of the path")
+    parser.add_argument("--numpoints", type=int, default=100000, help="number of intermediate points")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed repetitions")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lats = np.cumsum(rng.uniform(-0.5, 0.5, args.waypoints)).clip(-80, 80).tolist()
+    lons = np.cumsum(rng.uniform(-0.2, 1, args.waypoints)).tolist()
+
+    assert coordinate.get_distances(lats, lons).tolist() == distances_per_segment(lats, lons)
+    per_segment = min(timeit.repeat(lambda: distances_per_segment(lats, lons), number=1, repeat=args.repeat))
+    batch = min(timeit.repeat(lambda: coordinate.get_distances(lats, lons), number=1, repeat=args.repeat))
+    print(f"distances of {args.waypoints} waypoints")
+    print(f"  per segment: {1000 * per_segment:8.1f} ms")
+    print(f"  batch:       {1000 * batch:8.1f} ms ({per_segment / batch:.0f}x)")
+
+    for connection in ["linear", "greatcircle"]:
+        reference = path_points_per_segment(lats, lons, args.numpoints, connection)
+        result = coordinate.path_points(lats, lons, args.numpoints, connection=connection)
+        assert np.allclose(reference, result, rtol=0, atol=1e-9)
+        per_segment = min(timeit.repeat(
+            lambda: path_points_per_segment(lats, lons, args.numpoints, connection), number=1, repeat=args.repeat))
+        batch = min(timeit.repeat(
+            lambda: coordinate.path_points(lats, lons, args.numpoints, connection=connection),
+            number=1, repeat=args.repeat))
+        print(f"{len(result[0])} {connection} path points of {args.waypoints} waypoints")
+        print(f"  per segment: {1000 * per_segment:8.1f} ms")
+        print(f"  batch:       {1000 * batch:8.1f} ms ({per_segment / batch:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_plot_driver
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Times repeated GetMap-like plots of alternating layers with a
+    HorizontalSectionDriver, once re-opening the data files for every plot
+    (a pool without room for idle datasets) and once reusing the pooled
+    datasets.
+
+    Usage: python benchmarks/bench_plot_driver.py --repeat 20
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import logging
+import importlib
+import os
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+import fs
+
+from mslib.mswms.dataaccess import DefaultDataAccess
+from mslib.mswms.demodata import DataFiles
+from mslib.mswms.mss_plot_driver import DatasetPool, HorizontalSectionDriver
+
+
+def run(data_access, pool, repeat):
+    # requires mswms_settings to be imported before, see main()
+    from mslib.mswms import mpl_hsec_styles
+
+    driver = HorizontalSectionDriver(data_access, dataset_pool=pool)
+    init_time = valid_time = datetime(2012, 10, 17, 12)
+    layers = [(mpl_hsec_styles.HS_MSLPStyle_01(driver=driver), None),
+              (mpl_hsec_styles.HS_TemperatureStyle_PL_01(driver=driver), 300),
+              (mpl_hsec_styles.HS_TemperatureStyle_ML_01(driver=driver), 10)]
+    for _ in range(repeat):
+        for plot_object, level in layers:
+            driver.set_plot_parameters(
+                plot_object=plot_object, bbox=[-22.5, 27.5, 55, 62.5], level=level, crs="EPSG:4326",
+                init_time=init_time, valid_time=valid_time, figsize=(400, 300), show=False)
+            driver.plot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="number of plots per layer")
+    parser.add_argument("--path", default=None, help="existing directory with the demodata")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    data_path = args.path or tempfile.mkdtemp()
+    if len(os.listdir(data_path)) == 0:
+        print(f"creating demodata in '{data_path}'")
+        DataFiles(data_fs=fs.open_fs(data_path)).create_data()
+    if importlib.util.find_spec("mswms_settings") is None:
+        config_path = tempfile.mkdtemp()
+        DataFiles(data_fs=fs.open_fs(data_path), server_config_fs=fs.open_fs(config_path)).create_server_config(
+            detailed_information=True)
+        sys.path.insert(0, config_path)
+    # the style modules import mswms_settings, which in turn imports them
+    importlib.import_module("mswms_settings")
+    data_access = DefaultDataAccess(data_path, "EUR_LL015")
+    data_access.setup()
+
+    without_pool = timeit.timeit(lambda: run(data_access, DatasetPool(max_open_files=0), args.repeat), number=1)
+    with_pool = timeit.timeit(lambda: run(data_access, DatasetPool(), args.repeat), number=1)
+    plots = 3 * args.repeat
+    print(f"{plots} plots re-opening files: {without_pool:8.3f} s ({1000 * without_pool / plots:7.1f} ms/plot)")
+    print(f"{plots} plots pooled datasets:  {with_pool:8.3f} s ({1000 * with_pool / plots:7.1f} ms/plot)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_png_encoding
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the time to encode a rendered GetMap-sized figure as palette
+    PNG by writing, decoding and re-encoding an RGBA PNG (the former way of
+    the plot styles) with the single-pass encoding of mswms.utils.encode_png
+    at several zlib levels and with a reused palette.
+
+    Usage: python benchmarks/bench_png_encoding.py --repeat 50
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import io
+import timeit
+
+import matplotlib.figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+import numpy as np
+import PIL.Image
+
+from mslib.mswms.utils import encode_png
+
+
+def create_canvas(width, height):
+    dpi = 80
+    fig = matplotlib.figure.Figure(figsize=(width / dpi, height / dpi), dpi=dpi, facecolor="white")
+    ax = fig.add_axes([0.0, 0.0, 1.0, 1.0])
+    x, y = np.meshgrid(np.linspace(0, 10, 400), np.linspace(0, 6, 300))
+    ax.contourf(x, y, np.sin(x) * np.cos(y) + 0.1 * np.sin(5 * x * y), 30, cmap="jet")
+    ax.contour(x, y, np.cos(x) * np.sin(y), 10, colors="k")
+    ax.axis("off")
+    return FigureCanvas(fig)
+
+
+def encode_png_twice(canvas):
+    output = io.BytesIO()
+    canvas.print_png(output)
+    output.seek(0)
+    palette_img = PIL.Image.open(output).convert(mode="RGB").convert("P", palette=PIL.Image.Palette.ADAPTIVE)
+    output = io.BytesIO()
+    palette_img.save(output, format="PNG")
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50, help="number of encoded images per variant")
+    parser.add_argument("--width", type=int, default=900, help="image width in pixels")
+    parser.add_argument("--height", type=int, default=600, help="image height in pixels")
+    args = parser.parse_args()
+
+    canvas = create_canvas(args.width, args.height)
+    # the rendering of the figure is part of both variants, time it separately
+    draw = timeit.timeit(canvas.draw, number=args.repeat)
+    variants = [("two-pass (former)", lambda: encode_png_twice(canvas))]
+    for level in (1, 6, 9):
+        variants.append((f"single-pass, zlib {level}", lambda level=level: encode_png(canvas, compress_level=level)))
+    with PIL.Image.open(io.BytesIO(encode_png(canvas))) as palette:
+        palette.load()
+    variants.append(("single-pass, reused palette", lambda: encode_png(canvas, palette=palette)))
+
+    print(f"drawing the figure:            {1000 * draw / args.repeat:7.1f} ms/image")
+    for name, function in variants:
+        seconds = timeit.timeit(function, number=args.repeat)
+        print(f"{name:30s} {1000 * (seconds - draw) / args.repeat:7.1f} ms/image encoding, "
+              f"{len(function()) / 1024:7.1f} kB")
+
+
+if __name__ == "__main__":
+    main()
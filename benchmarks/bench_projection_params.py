@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_projection_params
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures repeated lookups of the projection parameters of CRS codes by
+    coordinate.get_projection_params with and without the memoised parsing,
+    and the creation of the projections converting meter bboxes to degrees
+    for each request (the former way of mpl_hsec) against the cached ones.
+
+    Usage: python benchmarks/bench_projection_params.py --lookups 100000
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import importlib
+import logging
+import sys
+import tempfile
+import timeit
+
+import fs
+import mpl_toolkits.basemap as basemap
+
+from mslib.mswms.demodata import DataFiles
+from mslib.utils import coordinate
+
+CRS_CODES = ["EPSG:4326", "EPSG:3857", "EPSG:3031", "EPSG:31467", "EPSG:77790010",
+             "MSS:stere,10,90,70", "MSS:lcc,10,50,40,60", "MSS:merc,40"]
+METER_CRS_CODES = ["EPSG:3857", "EPSG:3031", "EPSG:3413"]
+
+
+def create_meter_projection(bm_params):
+    try:
+        return basemap.Basemap(resolution=None, **bm_params)
+    except ValueError:  # projection requires some extent
+        return basemap.Basemap(resolution=None, width=1e7, height=1e7, **bm_params)
+
+
+def get_projection_params_unmemoised(proj):
+    return coordinate._parse_projection.__wrapped__(proj.lower())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lookups", type=int, default=100000, help="number of lookups of CRS codes")
+    parser.add_argument("--projections", type=int, default=100, help="number of created meter projections")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    codes = [CRS_CODES[_i % len(CRS_CODES)] for _i in range(args.lookups)]
+    parsing = timeit.timeit(lambda: [get_projection_params_unmemoised(_x) for _x in codes], number=1)
+    memoised = timeit.timeit(lambda: [coordinate.get_projection_params(_x) for _x in codes], number=1)
+    print(f"get_projection_params, parsing each code: {1e6 * parsing / args.lookups:8.2f} us/lookup")
+    print(f"get_projection_params, memoised:          {1e6 * memoised / args.lookups:8.2f} us/lookup")
+
+    if importlib.util.find_spec("mswms_settings") is None:
+        config_path = tempfile.mkdtemp()
+        DataFiles(data_fs=fs.open_fs(tempfile.mkdtemp()), server_config_fs=fs.open_fs(config_path)) \
+            .create_server_config(detailed_information=True)
+        sys.path.insert(0, config_path)
+    # the style modules import mswms_settings, which in turn imports them
+    importlib.import_module("mswms_settings")
+    from mslib.mswms.mpl_hsec import get_meter_projection
+    params = [dict(coordinate.get_projection_params(METER_CRS_CODES[_i % len(METER_CRS_CODES)])["basemap"],
+                   area_thresh=1000.) for _i in range(args.projections)]
+    fresh = timeit.timeit(lambda: [create_meter_projection(_x) for _x in params], number=1)
+    cached = timeit.timeit(lambda: [get_meter_projection(_x) for _x in params], number=1)
+    print(f"meter projection, created per request:    {1000 * fresh / args.projections:8.2f} ms/request")
+    print(f"meter projection, cached:                 {1000 * cached / args.projections:8.2f} ms/request")
+
+
+if __name__ == "__main__":
+    main()
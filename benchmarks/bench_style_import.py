@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_style_import
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the time to import mpl_hsec_styles and mpl_vsec_styles in a
+    fresh interpreter, in which the generic plotting layers are only
+    registered, and the time to create all registered generic classes,
+    which the former import spent on every start of a WMS worker.
+
+    Usage: python benchmarks/bench_style_import.py --repeat 5
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import tempfile
+
+import fs
+
+from mslib.mswms.demodata import DataFiles
+
+MODULES = ["mslib.mswms.mpl_hsec_styles", "mslib.mswms.mpl_vsec_styles"]
+
+# the style modules import mswms_settings, which in turn imports them
+SCRIPT = """
+import time
+import mswms_settings
+from mslib.mswms import mpl_hsec_styles, mpl_vsec_styles
+start = time.perf_counter()
+classes = 0
+for module in (mpl_hsec_styles, mpl_vsec_styles):
+    for name in module._GENERIC_CLASSES:
+        getattr(module, name)
+        classes += 1
+print(classes, time.perf_counter() - start)
+"""
+
+
+def measure(env):
+    """
+    Returns the self import times of the style modules in seconds, the number
+    of generic classes and the seconds needed to create them.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", SCRIPT], env=env,
+                            capture_output=True, text=True, check=True)
+    import_time = 0
+    for line in result.stderr.splitlines():
+        fields = [_x.strip() for _x in line.split("|")]
+        if len(fields) == 3 and fields[2] in MODULES:
+            import_time += int(fields[0].split()[-1]) / 1e6
+    classes, create_time = result.stdout.split()
+    return import_time, int(classes), float(create_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="number of started interpreters")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if importlib.util.find_spec("mswms_settings") is None:
+        config_path = tempfile.mkdtemp()
+        DataFiles(data_fs=fs.open_fs(tempfile.mkdtemp()), server_config_fs=fs.open_fs(config_path)) \
+            .create_server_config(detailed_information=True)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [config_path] + [_x for _x in env.get("PYTHONPATH", "").split(os.pathsep) if _x])
+
+    results = [measure(env) for _ in range(args.repeat)]
+    import_time = min(_x[0] for _x in results)
+    classes = results[0][1]
+    create_time = min(_x[2] for _x in results)
+    print(f"import of the style modules:     {1000 * import_time:8.1f} ms")
+    print(f"creation of {classes:4d} generic classes: {1000 * create_time:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_thermolib
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Times the thermodynamic functions of thermolib on gridded arrays
+    without units, and compares the calls of flightlevel2pressure and
+    pressure2flightlevel for single values through the MetPy decorators and
+    through the cached unit conversions.
+
+    Usage: python benchmarks/bench_thermolib.py --shape 60 181 360 --calls 10000
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import timeit
+import warnings
+
+import numpy as np
+
+from mslib.utils import thermolib
+from mslib.utils.units import units
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", type=int, nargs=3, default=[60, 181, 360], help="shape of the grid")
+    parser.add_argument("--calls", type=int, default=10000, help="number of calls with single values")
+    parser.add_argument("--repeat", type=int, default=3, help="number of repetitions")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    p = rng.uniform(1000, 105000, args.shape)
+    t = rng.uniform(190, 310, args.shape)
+    q = rng.uniform(1e-6, 0.02, args.shape)
+    size = "x".join(str(_x) for _x in args.shape)
+    # the random humidities are partly supersaturated
+    warnings.filterwarnings("ignore", "Relative humidity")
+    for name, function, arguments in [
+            ("pot_temp", thermolib.pot_temp, (p, t)),
+            ("rel_hum", thermolib.rel_hum, (p, t, q)),
+            ("eqpt_approx", thermolib.eqpt_approx, (p, t, q))]:
+        with np.errstate(invalid="ignore"):
+            seconds = min(timeit.repeat(lambda: function(*arguments), number=1, repeat=args.repeat))
+        print(f"{name:12s} on {size}: {1000 * seconds:8.1f} ms")
+
+    for name, function, value in [
+            ("flightlevel2pressure", thermolib.flightlevel2pressure, 350 * units.hft),
+            ("pressure2flightlevel", thermolib.pressure2flightlevel, 250 * units.hPa)]:
+        decorators = min(timeit.repeat(lambda: function.__wrapped__(value), number=args.calls, repeat=args.repeat))
+        cached = min(timeit.repeat(lambda: function(value), number=args.calls, repeat=args.repeat))
+        print(f"{name} of single values, MetPy decorators: {1e6 * decorators / args.calls:8.1f} us/call")
+        print(f"{name} of single values, cached factors:   {1e6 * cached / args.calls:8.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
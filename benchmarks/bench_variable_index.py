@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_variable_index
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the lookup of all variables of wide NetCDF files by scanning
+    the attributes of all variables for each lookup (the former way of
+    netCDF4tools.identify_variable) with the lookup by the VariableIndex of
+    the files, and times the parsing of the directory by the data access.
+
+    Usage: python benchmarks/bench_variable_index.py --files 20 --variables 300
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import os
+import tempfile
+import timeit
+
+import netCDF4
+import numpy as np
+
+from mslib.mswms.dataaccess import parse_file
+from mslib.utils import netCDF4tools
+
+
+def create_files(path, files, variables):
+    for index in range(files):
+        with netCDF4.Dataset(os.path.join(path, f"wide_{index:04d}.pl.nc"), "w", format="NETCDF4_CLASSIC") as nc:
+            for name, size in [("time", 2), ("isobaric", 4), ("lat", 5), ("lon", 6)]:
+                nc.createDimension(name, size)
+            for name, standard_name, units, values in [
+                    ("time", "time", "hours since 2012-10-17T12:00:00.000Z", [0, 6]),
+                    ("isobaric", "atmosphere_pressure_coordinate", "hPa", [200, 300, 500, 850]),
+                    ("lat", "latitude", "degrees_north", np.linspace(40, 60, 5)),
+                    ("lon", "longitude", "degrees_east", np.linspace(-10, 10, 6))]:
+                variable = nc.createVariable(name, "f8", (name,))
+                variable.standard_name = standard_name
+                variable.units = units
+                variable[:] = values
+            for number in range(variables):
+                variable = nc.createVariable(f"var_{number}", "f4", ("time", "isobaric", "lat", "lon"))
+                variable.standard_name = f"quantity_{number}"
+                variable.units = "K"
+                variable.long_name = f"quantity number {number}"
+
+
+def identify_variable_by_scan(ncfile, standard_names):
+    if not isinstance(standard_names, list):
+        standard_names = [standard_names]
+    for var_name, variable in ncfile.variables.items():
+        if "standard_name" in variable.ncattrs() and variable.standard_name in standard_names:
+            return var_name, variable
+    return None, None
+
+
+def lookup_all(filenames, variables, identify_variable, share=False):
+    for filename in filenames:
+        with netCDF4.Dataset(filename) as ncfile:
+            if share:
+                # the files are opened read-only, so the index may be shared by all lookups
+                netCDF4tools.share_variable_index(ncfile)
+            for number in range(variables):
+                identify_variable(ncfile, f"quantity_{number}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20, help="number of files")
+    parser.add_argument("--variables", type=int, default=300, help="number of variables per file")
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    create_files(path, args.files, args.variables)
+    filenames = sorted(os.path.join(path, _x) for _x in os.listdir(path))
+
+    lookups = args.files * args.variables
+    scan = timeit.timeit(lambda: lookup_all(filenames, args.variables, identify_variable_by_scan), number=1)
+    indexed = timeit.timeit(
+        lambda: lookup_all(filenames, args.variables, netCDF4tools.identify_variable, share=True), number=1)
+    parsing = timeit.timeit(lambda: [parse_file(path, os.path.basename(_x)) for _x in filenames], number=1)
+    print(f"{lookups} lookups scanning all variables: {scan:8.3f} s ({1e6 * scan / lookups:8.1f} us/lookup)")
+    print(f"{lookups} lookups by variable index:      {indexed:8.3f} s ({1e6 * indexed / lookups:8.1f} us/lookup)")
+    print(f"parsing {args.files} files of {args.variables} variables: {parsing:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_vsec_interpolation
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the bilinear horizontal interpolation of vertical sections
+    computed for all levels at once with the former implementation calling
+    scipy.ndimage.map_coordinates once per level.
+
+    Usage: python benchmarks/bench_vsec_interpolation.py --points 5000 --levels 137
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+from scipy.interpolate import interp1d
+from scipy.ndimage import map_coordinates
+
+from mslib.utils import coordinate
+
+
+def interpolate_per_level(data3D, data3D_lats, data3D_lons, lats, lons):
+    """
+    Former implementation of coordinate.interpolate_vertsec.
+    """
+    curtain = np.zeros([data3D.shape[0], len(lats)])
+    interp_lat = interp1d(data3D_lats, np.arange(len(data3D_lats)), bounds_error=False)
+    ind_lats = interp_lat(lats)
+    interp_lon = interp1d(data3D_lons, np.arange(len(data3D_lons)), bounds_error=False)
+    ind_lons = interp_lon(lons)
+    ind_coords = np.array([ind_lats, ind_lons])
+    for ml in range(data3D.shape[0]):
+        curtain[ml, :] = map_coordinates(data3D[ml, :, :].filled(np.nan), ind_coords, order=1)
+    curtain[:, np.isnan(ind_lats) | np.isnan(ind_lons)] = np.nan
+    return np.ma.masked_invalid(curtain)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=5000, help="number of points along the path")
+    parser.add_argument("--levels", type=int, default=137, help="number of model levels")
+    parser.add_argument("--resolution", type=float, default=0.25, help="grid spacing in degrees")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed repetitions")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lats = np.arange(30, 70 + args.resolution / 2, args.resolution)
+    lons = np.arange(-30, 50 + args.resolution / 2, args.resolution)
+    data = np.ma.masked_array(rng.normal(250, 20, (args.levels, len(lats), len(lons))).astype("f4"))
+    data[:, :10, :10] = np.ma.masked
+    path_lats = np.linspace(35, 65, args.points)
+    path_lons = np.linspace(-25, 45, args.points)
+
+    reference = interpolate_per_level(data, lats, lons, path_lats, path_lons)
+    result = coordinate.interpolate_vertsec(data, lats, lons, path_lats, path_lons)
+    assert (reference.mask == result.mask).all() and np.ma.allclose(reference, result, rtol=1e-6)
+    per_level = min(timeit.repeat(
+        lambda: interpolate_per_level(data, lats, lons, path_lats, path_lons), number=1, repeat=args.repeat))
+    all_levels = min(timeit.repeat(
+        lambda: coordinate.interpolate_vertsec(data, lats, lons, path_lats, path_lons),
+        number=1, repeat=args.repeat))
+
+    print(f"{args.points} points, {args.levels} levels, {len(lats)}x{len(lons)} grid")
+    print(f"per level:  {per_level:8.4f} s")
+    print(f"all levels: {all_levels:8.4f} s ({per_level / all_levels:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
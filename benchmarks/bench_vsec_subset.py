@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+
+    benchmarks.bench_vsec_subset
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares vertical section plots on a global grid with reading the
+    complete data fields and with reading only the part of the fields
+    covering the path.
+
+    Usage: python benchmarks/bench_vsec_subset.py --resolution 0.1
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import argparse
+import importlib
+import logging
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from unittest import mock
+
+import fs
+import numpy as np
+
+from mslib.mswms.dataaccess import DefaultDataAccess
+from mslib.mswms.demodata import DataFiles
+from mslib.mswms.mss_plot_driver import VerticalSectionDriver
+
+
+def create_grid(path, resolution, levels):
+    """
+    Writes one global pressure level file with the given grid spacing in degree.
+    """
+    lats, lons = np.arange(90, -90 - resolution / 2, -resolution), np.arange(0, 360, resolution)
+    DataFiles(data_fs=fs.open_fs(path)).generate_file(
+        "air_pressure", "PRESSURE_LEVELS", "pl",
+        (("time", [0]), ("atmosphere_pressure_coordinate", np.linspace(900, 100, levels)),
+         ("latitude", lats), ("longitude", lons)),
+        ["air_temperature", "air_potential_temperature", "ertel_potential_vorticity"])
+
+
+def run(data_access, path, repeat):
+    # requires mswms_settings to be imported before, see main()
+    from mslib.mswms import mpl_vsec_styles
+
+    driver = VerticalSectionDriver(data_access)
+    init_time = valid_time = datetime(2012, 10, 17, 12)
+    for _ in range(repeat):
+        driver.set_plot_parameters(
+            plot_object=mpl_vsec_styles.VS_GenericStyle_PL_air_temperature(driver=driver), vsec_path=path,
+            vsec_numpoints=101, vsec_path_connection="greatcircle", bbox=[3, 1000, 3, 100],
+            init_time=init_time, valid_time=valid_time, style="default", figsize=(400, 300), show=False)
+        driver.plot()
+    return driver
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolution", type=float, default=0.1, help="grid spacing in degree")
+    parser.add_argument("--levels", type=int, default=4, help="number of pressure levels")
+    parser.add_argument("--repeat", type=int, default=3, help="number of plots per path")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    data_path = tempfile.mkdtemp()
+    print(f"creating {args.resolution} degree grid in '{data_path}'")
+    create_grid(data_path, args.resolution, args.levels)
+    if importlib.util.find_spec("mswms_settings") is None:
+        config_path = tempfile.mkdtemp()
+        DataFiles(data_fs=fs.open_fs(data_path), server_config_fs=fs.open_fs(config_path)).create_server_config(
+            detailed_information=True)
+        sys.path.insert(0, config_path)
+    # the style modules import mswms_settings, which in turn imports them
+    importlib.import_module("mswms_settings")
+    data_access = DefaultDataAccess(data_path, "EUR_LL015")
+    data_access.setup()
+
+    paths = ([[48, 11], [52, 13]], [[45, 8], [50, 12], [51, 15], [48, 11]], [[60, 170], [55, -160]],
+             [[50, -120], [40, 20]])
+    # warm up caches of the operating system
+    run(data_access, paths[0], 1)
+    for path in paths:
+        subset = timeit.timeit(lambda: run(data_access, path, args.repeat), number=1)
+        driver = run(data_access, path, 1)
+        subset_load = timeit.timeit(driver._load_interpolate_timestep, number=args.repeat)
+        with mock.patch.object(VerticalSectionDriver, "_get_path_window", return_value=None):
+            full = timeit.timeit(lambda: run(data_access, path, args.repeat), number=1)
+            full_load = timeit.timeit(driver._load_interpolate_timestep, number=args.repeat)
+        print(f"path {str(path):40s} full fields: {1000 * full / args.repeat:8.1f} ms/plot "
+              f"({1000 * full_load / args.repeat:6.1f} ms loading), "
+              f"subset: {1000 * subset / args.repeat:8.1f} ms/plot "
+              f"({1000 * subset_load / args.repeat:6.1f} ms loading)")
+
+
+if __name__ == "__main__":
+    main()
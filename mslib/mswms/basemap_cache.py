@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+
+    mslib.mswms.basemap_cache
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    LRU cache of Basemap instances for horizontal sections.
+
+    Creating a Basemap with coastlines and country borders reads, clips and
+    projects the boundary databases, which takes a large part of the time of
+    a GetMap request. The cache keeps fully initialised instances together
+    with their projected boundary geometry and hands out shallow copies, so
+    that each plot may attach the copy to its own axes.
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import copy
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# approximate memory of one point of a boundary segment stored as tuple of floats
+_BYTES_PER_POINT = 104
+
+
+def _estimate_size(bm):
+    """
+    Returns the approximate memory in bytes held by the boundary geometry of
+    a Basemap instance.
+    """
+    points = 0
+    for segments in (getattr(bm, "coastsegs", []), getattr(bm, "cntrysegs", [])):
+        points += sum(len(_segment) for _segment in segments)
+    points += sum(len(_xs) for _xs, _ in getattr(bm, "coastpolygons", []))
+    size = points * _BYTES_PER_POINT
+    for polygons in (getattr(bm, "landpolygons", []), getattr(bm, "lakepolygons", [])):
+        size += sum(np.asarray(_polygon.boundary).nbytes for _polygon in polygons)
+    return size
+
+
+class BasemapCache(object):
+    """
+    Thread-safe LRU cache of Basemap instances.
+
+    At most <max_entries> instances are kept, whose boundary geometry takes
+    approximately at most <max_bytes> bytes. The least recently used
+    instances are evicted first. The numbers of hits, misses and evictions
+    are counted for monitoring.
+    """
+
+    def __init__(self, max_entries=20, max_bytes=256 * 2 ** 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(proj_params, bbox, bbox_units, resolution, digits=6):
+        """
+        Returns the cache key of a map. The bounding box is rounded to
+        <digits> decimals, so that requests differing only by floating point
+        noise share an entry.
+        """
+        return repr((proj_params, tuple(round(float(_x), digits) for _x in bbox), bbox_units, resolution))
+
+    def get(self, key, create):
+        """
+        Returns a shallow copy of the Basemap instance cached under <key>.
+        On a miss, the instance is created by calling <create> (without
+        holding the lock) and stored in the cache.
+
+        The copies share the (read-only) boundary geometry, attributes set on a
+        copy, e.g. its axes, do not affect the cached instance.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                logging.debug("Loaded '%s' from basemap cache", key)
+                return copy.copy(entry[0])
+            self.misses += 1
+        bm = create()
+        size = _estimate_size(bm)
+        with self._lock:
+            if key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = (bm, size)
+                self._bytes += size
+                self._evict()
+        return copy.copy(bm)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            logging.debug("Evicted '%s' from basemap cache", key)
+
+    def info(self):
+        """
+        Returns a dictionary with the counters and the current size of the cache.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self._bytes}
+
+    def clear(self):
+        """
+        Removes all entries from the cache and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
@@ -27,13 +27,19 @@
 """
 
 from abc import ABCMeta, abstractmethod
+import concurrent.futures
+import hashlib
 import itertools
+import json
 import os
 import logging
+import sqlite3
+import threading
 import netCDF4
 import numpy as np
 import pint
 
+from mslib.mswms import derived_variables, filewatcher
 from mslib.utils import netCDF4tools
 from mslib.utils.units import units
 
@@ -65,16 +71,32 @@ class NWPDataAccess(metaclass=ABCMeta):
     def setup(self):
         """
         Checks for existing files etc. and sets up the class. Called by
-        server whenever a client requests a current capability document.
+        server on startup.
         """
         pass
 
+    def refresh(self):
+        """
+        Brings the class up to date with the data files. Called by server
+        whenever a client requests a current capability document. By
+        default, setup() is called again.
+        """
+        self.setup()
+
     def have_data(self, variable, vartype, init_time, valid_time):
         """
         Checks whether a file with data for the specified variable,
         type and times is known. This does not trigger a search for
         updated data files on disk.
         """
+        return (self._have_stored_data(variable, vartype, init_time, valid_time) or
+                self._get_derivation(variable, vartype, init_time, valid_time) is not None)
+
+    def _have_stored_data(self, variable, vartype, init_time, valid_time):
+        """
+        Checks whether the specified variable is stored in a known file, i.e.
+        without computing it as derived variable.
+        """
         try:
             self._determine_filename(
                 variable, vartype, init_time, valid_time, reload=False)
@@ -83,6 +105,19 @@ class NWPDataAccess(metaclass=ABCMeta):
         else:
             return True
 
+    def _get_derivation(self, variable, vartype, init_time, valid_time):
+        """
+        Returns the DerivedVariable (see mslib.mswms.derived_variables) by which
+        the specified variable can be computed, if it is not stored itself, but
+        all its dependencies are available. Otherwise, None is returned.
+        """
+        derived = derived_variables.get_derived_variable(variable)
+        if derived is None or self._have_stored_data(variable, vartype, init_time, valid_time):
+            return None
+        if all(self.have_data(_name, vartype, init_time, valid_time) for _name in derived.dependency_names):
+            return derived
+        return None
+
     def get_filename(self, variable, vartype, init_time, valid_time,
                      fullpath=False):
         """
@@ -109,6 +144,23 @@ class NWPDataAccess(metaclass=ABCMeta):
         else:
             return filename
 
+    def get_filenames(self, variable, vartype, init_time, valid_time,
+                      fullpath=False):
+        """
+        Similar to get_filename(), but returns the list of all files needed
+        for the variable. For a derived variable that is not stored itself,
+        these are the files of its dependencies.
+        """
+        derived = self._get_derivation(variable, vartype, init_time, valid_time)
+        if derived is None:
+            return [self.get_filename(variable, vartype, init_time, valid_time, fullpath=fullpath)]
+        filenames = []
+        for name in derived.dependency_names:
+            for filename in self.get_filenames(name, vartype, init_time, valid_time, fullpath=fullpath):
+                if filename not in filenames:
+                    filenames.append(filename)
+        return filenames
+
     @abstractmethod
     def is_reload_required(self, filenames):
         """
@@ -179,6 +231,24 @@ class NWPDataAccess(metaclass=ABCMeta):
         """
         pass
 
+    def get_inventory_hash(self):
+        """
+        Returns a hash of the available data, which changes whenever data
+        files are added, removed or modified. It is used e.g. to decide
+        whether a cached capabilities document is still up-to-date.
+
+        This implementation is based on the names, sizes and modification
+        times of all data files.
+        """
+        digest = hashlib.sha1()
+        for filename in sorted(self.get_all_datafiles()):
+            try:
+                stat = os.stat(os.path.join(self._root_path, filename))
+            except OSError:
+                continue
+            digest.update(f"{filename} {stat.st_size} {stat.st_mtime_ns}\n".encode("utf-8"))
+        return digest.hexdigest()
+
     _mfDatasetArgsDict = {}
 
     def mfDatasetArgs(self):
@@ -192,17 +262,226 @@ class NWPDataAccess(metaclass=ABCMeta):
         """
         return self._mfDatasetArgsDict
 
+    def get_coordinate_hashes(self, filenames):
+        """
+        Returns a dictionary mapping those of the given full file names, for
+        which the hashes of their coordinate variables are known and
+        up-to-date, to these hashes (see netCDF4tools.coordinate_hashes).
+        This implementation knows no hashes.
+        """
+        return {}
+
+
+def parse_file(root_path, filename, uses_init_time=True, uses_valid_time=True):
+    """
+    Extracts vertical type, elevations, init time, valid times, the
+    standard_names of all usable variables and the hashes of the coordinate
+    variables from a data file.
+
+    This is a module level function, so that it can be used by the worker
+    processes of DefaultDataAccess.setup().
+    """
+    elevations = {"filename": filename, "levels": [], "units": None}
+    with netCDF4tools.netcdf_lock, netCDF4.Dataset(os.path.join(root_path, filename)) as dataset:
+        netCDF4tools.share_variable_index(dataset)
+        time_name, time_var = netCDF4tools.identify_CF_time(dataset)
+        init_time = netCDF4tools.num2date(0, time_var.units)
+        if not uses_init_time:
+            init_time = None
+        valid_times = netCDF4tools.num2date(time_var[:], time_var.units)
+        if not uses_valid_time:
+            if len(valid_times) > 0:
+                raise IOError(f"Skipping file '{filename}: no support for valid time, but multiple "
+                              f"time steps present")
+            valid_times = [None]
+        lat_name, lat_var, lon_name, lon_var = netCDF4tools.identify_CF_lonlat(dataset)
+        vert_name, vert_var, _, _, vert_type = netCDF4tools.identify_vertical_axis(dataset)
+
+        if len(time_var.dimensions) != 1 or time_var.dimensions[0] != time_name:
+            raise IOError("Problem with time coordinate variable")
+        if len(lat_var.dimensions) != 1 or lat_var.dimensions[0] != lat_name:
+            raise IOError("Problem with latitude coordinate variable")
+        if len(lon_var.dimensions) != 1 or lon_var.dimensions[0] != lon_name:
+            raise IOError("Problem with longitude coordinate variable")
+
+        if vert_type != "sfc":
+            elevations = {
+                "filename": filename,
+                "levels": vert_var[:],
+                "units": getattr(vert_var, "units", "dimensionless")}
+
+        standard_names = []
+        for ncvarname, ncvar in dataset.variables.items():
+            if hasattr(ncvar, "standard_name") and (len(ncvar.dimensions) >= 3):
+                if (ncvar.dimensions[0] != time_name or
+                        ncvar.dimensions[-2] != lat_name or
+                        ncvar.dimensions[-1] != lon_name):
+                    logging.error("Skipping variable '%s' in file '%s': Incorrect order of dimensions",
+                                  ncvarname, filename)
+                    continue
+                if not hasattr(ncvar, "units"):
+                    logging.error("Skipping variable '%s' in file '%s': No units attribute",
+                                  ncvarname, filename)
+                    continue
+                if ncvar.standard_name != "time":
+                    try:
+                        units(ncvar.units)
+                    except (AttributeError, ValueError, pint.UndefinedUnitError, pint.DefinitionSyntaxError):
+                        logging.error("Skipping variable '%s' in file '%s': unparseable units attribute '%s'",
+                                      ncvarname, filename, ncvar.units)
+                        continue
+                if len(ncvar.shape) == 4 and vert_name in ncvar.dimensions:
+                    standard_names.append(ncvar.standard_name)
+                elif len(ncvar.shape) == 3 and vert_type == "sfc":
+                    standard_names.append(ncvar.standard_name)
+        coordinate_hashes = netCDF4tools.coordinate_hashes(dataset)
+    return {
+        "vert_type": vert_type,
+        "elevations": elevations,
+        "init_time": init_time,
+        "valid_times": valid_times,
+        "standard_names": standard_names,
+        "coordinate_hashes": coordinate_hashes
+    }
+
+
+def _inventory_items(tree):
+    """
+    Converts the nested dictionaries of a file tree into sorted lists, so
+    that their representation does not depend on the order of insertion.
+    """
+    if isinstance(tree, dict):
+        return sorted((str(_key), _inventory_items(_value)) for _key, _value in tree.items())
+    return str(tree)
+
+
+class FileMetadataIndex(object):
+    """
+    Persistent catalogue of the metadata extracted from data files by
+    DefaultDataAccess._parse_file().
+
+    The catalogue is an SQLite database. Entries are keyed by the full path
+    of a file and are only considered valid as long as size, modification
+    time and inode of the file are unchanged. This allows a freshly started
+    server to rebuild its file tree without opening any unchanged file.
+    """
+
+    _TIME_UNITS = "seconds since 1970-01-01T00:00:00Z"
+
+    def __init__(self, path):
+        self._path = path
+        self._connection = None
+
+    def __enter__(self):
+        self._connection = sqlite3.connect(self._path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, inode INTEGER, options TEXT, content TEXT)")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._connection.commit()
+        self._connection.close()
+        self._connection = None
+
+    @classmethod
+    def _dumps(cls, content):
+        """
+        Serializes the result of _parse_file() to JSON.
+        """
+        levels = np.asarray(content["elevations"]["levels"])
+        times = [content["init_time"]] + list(content["valid_times"])
+        return json.dumps({
+            "vert_type": content["vert_type"],
+            "elevations": {
+                "filename": content["elevations"]["filename"],
+                "levels": levels.tolist(),
+                "dtype": levels.dtype.str,
+                "units": content["elevations"]["units"]},
+            "times": [None if _x is None else float(netCDF4.date2num(_x, cls._TIME_UNITS)) for _x in times],
+            "standard_names": content["standard_names"],
+            "coordinate_hashes": content.get("coordinate_hashes", {})})
+
+    @classmethod
+    def _loads(cls, text):
+        """
+        Restores the result of _parse_file() from JSON.
+        """
+        data = json.loads(text)
+        times = [None if _x is None else netCDF4tools.num2date(_x, cls._TIME_UNITS) for _x in data["times"]]
+        elevations = data["elevations"]
+        return {
+            "vert_type": data["vert_type"],
+            "elevations": {
+                "filename": elevations["filename"],
+                "levels": np.asarray(elevations["levels"], dtype=elevations["dtype"]) if elevations["levels"] else [],
+                "units": elevations["units"]},
+            "init_time": times[0],
+            "valid_times": [None] if times[1:] == [None] else np.asarray(times[1:]),
+            "standard_names": data["standard_names"],
+            "coordinate_hashes": data.get("coordinate_hashes", {})}
+
+    def get(self, path, stat, options=""):
+        """
+        Returns the stored content for the file at path or None, if the file
+        is unknown or was modified since it has been stored.
+        """
+        row = self._connection.execute(
+            "SELECT content FROM files WHERE path = ? AND size = ? AND mtime = ? AND inode = ? AND options = ?",
+            (path, stat.st_size, stat.st_mtime, stat.st_ino, options)).fetchone()
+        if row is None:
+            return None
+        try:
+            return self._loads(row[0])
+        except (ValueError, KeyError, TypeError) as ex:
+            logging.error("Ignoring corrupt index entry for '%s' (%s: %s)", path, type(ex), ex)
+            return None
+
+    def put(self, path, stat, content, options=""):
+        """
+        Stores the content parsed from the file at path.
+        """
+        self._connection.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime, inode, options, content) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime, stat.st_ino, options, self._dumps(content)))
+
+    def purge(self, root_path):
+        """
+        Removes all entries of files below root_path that do not exist anymore.
+        """
+        root_path = os.path.normpath(root_path)
+        stale = [(_path,) for (_path,) in self._connection.execute("SELECT path FROM files")
+                 if os.path.dirname(_path) == root_path and not os.path.exists(_path)]
+        self._connection.executemany("DELETE FROM files WHERE path = ?", stale)
+
 
 class DefaultDataAccess(NWPDataAccess):
     """
     Subclass to NWPDataAccess for accessing properly constructed NetCDF files
     Constructor needs information on domain ID.
+
+    If index_path is given, the metadata of all parsed files is additionally
+    stored in a persistent FileMetadataIndex at that location, so that a
+    restarted server needs to open only new or modified files.
+
+    If setup_workers is larger than one, new or modified files are parsed by
+    a pool of this many processes. The results are merged in the same order
+    as in the serial case, so the resulting file tree is identical.
+
+    If chunk_cache is given, it sets the HDF5 chunk cache of the chunked
+    variables of NETCDF4 files, see MFDatasetCommonDims.
+
+    The object may be shared by the threads serving requests. setup() is
+    serialised by a lock and replaces the tree structure and the vertical
+    levels at once, so that readers see either the old or the new state.
     """
 
     # Workaround for the numerical issue concering the lon dimension in
     # NetCDF files produced by netcdf-java 4.3..
 
-    def __init__(self, rootpath, domain_id, skip_dim_check=[], **kwargs):
+    def __init__(self, rootpath, domain_id, skip_dim_check=[], index_path=None, setup_workers=1, chunk_cache=None,
+                 **kwargs):
         """
         Constructor takes the path of the data directory and determines whether
         this class employs different init_times or valid_times.
@@ -212,7 +491,14 @@ class DefaultDataAccess(NWPDataAccess):
         self._available_files = None
         self._filetree = None
         self._mfDatasetArgsDict = {"skip_dim_check": skip_dim_check}
+        if chunk_cache is not None:
+            self._mfDatasetArgsDict["chunk_cache"] = chunk_cache
         self._file_cache = {}
+        self._index = FileMetadataIndex(index_path) if index_path is not None else None
+        self._setup_workers = setup_workers
+        self._inventory_hash = None
+        self._file_mtimes = None
+        self._lock = threading.RLock()
 
     def _determine_filename(self, variable, vartype, init_time, valid_time, reload=True):
         """
@@ -220,93 +506,73 @@ class DefaultDataAccess(NWPDataAccess):
         the variable <variable> with type <vartype> of the forecast specified
         by <init_time> and <valid_time>.
         """
-        assert self._filetree is not None, "filetree is None. Forgot to call setup()?"
+        filetree = self._filetree
+        assert filetree is not None, "filetree is None. Forgot to call setup()?"
         try:
-            return self._filetree[vartype][init_time][variable][valid_time]
+            return filetree[vartype][init_time][variable][valid_time]
         except KeyError as ex:
             if reload:
-                self.setup()
+                with self._lock:
+                    # skip the setup if another thread did one while waiting for the lock
+                    if self._filetree is filetree:
+                        self.setup()
                 return self._determine_filename(variable, vartype, init_time, valid_time, reload=False)
             else:
                 logging.error("Could not identify filename. %s %s %s %s %s %s",
                               variable, vartype, init_time, valid_time, type(ex), ex)
                 raise ValueError(f"variable type {vartype} not available for variable {variable}")
 
+    def _have_stored_data(self, variable, vartype, init_time, valid_time):
+        """
+        See NWPDataAccess._have_stored_data(), but does not log unknown variables.
+        """
+        assert self._filetree is not None, "filetree is None. Forgot to call setup()?"
+        return valid_time in self._filetree.get(vartype, {}).get(init_time, {}).get(variable, {})
+
     def is_reload_required(self, filenames):
         return False
 
     def _parse_file(self, filename):
-        elevations = {"filename": filename, "levels": [], "units": None}
-        with netCDF4.Dataset(os.path.join(self._root_path, filename)) as dataset:
-            time_name, time_var = netCDF4tools.identify_CF_time(dataset)
-            init_time = netCDF4tools.num2date(0, time_var.units)
-            if not self.uses_inittime_dimension():
-                init_time = None
-            valid_times = netCDF4tools.num2date(time_var[:], time_var.units)
-            if not self.uses_validtime_dimension():
-                if len(valid_times) > 0:
-                    raise IOError(f"Skipping file '{filename}: no support for valid time, but multiple "
-                                  f"time steps present")
-                valid_times = [None]
-            lat_name, lat_var, lon_name, lon_var = netCDF4tools.identify_CF_lonlat(dataset)
-            vert_name, vert_var, _, _, vert_type = netCDF4tools.identify_vertical_axis(dataset)
-
-            if len(time_var.dimensions) != 1 or time_var.dimensions[0] != time_name:
-                raise IOError("Problem with time coordinate variable")
-            if len(lat_var.dimensions) != 1 or lat_var.dimensions[0] != lat_name:
-                raise IOError("Problem with latitude coordinate variable")
-            if len(lon_var.dimensions) != 1 or lon_var.dimensions[0] != lon_name:
-                raise IOError("Problem with longitude coordinate variable")
-
-            if vert_type != "sfc":
-                elevations = {
-                    "filename": filename,
-                    "levels": vert_var[:],
-                    "units": getattr(vert_var, "units", "dimensionless")}
-                if vert_type in self._elevations:
-                    if len(vert_var[:]) != len(self._elevations[vert_type]["levels"]):
-                        raise IOError(f"Number of vertical levels does not fit to levels of "
-                                      f"previous file '{self._elevations[vert_type]['filename']}'.")
-                    if not np.allclose(vert_var[:], self._elevations[vert_type]["levels"]):
-                        raise IOError(f"vertical levels do not fit to levels of previous "
-                                      f"file '{self._elevations[vert_type]['filename']}'.")
-                    if elevations["units"] != self._elevations[vert_type]["units"]:
-                        raise IOError(f"vertical level units do not match previous "
-                                      f"file '{self._elevations[vert_type]['filename']}'")
-
-            standard_names = []
-            for ncvarname, ncvar in dataset.variables.items():
-                if hasattr(ncvar, "standard_name") and (len(ncvar.dimensions) >= 3):
-                    if (ncvar.dimensions[0] != time_name or
-                            ncvar.dimensions[-2] != lat_name or
-                            ncvar.dimensions[-1] != lon_name):
-                        logging.error("Skipping variable '%s' in file '%s': Incorrect order of dimensions",
-                                      ncvarname, filename)
-                        continue
-                    if not hasattr(ncvar, "units"):
-                        logging.error("Skipping variable '%s' in file '%s': No units attribute",
-                                      ncvarname, filename)
-                        continue
-                    if ncvar.standard_name != "time":
-                        try:
-                            units(ncvar.units)
-                        except (AttributeError, ValueError, pint.UndefinedUnitError, pint.DefinitionSyntaxError):
-                            logging.error("Skipping variable '%s' in file '%s': unparseable units attribute '%s'",
-                                          ncvarname, filename, ncvar.units)
-                            continue
-                    if len(ncvar.shape) == 4 and vert_name in ncvar.dimensions:
-                        standard_names.append(ncvar.standard_name)
-                    elif len(ncvar.shape) == 3 and vert_type == "sfc":
-                        standard_names.append(ncvar.standard_name)
-        return {
-            "vert_type": vert_type,
-            "elevations": elevations,
-            "init_time": init_time,
-            "valid_times": valid_times,
-            "standard_names": standard_names
-        }
-
-    def _add_to_filetree(self, filename, content):
+        return parse_file(self._root_path, filename,
+                          self.uses_inittime_dimension(), self.uses_validtime_dimension())
+
+    def _check_elevations(self, filename, content, elevations=None):
+        """
+        Checks that the vertical levels of a parsed file agree with the ones
+        of previously added files of the same vertical type, which are taken
+        from <elevations> if given.
+        """
+        if elevations is None:
+            elevations = self._elevations
+        vert_type, file_elevations = content["vert_type"], content["elevations"]
+        if vert_type != "sfc" and vert_type in elevations:
+            if len(file_elevations["levels"]) != len(elevations[vert_type]["levels"]):
+                raise IOError(f"Number of vertical levels does not fit to levels of "
+                              f"previous file '{elevations[vert_type]['filename']}'.")
+            if not np.allclose(file_elevations["levels"], elevations[vert_type]["levels"]):
+                raise IOError(f"vertical levels do not fit to levels of previous "
+                              f"file '{elevations[vert_type]['filename']}'.")
+            if file_elevations["units"] != elevations[vert_type]["units"]:
+                raise IOError(f"vertical level units do not match previous "
+                              f"file '{elevations[vert_type]['filename']}'")
+
+    def _elevations_match(self, content, elevations=None):
+        """
+        Checks if the vertical levels of already parsed content agree with
+        the ones of previously added files of the same vertical type, which
+        are taken from <elevations> if given.
+        """
+        if elevations is None:
+            elevations = self._elevations
+        vert_type = content["vert_type"]
+        if vert_type == "sfc":
+            return True
+        if vert_type not in elevations:
+            elevations[vert_type] = content["elevations"]
+        return ((len(elevations[vert_type]["levels"]) == len(content["elevations"]["levels"])) and
+                np.allclose(elevations[vert_type]["levels"], content["elevations"]["levels"]))
+
+    def _add_to_filetree(self, filename, content, filetree=None):
         logging.info("File '%s' identified as '%s' type", filename, content["vert_type"])
         logging.info("Found init time '%s', %s valid_times and %s standard_names",
                      content["init_time"], len(content["valid_times"]), len(content["standard_names"]))
@@ -317,69 +583,309 @@ class DefaultDataAccess(NWPDataAccess):
         else:
             logging.debug("valid_times='%s' standard_names='%s'",
                           content["valid_times"], content["standard_names"])
-        leaf = self._filetree.setdefault(content["vert_type"], {}).setdefault(content["init_time"], {})
+        if filetree is None:
+            filetree = self._filetree
+        leaf = filetree.setdefault(content["vert_type"], {}).setdefault(content["init_time"], {})
         for standard_name in content["standard_names"]:
             var_leaf = leaf.setdefault(standard_name, {})
             for valid_time in content["valid_times"]:
                 if valid_time in var_leaf:
+                    # the file sorting first wins, also if files are not added in order
+                    first_file, second_file = sorted([var_leaf[valid_time], filename])
                     logging.warning(
                         "some data was found twice! vartype='%s' init_time='%s' standard_name='%s' "
                         "valid_time='%s' first_file='%s' second_file='%s'",
                         content["vert_type"], content["init_time"], standard_name,
-                        valid_time, var_leaf[valid_time], filename)
+                        valid_time, first_file, second_file)
+                    var_leaf[valid_time] = first_file
                 else:
                     var_leaf[valid_time] = filename
 
+    def _apply_changes(self, changed, removed):
+        """
+        Updates the tree structure with the given sets of changed (i.e. added
+        or modified) and removed files, as reported by a FileWatcher. Only the
+        changed files are parsed and only their leaves are updated. If several
+        files hold the same data, the first one in sorted order wins, as in
+        setup(). The tree is only rebuilt completely if the vertical levels
+        of a type change.
+
+        The affected parts of the tree are copied before being modified, so
+        that readers see either the old or the new state.
+        """
+        with self._lock:
+            old_contents = {}
+            for filename in sorted(removed | changed):
+                if filename in self._file_cache:
+                    logging.info("Removing candidate '%s'", filename)
+                    old_contents[filename] = self._file_cache.pop(filename)[1]
+            new_files = sorted(
+                _filename for _filename in changed if os.path.exists(os.path.join(self._root_path, _filename)))
+            available_files = sorted((set(self._available_files) - removed - changed) | set(new_files))
+
+            if self._index is not None:
+                with self._index:
+                    new_contents = list(self._iter_contents(new_files))
+            else:
+                new_contents = list(self._iter_contents(new_files))
+            contents = list(old_contents.values()) + [_x[3] for _x in new_contents]
+
+            elevations = self._update_elevations(
+                available_files, {_x["vert_type"] for _x in contents},
+                {_x[0]: _x[3] for _x in new_contents})
+            if elevations is None:
+                logging.info("Vertical levels changed, rebuilding the tree structure")
+                if self._index is not None:
+                    with self._index:
+                        filetree, elevations = self._build_filetree(available_files)
+                else:
+                    filetree, elevations = self._build_filetree(available_files)
+                self._available_files, self._filetree, self._elevations = available_files, filetree, elevations
+                self._inventory_hash = None
+                return
+
+            filetree = dict(self._filetree)
+            for vert_type, init_time in {(_x["vert_type"], _x["init_time"]) for _x in contents}:
+                if vert_type not in filetree:
+                    continue
+                if filetree[vert_type] is self._filetree[vert_type]:
+                    filetree[vert_type] = dict(filetree[vert_type])
+                if init_time in filetree[vert_type]:
+                    filetree[vert_type][init_time] = {
+                        _name: dict(_var_leaf) for _name, _var_leaf in filetree[vert_type][init_time].items()}
+
+            # Remove the leaves held by the old files.
+            orphans = set()
+            for filename, content in old_contents.items():
+                leaf = filetree.get(content["vert_type"], {}).get(content["init_time"], {})
+                for standard_name in content["standard_names"]:
+                    var_leaf = leaf.get(standard_name, {})
+                    for valid_time in content["valid_times"]:
+                        if var_leaf.get(valid_time) == filename:
+                            del var_leaf[valid_time]
+                            orphans.add((content["vert_type"], content["init_time"], standard_name, valid_time))
+
+            for filename, fullname, stat, content, cached in new_contents:
+                if self._accept_content(filename, fullname, stat, content, cached, elevations):
+                    self._add_to_filetree(filename, content, filetree)
+
+            # Other files holding the same data as the old ones take their place.
+            orphan_groups = {_x[:2] for _x in orphans}
+            for filename in available_files:
+                if not orphans:
+                    break
+                if filename not in self._file_cache or filename in old_contents:
+                    continue
+                content = self._file_cache[filename][1]
+                if (content["vert_type"], content["init_time"]) not in orphan_groups or \
+                        not self._elevations_match(content, elevations):
+                    continue
+                leaf = filetree[content["vert_type"]][content["init_time"]]
+                for standard_name in content["standard_names"]:
+                    for valid_time in content["valid_times"]:
+                        key = (content["vert_type"], content["init_time"], standard_name, valid_time)
+                        if key in orphans:
+                            orphans.remove(key)
+                            var_leaf = leaf.setdefault(standard_name, {})
+                            if valid_time not in var_leaf or filename < var_leaf[valid_time]:
+                                var_leaf[valid_time] = filename
+
+            # Drop the parts of the tree that became empty.
+            for vert_type, init_time in orphan_groups:
+                leaf = filetree[vert_type][init_time]
+                for standard_name in [_name for _name, _var_leaf in leaf.items() if not _var_leaf]:
+                    del leaf[standard_name]
+                if not leaf:
+                    del filetree[vert_type][init_time]
+                if not filetree[vert_type]:
+                    del filetree[vert_type]
+
+            self._available_files, self._filetree, self._elevations = available_files, filetree, elevations
+            self._inventory_hash = None
+
+    def _update_elevations(self, available_files, vert_types, new_contents):
+        """
+        Returns the vertical levels after files of the given vertical types
+        changed, determining the first file of each of these types and its
+        levels anew.
+        Returns None if the levels of a type change or if files skipped so
+        far would need to be parsed, which requires a rebuild of the tree.
+        """
+        elevations = dict(self._elevations)
+        for vert_type in vert_types - {"sfc"}:
+            first, content = None, None
+            for filename in available_files:
+                content = new_contents.get(filename, self._file_cache.get(filename, (None, None))[1])
+                if content is not None and content["vert_type"] == vert_type:
+                    first = filename
+                    break
+            if vert_type in elevations:
+                if elevations[vert_type]["filename"] == first and first not in new_contents:
+                    continue
+                if any(_filename not in self._file_cache and _filename not in new_contents
+                       for _filename in available_files):
+                    return None
+            if first is None:
+                elevations.pop(vert_type, None)
+                continue
+            if vert_type in elevations:
+                try:
+                    self._check_elevations(first, content, elevations)
+                except IOError:
+                    return None
+            elevations[vert_type] = content["elevations"]
+        return elevations
+
     def setup(self):
-        # Get a list of the available data files.
-        self._available_files = [
-            _filename for _filename in sorted(os.listdir(self._root_path)) if self._domain_id in _filename]
-        logging.info("Files identified for domain '%s': %s",
-                     self._domain_id, self._available_files)
-
-        for filename in list(self._file_cache):
-            if filename not in self._available_files:
-                del self._file_cache[filename]
-
-        self._filetree = {}
-        self._elevations = {"sfc": {"filename": None, "levels": [], "units": None}}
-
-        # Build the tree structure.
-        for filename in self._available_files:
-            mtime = os.path.getmtime(os.path.join(self._root_path, filename))
-            if (filename in self._file_cache) and (mtime == self._file_cache[filename][0]):
+        with self._lock:
+            # Get a list of the available data files.
+            available_files = [
+                _filename for _filename in sorted(os.listdir(self._root_path)) if self._domain_id in _filename]
+            logging.info("Files identified for domain '%s': %s",
+                         self._domain_id, available_files)
+
+            for filename in list(self._file_cache):
+                if filename not in available_files:
+                    del self._file_cache[filename]
+
+            if self._index is not None:
+                with self._index:
+                    self._index.purge(self._root_path)
+                    filetree, elevations = self._build_filetree(available_files)
+            else:
+                filetree, elevations = self._build_filetree(available_files)
+
+            self._available_files, self._filetree, self._elevations = available_files, filetree, elevations
+            self._inventory_hash = None
+            self._file_mtimes = None
+
+    def refresh(self):
+        """
+        Applies the files added, modified or removed since the last setup()
+        or refresh() to the tree structure, without rebuilding it if nothing
+        changed. Returns the set of changed or removed files.
+        """
+        with self._lock:
+            if self._filetree is None:
+                self.setup()
+                return set(self._available_files)
+            file_mtimes = {}
+            for filename in os.listdir(self._root_path):
+                if self._domain_id in filename:
+                    try:
+                        file_mtimes[filename] = os.stat(os.path.join(self._root_path, filename)).st_mtime
+                    except OSError:
+                        continue
+            previous = self._file_mtimes
+            if previous is None:
+                # files skipped by the last setup() are unknown and tried again
+                previous = {_filename: _entry[0] for _filename, _entry in self._file_cache.items()}
+            changed = {_filename for _filename, _mtime in file_mtimes.items() if previous.get(_filename) != _mtime}
+            removed = set(self._available_files) - set(file_mtimes)
+            if changed or removed:
+                self._apply_changes(changed, removed)
+            self._file_mtimes = file_mtimes
+            return changed | removed
+
+    def _build_filetree(self, available_files):
+        """
+        Returns a new tree structure and the vertical levels of the given
+        files.
+        """
+        filetree = {}
+        elevations = {"sfc": {"filename": None, "levels": [], "units": None}}
+        for filename, fullname, stat, content, cached in self._iter_contents(available_files):
+            if self._accept_content(filename, fullname, stat, content, cached, elevations):
+                self._add_to_filetree(filename, content, filetree)
+        return filetree, elevations
+
+    def _iter_contents(self, filenames):
+        """
+        Yields filename, full name, stat, parsed content and whether the
+        content was cached for the given files in order, skipping files that
+        cannot be parsed. Files are only parsed if neither the in-memory cache
+        nor the persistent index (if any) hold up-to-date information about them.
+        """
+        index_options = f"{self.uses_inittime_dimension()}/{self.uses_validtime_dimension()}"
+        candidates = []
+        for filename in filenames:
+            fullname = os.path.normpath(os.path.join(self._root_path, filename))
+            stat = os.stat(fullname)
+            content = None
+            if (filename in self._file_cache) and (stat.st_mtime == self._file_cache[filename][0]):
                 logging.info("Using cached candidate '%s'", filename)
                 content = self._file_cache[filename][1]
-                if content["vert_type"] != "sfc":
-                    if content["vert_type"] not in self._elevations:
-                        self._elevations[content["vert_type"]] = content["elevations"]
-                    if ((len(self._elevations[content["vert_type"]]["levels"]) !=
-                         len(content["elevations"]["levels"])) or
-                        (not np.allclose(
-                         self._elevations[content["vert_type"]]["levels"],
-                         content["elevations"]["levels"]))):
-                        logging.error("Skipping file '%s' due to elevation mismatch", filename)
-                        continue
-            else:
+            elif self._index is not None:
+                content = self._index.get(fullname, stat, index_options)
+                if content is not None:
+                    logging.info("Using indexed candidate '%s'", filename)
+                    self._file_cache[filename] = (stat.st_mtime, content)
+            candidates.append((filename, fullname, stat, content))
+
+        futures = {}
+        executor = None
+        to_parse = [_filename for _filename, _, _, _content in candidates if _content is None]
+        if self._setup_workers > 1 and len(to_parse) > 1:
+            logging.info("Parsing %s files with %s worker processes", len(to_parse), self._setup_workers)
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=self._setup_workers)
+            futures = {
+                _filename: executor.submit(
+                    parse_file, self._root_path, _filename,
+                    self.uses_inittime_dimension(), self.uses_validtime_dimension())
+                for _filename in to_parse}
+
+        try:
+            for filename, fullname, stat, content in candidates:
+                if content is not None:
+                    yield filename, fullname, stat, content, True
+                    continue
                 if filename in self._file_cache:
                     del self._file_cache[filename]
                 logging.info("Opening candidate '%s'", filename)
                 try:
-                    content = self._parse_file(filename)
+                    if filename in futures:
+                        content = futures[filename].result()
+                    else:
+                        content = self._parse_file(filename)
                 except IOError as ex:
                     logging.error("Skipping file '%s' (%s: %s)", filename, type(ex), ex)
                     continue
-                self._file_cache[filename] = (mtime, content)
-                if content["vert_type"] not in self._elevations:
-                    self._elevations[content["vert_type"]] = content["elevations"]
-            self._add_to_filetree(filename, content)
+                yield filename, fullname, stat, content, False
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def _accept_content(self, filename, fullname, stat, content, cached, elevations):
+        """
+        Checks the vertical levels of a file against <elevations> and returns
+        whether it may be added to the tree. Newly parsed files are stored in
+        the caches and define the levels of their type if they are the first.
+        """
+        if cached:
+            if not self._elevations_match(content, elevations):
+                logging.error("Skipping file '%s' due to elevation mismatch", filename)
+                return False
+            return True
+        try:
+            self._check_elevations(filename, content, elevations)
+        except IOError as ex:
+            logging.error("Skipping file '%s' (%s: %s)", filename, type(ex), ex)
+            return False
+        self._file_cache[filename] = (stat.st_mtime, content)
+        if self._index is not None:
+            self._index.put(fullname, stat, content,
+                            f"{self.uses_inittime_dimension()}/{self.uses_validtime_dimension()}")
+        if content["vert_type"] not in elevations:
+            elevations[content["vert_type"]] = content["elevations"]
+        return True
 
     def get_init_times(self):
         """
         Returns a list of available forecast init times (base times).
         """
+        filetree = self._filetree
         init_times = set(itertools.chain.from_iterable(
-            self._filetree[_x].keys() for _x in self._filetree))
+            filetree[_x].keys() for _x in filetree))
         return sorted(init_times)
 
     def get_valid_times(self, variable, vartype, init_time):
@@ -387,11 +893,28 @@ class DefaultDataAccess(NWPDataAccess):
         Returns a list of available valid times for the specified
         variable at the specified init time.
         """
-        try:
-            return sorted(self._filetree[vartype][init_time][variable])
-        except KeyError as ex:
-            logging.error("Could not find times! %s %s", type(ex), ex)
+        valid_times = self._get_valid_times(variable, vartype, init_time)
+        if valid_times is None:
+            logging.error("Could not find times! %s %s %s", variable, vartype, init_time)
             return []
+        return sorted(valid_times)
+
+    def _get_valid_times(self, variable, vartype, init_time):
+        """
+        Returns the set of valid times at which the variable is stored or, for
+        a derived variable, all its dependencies are available. None is
+        returned for unknown variables.
+        """
+        leaf = self._filetree.get(vartype, {}).get(init_time, {})
+        if variable in leaf:
+            return set(leaf[variable])
+        derived = derived_variables.get_derived_variable(variable)
+        if derived is None:
+            return None
+        valid_times = [self._get_valid_times(_name, vartype, init_time) for _name in derived.dependency_names]
+        if any(_x is None for _x in valid_times):
+            return None
+        return set.intersection(*valid_times)
 
     def get_elevations(self, vert_type):
         """
@@ -411,11 +934,11 @@ class DefaultDataAccess(NWPDataAccess):
         of all available init times.
         """
         all_valid_times = []
-        if vartype not in self._filetree:
+        filetree = self._filetree
+        if vartype not in filetree:
             return []
-        for init_time in self._filetree[vartype]:
-            if variable in self._filetree[vartype][init_time]:
-                all_valid_times.extend(list(self._filetree[vartype][init_time][variable]))
+        for init_time in filetree[vartype]:
+            all_valid_times.extend(self._get_valid_times(variable, vartype, init_time) or [])
         return sorted(set(all_valid_times))
 
     def get_all_datafiles(self):
@@ -424,6 +947,41 @@ class DefaultDataAccess(NWPDataAccess):
         """
         return self._available_files
 
+    def get_coordinate_hashes(self, filenames):
+        """
+        Returns the hashes of the coordinate variables recorded on parsing the
+        given full file names, for all files not modified since then.
+        """
+        result = {}
+        for fullname in filenames:
+            filename = os.path.basename(fullname)
+            if filename not in self._file_cache:
+                continue
+            mtime, content = self._file_cache[filename]
+            try:
+                if os.path.getmtime(fullname) != mtime:
+                    continue
+            except OSError:
+                continue
+            if content.get("coordinate_hashes"):
+                result[fullname] = content["coordinate_hashes"]
+        return result
+
+    def get_inventory_hash(self):
+        """
+        Returns a hash of the file tree and the vertical levels, i.e. of all
+        information about the available data. In contrast to the super
+        method, files modified without changing their content keep the hash.
+        """
+        with self._lock:
+            if self._inventory_hash is None:
+                elevations = sorted(
+                    (_vert_type, [float(_x) for _x in _elevations["levels"]], _elevations["units"])
+                    for _vert_type, _elevations in self._elevations.items())
+                self._inventory_hash = hashlib.sha1(
+                    repr((_inventory_items(self._filetree), elevations)).encode("utf-8")).hexdigest()
+            return self._inventory_hash
+
 
 # to retain backwards compatibility
 CachedDataAccess = DefaultDataAccess
@@ -432,10 +990,50 @@ CachedDataAccess = DefaultDataAccess
 class WatchModificationDataAccess(DefaultDataAccess):
     """
     Subclass to CachedDataAccess that constantly watches for modified netCDF files.
-    Imposes a heavy performance cost. It is mostly thought for use when setting up
-    a server in contrast to operation use.
+
+    Changes are reported by a FileWatcher (see mslib.mswms.filewatcher) and
+    applied incrementally to the file tree, so that only added or modified
+    files need to be opened. The "inotify" backend is event driven and cheap,
+    the "polling" backend lists the data directory at most every
+    <poll_interval> seconds, so that requests do not scan it each time.
+    It is mostly thought for use when setting up a server in contrast to
+    operation use.
     """
 
+    def __init__(self, rootpath, domain_id, watcher_backend="auto", poll_interval=5, **kwargs):
+        super().__init__(rootpath, domain_id, **kwargs)
+        self._watcher_backend = watcher_backend
+        self._poll_interval = poll_interval
+        self._watcher = None
+
+    def setup(self):
+        with self._lock:
+            if self._watcher is None:
+                # Start watching before the initial scan, so that no change is lost.
+                self._watcher = filewatcher.create_file_watcher(
+                    self._root_path, self._domain_id, backend=self._watcher_backend, interval=self._poll_interval)
+                super().setup()
+            else:
+                self.refresh()
+
+    def refresh(self):
+        """
+        Applies all changes reported by the watcher since the last call.
+        Returns the set of changed or removed files.
+        """
+        with self._lock:
+            changes = self._watcher.poll() if self._watcher is not None else None
+            if changes is None:
+                if self._watcher is not None:
+                    self._watcher.close()
+                    self._watcher = None
+                self.setup()
+                return set(self._file_cache)
+            changed, removed = changes
+            if changed or removed:
+                self._apply_changes(changed, removed)
+            return changed | removed
+
     def _determine_filename(self, variable, vartype, init_time, valid_time, reload=True):
         """
         Determines the name of the data file that contains
@@ -443,34 +1041,10 @@ class WatchModificationDataAccess(DefaultDataAccess):
         by <init_time> and <valid_time>.
         """
         assert self._filetree is not None, "filetree is None. Forgot to call setup()?"
-        try:
-            filename = self._filetree[vartype][init_time][variable][valid_time]
-            mtime = os.path.getmtime(os.path.join(self._root_path, filename))
-            if filename in self._file_cache and mtime == self._file_cache[filename][0]:
-                return filename
-            raise KeyError
-        except (KeyError, OSError) as ex:
-            if reload:
-                self.setup()
-                self._determine_filename(self, variable, vartype, init_time, valid_time, reload=False)
-            else:
-                logging.error("Could not identify filename. %s %s %s %s %s %s",
-                              variable, vartype, init_time, valid_time, type(ex), ex)
-                raise ValueError(f"variable type {vartype} not available for variable {variable}")
+        if reload:
+            self.refresh()
+        return super()._determine_filename(variable, vartype, init_time, valid_time, reload=False)
 
     def is_reload_required(self, filenames):
-        try:
-            for filename in filenames:
-                basename = os.path.basename(filename)
-                if basename not in self._file_cache:
-                    raise OSError
-                fullname = os.path.join(self._root_path, basename)
-                if not os.path.exists(fullname):
-                    raise OSError
-                mtime = os.path.getmtime(fullname)
-                if mtime != self._file_cache[basename][0]:
-                    raise OSError
-        except OSError:
-            self.setup()
-            return True
-        return False
+        changes = self.refresh()
+        return any(os.path.basename(_filename) in changes for _filename in filenames)
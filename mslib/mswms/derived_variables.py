@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+
+    mslib.mswms.derived_variables
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Registry of variables that are not stored in the data files, but are
+    computed on demand by the plot drivers from the variables they depend
+    on, e.g. the potential temperature from temperature and pressure.
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import mslib.mswms.generics as generics
+from mslib.utils import netCDF4tools, thermolib
+from mslib.utils.units import convert_to
+
+
+class DerivedVariable(object):
+    """
+    Declares that the variable <standard_name> with unit <unit> is computed
+    by <function> from the variables given by the list of (standard_name,
+    unit) tuples <dependencies>. The function is called with plain arrays of
+    the dependencies in the declared order and units. All dependencies must
+    have the same dimensions.
+    """
+
+    def __init__(self, standard_name, dependencies, function, unit):
+        self.standard_name = standard_name
+        self.dependencies = list(dependencies)
+        self.function = function
+        self.unit = unit
+
+    @property
+    def dependency_names(self):
+        return [_name for _name, _ in self.dependencies]
+
+    def compute(self, arrays, array_units):
+        """
+        Computes the variable from the (masked) arrays of the dependencies,
+        which are given in the units <array_units>. Masked input values and
+        values outside the domain of the function yield masked results.
+        """
+        values = []
+        for (_, unit), array, array_unit in zip(self.dependencies, arrays, array_units):
+            array = np.ma.filled(np.ma.asarray(array, dtype=float), np.nan)
+            if array_unit is not None and array_unit != unit:
+                array = convert_to(array, array_unit, unit)
+            values.append(array)
+        with np.errstate(all="ignore"):
+            return np.ma.masked_invalid(self.function(*values))
+
+
+_DERIVED_VARIABLES = {}
+
+
+def _required_names(derived):
+    """
+    Returns the names of all variables <derived> depends on, also indirectly
+    through other derived variables.
+    """
+    names, pending = set(), list(derived.dependency_names)
+    while pending:
+        name = pending.pop()
+        if name not in names:
+            names.add(name)
+            if name in _DERIVED_VARIABLES:
+                pending.extend(_DERIVED_VARIABLES[name].dependency_names)
+    return names
+
+
+def register_derived_variable(standard_name, dependencies, function, unit, title=None):
+    """
+    Registers or replaces a derived variable, see DerivedVariable.
+
+    The standard_name is also registered with the generics module, so that
+    generic plotting layers are generated for it. As for
+    generics.register_standard_name, this must happen before the styles
+    modules are imported.
+    """
+    derived = DerivedVariable(standard_name, dependencies, function, unit)
+    if standard_name in _required_names(derived):
+        raise ValueError(f"derived variable '{standard_name}' depends on itself")
+    _DERIVED_VARIABLES[standard_name] = derived
+    generics.register_standard_name(standard_name, unit, title=title)
+
+
+def get_derived_variable(standard_name):
+    """
+    Returns the DerivedVariable registered for <standard_name> or None.
+    """
+    return _DERIVED_VARIABLES.get(standard_name)
+
+
+def get_derived_names():
+    """
+    Returns the sorted standard_names of all registered derived variables.
+    """
+    return sorted(_DERIVED_VARIABLES)
+
+
+def _index_key(index):
+    """
+    Returns a hashable representation of an index of integers and slices.
+    """
+    if not isinstance(index, tuple):
+        index = (index,)
+    return tuple((_x.start, _x.stop, _x.step) if isinstance(_x, slice) else _x for _x in index)
+
+
+class DerivedFieldCache(object):
+    """
+    Thread-safe LRU cache of computed fields of derived variables.
+
+    The fields are keyed by the files they are computed from, the
+    standard_name and the read hyperslab, i.e. time step, level and bounding
+    box. The least recently used fields are evicted first if the fields take
+    more than <max_bytes> bytes.
+    """
+
+    def __init__(self, max_bytes=64 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, create):
+        """
+        Returns a copy of the field cached under <key>. On a miss, the field
+        is computed by calling <create> (without holding the lock) and stored
+        in the cache.
+        """
+        with self._lock:
+            field = self._entries.get(key)
+            if field is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return field.copy()
+            self.misses += 1
+        field = create()
+        size = field.nbytes + np.ma.getmaskarray(field).nbytes
+        with self._lock:
+            if key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = field
+                self._bytes += size
+                self._evict()
+        return field.copy()
+
+    def _evict(self):
+        while self._entries and self._bytes > self.max_bytes:
+            _, field = self._entries.popitem(last=False)
+            self._bytes -= field.nbytes + np.ma.getmaskarray(field).nbytes
+            self.evictions += 1
+
+    def discard(self, dataset_key):
+        """
+        Removes all fields computed from the dataset with the given key.
+        """
+        with self._lock:
+            for key in [_key for _key in self._entries if _key[0] == dataset_key]:
+                field = self._entries.pop(key)
+                self._bytes -= field.nbytes + np.ma.getmaskarray(field).nbytes
+
+    def info(self):
+        """
+        Returns a dictionary with the counters and the current size of the cache.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self._bytes}
+
+    def clear(self):
+        """
+        Removes all entries from the cache and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+
+class DerivedField(object):
+    """
+    Read-only stand-in for the NetCDF variable of a derived variable in an
+    open dataset.
+
+    Indexing reads the same hyperslab of the <variables> of the dependencies
+    (NetCDF variables or DerivedFields themselves) and computes the derived
+    variable from them. If a <cache> is given, the results are stored in it
+    under <dataset_key>, which identifies the files of the dataset.
+    """
+
+    def __init__(self, derived, variables, cache=None, dataset_key=None):
+        self.derived = derived
+        self.variables = variables
+        self.cache = cache
+        self.dataset_key = dataset_key
+        self.standard_name = derived.standard_name
+        self.units = derived.unit
+        self.dimensions = variables[0].dimensions
+        self.shape = variables[0].shape
+        self.ndim = len(self.shape)
+
+    def ncattrs(self):
+        return ["standard_name", "units"]
+
+    def chunking(self):
+        # the variables of the dependencies are read by chunks, if suitable
+        return None
+
+    def __getitem__(self, index):
+        if self.cache is None:
+            return self._compute(index)
+        key = (self.dataset_key, self.standard_name, _index_key(index))
+        try:
+            hash(key)
+        except TypeError:
+            return self._compute(index)
+        return self.cache.get(key, lambda: self._compute(index))
+
+    def _compute(self, index):
+        logging.debug("computing derived variable <%s> from %s", self.standard_name, self.derived.dependency_names)
+        arrays = [netCDF4tools.read_hyperslab(_var, index) for _var in self.variables]
+        return self.derived.compute(arrays, [getattr(_var, "units", None) for _var in self.variables])
+
+
+register_derived_variable(
+    "air_potential_temperature",
+    [("air_pressure", "Pa"), ("air_temperature", "K")],
+    thermolib.pot_temp, "K")
+register_derived_variable(
+    "equivalent_potential_temperature",
+    [("air_pressure", "Pa"), ("air_temperature", "K"), ("specific_humidity", "kg/kg")],
+    thermolib.eqpt_approx, "K")
+register_derived_variable(
+    "relative_humidity",
+    [("air_pressure", "Pa"), ("air_temperature", "K"), ("specific_humidity", "kg/kg")],
+    thermolib.rel_hum, "percent")
+register_derived_variable(
+    "upward_air_velocity",
+    [("lagrangian_tendency_of_air_pressure", "Pa/s"), ("air_pressure", "Pa"), ("air_temperature", "K")],
+    thermolib.omega_to_w, "m/s")
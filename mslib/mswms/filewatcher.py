@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+
+    mslib.mswms.filewatcher
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Watchers reporting added, modified and removed files of a data directory.
+
+    The watchers are used by WatchModificationDataAccess to update its file
+    tree incrementally instead of rescanning the whole data directory. The
+    polling backend needs no additional dependency, the inotify backend
+    requires the optional inotify_simple package (Linux only).
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from abc import ABCMeta, abstractmethod
+import logging
+import os
+import time
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+class FileWatcher(metaclass=ABCMeta):
+    """
+    Abstract superclass of all file watchers.
+
+    A watcher observes all files in directory <path> whose name contains
+    <domain_id>. Each call of poll() reports the changes since the previous
+    call (or since construction of the watcher).
+    """
+
+    def __init__(self, path, domain_id):
+        self._path = path
+        self._domain_id = domain_id
+
+    def _is_relevant(self, filename):
+        return self._domain_id in filename
+
+    @abstractmethod
+    def poll(self):
+        """
+        Returns a tuple (changed, removed) of sets of filenames (without path).
+        <changed> contains added as well as modified files. None is returned,
+        if the watcher lost track of the directory and the caller needs to
+        rescan it completely.
+        """
+        pass
+
+    def close(self):
+        """
+        Releases all resources held by the watcher.
+        """
+        pass
+
+
+class PollingFileWatcher(FileWatcher):
+    """
+    Watcher comparing size and modification time of all files with the state
+    seen at the last call.
+
+    The directory is scanned at most once per <interval> seconds, calls in
+    between report no changes.
+    """
+
+    def __init__(self, path, domain_id, interval=0):
+        super().__init__(path, domain_id)
+        self._interval = interval
+        self._last_poll = time.monotonic()
+        self._state = self._scan()
+
+    def _scan(self):
+        state = {}
+        for filename in os.listdir(self._path):
+            if self._is_relevant(filename):
+                try:
+                    stat = os.stat(os.path.join(self._path, filename))
+                except OSError:
+                    continue
+                state[filename] = (stat.st_mtime, stat.st_size)
+        return state
+
+    def poll(self):
+        now = time.monotonic()
+        if now - self._last_poll < self._interval:
+            return set(), set()
+        self._last_poll = now
+        state = self._scan()
+        changed = {_filename for _filename, _stat in state.items() if self._state.get(_filename) != _stat}
+        removed = set(self._state) - set(state)
+        self._state = state
+        return changed, removed
+
+
+class InotifyFileWatcher(FileWatcher):
+    """
+    Watcher based on the inotify interface of the Linux kernel.
+
+    Files are reported as changed only after they have been closed after
+    writing, so that half-written files are not picked up.
+    """
+
+    def __init__(self, path, domain_id):
+        if inotify_simple is None:
+            raise RuntimeError("The inotify file watcher requires the inotify_simple package.")
+        super().__init__(path, domain_id)
+        flags = inotify_simple.flags
+        self._inotify = inotify_simple.INotify()
+        self._inotify.add_watch(
+            path, flags.CLOSE_WRITE | flags.ATTRIB | flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE |
+            flags.DELETE_SELF | flags.MOVE_SELF)
+
+    def poll(self):
+        flags = inotify_simple.flags
+        changed, removed = set(), set()
+        for event in self._inotify.read(timeout=0):
+            if event.mask & (flags.Q_OVERFLOW | flags.DELETE_SELF | flags.MOVE_SELF | flags.IGNORED):
+                logging.warning("Lost track of directory '%s', a complete rescan is required", self._path)
+                return None
+            if not self._is_relevant(event.name):
+                continue
+            if event.mask & (flags.DELETE | flags.MOVED_FROM):
+                changed.discard(event.name)
+                removed.add(event.name)
+            else:
+                removed.discard(event.name)
+                changed.add(event.name)
+        return changed, removed
+
+    def close(self):
+        self._inotify.close()
+
+
+def create_file_watcher(path, domain_id, backend="auto", interval=0):
+    """
+    Creates a file watcher for the given directory.
+
+    Arguments:
+    backend -- "inotify", "polling" or "auto". The latter chooses the inotify
+               backend, if the inotify_simple package is available.
+    interval -- minimum time in seconds between two scans of the polling backend.
+    """
+    if backend == "auto":
+        backend = "inotify" if inotify_simple is not None else "polling"
+    if backend == "inotify":
+        return InotifyFileWatcher(path, domain_id)
+    elif backend == "polling":
+        return PollingFileWatcher(path, domain_id, interval=interval)
+    raise ValueError(f"unknown file watcher backend '{backend}'")
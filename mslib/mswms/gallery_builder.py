@@ -673,6 +673,29 @@ def create_linear_plot(xml, file_location):
     plt.close(fig)
 
 
+def get_image_filename(l_type, dataset, plot_object, level=None, itime=None, vtime=None, simple_naming=False):
+    """
+    Returns the name of the image file of a plot (without the .png extension)
+    """
+    return f"{l_type}_{dataset}{plot_object.name}-" + (
+        f"{level}it{itime}vt{vtime}".replace(" ", "_").replace(":", "_").replace("-", "_")
+        if not simple_naming else "")
+
+
+def save_image(path, plot, l_type, filename):
+    """
+    Saves the image (or for linear plots the xml data) into the plots folder
+    """
+    if not os.path.exists(os.path.join(path, "plots")):
+        os.makedirs(os.path.join(path, "plots"), exist_ok=True)
+    if l_type == "Linear":
+        create_linear_plot(etree.fromstring(plot), os.path.join(path, "plots", filename + ".png"))
+    else:
+        with Image.open(io.BytesIO(plot)) as image:
+            image.save(os.path.join(path, "plots", filename + ".png"),
+                       format="PNG")
+
+
 def add_image(path, plot, plot_object, generate_code=False, sphinx=False, url_prefix="",
               dataset=None, level=None, itime=None, vtime=None, simple_naming=False, plot_types=None):
     """
@@ -691,19 +714,10 @@ def add_image(path, plot, plot_object, generate_code=False, sphinx=False, url_pr
     l_type = "Linear" if isinstance(plot_object, AbstractLinearSectionStyle) else \
         "Side" if isinstance(plot_object, AbstractVerticalSectionStyle) else "Top"
     if l_type in plot_types:
-        filename = f"{l_type}_{dataset}{plot_object.name}-" + (
-            f"{level}it{itime}vt{vtime}".replace(" ", "_").replace(":", "_").replace("-", "_")
-            if not simple_naming else "")
+        filename = get_image_filename(l_type, dataset, plot_object, level, itime, vtime, simple_naming)
 
         if plot:
-            if not os.path.exists(os.path.join(path, "plots")):
-                os.mkdir(os.path.join(path, "plots"))
-            if l_type == "Linear":
-                create_linear_plot(etree.fromstring(plot), os.path.join(path, "plots", filename + ".png"))
-            else:
-                with Image.open(io.BytesIO(plot)) as image:
-                    image.save(os.path.join(path, "plots", filename + ".png"),
-                               format="PNG")
+            save_image(path, plot, l_type, filename)
 
         end = end.replace("files = [", f"files = [\"{filename}.png\",")\
             .replace(",];", "];")
@@ -25,6 +25,7 @@
 """
 
 import logging
+import threading
 import numpy as np
 import matplotlib
 
@@ -616,3 +617,38 @@ def register_standard_name(standard_name, unit, title=None, range_=None, thresho
         _RANGES[standard_name] = range_
     if threshold is not None:
         _THRESHOLDS[standard_name] = threshold
+
+
+class GenericClassRegistry(dict):
+    """
+    Arguments of make_generic_class for the generic plotting layers of a
+    styles module, by class name. The classes are created on first access,
+    when the module uses the getattr and dir methods as its module level
+    __getattr__ and __dir__ functions.
+
+    Args:
+        module_globals (dict): the globals() of the styles module
+        make_generic_class (callable): the function of the styles module creating
+                a class from the registered arguments and adding it to its globals
+    """
+
+    def __init__(self, module_globals, make_generic_class):
+        super().__init__()
+        self._globals = module_globals
+        self._make_generic_class = make_generic_class
+        self._lock = threading.Lock()
+
+    def register(self, name, *args, **kwargs):
+        self[name] = (args, kwargs)
+
+    def getattr(self, name):
+        if name not in self:
+            raise AttributeError(f"module {self._globals['__name__']!r} has no attribute {name!r}")
+        with self._lock:
+            if name not in self._globals:
+                args, kwargs = self[name]
+                self._make_generic_class(name, *args, **kwargs)
+        return self._globals[name]
+
+    def dir(self):
+        return sorted(set(self._globals) | set(self))
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+
+    mslib.mswms.image_cache
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Caches for the images (and XML documents) rendered by the WMS server.
+
+    Many clients panning over the same area request identical plots. The
+    WMS server stores its responses in one of these caches, keyed by a
+    hash of the normalised request parameters and of the modification times
+    of the used data files, see WMSServer.produce_plot.
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from abc import ABCMeta, abstractmethod
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class ImageCache(metaclass=ABCMeta):
+    """
+    Abstract superclass of all image caches.
+
+    Keys are hexadecimal hash strings, values are the bytes of a response.
+    The least recently used images are evicted first, if the images take
+    more than <max_bytes> bytes. All methods are thread-safe.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def get(self, key):
+        """
+        Returns the cached data for <key> or None.
+        """
+        pass
+
+    @abstractmethod
+    def put(self, key, data):
+        """
+        Stores <data> under <key>, evicting other images if necessary.
+        """
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """
+        Removes all images from the cache.
+        """
+        pass
+
+    def _count(self, data):
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+
+class MemoryImageCache(ImageCache):
+    """
+    Image cache keeping the images in memory of the server process.
+    """
+
+    def __init__(self, max_bytes=64 * 2 ** 20):
+        super().__init__(max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return self._count(data)
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class DirectoryImageCache(ImageCache):
+    """
+    Image cache storing each image as file in directory <path>, so that it
+    survives restarts of the server. Images already in the directory are
+    picked up on construction.
+
+    The size limit is only enforced for images written by this process.
+    """
+
+    def __init__(self, path, max_bytes=1024 * 2 ** 20):
+        super().__init__(max_bytes)
+        self._path = path
+        os.makedirs(path, exist_ok=True)
+        entries = []
+        for entry in os.scandir(path):
+            if entry.is_file() and entry.name.endswith(".cache"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(".cache")], stat.st_size))
+        self._entries = OrderedDict((_key, _size) for _, _key, _size in sorted(entries))
+        self._bytes = sum(self._entries.values())
+
+    def _filename(self, key):
+        return os.path.join(self._path, f"{key}.cache")
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return self._count(None)
+            self._entries.move_to_end(key)
+        try:
+            with open(self._filename(key), "rb") as fid:
+                data = fid.read()
+            # the modification time orders the images by use after a restart
+            os.utime(self._filename(key))
+        except OSError as ex:
+            logging.debug("cached image '%s' not readable (%s)", key, ex)
+            with self._lock:
+                self._bytes -= self._entries.pop(key, 0)
+            data = None
+        with self._lock:
+            return self._count(data)
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        # write to a temporary file first, so that readers never see partial images
+        handle, tmpname = tempfile.mkstemp(dir=self._path, suffix=".tmp")
+        with os.fdopen(handle, "wb") as fid:
+            fid.write(data)
+        os.replace(tmpname, self._filename(key))
+        evicted = []
+        with self._lock:
+            self._bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                evicted_key, size = self._entries.popitem(last=False)
+                self._bytes -= size
+                evicted.append(evicted_key)
+        for evicted_key in evicted:
+            try:
+                os.remove(self._filename(evicted_key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        for key in keys:
+            try:
+                os.remove(self._filename(key))
+            except OSError:
+                pass
@@ -29,8 +29,9 @@
 # style definitions should be put in mpl_hsec_styles.py
 
 
-import io
+import functools
 import logging
+import threading
 from abc import abstractmethod
 import mswms_settings
 
@@ -39,16 +40,53 @@ from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 import mpl_toolkits.basemap as basemap
 import mpl_toolkits.axes_grid1
 import numpy as np
-import PIL.Image
 
 from mslib.mswms import mss_2D_sections
+from mslib.mswms.basemap_cache import BasemapCache
 from mslib.utils.coordinate import get_projection_params
 from mslib.utils.units import convert_to
-from mslib.mswms.utils import make_cbar_labels_readable
+from mslib.mswms.utils import make_cbar_labels_readable, encode_png
 
 
-BASEMAP_CACHE = {}
-BASEMAP_REQUESTS = []
+BASEMAP_CACHE = None
+BASEMAP_CACHE_LOCK = threading.Lock()
+
+
+def get_basemap_cache():
+    """
+    Returns the Basemap cache shared by all horizontal section styles, which is
+    created on first use with the limits given in mswms_settings.
+    """
+    global BASEMAP_CACHE
+    with BASEMAP_CACHE_LOCK:
+        if BASEMAP_CACHE is None:
+            BASEMAP_CACHE = BasemapCache(
+                max_entries=getattr(mswms_settings, "basemap_cache_size", 20),
+                max_bytes=getattr(mswms_settings, "basemap_cache_max_bytes", 256 * 2 ** 20))
+        return BASEMAP_CACHE
+
+
+def get_meter_projection(bm_params):
+    """
+    Returns a Basemap without boundary data for the given keyword arguments,
+    which converts bboxes given in meters to degrees. These projections are
+    cached by their parameters, as many requests share the same CRS.
+    """
+    try:
+        key = tuple(sorted(bm_params.items()))
+        hash(key)
+    except TypeError:
+        return _create_meter_projection.__wrapped__(tuple(bm_params.items()))
+    return _create_meter_projection(key)
+
+
+@functools.lru_cache(maxsize=64)
+def _create_meter_projection(bm_params):
+    bm_params = dict(bm_params)
+    try:
+        return basemap.Basemap(resolution=None, **bm_params)
+    except ValueError:  # projection requires some extent
+        return basemap.Basemap(resolution=None, width=1e7, height=1e7, **bm_params)
 
 
 class AbstractHorizontalSectionStyle(mss_2D_sections.Abstract2DSectionStyle):
@@ -66,6 +104,15 @@ class AbstractHorizontalSectionStyle(mss_2D_sections.Abstract2DSectionStyle):
         """
         pass
 
+    def requires_full_domain(self, style, level):
+        """
+        Returns True, if the plot of the given style and level depends on data
+        outside of the requested bounding box, e.g. because its colour scale is
+        derived from the data range. Otherwise, the driver may only load the
+        part of the data fields covering the bounding box.
+        """
+        return False
+
     def add_colorbar(self, contour, label=None, tick_levels=None, width="3%", height="30%", cb_format=None,
                      fraction=0.05, pad=0.08, shrink=0.7, loc=4, extend="both", tick_position="left"):
         if not self.noframe:
@@ -296,57 +343,39 @@ class MPLBasemapHorizontalSectionStyle(AbstractHorizontalSectionStyle):
         # NOTE: While the MSUI always requests image sizes that match the aspect
         # ratio, for instance the Metview 4 client does not (mr, 2011Dec16).
 
-        # Some additional code to store the last 20 coastlines in memory for quicker
-        # access.
-        key = repr((proj_params, bbox, bbox_units))
-        basemap_use_cache = getattr(mswms_settings, "basemap_use_cache", False)
-        basemap_request_size = getattr(mswms_settings, "basemap_request_size ", 200)
-        basemap_cache_size = getattr(mswms_settings, "basemap_cache_size", 20)
-        bm_params = {"area_thresh": 1000., "ax": ax, "fix_aspect": (not noframe)}
-        bm_params.update(proj_params)
-        if bbox_units == "degree":
-            bm_params.update({"llcrnrlon": bbox[0], "llcrnrlat": bbox[1],
-                              "urcrnrlon": bbox[2], "urcrnrlat": bbox[3]})
-        elif bbox_units.startswith("meter"):
-            # convert meters to degrees
-            try:
-                bm_p = basemap.Basemap(resolution=None, **bm_params)
-            except ValueError:  # projection requires some extent
-                bm_p = basemap.Basemap(resolution=None, width=1e7, height=1e7, **bm_params)
-            bm_center = [float(_x) for _x in bbox_units[6:-1].split(",")]
-            center_x, center_y = bm_p(*bm_center)
-            bbox_0, bbox_1 = bm_p(bbox[0] + center_x, bbox[1] + center_y, inverse=True)
-            bbox_2, bbox_3 = bm_p(bbox[2] + center_x, bbox[3] + center_y, inverse=True)
-            bm_params.update({"llcrnrlon": bbox_0, "llcrnrlat": bbox_1,
-                              "urcrnrlon": bbox_2, "urcrnrlat": bbox_3})
-        elif bbox_units == "no":
-            pass
-        else:
-            raise ValueError(f"bbox_units '{bbox_units}' not known.")
-        if basemap_use_cache and key in BASEMAP_CACHE:
-            bm = basemap.Basemap(resolution=None, **bm_params)
-            (bm.resolution, bm.coastsegs, bm.coastpolygontypes, bm.coastpolygons,
-             bm.coastsegs, bm.landpolygons, bm.lakepolygons, bm.cntrysegs) = BASEMAP_CACHE[key]
-            logging.debug("Loaded '%s' from basemap cache", key)
-        else:
+        def create_basemap():
+            bm_params = {"area_thresh": 1000.}
+            bm_params.update(proj_params)
+            if bbox_units == "degree":
+                bm_params.update({"llcrnrlon": bbox[0], "llcrnrlat": bbox[1],
+                                  "urcrnrlon": bbox[2], "urcrnrlat": bbox[3]})
+            elif bbox_units.startswith("meter"):
+                # convert meters to degrees
+                bm_p = get_meter_projection(bm_params)
+                bm_center = [float(_x) for _x in bbox_units[6:-1].split(",")]
+                center_x, center_y = bm_p(*bm_center)
+                bbox_0, bbox_1 = bm_p(bbox[0] + center_x, bbox[1] + center_y, inverse=True)
+                bbox_2, bbox_3 = bm_p(bbox[2] + center_x, bbox[3] + center_y, inverse=True)
+                bm_params.update({"llcrnrlon": bbox_0, "llcrnrlat": bbox_1,
+                                  "urcrnrlon": bbox_2, "urcrnrlat": bbox_3})
+            elif bbox_units == "no":
+                pass
+            else:
+                raise ValueError(f"bbox_units '{bbox_units}' not known.")
             bm = basemap.Basemap(resolution='l', **bm_params)
             # read in countries manually, as those are laoded only on demand
             bm.cntrysegs, _ = bm._readboundarydata("countries")
-            if basemap_use_cache:
-                BASEMAP_CACHE[key] = (bm.resolution, bm.coastsegs, bm.coastpolygontypes, bm.coastpolygons,
-                                      bm.coastsegs, bm.landpolygons, bm.lakepolygons, bm.cntrysegs)
-        if basemap_use_cache:
-            BASEMAP_REQUESTS.append(key)
-            BASEMAP_REQUESTS[:] = BASEMAP_REQUESTS[-basemap_request_size:]
-
-            if len(BASEMAP_CACHE) > basemap_cache_size:
-                useful = {}
-                for idx, key in enumerate(BASEMAP_REQUESTS):
-                    useful[key] = useful.get(key, 0) + idx
-                least_useful = sorted([(value, key) for key, value in useful.items()])[:-basemap_cache_size]
-                for _, key in least_useful:
-                    del BASEMAP_CACHE[key]
-                    BASEMAP_REQUESTS[:] = [_x for _x in BASEMAP_REQUESTS if key != _x]
+            return bm
+
+        # Reading the coastlines and countries takes long, so the projected maps
+        # of previous requests are reused from a cache shared by all styles.
+        if getattr(mswms_settings, "basemap_use_cache", False):
+            basemap_cache = get_basemap_cache()
+            bm = basemap_cache.get(basemap_cache.key(proj_params, bbox, bbox_units, "l"), create_basemap)
+        else:
+            bm = create_basemap()
+        bm.ax = ax
+        bm.fix_aspect = not noframe
 
         if self._plot_countries:
             # Set up the map appearance.
@@ -378,11 +407,7 @@ class MPLBasemapHorizontalSectionStyle(AbstractHorizontalSectionStyle):
         if transparent:
             fig.patch.set_alpha(0.)
 
-        # Return the image as png embedded in a StringIO stream.
         canvas = FigureCanvas(fig)
-        output = io.BytesIO()
-        canvas.print_png(output)
-
         if show:
             logging.debug("saving figure to mpl_hsec.png ..")
             canvas.print_png("mpl_hsec.png")
@@ -390,46 +415,13 @@ class MPLBasemapHorizontalSectionStyle(AbstractHorizontalSectionStyle):
         # Convert the image to an 8bit palette image with a significantly
         # smaller file size (~factor 4, from RGBA to one 8bit value, plus the
         # space to store the palette colours).
-        # NOTE: PIL at the current time can only create an adaptive palette for
-        # RGB images, hence alpha values are lost here. If transparency is
-        # requested, the figure face colour is stored as the "transparent"
-        # colour in the image. This works in most cases, but might lead to
-        # visible artefacts in some cases.
         logging.debug("converting image to indexed palette.")
-        # Read the above stored png into a PIL image and create an adaptive
-        # colour palette.
-        output.seek(0)  # necessary for PIL.Image.open()
-        palette_img = PIL.Image.open(output).convert(mode="RGB").convert("P", palette=PIL.Image.Palette.ADAPTIVE)
-        output = io.BytesIO()
-        if not transparent:
-            logging.debug("saving figure as non-transparent PNG.")
-            palette_img.save(output, format="PNG")  # using optimize=True doesn't change much
-        else:
-            # If the image has a transparent background, we need to find the
-            # index of the background colour in the palette. See the
-            # documentation for PIL's ImagePalette module
-            # (http://www.pythonware.com/library/pil/handbook/imagepalette.htm). The
-            # idea is to create a 256 pixel image with the same colour palette
-            # as the original image and use it as a lookup-table. Converting the
-            # lut image back to RGB gives us a list of all colours in the
-            # palette. (Why doesn't PIL provide a method to directly access the
-            # colours in a palette??)
-            lut = palette_img.resize((256, 1))
-            lut.putdata(list(range(256)))
-            lut = [c[1] for c in lut.convert("RGB").getcolors()]
-            facecolor_rgb = list(mpl.colors.hex2color(mpl.colors.cnames[facecolor]))
-            for i in [0, 1, 2]:
-                facecolor_rgb[i] = int(facecolor_rgb[i] * 255)
-            try:
-                facecolor_index = lut.index(tuple(facecolor_rgb))
-                logging.debug("saving figure as transparent PNG with transparency index %s.", facecolor_index)
-                palette_img.save(output, format="PNG", transparency=facecolor_index)
-            except ValueError:
-                logging.debug("transparency requested but not possible, saving non-transparent instead")
-                palette_img.save(output, format="PNG")
+        # images of the same style share their colours, see the setting png_reuse_palette
+        output = encode_png(canvas, transparent=transparent, facecolor=facecolor,
+                            palette_key=(type(self).__name__, self.style, transparent, facecolor))
 
         logging.debug("returning figure..")
-        return output.getvalue()
+        return output
 
     def shift_data(self):
         """Shift the data fields such that the longitudes are in the range
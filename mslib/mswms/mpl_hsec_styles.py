@@ -76,6 +76,7 @@ from matplotlib import patheffects
 from mslib.mswms.mpl_hsec import MPLBasemapHorizontalSectionStyle
 from mslib.mswms.utils import get_cbar_label_format, make_cbar_labels_readable
 import mslib.mswms.generics as generics
+import mslib.mswms.derived_variables  # noqa: F401, registers the derived standard_names with generics
 from mslib.utils import thermolib
 from mslib.utils.units import convert_to
 
@@ -89,6 +90,11 @@ class HS_GenericStyle(MPLBasemapHorizontalSectionStyle):
         ("auto", "auto colour scale"),
         ("autolog", "auto logcolour scale"), ]
 
+    def requires_full_domain(self, style, level):
+        # the colour scale is derived from the data, if no range is configured
+        cmin, cmax = generics.get_range(self.dataname, level, self.name[-2:])
+        return style in ("auto", "autolog") or cmin is None or cmax is None
+
     def _plot_style(self):
         bm = self.bm
         ax = self.bm.ax
@@ -186,7 +192,7 @@ def make_generic_class(name, standard_name, vert, add_data=None, add_contours=No
         required_datafields = [(vert, standard_name, units)] + add_data
         contours = add_contours
 
-    fnord.__name__ = name
+    fnord.__name__ = fnord.__qualname__ = name
     fnord.styles = list(fnord.styles)
     if generics.get_thresholds(standard_name) is not None:
         fnord.styles += [("nonlinear", "nonlinear colour scale")]
@@ -204,26 +210,32 @@ def make_generic_class(name, standard_name, vert, add_data=None, add_contours=No
     globals()[name] = fnord
 
 
-# Generation of HS plotting layers for registered CF standard_names
+# The generic plotting layers are created on first access by __getattr__.
+_GENERIC_CLASSES = generics.GenericClassRegistry(globals(), make_generic_class)
+__getattr__ = _GENERIC_CLASSES.getattr
+__dir__ = _GENERIC_CLASSES.dir
+
+
+# Registration of HS plotting layers for registered CF standard_names
 for vert in ["al", "ml", "pl", "tl"]:
     for sn in generics.get_standard_names():
-        make_generic_class(f"HS_GenericStyle_{vert.upper()}_{sn}", sn, vert)
-    make_generic_class(
+        _GENERIC_CLASSES.register(f"HS_GenericStyle_{vert.upper()}_{sn}", sn, vert)
+    _GENERIC_CLASSES.register(
         f"HS_GenericStyle_{vert.upper()}_{'equivalent_latitude'}",
         "equivalent_latitude", vert, [], [],
         fix_styles=[("equivalent_latitude_nh", "northern hemisphere"),
                     ("equivalent_latitude_sh", "southern hemisphere")])
-    make_generic_class(
+    _GENERIC_CLASSES.register(
         f"HS_GenericStyle_{vert.upper()}_{'ertel_potential_vorticity'}",
         "ertel_potential_vorticity", vert, [], [],
         fix_styles=[("ertel_potential_vorticity_nh", "northern hemisphere"),
                     ("ertel_potential_vorticity_sh", "southern hemisphere")])
-    make_generic_class(
+    _GENERIC_CLASSES.register(
         f"HS_GenericStyle_{vert.upper()}_{'square_of_brunt_vaisala_frequency_in_air'}",
         "square_of_brunt_vaisala_frequency_in_air", vert, [], [],
         fix_styles=[("square_of_brunt_vaisala_frequency_in_air", "")])
 
-make_generic_class(
+_GENERIC_CLASSES.register(
     "HS_GenericStyle_SFC_tropopause_altitude",
     "tropopause_altitude", "sfc", [],
     [("tropopause_altitude", np.arange(5, 20.1, 0.500), "yellow", "red", "solid", 0.5, False)],
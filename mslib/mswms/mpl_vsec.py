@@ -28,8 +28,6 @@
 """
 # style definitions should be put in mpl_vsec_styles.py
 
-import PIL.Image
-import io
 import logging
 import numpy as np
 from abc import abstractmethod
@@ -40,7 +38,7 @@ import mpl_toolkits.axes_grid1
 
 from mslib.mswms import mss_2D_sections
 from mslib.utils.units import convert_to, units
-from mslib.mswms.utils import make_cbar_labels_readable
+from mslib.mswms.utils import make_cbar_labels_readable, encode_png
 
 
 mpl.rcParams['xtick.direction'] = 'out'
@@ -227,11 +225,7 @@ class AbstractVerticalSectionStyle(mss_2D_sections.Abstract2DSectionStyle):
             if transparent:
                 self.fig.patch.set_alpha(0.)
 
-            # Return the image as png embedded in a StringIO stream.
             canvas = FigureCanvas(self.fig)
-            output = io.BytesIO()
-            canvas.print_png(output)
-
             if show:
                 logging.debug("saving figure to mpl_vsec.png ..")
                 canvas.print_png("mpl_vsec.png")
@@ -239,45 +233,13 @@ class AbstractVerticalSectionStyle(mss_2D_sections.Abstract2DSectionStyle):
             # Convert the image to an 8bit palette image with a significantly
             # smaller file size (~factor 4, from RGBA to one 8bit value, plus the
             # space to store the palette colours).
-            # NOTE: PIL at the current time can only create an adaptive palette for
-            # RGB images, hence alpha values are lost here. If transparency is
-            # requested, the figure face colour is stored as the "transparent"
-            # colour in the image. This works in most cases, but might lead to
-            # visible artefacts in some cases.
             logging.debug("converting image to indexed palette.")
-            # Read the above stored png into a PIL image and create an adaptive
-            # colour palette.
-            output.seek(0)  # necessary for PIL.Image.open()
-            palette_img = PIL.Image.open(output).convert(
-                mode="RGB").convert("P", palette=PIL.Image.Palette.ADAPTIVE)
-            output = io.BytesIO()
-            if not transparent:
-                logging.debug("saving figure as non-transparent PNG.")
-                palette_img.save(output, format="PNG")  # using optimize=True doesn't change much
-            else:
-                # If the image has a transparent background, we need to find the
-                # index of the background colour in the palette. See the
-                # documentation for PIL's ImagePalette module
-                # (http://www.pythonware.com/library/pil/handbook/imagepalette.htm). The
-                # idea is to create a 256 pixel image with the same colour palette
-                # as the original image and use it as a lookup-table. Converting the
-                # lut image back to RGB gives us a list of all colours in the
-                # palette. (Why doesn't PIL provide a method to directly access the
-                # colours in a palette??)
-                lut = palette_img.resize((256, 1))
-                lut.putdata(list(range(256)))
-                lut = [c[1] for c in lut.convert("RGB").getcolors()]
-                facecolor_rgb = list(mpl.colors.hex2color(mpl.colors.cnames[facecolor]))
-                for i in [0, 1, 2]:
-                    facecolor_rgb[i] = int(facecolor_rgb[i] * 255)
-                facecolor_index = lut.index(tuple(facecolor_rgb))
-
-                logging.debug("saving figure as transparent PNG with transparency index %i.",
-                              facecolor_index)
-                palette_img.save(output, format="PNG", transparency=facecolor_index)
+            # images of the same style share their colours, see the setting png_reuse_palette
+            output = encode_png(canvas, transparent=transparent, facecolor=facecolor,
+                                palette_key=(type(self).__name__, self.style, transparent, facecolor))
 
             logging.debug("returning figure..")
-            return output.getvalue()
+            return output
 
         # Code for generating an XML document with the data values in ASCII format.
         # =========================================================================
@@ -40,6 +40,7 @@ import numpy as np
 from mslib.mswms.mpl_vsec import AbstractVerticalSectionStyle
 from mslib.mswms.utils import get_cbar_label_format, make_cbar_labels_readable
 import mslib.mswms.generics as generics
+import mslib.mswms.derived_variables  # noqa: F401, registers the derived standard_names with generics
 from mslib.utils import thermolib
 from mslib.utils.units import convert_to
 
@@ -163,7 +164,7 @@ def make_generic_class(name, standard_name, vert, add_data=None, add_contours=No
         required_datafields = [(vert, standard_name, units)] + add_data
         contours = add_contours
 
-    fnord.__name__ = name
+    fnord.__name__ = fnord.__qualname__ = name
     fnord.styles = list(fnord.styles)
     if generics.get_thresholds(standard_name) is not None:
         fnord.styles = fnord.styles + [("nonlinear", "nonlinear colour scale")]
@@ -182,6 +183,12 @@ def make_generic_class(name, standard_name, vert, add_data=None, add_contours=No
     globals()[name] = fnord
 
 
+# The generic plotting layers are created on first access by __getattr__.
+_GENERIC_CLASSES = generics.GenericClassRegistry(globals(), make_generic_class)
+__getattr__ = _GENERIC_CLASSES.getattr
+__dir__ = _GENERIC_CLASSES.dir
+
+
 _ADD_DATA = {
     "al": [("al", "ertel_potential_vorticity", "PVU"),
            ("al", "air_pressure", "Pa"),
@@ -195,25 +202,25 @@ _ADD_DATA = {
            ("tl", "air_pressure", "Pa")],
 }
 
-# Generation of vertical section plotting layers for registered CF standard_names
+# Registration of vertical section plotting layers for registered CF standard_names
 for vert in ["al", "ml", "pl", "tl"]:
     for sn in generics.get_standard_names():
-        make_generic_class(
+        _GENERIC_CLASSES.register(
             f"VS_GenericStyle_{vert.upper()}_{sn}", sn, vert,
             add_data=_ADD_DATA[vert])
-    make_generic_class(
+    _GENERIC_CLASSES.register(
         f"VS_GenericStyle_{vert.upper()}_{'ertel_potential_vorticity'}",
         "ertel_potential_vorticity", vert,
         add_data=_ADD_DATA[vert],
         fix_styles=[("ertel_potential_vorticity_nh", "northern hemisphere"),
                     ("ertel_potential_vorticity_sh", "southern hemisphere")])
-    make_generic_class(
+    _GENERIC_CLASSES.register(
         f"VS_GenericStyle_{vert.upper()}_{'equivalent_latitude'}",
         "equivalent_latitude", vert,
         add_data=_ADD_DATA[vert],
         fix_styles=[("equivalent_latitude_nh", "northern hemisphere"),
                     ("equivalent_latitude_sh", "southern hemisphere")])
-    make_generic_class(
+    _GENERIC_CLASSES.register(
         f"VS_GenericStyle_{vert.upper()}_{'gravity_wave_temperature_perturbation'}",
         "air_temperature_residual", vert,
         add_data=_ADD_DATA[vert] + [("sfc", "tropopause_air_pressure", "Pa"),
@@ -221,7 +228,7 @@ for vert in ["al", "ml", "pl", "tl"]:
         add_contours=[("tropopause_air_pressure", None, "darkgrey", "darkgrey", "solid", 2, True),
                       ("secondary_tropopause_air_pressure", None, "dimgrey", "dimgrey", "solid", 2, True)],
         fix_styles=[("gravity_wave_temperature_perturbation", "")])
-    make_generic_class(
+    _GENERIC_CLASSES.register(
         f"VS_GenericStyle_{vert.upper()}_{'square_of_brunt_vaisala_frequency_in_air'}",
         "square_of_brunt_vaisala_frequency_in_air", vert,
         add_data=_ADD_DATA[vert] + [("sfc", "tropopause_air_pressure", "Pa"),
@@ -231,7 +238,7 @@ for vert in ["al", "ml", "pl", "tl"]:
         fix_styles=[("square_of_brunt_vaisala_frequency_in_air", "")])
 
 vert = "pl"
-make_generic_class(
+_GENERIC_CLASSES.register(
     f"VS_GenericStyle_{vert.upper()}_{'cloud_ice_mixing_ratio'}",
     "cloud_ice_mixing_ratio", vert,
     add_data=[("pl", "maximum_relative_humidity_wrt_ice_on_backtrajectory", None)],
@@ -242,7 +249,7 @@ make_generic_class(
                    ["dashed", "solid", "solid", "solid"], 2, True)],
     fix_styles=[("cloud_ice_mixing_ratio", "iwc")])
 
-make_generic_class(
+_GENERIC_CLASSES.register(
     f"VS_GenericStyle_{vert.upper()}_{'number_concentration_of_ice_crystals_in_air'}",
     "number_concentration_of_ice_crystals_in_air", vert,
     add_data=[("pl", "maximum_relative_humidity_wrt_ice_on_backtrajectory", None)],
@@ -253,7 +260,7 @@ make_generic_class(
                    ["dashed", "solid", "solid", "solid"], 2, True)],
     fix_styles=[("number_concentration_of_ice_crystals_in_air", "nice")])
 
-make_generic_class(
+_GENERIC_CLASSES.register(
     f"VS_GenericStyle_{vert.upper()}_{'mean_mass_radius_of_cloud_ice_crystals'}",
     "mean_mass_radius_of_cloud_ice_crystals", vert,
     add_data=[("pl", "maximum_relative_humidity_wrt_ice_on_backtrajectory", None)],
@@ -264,7 +271,7 @@ make_generic_class(
                    ["dashed", "solid", "solid", "solid"], 2, True)],
     fix_styles=[("mean_mass_radius_of_cloud_ice_crystals", "radius")])
 
-make_generic_class(
+_GENERIC_CLASSES.register(
     f"VS_GenericStyle_{vert.upper()}_{'maximum_pressure_on_backtrajectory'}",
     "maximum_pressure_on_backtrajectory", vert, [], [])
 
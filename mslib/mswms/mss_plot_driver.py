@@ -26,18 +26,237 @@
     limitations under the License.
 """
 
+from collections import OrderedDict
+import contextlib
+import copy
 from datetime import datetime
 
 import logging
 import os
+import threading
 from abc import ABCMeta, abstractmethod
 
 import numpy as np
 
+from mslib.mswms import derived_variables
 from mslib.utils import netCDF4tools
 import mslib.utils.coordinate as coordinate
 
 
+class PooledDataset(object):
+    """
+    An open and validated MFDatasetCommonDims together with its time,
+    horizontal and vertical coordinates. Instances are handed out by a
+    DatasetPool and must be given back by DatasetPool.release().
+    """
+
+    def __init__(self, filenames, key, **mfdataset_kwargs):
+        self.filenames = filenames
+        self.key = key
+        self.users = 0
+        self.invalid = False
+        with netCDF4tools.netcdf_lock:
+            dataset = netCDF4tools.MFDatasetCommonDims(filenames, **mfdataset_kwargs)
+            try:
+                _, timevar = netCDF4tools.identify_CF_time(dataset)
+                self.times = netCDF4tools.num2date(timevar[:], timevar.units)
+                self.lat_data, self.lon_data, self.lat_order = netCDF4tools.get_latlon_data(dataset)
+                _, vert_data, self.vert_order, self.vert_units, _ = netCDF4tools.identify_vertical_axis(dataset)
+                self.vert_data = vert_data[:] if vert_data is not None else None
+            except Exception as ex:
+                logging.error("ERROR: %s %s", type(ex), ex)
+                dataset.close()
+                raise
+        self.dataset = dataset
+
+    def close(self):
+        with netCDF4tools.netcdf_lock:
+            self.dataset.close()
+
+
+class DatasetPool(object):
+    """
+    LRU pool of open datasets shared by all drivers of one data set.
+
+    Datasets are keyed by the names and modification times of their files,
+    so that a modified file is never served from a stale handle. The pool
+    keeps at most <max_open_files> files open; datasets currently in use by
+    a driver are never closed, so the limit may be exceeded temporarily.
+
+    The fields of derived variables computed from the datasets are kept in
+    a DerivedFieldCache of at most <derived_cache_max_bytes> bytes.
+    """
+
+    def __init__(self, max_open_files=32, derived_cache_max_bytes=64 * 2 ** 20):
+        self.max_open_files = max_open_files
+        self.derived_cache = derived_variables.DerivedFieldCache(max_bytes=derived_cache_max_bytes)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, filenames):
+        return tuple((_filename, os.path.getmtime(_filename)) for _filename in filenames)
+
+    def _open_files(self):
+        return sum(len(_entry.filenames) for _entry in self._entries.values())
+
+    def _evict(self):
+        for key, entry in list(self._entries.items()):
+            if self._open_files() <= self.max_open_files:
+                break
+            if entry.users == 0:
+                logging.debug("closing pooled dataset %s", entry.filenames)
+                del self._entries[key]
+                entry.close()
+
+    def acquire(self, filenames, **mfdataset_kwargs):
+        """
+        Returns a PooledDataset for the given files, opening them if no
+        up-to-date dataset is available in the pool.
+        """
+        key = self._key(filenames)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                logging.debug("using pooled dataset %s", filenames)
+                self._entries.move_to_end(key)
+                entry.users += 1
+                return entry
+        # Open outside of the lock, so that other drivers are not blocked.
+        entry = PooledDataset(filenames, key, **mfdataset_kwargs)
+        with self._lock:
+            if key in self._entries:
+                # another driver opened the same files in the meantime
+                entry.close()
+                entry = self._entries[key]
+                self._entries.move_to_end(key)
+            else:
+                self._invalidate(set(filenames), keep=key)
+                self._entries[key] = entry
+            entry.users += 1
+            self._evict()
+        return entry
+
+    def release(self, entry):
+        """
+        Gives back a dataset obtained by acquire().
+        """
+        with self._lock:
+            entry.users -= 1
+            if entry.users == 0:
+                if entry.invalid:
+                    entry.close()
+                else:
+                    self._evict()
+
+    def _invalidate(self, filenames, keep=None):
+        for key, entry in list(self._entries.items()):
+            if key != keep and filenames.intersection(entry.filenames):
+                del self._entries[key]
+                self.derived_cache.discard(key)
+                entry.invalid = True
+                if entry.users == 0:
+                    entry.close()
+
+    def invalidate(self, filenames):
+        """
+        Removes all datasets using any of the given files from the pool. Datasets
+        still in use are closed as soon as they are released.
+        """
+        with self._lock:
+            self._invalidate(set(filenames))
+
+    def clear(self):
+        """
+        Closes all datasets not in use and empties the pool.
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                entry.invalid = True
+                if entry.users == 0:
+                    entry.close()
+            self._entries.clear()
+        self.derived_cache.clear()
+
+
+class DriverPool(object):
+    """
+    Pool of plot drivers of one type for one data set.
+
+    A driver keeps the state of the plot it is producing, so concurrent
+    requests must not share a driver. Each request checks out a driver of
+    its own and returns it afterwards. At most <size> drivers are created,
+    further requests wait until a driver is returned. All drivers of the
+    pool share their open datasets via the given DatasetPool.
+    """
+
+    def __init__(self, driver_class, data_access_object, dataset_pool=None, size=4):
+        self.driver_class = driver_class
+        self.data_access = data_access_object
+        self.dataset_pool = dataset_pool if dataset_pool is not None else DatasetPool()
+        self.size = size
+        self._idle = []
+        self._layers = {}
+        self._created = 0
+        self._condition = threading.Condition()
+
+    def checkout(self, timeout=None):
+        """
+        Returns an idle driver, creating a new one if all drivers are in
+        use. Raises a RuntimeError, if no driver became available within
+        <timeout> seconds.
+        """
+        with self._condition:
+            if not self._idle and self._created >= self.size:
+                if not self._condition.wait_for(lambda: len(self._idle) > 0, timeout):
+                    raise RuntimeError(f"no plot driver available within {timeout} seconds")
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            driver = self.driver_class(self.data_access, dataset_pool=self.dataset_pool)
+        except Exception:
+            with self._condition:
+                self._created -= 1
+                self._condition.notify()
+            raise
+        self._layers[id(driver)] = {}
+        return driver
+
+    def checkin(self, driver):
+        """
+        Gives back a driver obtained by checkout().
+        """
+        with self._condition:
+            self._idle.append(driver)
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def driver(self, timeout=None):
+        """
+        Context manager checking out a driver for the duration of a request.
+        """
+        driver = self.checkout(timeout)
+        try:
+            yield driver
+        finally:
+            self.checkin(driver)
+
+    def bind(self, driver, layer):
+        """
+        Returns a copy of the registered <layer> plotting with <driver>.
+
+        Layers keep the data of the plot they are producing as well, so each
+        driver uses its own copies. These are kept, so that consecutive
+        requests of the same layer may reuse the open dataset of the driver.
+        """
+        layers = self._layers[id(driver)]
+        if id(layer) not in layers:
+            bound = copy.copy(layer)
+            bound.set_driver(driver)
+            layers[id(layer)] = bound
+        return layers[id(layer)]
+
+
 class MSSPlotDriver(metaclass=ABCMeta):
     """
     Abstract super class for implementing driver classes that provide
@@ -58,22 +277,34 @@ class MSSPlotDriver(metaclass=ABCMeta):
     set_plot_parameters() and plot().
     """
 
-    def __init__(self, data_access_object):
+    def __init__(self, data_access_object, dataset_pool=None):
         """
         Requires an instance of a data access object from the MSS
-        configuration (i.e. an NWPDataAccess instance).
+        configuration (i.e. an NWPDataAccess instance). Drivers of the same
+        data set may share their open datasets by passing the same
+        DatasetPool.
         """
         self.data_access = data_access_object
+        self.dataset_pool = dataset_pool if dataset_pool is not None else DatasetPool()
         self.dataset = None
+        self._pooled_dataset = None
         self.plot_object = None
         self.filenames = []
 
     def __del__(self):
         """
-        Closes the open NetCDF dataset, if existing.
+        Gives back the open NetCDF dataset, if existing.
         """
-        if self.dataset is not None:
-            self.dataset.close()
+        self._release_dataset()
+
+    def _release_dataset(self):
+        """
+        Gives the open NetCDF dataset (if any) back to the pool.
+        """
+        if getattr(self, "_pooled_dataset", None) is not None:
+            self.dataset_pool.release(self._pooled_dataset)
+            self._pooled_dataset = None
+        self.dataset = None
 
     def _set_time(self, init_time, fc_time):
         """
@@ -89,7 +320,7 @@ class MSSPlotDriver(metaclass=ABCMeta):
         """
         if len(self.plot_object.required_datafields) == 0:
             logging.debug("no datasets required.")
-            self.dataset = None
+            self._release_dataset()
             self.filenames = []
             self.init_time = None
             self.fc_time = None
@@ -120,21 +351,22 @@ class MSSPlotDriver(metaclass=ABCMeta):
             if not self.data_access.is_reload_required(self.filenames):
                 return
             logging.debug("need to re-open input files.")
-            self.dataset.close()
-            self.dataset = None
+            self.dataset_pool.invalidate(self.filenames)
+            self._release_dataset()
 
         # Determine the input files from the required variables and the
         # requested time:
 
-        # Create the names of the files containing the required parameters.
+        # Create the names of the files containing the required parameters
+        # (or, for derived variables, the parameters they are computed from).
         self.filenames = []
         for vartype, var, _ in self.plot_object.required_datafields:
-            filename = self.data_access.get_filename(
-                var, vartype, init_time, fc_time, fullpath=True)
-            if filename not in self.filenames:
-                self.filenames.append(filename)
-            logging.debug("\tvariable '%s' requires input file '%s'",
-                          var, os.path.basename(filename))
+            for filename in self.data_access.get_filenames(
+                    var, vartype, init_time, fc_time, fullpath=True):
+                if filename not in self.filenames:
+                    self.filenames.append(filename)
+                logging.debug("\tvariable '%s' requires input file '%s'",
+                              var, os.path.basename(filename))
 
         if len(self.filenames) == 0:
             raise ValueError("no files found that correspond to the specified "
@@ -142,46 +374,38 @@ class MSSPlotDriver(metaclass=ABCMeta):
 
         self.init_time = init_time
 
-        # Open NetCDF files as one dataset with common dimensions.
-        logging.debug("opening datasets.")
-        dsKWargs = self.data_access.mfDatasetArgs()
-        dataset = netCDF4tools.MFDatasetCommonDims(self.filenames, **dsKWargs)
-
-        # Load and check time dimension. self.dataset will remain None
-        # if an Exception is raised here.
-        timename, timevar = netCDF4tools.identify_CF_time(dataset)
+        # Get the NetCDF files as one dataset with common dimensions from the
+        # pool. Only if they are not open yet, the files are opened and their
+        # time, lat/lon and vertical dimensions are loaded and checked. The
+        # coordinate hashes recorded by the data access spare comparing the
+        # coordinates of unmodified files. self.dataset will remain None if an
+        # Exception is raised here.
+        self._release_dataset()
+        pooled = self.dataset_pool.acquire(
+            self.filenames, coordinate_hashes=self.data_access.get_coordinate_hashes(self.filenames),
+            **self.data_access.mfDatasetArgs())
 
-        times = netCDF4tools.num2date(timevar[:], timevar.units)
         # removed after discussion, see
         # https://mss-devel.slack.com/archives/emerge/p1486658769000007
         # if init_time != netCDF4tools.num2date(0, timevar.units):
         #     dataset.close()
         #     raise ValueError("wrong initialisation time in input")
 
-        if fc_time not in times:
+        if fc_time not in pooled.times:
             msg = f"Forecast valid time '{fc_time}' is not available."
             logging.error(msg)
-            dataset.close()
+            self.dataset_pool.release(pooled)
             raise ValueError(msg)
 
-        # Load lat/lon dimensions.
-        try:
-            lat_data, lon_data, lat_order = netCDF4tools.get_latlon_data(dataset)
-        except Exception as ex:
-            logging.error("ERROR: %s %s", type(ex), ex)
-            dataset.close()
-            raise
-
-        _, vert_data, vert_orientation, vert_units, _ = netCDF4tools.identify_vertical_axis(dataset)
-        self.vert_data = vert_data[:] if vert_data is not None else None
-        self.vert_order = vert_orientation
-        self.vert_units = vert_units
-
-        self.dataset = dataset
-        self.times = times
-        self.lat_data = lat_data
-        self.lon_data = lon_data
-        self.lat_order = lat_order
+        self._pooled_dataset = pooled
+        self.dataset = pooled.dataset
+        self.times = pooled.times
+        self.lat_data = pooled.lat_data
+        self.lon_data = pooled.lon_data
+        self.lat_order = pooled.lat_order
+        self.vert_data = pooled.vert_data
+        self.vert_order = pooled.vert_order
+        self.vert_units = pooled.vert_units
 
         # Identify the variable objects from the NetCDF file that correspond
         # to the data fields required by the plot object.
@@ -193,17 +417,34 @@ class MSSPlotDriver(metaclass=ABCMeta):
 
         A dictionary data_vars is created. Its keys are the CF standard names
         of the variables provided by the plot object. The values are pointers
-        to the NetCDF variable objects.
+        to the NetCDF variable objects or, for derived variables not stored
+        in the files, DerivedFields computing them.
 
         <data_vars> can be accessed as <self.data_vars>.
         """
         self.data_vars = {}
         self.data_units = {}
-        for df_type, df_name, _ in self.plot_object.required_datafields:
-            varname, var = netCDF4tools.identify_variable(self.dataset, df_name, check=True)
-            logging.debug("\tidentified variable <%s> for field <%s>", varname, df_name)
-            self.data_vars[df_name] = var
-            self.data_units[df_name] = getattr(var, "units", None)
+        with netCDF4tools.netcdf_lock:
+            for df_type, df_name, _ in self.plot_object.required_datafields:
+                varname, var = self._identify_variable(df_name)
+                logging.debug("\tidentified variable <%s> for field <%s>", varname, df_name)
+                self.data_vars[df_name] = var
+                self.data_units[df_name] = getattr(var, "units", None)
+
+    def _identify_variable(self, standard_name):
+        """
+        Returns the name and the NetCDF variable of the dataset for the given
+        standard_name, or, for a derived variable not stored in the dataset,
+        the standard_name and a DerivedField.
+        """
+        derived = derived_variables.get_derived_variable(standard_name)
+        varname, var = netCDF4tools.identify_variable(self.dataset, standard_name, check=derived is None)
+        if var is None:
+            var = derived_variables.DerivedField(
+                derived, [self._identify_variable(_name)[1] for _name in derived.dependency_names],
+                cache=self.dataset_pool.derived_cache, dataset_key=self._pooled_dataset.key)
+            varname = standard_name
+        return varname, var
 
     def have_data(self, plot_object, init_time, valid_time):
         """
@@ -240,8 +481,7 @@ class MSSPlotDriver(metaclass=ABCMeta):
         if self.plot_object is not None:
             require_reload = require_reload or (self.plot_object != plot_object)
         if require_reload and self.dataset is not None:
-            self.dataset.close()
-            self.dataset = None
+            self._release_dataset()
 
         self.plot_object = plot_object
         self.figsize = figsize
@@ -350,7 +590,14 @@ class VerticalSectionDriver(MSSPlotDriver):
     The vertical section driver is responsible for loading the data that
     is to be plotted and for calling the plotting routines (that have
     to be registered).
+
+    Only the part of the data fields covering the path (plus a halo of
+    <path_halo> grid cells) is read, unless this part amounts to more than
+    <max_subset_fraction> of the complete fields. In that case, a single
+    read of the complete fields is cheaper than the subset read.
     """
+    path_halo = 2
+    max_subset_fraction = 0.5
 
     def set_plot_parameters(self, plot_object=None, vsec_path=None,
                             vsec_numpoints=101, vsec_path_connection='linear',
@@ -469,24 +716,84 @@ class VerticalSectionDriver(MSSPlotDriver):
         lon_data = lon_data[lon_indices]
         lons = ((self.lons - left_longitude) % 360) + left_longitude
 
+        window = self._get_path_window(lon_data, lon_indices, lons)
+        if window is None:
+            lat_data, lat_slice, lon_slices = self.lat_data, slice(None), None
+        else:
+            (lat_start, lat_stop), (lon_start, lon_stop), lon_slices = window
+            logging.debug("\treading latitudes %s..%s and sorted longitudes %s..%s in %s lon windows",
+                          lat_start, lat_stop, lon_start, lon_stop, len(lon_slices))
+            lat_data = self.lat_data[lat_start:lat_stop]
+            lon_data = lon_data[lon_start:lon_stop]
+            # lat_data is increasing, the latitudes in the file may be stored the other way round
+            if self.lat_order == 1:
+                lat_slice = slice(lat_start, lat_stop)
+            else:
+                lat_slice = slice(len(self.lat_data) - lat_stop, len(self.lat_data) - lat_start)
+
         for name, var in self.data_vars.items():
             if len(var.shape) == 4:
-                var_data = var[timestep, ::-self.vert_order, ::self.lat_order, :]
+                index = (timestep, slice(None, None, -self.vert_order), lat_slice)
+            else:
+                index = (timestep, lat_slice)
+            if lon_slices is None:
+                var_data = netCDF4tools.read_hyperslab(var, index + (slice(None),))
             else:
-                var_data = var[:][timestep, np.newaxis, ::self.lat_order, :]
+                var_data = np.ma.concatenate(
+                    [netCDF4tools.read_hyperslab(var, index + (_lon_slice,)) for _lon_slice in lon_slices], axis=-1)
+            if len(var.shape) != 4:
+                var_data = var_data[np.newaxis]
+            var_data = var_data[:, ::self.lat_order, :]
             logging.debug("\tLoaded %.2f Mbytes from data field <%s> at timestep %s.",
                           var_data.nbytes / 1048576., name, timestep)
             logging.debug("\tVertical dimension direction is %s.",
                           "up" if self.vert_order == 1 else "down")
             logging.debug("\tInterpolating to cross-section path.")
-            # Re-arange longitude dimension in the data field.
-            var_data = var_data[:, :, lon_indices]
-            data[name] = coordinate.interpolate_vertsec(var_data, self.lat_data, lon_data, self.lats, lons)
+            if lon_slices is None:
+                # Re-arange longitude dimension in the data field.
+                var_data = var_data[:, :, lon_indices]
+            data[name] = coordinate.interpolate_vertsec(var_data, lat_data, lon_data, self.lats, lons)
             # Free memory.
             del var_data
 
         return data
 
+    def _get_path_window(self, lon_data, lon_indices, lons):
+        """
+        Determines the part of the data grid required to interpolate the data
+        fields to the path including a halo.
+
+        lon_data are the shifted and sorted longitudes of the data grid,
+        lon_indices the sorting indices and lons the shifted path longitudes.
+
+        Returns a tuple of the (start, stop) indices into lat_data, the
+        (start, stop) indices into the sorted lon_data and a list of slices
+        into the stored longitude dimension, which consists of two slices if
+        the window wraps around the end of the longitude axis. None is
+        returned, if the complete fields shall be read.
+        """
+        if len(self.lat_data) < 2 or len(lon_data) < 2:
+            return None
+        lat_start = max(self.lat_data.searchsorted(self.lats.min()) - self.path_halo, 0)
+        lat_stop = min(self.lat_data.searchsorted(self.lats.max(), side="right") + self.path_halo,
+                       len(self.lat_data))
+        lon_start = max(lon_data.searchsorted(lons.min()) - self.path_halo, 0)
+        lon_stop = min(lon_data.searchsorted(lons.max(), side="right") + self.path_halo, len(lon_data))
+        if lat_stop - lat_start < 2 or lon_stop - lon_start < 2:
+            return None
+        # the number of levels and the item size are the same for both reads,
+        # so the ratio of the read bytes is the ratio of the horizontal areas
+        fraction = ((lat_stop - lat_start) * (lon_stop - lon_start)) / (len(self.lat_data) * len(lon_data))
+        if fraction > self.max_subset_fraction:
+            logging.debug("\treading complete fields, path window covers %.0f%% of the grid", 100 * fraction)
+            return None
+
+        window_indices = lon_indices[lon_start:lon_stop]
+        runs = np.split(window_indices, np.where(np.diff(window_indices) != 1)[0] + 1)
+        if len(runs) > 2:
+            return None
+        return (lat_start, lat_stop), (lon_start, lon_stop), [slice(_run[0], _run[-1] + 1) for _run in runs]
+
     def shift_data(self):
         """
         Shift the data fields such that the longitudes are in the range
@@ -522,7 +829,8 @@ class VerticalSectionDriver(MSSPlotDriver):
         # section style instance. <data> is a dictionary containing the
         # interpolated curtains of the variables identified through CF
         # standard names as specified by <self.vsec_style_instance>.
-        data = self._load_interpolate_timestep()
+        with netCDF4tools.netcdf_lock:
+            data = self._load_interpolate_timestep()
 
         d2 = datetime.now()
         logging.debug("Loaded and interpolated data (required time %s).", d2 - d1)
@@ -567,7 +875,15 @@ class HorizontalSectionDriver(MSSPlotDriver):
     The horizontal section driver is responsible for loading the data that
     is to be plotted and for calling the plotting routines (that have
     to be registered).
+
+    For cylindrical projections, only the part of the data fields covering
+    the requested bounding box (plus a halo of <bbox_halo> grid cells and a
+    tenth of the bounding box size on each side) is read.
     """
+    # basemap projections, for which a bounding box in degree covers exactly
+    # the longitude/latitude rectangle between its corners
+    cylindrical_projections = ("cyl", "merc", "mill", "gall")
+    bbox_halo = 3
 
     def set_plot_parameters(self, plot_object=None, bbox=None, level=None, crs=None, init_time=None, valid_time=None,
                             style=None, figsize=(800, 600), noframe=False, show=False, transparent=False,
@@ -612,6 +928,7 @@ class HorizontalSectionDriver(MSSPlotDriver):
         Load the data fields as required by the horizontal section style
         instance at the current timestep.
         """
+        self.plot_lats, self.plot_lons = self.lat_data, self.lon_data
         if self.dataset is None:
             return {}
         data = {}
@@ -625,13 +942,32 @@ class HorizontalSectionDriver(MSSPlotDriver):
             self.actual_level = self.vert_data[level]
         logging.debug("loading data for time step %s (%s), level index %s (level %s)",
                       timestep, self.fc_time, level, self.actual_level)
+
+        window = self._get_bbox_window()
+        if window is None:
+            (lat_start, lat_stop), lon_slices = (0, len(self.lat_data)), [slice(None)]
+        else:
+            (lat_start, lat_stop), lon_slices = window
+            logging.debug("\treading latitudes %s..%s in %s lon windows", lat_start, lat_stop, len(lon_slices))
+        self.plot_lats = self.lat_data[lat_start:lat_stop]
+        self.plot_lons = np.concatenate([self.lon_data[_lon_slice] for _lon_slice in lon_slices])
+        # lat_data is increasing, the latitudes in the file may be stored the other way round
+        if self.lat_order == 1:
+            lat_slice = slice(lat_start, lat_stop)
+        else:
+            lat_slice = slice(len(self.lat_data) - lat_stop, len(self.lat_data) - lat_start)
+
         for name, var in self.data_vars.items():
             if level is None or len(var.shape) == 3:
                 # 2D fields: time, lat, lon.
-                var_data = var[timestep, ::self.lat_order, :]
+                index = (timestep, lat_slice)
             else:
                 # 3D fields: time, level, lat, lon.
-                var_data = var[timestep, level, ::self.lat_order, :]
+                index = (timestep, level, lat_slice)
+            var_data = np.ma.concatenate(
+                [netCDF4tools.read_hyperslab(var, index + (_lon_slice,)) for _lon_slice in lon_slices], axis=-1) \
+                if len(lon_slices) > 1 else netCDF4tools.read_hyperslab(var, index + (lon_slices[0],))
+            var_data = var_data[::self.lat_order, :]
             logging.debug("\tLoaded %.2f Mbytes from data field <%s>.",
                           var_data.nbytes / 1048576., name)
             data[name] = var_data
@@ -640,6 +976,52 @@ class HorizontalSectionDriver(MSSPlotDriver):
 
         return data
 
+    def _get_bbox_window(self):
+        """
+        Determines the part of the data grid covering the bounding box of a
+        cylindrical map including a halo.
+
+        Returns a tuple of the (start, stop) indices into lat_data and a list
+        of slices into lon_data, which consists of two slices if the window
+        wraps around the end of the longitude axis. None is returned, if the
+        complete fields shall be read.
+        """
+        if self.bbox is None or self.crs is None or len(self.lat_data) < 2 or len(self.lon_data) < 2:
+            return None
+        if self.plot_object.requires_full_domain(self.style, self.actual_level):
+            return None
+        try:
+            proj_params, bbox_units = [coordinate.get_projection_params(self.crs)[_x] for _x in ("basemap", "bbox")]
+        except ValueError:
+            return None
+        if bbox_units != "degree" or (proj_params.get("projection") not in self.cylindrical_projections and
+                                      proj_params.get("epsg") != "4326"):
+            return None
+        lon_min, lat_min, lon_max, lat_max = self.bbox
+        if lon_max <= lon_min or lat_max <= lat_min:
+            return None
+
+        halo_lat = 0.1 * (lat_max - lat_min) + self.bbox_halo * abs(self.lat_data[1] - self.lat_data[0])
+        halo_lon = 0.1 * (lon_max - lon_min) + self.bbox_halo * abs(self.lon_data[1] - self.lon_data[0])
+        lat_indices = np.where((self.lat_data >= lat_min - halo_lat) & (self.lat_data <= lat_max + halo_lat))[0]
+        if len(lat_indices) < 2:
+            return None
+        lat_window = (lat_indices[0], lat_indices[-1] + 1)
+
+        width = lon_max - lon_min + 2 * halo_lon
+        if width >= 360:
+            return lat_window, [slice(None)]
+        lon_indices = np.where((self.lon_data - (lon_min - halo_lon)) % 360 <= width)[0]
+        if len(lon_indices) < 2:
+            return None
+        runs = np.split(lon_indices, np.where(np.diff(lon_indices) > 1)[0] + 1)
+        if len(runs) == 1:
+            return lat_window, [slice(runs[0][0], runs[0][-1] + 1)]
+        if len(runs) == 2 and runs[0][0] == 0 and runs[1][-1] == len(self.lon_data) - 1:
+            # the window crosses the longitude seam of the data
+            return lat_window, [slice(runs[1][0], None), slice(None, runs[0][-1] + 1)]
+        return None
+
     def plot(self):
         """
         """
@@ -649,7 +1031,8 @@ class HorizontalSectionDriver(MSSPlotDriver):
         # section style instance. <data> is a dictionary containing the
         # horizontal sections of the variables identified through CF
         # standard names as specified by <self.hsec_style_instance>.
-        data = self._load_timestep()
+        with netCDF4tools.netcdf_lock:
+            data = self._load_timestep()
 
         d2 = datetime.now()
         logging.debug("Loaded data (required time %s).", (d2 - d1))
@@ -665,8 +1048,8 @@ class HorizontalSectionDriver(MSSPlotDriver):
 
         # Call the plotting method of the horizontal section style instance.
         image = self.plot_object.plot_hsection(data,
-                                               self.lat_data,
-                                               self.lon_data,
+                                               self.plot_lats,
+                                               self.plot_lons,
                                                self.bbox,
                                                level=self.actual_level,
                                                valid_time=self.fc_time,
@@ -783,7 +1166,7 @@ class LinearSectionDriver(VerticalSectionDriver):
         lon_indices = lon_data.argsort()
         lon_data = lon_data[lon_indices]
         lons = ((self.lons - left_longitude) % 360) + left_longitude
-        factors = []
+        factors = None
 
         # Make sure air_pressure is the first to be evaluated if needed
         variables = list(self.data_vars)
@@ -793,11 +1176,12 @@ class LinearSectionDriver(VerticalSectionDriver):
 
         for name in variables:
             var = self.data_vars[name]
-            data[name] = []
             if len(var.shape) == 4:
-                var_data = var[timestep, ::-self.vert_order, ::self.lat_order, :]
+                index = (timestep, slice(None, None, -self.vert_order), slice(None, None, self.lat_order), slice(None))
+                var_data = netCDF4tools.read_hyperslab(var, index)
             else:
-                var_data = var[:][timestep, np.newaxis, ::self.lat_order, :]
+                var_data = netCDF4tools.read_hyperslab(
+                    var, (timestep, slice(None, None, self.lat_order), slice(None)))[np.newaxis]
             logging.debug("\tLoaded %.2f Mbytes from data field <%s> at timestep %s.",
                           var_data.nbytes / 1048576., name, timestep)
             logging.debug("\tVertical dimension direction is %s.",
@@ -808,40 +1192,16 @@ class LinearSectionDriver(VerticalSectionDriver):
 
             cross_section = coordinate.interpolate_vertsec(var_data, self.lat_data, lon_data, self.lats, lons)
             # Create vertical interpolation factors and indices for subsequent variables
-            # TODO: Improve performance for this interpolation in general
-            if len(factors) == 0:
-                for index_lonlat, alt in enumerate(self.alts):
-                    pressures = cross_section[:, index_lonlat] if name == "air_pressure" \
-                        else self.vert_data[::-self.vert_order] * (100 if self.vert_units.lower() == "hpa" else 1)
-                    closest = 0
-                    direction = 1
-                    for index_altitude, pressure in enumerate(pressures):
-                        if abs(pressure - alt) < abs(pressures[closest] - alt):
-                            closest = index_altitude
-                            direction = 1 if pressure - alt > 0 else -1
-
-                    next_closest = closest + direction
-                    if next_closest >= len(pressures) or next_closest < 0:
-                        next_closest = closest
-
-                    if closest == next_closest:
-                        factors.append([[closest, 0.5], [closest, 0.5]])
-                    else:
-                        distance = abs(pressures[closest] - alt) + abs(pressures[next_closest] - alt)
-                        factors.append(
-                            [[closest, 1 - (abs(pressures[closest] - alt) / distance)],
-                             [next_closest, 1 - (abs(pressures[next_closest] - alt) / distance)]])
+            if factors is None:
+                pressures = cross_section if name == "air_pressure" \
+                    else self.vert_data[::-self.vert_order] * (100 if self.vert_units.lower() == "hpa" else 1)
+                factors = coordinate.get_vertical_interpolation_factors(pressures, self.alts)
 
             # Interpolate with the previously calculated pressure indices and factors
-            for index in range(len(self.alts)):
-                cur_factor = factors[index]
-                value = cross_section[cur_factor[0][0], index] * cur_factor[0][1] + \
-                    cross_section[cur_factor[1][0], index] * cur_factor[1][1]
-                data[name].append(value)
+            data[name] = coordinate.interpolate_vertical(cross_section, *factors)
 
             # Free memory.
             del var_data
-            data[name] = np.array(data[name])
 
         return data
 
@@ -854,7 +1214,8 @@ class LinearSectionDriver(VerticalSectionDriver):
         # section style instance. <data> is a dictionary containing the
         # interpolated curtains of the variables identified through CF
         # standard names as specified by <self.lsec_style_instance>.
-        data = self._load_interpolate_timestep()
+        with netCDF4tools.netcdf_lock:
+            data = self._load_interpolate_timestep()
         d2 = datetime.now()
 
         if self.mime_type != "text/xml":
@@ -77,6 +77,9 @@ def main():
     gallery.add_argument("--plot_types", default=None,
                          help='A comma-separated list of all plot_types. \n'
                               'Default is ["Top", "Side", "Linear"]')
+    gallery.add_argument("--processes", type=int, default=0,
+                         help="Number of worker processes rendering the plots in parallel.\n"
+                              "Default is to render them one after another.")
 
     args = parser.parse_args()
     if args.version:
@@ -110,7 +113,8 @@ def main():
         create = args.create or args.refresh
         clear = args.clear or args.refresh
         server.generate_gallery(create, clear, args.show_code, url_prefix=args.url_prefix, levels=args.levels,
-                                itimes=args.itimes, vtimes=args.vtimes, plot_types=plot_types)
+                                itimes=args.itimes, vtimes=args.vtimes, plot_types=plot_types,
+                                processes=args.processes)
         logging.info("Gallery generation done.")
         sys.exit()
 
@@ -25,7 +25,19 @@
     limitations under the License.
 """
 
+import collections
+import io
+import logging
+import sys
+import threading
+
 import matplotlib
+import PIL.Image
+
+# palettes computed by encode_png for a palette_key, least recently used first
+_PALETTES = collections.OrderedDict()
+_PALETTES_LOCK = threading.Lock()
+_PALETTES_SIZE = 64
 
 
 def get_cbar_label_format(style, maxvalue):
@@ -55,3 +67,73 @@ def make_cbar_labels_readable(fig, axs):
     for x in axs.yaxis.majorTicks:
         x.label1.set_path_effects([matplotlib.patheffects.withStroke(linewidth=4, foreground='w')])
         x.label1.set_fontsize(fontsize)
+
+
+def _get_setting(name, default):
+    """
+    Returns a setting of the server. The settings are looked up when needed,
+    as importing them with this module would be circular: the settings import
+    the plot styles, which import this module.
+    """
+    return getattr(sys.modules.get("mswms_settings"), name, default)
+
+
+def encode_png(canvas, transparent=False, facecolor="white", compress_level=None, palette=None, palette_key=None):
+    """
+    Renders the figure of an Agg canvas and returns it as 8bit palette PNG.
+
+    The RGBA buffer of the canvas is quantised in memory and encoded once,
+    instead of writing an RGBA PNG and decoding it again. Alpha values are
+    dropped as PIL creates adaptive palettes only for RGB images. If
+    <transparent> is set, the colour <facecolor> is stored as transparent
+    colour of the image, if it appears in the palette.
+
+    Arguments:
+    compress_level -- zlib compression level (0-9) of the PNG encoder, by
+                      default the setting png_compress_level (or 6).
+    palette -- optional image of mode "P", whose palette is used instead of
+               computing an adaptive palette. The colours are mapped to the
+               nearest palette entry, which saves the quantisation.
+    palette_key -- optional hashable key of images with similar colours, e.g.
+                   the plot style. If the setting png_reuse_palette is
+                   enabled, the adaptive palette of the first image encoded
+                   with this key is kept and used for the following ones.
+    """
+    if compress_level is None:
+        compress_level = _get_setting("png_compress_level", 6)
+    if not _get_setting("png_reuse_palette", False):
+        palette_key = None
+    if palette is None and palette_key is not None:
+        with _PALETTES_LOCK:
+            palette = _PALETTES.get(palette_key)
+            if palette is not None:
+                _PALETTES.move_to_end(palette_key)
+    canvas.draw()
+    width, height = canvas.get_width_height()
+    image = PIL.Image.frombuffer("RGBA", (width, height), canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+    image = image.convert(mode="RGB")
+    if palette is None:
+        palette_img = image.convert("P", palette=PIL.Image.Palette.ADAPTIVE)
+        if palette_key is not None:
+            cached = PIL.Image.new("P", (1, 1))
+            cached.putpalette(palette_img.getpalette())
+            with _PALETTES_LOCK:
+                _PALETTES[palette_key] = cached
+                while len(_PALETTES) > _PALETTES_SIZE:
+                    _PALETTES.popitem(last=False)
+    else:
+        palette_img = image.quantize(palette=palette, dither=PIL.Image.Dither.NONE)
+
+    options = {"compress_level": compress_level}
+    if transparent:
+        facecolor_rgb = tuple(int(_x * 255) for _x in matplotlib.colors.to_rgb(facecolor))
+        colours = palette_img.getpalette()
+        colours = [tuple(colours[_i:_i + 3]) for _i in range(0, len(colours), 3)]
+        if facecolor_rgb in colours:
+            options["transparency"] = colours.index(facecolor_rgb)
+            logging.debug("saving figure as transparent PNG with transparency index %s.", options["transparency"])
+        else:
+            logging.debug("transparency requested but not possible, saving non-transparent instead")
+    output = io.BytesIO()
+    palette_img.save(output, format="PNG", **options)
+    return output.getvalue()
@@ -45,15 +45,22 @@ from future import standard_library
 
 standard_library.install_aliases()
 
+import concurrent.futures
 import glob
+import hashlib
 import os
 import io
 import inspect
 import logging
+import multiprocessing
+import pickle
 import shutil
 import tempfile
+import threading
+import time
 import traceback
 import urllib.parse
+from collections import OrderedDict, namedtuple
 
 from xml.etree import ElementTree
 from chameleon import PageTemplateLoader
@@ -68,7 +75,7 @@ from mslib.utils import conditional_decorator
 from mslib.utils.time import parse_iso_datetime
 from mslib.index import create_app
 from mslib.mswms.gallery_builder import add_image, write_html, add_levels, add_times, \
-    write_doc_index, write_code_pages, STATIC_LOCATION, DOCS_LOCATION
+    write_doc_index, write_code_pages, get_image_filename, save_image, STATIC_LOCATION, DOCS_LOCATION
 
 # Flask basic auth's documentation
 # https://flask-basicauth.readthedocs.io/en/latest/#flask.ext.basicauth.BasicAuth.check_credentials
@@ -120,7 +127,6 @@ except ImportError as ex:
 if mswms_settings.__dict__.get('enable_basic_http_authentication', False):
     logging.debug("Enabling basic HTTP authentication. Username and "
                   "password required to access the service.")
-    import hashlib
 
     def authfunc(username, password):
         for u, p in mswms_auth.allowed_users:
@@ -149,6 +155,11 @@ base_dir = os.path.abspath(os.path.dirname(__file__))
 xml_template_location = os.path.join(base_dir, "xml_templates")
 templates = PageTemplateLoader(mswms_settings.__dict__.get("xml_template_location", xml_template_location))
 
+# A plot of the gallery: the render_layer arguments (mode, dataset, layer, parameters) as job, the
+# arguments of add_image and add_levels and whether the image needs to be rendered, see plan_gallery
+GalleryPlot = namedtuple("GalleryPlot", ["job", "plot_object", "l_type", "dataset", "filename", "level",
+                                         "level_option", "render"])
+
 
 def squash_multiple_images(imgs):
     with Image.open(io.BytesIO(imgs[0])) as background:
@@ -171,7 +182,16 @@ def squash_multiple_xml(xml_strings):
     return ElementTree.tostring(base)
 
 
+class RenderWorkerError(RuntimeError):
+    """
+    Raised if the worker processes fail to render the layers of a request,
+    as opposed to errors of the layers themselves.
+    """
+
+
 class WMSServer(object):
+    # number of rendered capabilities documents (per version and server url) kept in memory
+    capabilities_cache_size = 16
 
     def __init__(self):
         """
@@ -179,23 +199,66 @@ class WMSServer(object):
         """
         data_access_dict = mswms_settings.data
 
+        self._capabilities_cache = OrderedDict()
+        self._capabilities_inventory = None
+        self._capabilities_modified = None
+        self._capabilities_lock = threading.Lock()
+
+        # The layers of a GetMap request are rendered by this many processes
+        # in parallel, zero or one renders them one after another.
+        self.render_processes = mswms_settings.__dict__.get("render_processes", 0)
+        self._render_executor = None
+        self._render_executor_lock = threading.Lock()
+        # (method, args, kwargs) of all layer registrations, which are replayed
+        # in the worker processes, see _init_render_worker
+        self._layer_registrations = []
+
+        # Optional cache of rendered images (see mslib.mswms.image_cache).
+        # Concurrent requests for an image currently being rendered wait for
+        # it instead of rendering it again.
+        self.image_cache = mswms_settings.__dict__.get("image_cache")
+        self._image_cache_pending = {}
+        self._image_cache_lock = threading.Lock()
+
         for key in data_access_dict:
             data_access_dict[key].setup()
 
+        # The drivers of one data set share their open datasets.
+        max_open_files = mswms_settings.__dict__.get("dataset_pool_max_open_files", 32)
+        derived_cache_max_bytes = mswms_settings.__dict__.get("derived_cache_max_bytes", 64 * 2 ** 20)
+        self.dataset_pools = {}
+        for key in data_access_dict:
+            self.dataset_pools[key] = mss_plot_driver.DatasetPool(
+                max_open_files=max_open_files, derived_cache_max_bytes=derived_cache_max_bytes)
+
         self.hsec_drivers = {}
         for key in data_access_dict:
             self.hsec_drivers[key] = mss_plot_driver.HorizontalSectionDriver(
-                data_access_dict[key])
+                data_access_dict[key], dataset_pool=self.dataset_pools[key])
 
         self.vsec_drivers = {}
         for key in data_access_dict:
             self.vsec_drivers[key] = mss_plot_driver.VerticalSectionDriver(
-                data_access_dict[key])
+                data_access_dict[key], dataset_pool=self.dataset_pools[key])
 
         self.lsec_drivers = {}
         for key in data_access_dict:
             self.lsec_drivers[key] = mss_plot_driver.LinearSectionDriver(
-                data_access_dict[key])
+                data_access_dict[key], dataset_pool=self.dataset_pools[key])
+
+        # The drivers above hold the registered layers. Requests are plotted by
+        # drivers checked out of these pools, so that concurrent requests
+        # (of a multi-threaded WSGI server) do not share the state of a driver.
+        driver_pool_size = mswms_settings.__dict__.get("driver_pool_size", 4)
+        self.hsec_driver_pools, self.vsec_driver_pools, self.lsec_driver_pools = {}, {}, {}
+        for driver_pools, driver_class in (
+                (self.hsec_driver_pools, mss_plot_driver.HorizontalSectionDriver),
+                (self.vsec_driver_pools, mss_plot_driver.VerticalSectionDriver),
+                (self.lsec_driver_pools, mss_plot_driver.LinearSectionDriver)):
+            for key in data_access_dict:
+                driver_pools[key] = mss_plot_driver.DriverPool(
+                    driver_class, data_access_dict[key], dataset_pool=self.dataset_pools[key],
+                    size=driver_pool_size)
 
         self.hsec_layer_registry = {}
         for layer, datasets in mswms_settings.register_horizontal_layers:
@@ -219,32 +282,238 @@ class WMSServer(object):
             else:
                 self.register_lsec_layer(layer[1], layer_class=layer[0])
 
+    def register_all_layers(self):
+        """
+        Registers all plotting layers of the styles modules with the first
+        dataset, e.g. to show all of them in the gallery.
+        """
+        # Imports here due to some circular import issue if imported too soon
+        from mslib.mswms import mpl_hsec_styles, mpl_vsec_styles, mpl_lsec_styles
+
+        dataset = [next(iter(mswms_settings.data))]
+        mswms_settings.register_horizontal_layers = [
+            (plot[1], dataset) for plot in inspect.getmembers(mpl_hsec_styles, inspect.isclass)
+            if plot[0] != "HS_GenericStyle" and
+            not any(x in plot[0] or x in str(plot[1]) for x in ["Abstract", "Target", "fnord"])
+        ]
+        mswms_settings.register_vertical_layers = [
+            (plot[1], dataset) for plot in inspect.getmembers(mpl_vsec_styles, inspect.isclass)
+            if plot[0] != "VS_GenericStyle" and
+            not any(x in plot[0] or x in str(plot[1]) for x in ["Abstract", "Target", "fnord"])
+        ]
+        mswms_settings.register_linear_layers = [
+            (plot[1], dataset) for plot in inspect.getmembers(mpl_lsec_styles, inspect.isclass)
+        ]
+        self._shutdown_render_executor()
+        self.__init__()
+
+    def plan_gallery(self, plot_list, path, clear=False, levels="", itimes="", vtimes="", simple_naming=False):
+        """
+        Returns a GalleryPlot for each plot of the gallery, i.e. for all registered
+        layers of <plot_list> and the requested init times, valid times and levels.
+
+        A plot is to be rendered, if <clear> is set or its image in <path> is
+        missing or older than one of the data files.
+        """
+        gallery_plots = []
+        for driver, registry in plot_list:
+            multiple_datasets = len(driver) > 1
+            mode = "getlsec" if driver == self.lsec_drivers else "getvsec" if driver == self.vsec_drivers else "getmap"
+            l_type = {"getlsec": "Linear", "getvsec": "Side", "getmap": "Top"}[mode]
+            for dataset in driver:
+                plot_driver = driver[dataset]
+                if dataset not in registry:
+                    continue
+                prefix = dataset if multiple_datasets else ""
+                for plot in registry[dataset]:
+                    plot_object = registry[dataset][plot]
+
+                    def add_plot(parameters, level=None, level_option=None):
+                        filename = get_image_filename(
+                            l_type, prefix, plot_object, level, parameters["init_time"], parameters["valid_time"],
+                            simple_naming)
+                        job = (mode, dataset, plot, parameters)
+                        gallery_plots.append(GalleryPlot(
+                            job, plot_object, l_type, prefix, filename, level, level_option,
+                            clear or not self._is_gallery_image_current(path, filename, job)))
+
+                    try:
+                        file_types = [field[0] for field in plot_object.required_datafields
+                                      if field[0] != "sfc"]
+                        file_type = file_types[0] if file_types else "sfc"
+
+                        # All specified init times, or the latest if empty, or all if "all",
+                        # or None if there are no init times
+                        init_times = [parse_iso_datetime(itime) if isinstance(itime, str) else itime
+                                      for itime in (itimes.split(",") if itimes != "all" and itimes != "" else
+                                                    plot_driver.get_init_times() if itimes == "all" else
+                                                    [plot_driver.get_init_times()[-1]])] or [None]
+
+                        for itime in sorted(init_times):
+                            if itime and plot_driver.get_init_times() and itime not in plot_driver.get_init_times():
+                                logging.warning("Requested itime %s not present for "
+                                                "%s %s! itimes present: "
+                                                "%s", itime, dataset, plot_object.name, plot_driver.get_init_times()
+                                                )
+                                continue
+                            elif not plot_driver.get_init_times():
+                                itime = None
+
+                            try:
+                                # All valid times for the specific init time
+                                i_vtimes = plot_driver.get_valid_times(plot_object.required_datafields[0][1],
+                                                                       file_type, itime)
+                            except IndexError:
+                                # ToDo fix demodata for sfc
+                                logging.debug("plot_object.required_datafields incomplete"
+                                              " for filetype: %s in dataset: %s for l_type: %s",
+                                              file_type, dataset, l_type)
+                                continue
+
+                            # All specified valid times, or the latest if empty, or all if "all",
+                            # or None if there are no valid times for the init time
+                            valid_times = [parse_iso_datetime(vtime) if isinstance(vtime, str) else vtime
+                                           for vtime in (vtimes.split(",") if vtimes != "all" and vtimes != "" else
+                                                         i_vtimes if vtimes == "all" else [i_vtimes[-1]])] or [None]
+
+                            for vtime in sorted(valid_times):
+                                if vtime and i_vtimes and vtime not in i_vtimes:
+                                    logging.warning("Requested vtime %s at %s not present for "
+                                                    "%s %s! vtimes present: %s", vtime, itime, dataset,
+                                                    plot_object.name, i_vtimes)
+                                    continue
+                                elif not i_vtimes:
+                                    vtime = None
+
+                                style = plot_object.styles[0][0] if plot_object.styles else None
+                                kwargs = {"init_time": itime, "valid_time": vtime}
+
+                                # the extent of the plots is given by the coordinates of the data
+                                if mode == "getlsec":
+                                    plot_driver.set_plot_parameters(plot_object=plot_object, **kwargs,
+                                                                    lsec_path=[[0, 0, 20000], [1, 1, 20000]],
+                                                                    lsec_numpoints=201, mime_type="text/xml")
+                                    lon_data = np.rad2deg(np.unwrap(np.deg2rad(plot_driver.lon_data)))
+                                    lpath = [[min(plot_driver.lat_data), min(lon_data), 20000],
+                                             [max(plot_driver.lat_data), max(lon_data), 20000]]
+                                    add_plot(dict(kwargs, lsec_path=lpath, lsec_numpoints=201,
+                                                  lsec_path_connection="linear", mime_type="text/xml"))
+
+                                elif mode == "getvsec":
+                                    plot_driver.set_plot_parameters(plot_object=plot_object, **kwargs,
+                                                                    vsec_path=[[0, 0], [1, 1]], vsec_numpoints=201,
+                                                                    mime_type="image/png")
+                                    lon_data = np.rad2deg(np.unwrap(np.deg2rad(plot_driver.lon_data)))
+                                    lpath = [[min(plot_driver.lat_data), min(lon_data)],
+                                             [max(plot_driver.lat_data), max(lon_data)]]
+                                    add_plot(dict(kwargs, vsec_path=lpath, vsec_numpoints=201, figsize=[800, 600],
+                                                  vsec_path_connection="linear", style=style, noframe=False,
+                                                  bbox=[101, 1050, 10, 180], mime_type="image/png"))
+
+                                else:
+                                    elevations = plot_object.get_elevations()
+                                    elevation = float(elevations[len(elevations) // 2]) if len(elevations) > 0 \
+                                        else None
+                                    plot_driver.set_plot_parameters(plot_object=plot_object, **kwargs,
+                                                                    crs="EPSG:4326", level=elevation,
+                                                                    mime_type="image/png")
+                                    lon_data = np.rad2deg(np.unwrap(np.deg2rad(plot_driver.lon_data)))
+                                    bbox = [min(lon_data), min(plot_driver.lat_data),
+                                            max(lon_data), max(plot_driver.lat_data)]
+                                    vert_units = plot_driver.vert_units
+
+                                    # All specified levels, or the mid if empty, or all if "all",
+                                    # or None if there are no levels
+                                    rendered_levels = [float(elev) if elev else elev for elev in
+                                                       (levels.split(",") if (levels != "all" and levels != "") else
+                                                        elevations if levels == "all" else [elevation])] or [None]
+
+                                    for level in sorted(rendered_levels):
+                                        if level and elevations and level \
+                                                not in [float(elev) for elev in elevations]:
+                                            logging.warning("Requested level %s not present for "
+                                                            "%s %s! Levels present: "
+                                                            "%s", level, dataset, plot_object.name, elevations)
+                                            continue
+                                        elif not elevations:
+                                            level = None
+
+                                        add_plot(dict(kwargs, noframe=False, figsize=[800, 600], crs="EPSG:4326",
+                                                      style=style, bbox=bbox, level=level, mime_type="image/png"),
+                                                 f"{level}{vert_units}",
+                                                 [f"{level} {vert_units}", vert_units] if level else
+                                                 ["None None", "None"])
+
+                    except Exception as e:
+                        traceback.print_exc()
+                        logging.error("%s %s %s", plot_object.name, type(e), e)
+        return gallery_plots
+
+    def _is_gallery_image_current(self, path, filename, job):
+        """
+        Checks whether the image <filename> of the gallery in <path> exists and
+        is newer than the data files of the plot.
+        """
+        try:
+            modified = os.path.getmtime(os.path.join(path, "plots", filename + ".png"))
+        except OSError:
+            return False
+        try:
+            return all(os.path.getmtime(_filename) <= modified for _filename in self.get_data_files(*job))
+        except (IOError, ValueError, KeyError) as ex:
+            logging.debug("data files of '%s' not determined (%s: %s)", filename, type(ex), ex)
+            return False
+
+    def render_gallery(self, gallery_plots, path, processes=0, all_plots=False, plot_types=None):
+        """
+        Renders the images of the gallery plots that are to be rendered (and
+        are of one of the <plot_types>) into <path> and returns the set of
+        filenames of the failed plots.
+
+        The plots are rendered by <processes> worker processes, if it is larger
+        than one, otherwise one after another. Progress is logged.
+        """
+        pending = [gallery_plot for gallery_plot in gallery_plots if gallery_plot.render and
+                   (plot_types is None or gallery_plot.l_type in plot_types)]
+        failed = set()
+        done = []
+        logging.info("Rendering %d of %d gallery plots", len(pending), len(gallery_plots))
+
+        def store(gallery_plot, result):
+            try:
+                save_image(path, result(), gallery_plot.l_type, gallery_plot.filename)
+            except Exception as e:
+                traceback.print_exc()
+                logging.error("%s %s %s", gallery_plot.plot_object.name, type(e), e)
+                failed.add(gallery_plot.filename)
+            logging.info("Gallery plot %d/%d done: %s", len(done) + 1, len(pending), gallery_plot.filename)
+            done.append(gallery_plot)
+
+        if processes <= 1 or len(pending) <= 1:
+            for gallery_plot in pending:
+                store(gallery_plot, lambda: self.render_layer(*gallery_plot.job))
+            return failed
+        # the workers are started from scratch and set up a server of their own, see render_layers
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_gallery_worker, initargs=(all_plots,)) as executor:
+            futures = {executor.submit(_render_layer, *gallery_plot.job): gallery_plot for gallery_plot in pending}
+            for future in concurrent.futures.as_completed(futures):
+                store(futures[future], future.result)
+        return failed
+
     def generate_gallery(self, create=False, clear=False, generate_code=False, sphinx=False, plot_list=None,
                          all_plots=False, url_prefix="", levels="", itimes="", vtimes="", simple_naming=False,
-                         plot_types=None):
+                         plot_types=None, processes=0):
         """
         Iterates through all registered layers, draws their plots and puts them in the gallery
+
+        The plots are planned first, then rendered (by <processes> worker processes
+        in parallel, if larger than one), and finally the gallery is written.
         """
         if mswms_settings.__file__:
             if all_plots:
-                # Imports here due to some circular import issue if imported too soon
-                from mslib.mswms import mpl_hsec_styles, mpl_vsec_styles, mpl_lsec_styles
-
-                dataset = [next(iter(mswms_settings.data))]
-                mswms_settings.register_horizontal_layers = [
-                    (plot[1], dataset) for plot in inspect.getmembers(mpl_hsec_styles, inspect.isclass)
-                    if plot[0] != "HS_GenericStyle" and
-                    not any(x in plot[0] or x in str(plot[1]) for x in ["Abstract", "Target", "fnord"])
-                ]
-                mswms_settings.register_vertical_layers = [
-                    (plot[1], dataset) for plot in inspect.getmembers(mpl_vsec_styles, inspect.isclass)
-                    if plot[0] != "VS_GenericStyle" and
-                    not any(x in plot[0] or x in str(plot[1]) for x in ["Abstract", "Target", "fnord"])
-                ]
-                mswms_settings.register_linear_layers = [
-                    (plot[1], dataset) for plot in inspect.getmembers(mpl_lsec_styles, inspect.isclass)
-                ]
-                self.__init__()
+                self.register_all_layers()
 
             if not (create or generate_code or all_plots or plot_list):
                 return
@@ -257,166 +526,22 @@ class WMSServer(object):
                              [self.vsec_drivers, self.vsec_layer_registry],
                              [self.hsec_drivers, self.hsec_layer_registry]]
 
-            # Iterate through all plots of all datasets, create the plot and build the gallery with it
-            for driver, registry in plot_list:
-                multiple_datasets = len(driver) > 1
-                for dataset in driver:
-                    plot_driver = driver[dataset]
-                    if dataset not in registry:
-                        continue
-                    for plot in registry[dataset]:
-                        plot_object = registry[dataset][plot]
-                        l_type = "Linear" if driver == self.lsec_drivers else \
-                            "Side" if driver == self.vsec_drivers else "Top"
-
-                        try:
-                            file_types = [field[0] for field in plot_object.required_datafields
-                                          if field[0] != "sfc"]
-                            file_type = file_types[0] if file_types else "sfc"
-
-                            # All specified init times, or the latest if empty, or all if "all",
-                            # or None if there are no init times
-                            init_times = [parse_iso_datetime(itime) if isinstance(itime, str) else itime
-                                          for itime in (itimes.split(",") if itimes != "all" and itimes != "" else
-                                                        plot_driver.get_init_times() if itimes == "all" else
-                                                        [plot_driver.get_init_times()[-1]])] or [None]
-
-                            for itime in sorted(init_times):
-                                if itime and plot_driver.get_init_times() and itime not in plot_driver.get_init_times():
-                                    logging.warning("Requested itime %s not present for "
-                                                    "%s %s! itimes present: "
-                                                    "%s", itime, dataset, plot_object.name, plot_driver.get_init_times()
-                                                    )
-                                    continue
-                                elif not plot_driver.get_init_times():
-                                    itime = None
-
-                                try:
-                                    # All valid times for the specific init time
-                                    i_vtimes = plot_driver.get_valid_times(plot_object.required_datafields[0][1],
-                                                                           file_type, itime)
-                                except IndexError:
-                                    # ToDo fix demodata for sfc
-                                    logging.debug("plot_object.required_datafields incomplete"
-                                                  " for filetype: %s in dataset: %s for l_type: %s",
-                                                  file_type, dataset, l_type)
-                                    continue
+            gallery_plots = self.plan_gallery(plot_list, path, clear=clear, levels=levels, itimes=itimes,
+                                              vtimes=vtimes, simple_naming=simple_naming)
+            failed = self.render_gallery(gallery_plots, tmp_path, processes=processes, all_plots=all_plots,
+                                         plot_types=plot_types)
 
-                                # All specified valid times, or the latest if empty, or all if "all",
-                                # or None if there are no valid times for the init time
-                                valid_times = [parse_iso_datetime(vtime) if isinstance(vtime, str) else vtime
-                                               for vtime in (vtimes.split(",") if vtimes != "all" and vtimes != "" else
-                                                             i_vtimes if vtimes == "all" else [i_vtimes[-1]])] or [None]
-
-                                for vtime in sorted(valid_times):
-                                    if vtime and i_vtimes and vtime not in i_vtimes:
-                                        logging.warning("Requested vtime %s at %s not present for "
-                                                        "%s %s! vtimes present: %s", vtime, itime, dataset,
-                                                        plot_object.name, i_vtimes)
-                                        continue
-                                    elif not i_vtimes:
-                                        vtime = None
-
-                                    style = plot_object.styles[0][0] if plot_object.styles else None
-                                    kwargs = {"plot_object": plot_object,
-                                              "init_time": itime,
-                                              "valid_time": vtime}
-                                    filename = f"{l_type}_{dataset if multiple_datasets else ''}{plot_object.name}-" \
-                                               + f"Noneit{itime}vt{vtime}".replace(" ", "_").replace(":", "_")\
-                                                                          .replace("-", "_")
-
-                                    exists = (not clear) and os.path.exists(
-                                        os.path.join(path, "plots", filename + ".png"))
-
-                                    if driver == self.lsec_drivers and not exists:
-                                        plot_driver.set_plot_parameters(**kwargs,
-                                                                        lsec_path=[[0, 0, 20000], [1, 1, 20000]],
-                                                                        lsec_numpoints=201,
-                                                                        lsec_path_connection="linear",
-                                                                        mime_type="text/xml")
-                                        lon_data = np.rad2deg(np.unwrap(np.deg2rad(plot_driver.lon_data)))
-                                        lpath = [[min(plot_driver.lat_data), min(lon_data), 20000],
-                                                 [max(plot_driver.lat_data), max(lon_data), 20000]]
-                                        plot_driver.update_plot_parameters(lsec_path=lpath)
-
-                                    elif driver == self.vsec_drivers and not exists:
-                                        plot_driver.set_plot_parameters(**kwargs, vsec_path=[[0, 0], [1, 1]],
-                                                                        vsec_numpoints=201, figsize=[800, 600],
-                                                                        vsec_path_connection="linear", style=style,
-                                                                        noframe=False, bbox=[101, 1050, 10, 180],
-                                                                        mime_type="image/png")
-                                        lon_data = np.rad2deg(np.unwrap(np.deg2rad(plot_driver.lon_data)))
-                                        lpath = [[min(plot_driver.lat_data), min(lon_data)],
-                                                 [max(plot_driver.lat_data), max(lon_data)]]
-                                        plot_driver.update_plot_parameters(vsec_path=lpath)
-
-                                    elif driver == self.hsec_drivers:
-                                        elevations = plot_object.get_elevations()
-                                        elevation = float(elevations[len(elevations) // 2]) if len(elevations) > 0 \
-                                            else None
-                                        plot_driver.set_plot_parameters(**kwargs, noframe=False, figsize=[800, 600],
-                                                                        crs="EPSG:4326", style=style,
-                                                                        bbox=[-15, 35, 30, 65],
-                                                                        level=elevation,
-                                                                        mime_type="image/png")
-                                        lon_data = np.rad2deg(np.unwrap(np.deg2rad(plot_driver.lon_data)))
-                                        bbox = [min(lon_data), min(plot_driver.lat_data),
-                                                max(lon_data), max(plot_driver.lat_data)]
-                                        vert_units = plot_driver.vert_units
-                                        plot_driver.update_plot_parameters(bbox=bbox)
-
-                                        # All specified levels, or the mid if empty, or all if "all",
-                                        # or None if there are no levels
-                                        rendered_levels = [float(elev) if elev else elev for elev in
-                                                           (levels.split(",") if (levels != "all" and levels != "") else
-                                                            elevations if levels == "all" else [elevation])] or [None]
-
-                                        for level in sorted(rendered_levels):
-                                            if level and elevations and level \
-                                                    not in [float(elev) for elev in elevations]:
-                                                logging.warning("Requested level %s not present for "
-                                                                "%s %s! Levels present: "
-                                                                "%s", level, dataset, plot_object.name, elevations)
-                                                continue
-                                            elif not elevations:
-                                                level = None
-
-                                            plot_driver.update_plot_parameters(level=level)
-
-                                            # filename is different for top layers, so needs a redefine
-                                            filename = f"{l_type}_{dataset if multiple_datasets else ''}" \
-                                                       f"{plot_object.name}-" + \
-                                                       f"{level}{vert_units}it{itime}vt{vtime}".replace(" ", "_")\
-                                                                                               .replace(":", "_")\
-                                                                                               .replace("-", "_")
-                                            exists = (not clear) and os.path.exists(
-                                                os.path.join(path, "plots", filename + ".png"))
-
-                                            add_image(tmp_path, None if exists else plot_driver.plot(), plot_object,
-                                                      generate_code, sphinx, url_prefix=url_prefix,
-                                                      dataset=dataset if multiple_datasets else "", level=f"{level}" +
-                                                                                                f"{vert_units}",
-                                                      itime=str(itime), vtime=str(vtime), simple_naming=simple_naming,
-                                                      plot_types=plot_types)
-                                            if level:
-                                                add_levels([f"{level} {vert_units}"], vert_units)
-                                            else:
-                                                add_levels(["None None"], "None")
-
-                                            add_times(itime, [vtime])
-                                        continue
-
-                                    add_image(
-                                        tmp_path,
-                                        None if exists else plot_driver.plot(), plot_object, generate_code,
-                                        sphinx, url_prefix=url_prefix,
-                                        dataset=dataset if multiple_datasets else "", itime=str(itime),
-                                        vtime=str(vtime), simple_naming=simple_naming, plot_types=plot_types)
-                                    add_times(itime, [vtime])
-
-                        except Exception as e:
-                            traceback.print_exc()
-                            logging.error("%s %s %s", plot_object.name, type(e), e)
+            # The gallery is built in the order of the plan, independent of the order of rendering
+            for gallery_plot in gallery_plots:
+                if gallery_plot.filename in failed:
+                    continue
+                add_image(tmp_path, None, gallery_plot.plot_object, generate_code, sphinx, url_prefix=url_prefix,
+                          dataset=gallery_plot.dataset, level=gallery_plot.level,
+                          itime=str(gallery_plot.job[3]["init_time"]), vtime=str(gallery_plot.job[3]["valid_time"]),
+                          simple_naming=simple_naming, plot_types=plot_types)
+                if gallery_plot.level_option is not None:
+                    add_levels([gallery_plot.level_option[0]], gallery_plot.level_option[1])
+                add_times(gallery_plot.job[3]["init_time"], [gallery_plot.job[3]["valid_time"]])
 
             write_html(tmp_path, sphinx, plot_types=plot_types)
             if generate_code:
@@ -427,10 +552,10 @@ class WMSServer(object):
             if clear and os.path.exists(os.path.join(path, "plots")):
                 shutil.rmtree(os.path.join(path, "plots"))
             if os.path.exists(os.path.join(path, "plots")):
+                # only outdated or missing images were rendered, these replace the present ones
                 for fn in glob.glob(os.path.join(tmp_path, "plots", "*")):
-                    if not os.path.exists(os.path.join(path, "plots", os.path.basename(fn))):
-                        shutil.move(fn, os.path.join(path, "plots"))
-            else:
+                    shutil.move(fn, os.path.join(path, "plots", os.path.basename(fn)))
+            elif os.path.exists(os.path.join(tmp_path, "plots")):
                 shutil.move(os.path.join(tmp_path, "plots"), path)
             if os.path.exists(os.path.join(path, "code")):
                 shutil.rmtree(os.path.join(path, "code"))
@@ -454,6 +579,7 @@ class WMSServer(object):
         # Loop over all provided dataset names. Create an instance of the
         # provided layer class for all datasets and register the layer
         # instances with the datasets.
+        self._add_layer_registration("register_hsec_layer", datasets, layer_class)
         for dataset in datasets:
             try:
                 layer = layer_class(self.hsec_drivers[dataset])
@@ -485,6 +611,7 @@ class WMSServer(object):
         # Loop over all provided dataset names. Create an instance of the
         # provided layer class for all datasets and register the layer
         # instances with the datasets.
+        self._add_layer_registration("register_vsec_layer", datasets, layer_class)
         for dataset in datasets:
             try:
                 layer = layer_class(self.vsec_drivers[dataset])
@@ -516,6 +643,8 @@ class WMSServer(object):
         # Loop over all provided dataset names. Create an instance of the
         # provided layer class for all datasets and register the layer
         # instances with the datasets.
+        self._add_layer_registration(
+            "register_lsec_layer", datasets, variable=variable, filetype=filetype, layer_class=layer_class)
         for dataset in datasets:
             try:
                 if variable:
@@ -538,6 +667,26 @@ class WMSServer(object):
                                  f"new={layer} old={self.lsec_layer_registry[dataset][layer.name]}")
             self.lsec_layer_registry[dataset][layer.name] = layer
 
+    def _add_layer_registration(self, method, *args, **kwargs):
+        """
+        Records a layer registration for the worker processes rendering the
+        layers. Running workers do not know the new layer, hence they are
+        replaced by new ones for the following requests.
+        """
+        self._layer_registrations.append((method, args, kwargs))
+        self._shutdown_render_executor()
+
+    def _shutdown_render_executor(self, executor=None):
+        """
+        Shuts down the worker processes rendering the layers without waiting
+        for them, so the next request starts new ones. If executor is given,
+        it is only shut down if it is still the current one.
+        """
+        with self._render_executor_lock:
+            if self._render_executor is not None and executor in (None, self._render_executor):
+                self._render_executor.shutdown(wait=False)
+                self._render_executor = None
+
     def create_service_exception(self, code=None, text="", version="1.3.0"):
         """
         Create a service exception XML from the XML template defined above.
@@ -555,13 +704,21 @@ class WMSServer(object):
         template = templates['service_exception.pt' if version == "1.1.1" else "service_exception130.pt"]
         return template(code=code, text=text).encode("utf-8"), "text/xml"
 
-    def get_capabilities(self, query, server_url=None):
+    def get_capabilities(self, query, server_url=None, validators=None):
+        """
+        Returns the capabilities document. The rendered document is cached
+        until the available data or the registered layers change.
+
+        If a dictionary <validators> is passed, the ETag and the time of the
+        last modification of the returned document are stored in it.
+        """
         # ToDo find a more elegant method to do the same
         # Preferable we don't want a seperate data_access module to be configured
         data_access_dict = mswms_settings.data
 
+        # only changed files are read, the inventory hashes of unchanged data sets are kept
         for key in data_access_dict:
-            data_access_dict[key].setup()
+            data_access_dict[key].refresh()
 
         version = query.get("VERSION", "1.1.1")
 
@@ -578,6 +735,50 @@ class WMSServer(object):
                 text="Requested update sequence is higher than current",
                 version=version)
 
+        inventory = self._get_inventory_hash()
+        key = (version, server_url)
+        with self._capabilities_lock:
+            if inventory != self._capabilities_inventory:
+                logging.debug("available data or layers changed, clearing capabilities cache")
+                self._capabilities_cache.clear()
+                if self._capabilities_inventory is not None and self.image_cache is not None:
+                    self.image_cache.clear()
+                self._capabilities_inventory = inventory
+                self._capabilities_modified = time.time()
+            modified = self._capabilities_modified
+            entry = self._capabilities_cache.get(key)
+            if entry is not None:
+                self._capabilities_cache.move_to_end(key)
+        if entry is None:
+            return_data = self._render_capabilities(version, server_url)
+            entry = (return_data, hashlib.sha1(return_data).hexdigest())
+            with self._capabilities_lock:
+                if inventory == self._capabilities_inventory:
+                    self._capabilities_cache[key] = entry
+                    while len(self._capabilities_cache) > self.capabilities_cache_size:
+                        self._capabilities_cache.popitem(last=False)
+        if validators is not None:
+            validators["etag"], validators["last_modified"] = entry[1], modified
+        return entry[0], "text/xml"
+
+    def _get_inventory_hash(self):
+        """
+        Returns a hash of the data available for all data sets and of the
+        registered layers.
+        """
+        digest = hashlib.sha1()
+        data_access_dict = mswms_settings.data
+        for dataset in sorted(data_access_dict):
+            digest.update(f"{dataset} {data_access_dict[dataset].get_inventory_hash()}\n".encode("utf-8"))
+        for registry in (self.hsec_layer_registry, self.vsec_layer_registry, self.lsec_layer_registry):
+            for dataset in sorted(registry):
+                digest.update(f"{dataset} {' '.join(sorted(registry[dataset]))}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _render_capabilities(self, version, server_url):
+        """
+        Renders the capabilities document for the given WMS version.
+        """
         template = templates['get_capabilities130.pt' if version == "1.3.0" else 'get_capabilities.pt']
         logging.debug("server-url '%s'", server_url)
 
@@ -637,7 +838,139 @@ class WMSServer(object):
                                service_access_constraints=settings.get(
                                    "service_access_constraints",
                                    "This service is intended for research purposes only."))
-        return return_data.encode("utf-8"), "text/xml"
+        return return_data.encode("utf-8")
+
+    def get_image_cache_key(self, jobs):
+        """
+        Returns the image cache key of the response to a list of (mode,
+        dataset, layer, parameters) tuples. The key is a hash of the
+        normalised plot parameters and of the sizes and modification times
+        of the data files used by the layers. None is returned, if the data
+        files cannot be determined, e.g. as the requested time is not
+        available; such requests are not cached.
+        """
+        digest = hashlib.sha1()
+        for mode, dataset, layer, parameters in jobs:
+            digest.update(repr((mode, dataset, layer, sorted(parameters.items()))).encode("utf-8"))
+            try:
+                filenames = self.get_data_files(mode, dataset, layer, parameters)
+                stats = [os.stat(_filename) for _filename in filenames]
+            except (IOError, ValueError, KeyError) as ex:
+                logging.debug("not caching request, data files not determined (%s: %s)", type(ex), ex)
+                return None
+            for filename, stat in zip(filenames, stats):
+                digest.update(f"{filename} {stat.st_size} {stat.st_mtime_ns}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_data_files(self, mode, dataset, layer, parameters):
+        """
+        Returns the names of the data files read for plotting the registered
+        layer <dataset>.<layer> with the given plot parameters. Raises IOError,
+        ValueError or KeyError, if they cannot be determined.
+        """
+        layer_registry = {"getmap": self.hsec_layer_registry, "getvsec": self.vsec_layer_registry,
+                          "getlsec": self.lsec_layer_registry}[mode]
+        data_access = mswms_settings.data[dataset]
+        return [_filename for vartype, var, _ in layer_registry[dataset][layer].required_datafields
+                for _filename in data_access.get_filenames(
+                    var, vartype, parameters["init_time"], parameters["valid_time"], fullpath=True)]
+
+    def _get_cached_image(self, key):
+        """
+        Returns the cached image for <key>. If it is not cached, None is
+        returned and the caller is responsible for rendering the image and
+        calling _release_cached_image. Until then, further callers for the
+        same key wait.
+        """
+        while True:
+            data = self.image_cache.get(key)
+            if data is not None:
+                return data
+            with self._image_cache_lock:
+                pending = self._image_cache_pending.get(key)
+                if pending is None:
+                    self._image_cache_pending[key] = threading.Event()
+                    return None
+            pending.wait()
+
+    def _release_cached_image(self, key, data=None):
+        """
+        Stores the rendered <data> (if rendering succeeded) and wakes up the
+        callers waiting for the image.
+        """
+        if data is not None:
+            self.image_cache.put(key, data)
+        with self._image_cache_lock:
+            self._image_cache_pending.pop(key).set()
+
+    def render_layer(self, mode, dataset, layer, parameters):
+        """
+        Plots the registered layer <dataset>.<layer> with the given plot
+        parameters by a driver of the pool for <mode> ("getmap", "getvsec"
+        or "getlsec") and returns the image (or XML) data.
+        """
+        driver_pools, layer_registry = {
+            "getmap": (self.hsec_driver_pools, self.hsec_layer_registry),
+            "getvsec": (self.vsec_driver_pools, self.vsec_layer_registry),
+            "getlsec": (self.lsec_driver_pools, self.lsec_layer_registry)}[mode]
+        driver_pool = driver_pools[dataset]
+        with driver_pool.driver() as plot_driver:
+            plot_driver.set_plot_parameters(
+                plot_object=driver_pool.bind(plot_driver, layer_registry[dataset][layer]), **parameters)
+            return plot_driver.plot()
+
+    def render_layers(self, jobs):
+        """
+        Yields the results of render_layer for a list of (mode, dataset,
+        layer, parameters) tuples in the order of the list.
+
+        If render_processes is larger than one, multiple layers are rendered
+        in parallel by worker processes, as plotting is CPU-bound and
+        threads would be serialised by the GIL. An error of a layer is
+        raised when its result is reached, a failure of the worker processes
+        as RenderWorkerError.
+        """
+        if self.render_processes <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                yield self.render_layer(*job)
+            return
+        with self._render_executor_lock:
+            # submitting under the lock keeps a new layer registration from
+            # shutting down the executor in between
+            executor = self._get_render_executor()
+            try:
+                futures = [executor.submit(_render_layer, *job) for job in jobs]
+            except Exception as ex:
+                # e.g. the workers could not be started or a job could not be pickled
+                executor.shutdown(wait=False)
+                self._render_executor = None
+                raise RenderWorkerError(f"The render processes could not be started: {ex}") from ex
+        try:
+            for future in futures:
+                try:
+                    result = future.result()
+                except (concurrent.futures.BrokenExecutor, pickle.PicklingError) as ex:
+                    # a broken pool does not recover, the next request gets a new one
+                    self._shutdown_render_executor(executor)
+                    raise RenderWorkerError(f"A render process failed: {ex}") from ex
+                yield result
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _get_render_executor(self):
+        """
+        Returns the executor of the worker processes, starting it if needed.
+        Must be called with _render_executor_lock held.
+        """
+        if self._render_executor is None:
+            # forking a multi-threaded server could copy held locks, hence the
+            # workers are started from scratch and set up a server of their own,
+            # to which the layers registered at runtime are added
+            self._render_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.render_processes, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_render_worker, initargs=(list(self._layer_registrations),))
+        return self._render_executor
 
     def produce_plot(self, query, mode):
         """
@@ -660,7 +993,8 @@ class WMSServer(object):
 
         # Requested layers.
         layers = [layer for layer in query.get('LAYERS', '').strip().split(',') if layer]
-        images = []
+        # (mode, dataset, layer, plot parameters) of each requested layer
+        jobs = []
         for index, layer in enumerate(layers):
             if layer.find(".") > 0:
                 dataset, layer = layer.split(".")
@@ -791,20 +1125,9 @@ class WMSServer(object):
                         text=f"ELEVATION argument not applicable for layer '{layer}'. Please omit this argument.",
                         version=version)
 
-                plot_driver = self.hsec_drivers[dataset]
-                try:
-                    plot_driver.set_plot_parameters(self.hsec_layer_registry[dataset][layer], bbox=bbox, level=level,
-                                                    crs=crs, init_time=init_time, valid_time=valid_time, style=style,
-                                                    figsize=figsize, noframe=noframe, transparent=transparent,
-                                                    mime_type=mime_type)
-                    images.append(plot_driver.plot())
-                except (IOError, ValueError) as ex:
-                    logging.error("ERROR: %s %s", type(ex), ex)
-                    logging.debug("%s", traceback.format_exc())
-                    msg = "The data corresponding to your request is not available. Please check the " \
-                          "times and/or levels you have specified.\n\n" \
-                          f"Error message: '{ex}'"
-                    return self.create_service_exception(text=msg, version=version)
+                jobs.append((mode, dataset, layer, dict(
+                    bbox=bbox, level=level, crs=crs, init_time=init_time, valid_time=valid_time, style=style,
+                    figsize=figsize, noframe=noframe, transparent=transparent, mime_type=mime_type)))
 
             elif mode == "getvsec":
                 # Vertical secton path.
@@ -845,30 +1168,20 @@ class WMSServer(object):
 
                 draw_verticals = query.get("DRAWVERTICALS", "false").lower() == "true"
 
-                plot_driver = self.vsec_drivers[dataset]
-                try:
-                    plot_driver.set_plot_parameters(plot_object=self.vsec_layer_registry[dataset][layer],
-                                                    vsec_path=path,
-                                                    vsec_numpoints=bbox[0],
-                                                    vsec_path_connection="greatcircle",
-                                                    vsec_numlabels=bbox[2],
-                                                    init_time=init_time,
-                                                    valid_time=valid_time,
-                                                    style=style,
-                                                    bbox=bbox,
-                                                    figsize=figsize,
-                                                    noframe=noframe,
-                                                    draw_verticals=draw_verticals,
-                                                    transparent=transparent,
-                                                    mime_type=mime_type)
-                    images.append(plot_driver.plot())
-                except (IOError, ValueError) as ex:
-                    logging.error("ERROR: %s %s", type(ex), ex)
-                    msg = "The data corresponding to your request is not available. Please check the " \
-                          "times and/or path you have specified.\n\n" \
-                          f"Error message: {ex}.\n" \
-                          "Hint: Check used waypoints."
-                    return self.create_service_exception(text=msg, version=version)
+                jobs.append((mode, dataset, layer, dict(
+                    vsec_path=path,
+                    vsec_numpoints=bbox[0],
+                    vsec_path_connection="greatcircle",
+                    vsec_numlabels=bbox[2],
+                    init_time=init_time,
+                    valid_time=valid_time,
+                    style=style,
+                    bbox=bbox,
+                    figsize=figsize,
+                    noframe=noframe,
+                    draw_verticals=draw_verticals,
+                    transparent=transparent,
+                    mime_type=mime_type)))
 
             elif mode == "getlsec":
                 if mime_type != "text/xml":
@@ -913,36 +1226,100 @@ class WMSServer(object):
                 except ValueError:
                     return self.create_service_exception(text=f"Invalid BBOX: {query.get('BBOX')}", version=version)
 
-                plot_driver = self.lsec_drivers[dataset]
-                try:
-                    plot_driver.set_plot_parameters(plot_object=self.lsec_layer_registry[dataset][layer],
-                                                    lsec_path=path,
-                                                    lsec_numpoints=bbox,
-                                                    lsec_path_connection="greatcircle",
-                                                    init_time=init_time,
-                                                    valid_time=valid_time,
-                                                    bbox=bbox,
-                                                    mime_type=mime_type)
-                    images.append(plot_driver.plot())
-                except (IOError, ValueError) as ex:
-                    logging.error("ERROR: %s %s", type(ex), ex)
+                jobs.append((mode, dataset, layer, dict(
+                    lsec_path=path,
+                    lsec_numpoints=bbox,
+                    lsec_path_connection="greatcircle",
+                    init_time=init_time,
+                    valid_time=valid_time,
+                    bbox=bbox,
+                    mime_type=mime_type)))
+
+        # 4) Look up the response in the image cache.
+        # ==========================================
+        cache_key = None
+        if self.image_cache is not None:
+            cache_key = self.get_image_cache_key(jobs)
+            if cache_key is not None:
+                data = self._get_cached_image(cache_key)
+                if data is not None:
+                    logging.debug("returning cached image %s", cache_key)
+                    return data, mime_type
+
+        data = None
+        try:
+            # 5) Produce the images of all layers.
+            # ====================================
+            images = []
+            try:
+                for image in self.render_layers(jobs):
+                    images.append(image)
+            except (IOError, ValueError) as ex:
+                logging.error("ERROR: %s %s", type(ex), ex)
+                logging.debug("%s", traceback.format_exc())
+                if jobs[len(images)][0] == "getmap":
+                    msg = "The data corresponding to your request is not available. Please check the " \
+                          "times and/or levels you have specified.\n\n" \
+                          f"Error message: '{ex}'"
+                else:
                     msg = "The data corresponding to your request is not available. Please check the " \
                           "times and/or path you have specified.\n\n" \
                           f"Error message: {ex}.\n" \
                           "Hint: Check used waypoints."
-                    return self.create_service_exception(text=msg, version=version)
-
-        # 4) Return the produced image.
-        # =============================
-        if len(layers) > 1:
-            if "image" in mime_type:
-                return squash_multiple_images(images), mime_type
-            elif "xml" in mime_type:
-                return squash_multiple_xml(images), mime_type
+                return self.create_service_exception(text=msg, version=version)
+            except RenderWorkerError as ex:
+                logging.error("ERROR: %s %s", type(ex), ex)
+                logging.debug("%s", traceback.format_exc())
+                msg = "The server could not render your request, please try again.\n\n" \
+                      f"Error message: {ex}"
+                return self.create_service_exception(text=msg, version=version)
+
+            # 6) Return the produced image.
+            # =============================
+            if len(layers) > 1:
+                if "image" in mime_type:
+                    data = squash_multiple_images(images)
+                elif "xml" in mime_type:
+                    data = squash_multiple_xml(images)
+                else:
+                    raise RuntimeError(f"Unexpected format error: {mime_type}")
             else:
-                raise RuntimeError(f"Unexpected format error: {mime_type}")
-        else:
-            return images[0], mime_type
+                data = images[0]
+            return data, mime_type
+        finally:
+            if cache_key is not None:
+                # only successfully produced images are cached
+                self._release_cached_image(cache_key, data)
+
+
+def _render_layer(mode, dataset, layer, parameters):
+    """
+    Renders a layer in a worker process, see WMSServer.render_layers.
+    """
+    return server.render_layer(mode, dataset, layer, parameters)
+
+
+def _init_render_worker(layer_registrations):
+    """
+    Registers the layers of the server process, which were not registered by
+    the settings, in a worker process, see WMSServer.render_layers.
+    """
+    for registration in layer_registrations:
+        if registration not in server._layer_registrations:
+            method, args, kwargs = registration
+            try:
+                getattr(server, method)(*args, **kwargs)
+            except ValueError as ex:
+                # the registration failed likewise in the server process
+                logging.debug("%s %s", type(ex), ex)
+
+
+def _init_gallery_worker(all_plots):
+    """
+    Registers the layers of the gallery in a worker process, see WMSServer.render_gallery.
+    """
+    if all_plots:
+        server.register_all_layers()
 
 
 server = WMSServer()
@@ -967,9 +1344,10 @@ def application():
         url = request.url
         server_url = urllib.parse.urljoin(url, urllib.parse.urlparse(url).path)
 
+        validators = {}
         if (request_type in ('getcapabilities', 'capabilities') and
                 request_service == 'wms' and request_version in ('1.1.1', '1.3.0', '')):
-            return_data, mime_type = server.get_capabilities(query, server_url)
+            return_data, mime_type = server.get_capabilities(query, server_url, validators=validators)
         elif request_type in ('getmap', 'getvsec', 'getlsec') and request_version in ('1.1.1', '1.3.0', ''):
             return_data, mime_type = server.produce_plot(query, request_type)
         else:
@@ -980,6 +1358,11 @@ def application():
         response_headers = [('Content-type', mime_type), ('Content-Length', str(len(return_data)))]
         for response_header in response_headers:
             res.headers[response_header[0]] = response_header[1]
+        if validators:
+            # answers If-None-Match and If-Modified-Since with 304 Not Modified
+            res.set_etag(validators["etag"])
+            res.last_modified = validators["last_modified"]
+            res.make_conditional(request)
 
         return res
 
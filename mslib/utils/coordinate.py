@@ -26,11 +26,11 @@
     limitations under the License.
 """
 
+import functools
 import logging
 import netCDF4 as nc
 import numpy as np
-from scipy.interpolate import interp1d
-from scipy.ndimage import map_coordinates
+from scipy.spatial import cKDTree
 
 try:
     import mpl_toolkits.basemap.pyproj as pyproj
@@ -41,6 +41,10 @@ from mslib.utils.config import config_loader
 
 
 __PR = pyproj.Geod(ellps='WGS84')
+# smallest radius of curvature of the ellipsoid in km, geodesics are at least
+# as long as the angle between the surface normals of their end points times it
+_MIN_CURVATURE_RADIUS = __PR.b ** 2 / __PR.a / 1000.
+_location_index = None
 
 
 def get_distance(lat0, lon0, lat1, lon1):
@@ -58,6 +62,24 @@ def get_distance(lat0, lon0, lat1, lon1):
     return __PR.inv(lon0, lat0, lon1, lat1)[-1] / 1000.
 
 
+def get_distances(lats, lons):
+    """
+    Computes the distances between consecutive points of a path on the Earth
+    surface by a single geodesic computation for all segments.
+
+    Args:
+        lats: lats of the points
+        lons: lons of the points
+
+    Returns:
+        array of the lengths of the len(lats) - 1 segments in km
+    """
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    if len(lats) < 2:
+        return np.zeros(0)
+    return _geod_arrays(__PR.inv, lons[:-1], lats[:-1], lons[1:], lats[1:])[-1] / 1000.
+
+
 def find_location(lat, lon, tolerance=5):
     """
     Checks if a location is present at given coordinates
@@ -66,15 +88,114 @@ def find_location(lat, lon, tolerance=5):
     :param tolerance: maximum distance between location and coordinates in km
     :return: None or lat/lon, name
     """
-    locations = config_loader(dataset='locations')
-    distances = sorted([(get_distance(lat, lon, loc_lat, loc_lon), loc)
-                        for loc, (loc_lat, loc_lon) in locations.items()])
-    if len(distances) > 0 and distances[0][0] <= tolerance:
-        return locations[distances[0][1]], distances[0][1]
+    index = get_location_index()
+    distances = index.within(lat, lon, tolerance)
+    if len(distances) > 0:
+        return index.locations[distances[0][1]], distances[0][1]
     else:
         return None
 
 
+def get_location_index():
+    """
+    Returns the LocationIndex of the locations of the config. It is built once
+    and rebuilt whenever the config provides different locations.
+    """
+    global _location_index
+    locations = config_loader(dataset='locations')
+    if _location_index is None or (
+            _location_index.source is not locations and _location_index.locations != locations):
+        _location_index = LocationIndex(locations)
+    _location_index.source = locations
+    return _location_index
+
+
+def _unit_vectors(lats, lons):
+    """
+    Returns the surface normals of the given coordinates as unit vectors.
+    """
+    lats, lons = np.radians(lats), np.radians(lons)
+    return np.stack([np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)], axis=-1)
+
+
+def _geod_arrays(function, *arrays):
+    """
+    Calls a method of Geod, e.g. inv or fwd, for arrays of equal length and
+    returns its results as arrays. A single element is passed as scalars, as
+    pyproj would convert one-element arrays to scalars, which NumPy deprecated.
+    """
+    if len(arrays[0]) == 1:
+        return tuple(np.array([_x]) for _x in function(*[_x[0] for _x in arrays]))
+    return tuple(np.asarray(_x) for _x in function(*arrays))
+
+
+def _distances_from(lat, lon, lats, lons):
+    """
+    Returns the distances in km from one point to each of the given points.
+    """
+    lat, lon = np.full(len(lats), lat, dtype=float), np.full(len(lons), lon, dtype=float)
+    return _geod_arrays(__PR.inv, lon, lat, lons, lats)[-1] / 1000.
+
+
+class LocationIndex(object):
+    """
+    Spatial index of named locations for nearest neighbour and radius queries
+    by geodesic distance.
+
+    The surface normals of the locations are kept in a k-d tree. A radius on
+    the ellipsoid bounds the angle between the normals, so the tree returns a
+    superset of the matching locations, whose distances are then computed
+    exactly as by get_distance. The results are identical to sorting the
+    distances to all locations.
+    """
+
+    def __init__(self, locations):
+        """
+        Args:
+            locations: dictionary of location names to (lat, lon)
+        """
+        self.locations = dict(locations)
+        self.source = locations
+        self.names = list(self.locations)
+        coordinates = np.asarray([self.locations[_x] for _x in self.names], dtype=float).reshape(-1, 2)
+        self.lats, self.lons = coordinates[:, 0].copy(), coordinates[:, 1].copy()
+        self.tree = cKDTree(_unit_vectors(self.lats, self.lons)) if len(self.names) > 0 else None
+
+    def __len__(self):
+        return len(self.names)
+
+    def within(self, lat, lon, radius):
+        """
+        Returns the locations at most radius km away from the given coordinates.
+
+        Returns:
+            list of (distance in km, name) sorted by distance and name
+        """
+        if self.tree is None or not np.isfinite([lat, lon, radius]).all() or radius < 0:
+            return []
+        angle = min(np.pi, radius / _MIN_CURVATURE_RADIUS)
+        chord = 2 * np.sin(angle / 2) * (1 + 1e-9) + 1e-12
+        indices = np.asarray(self.tree.query_ball_point(_unit_vectors(lat, lon), chord), dtype=int)
+        distances = _distances_from(lat, lon, self.lats[indices], self.lons[indices])
+        return sorted((_d, self.names[_i]) for _d, _i in zip(distances.tolist(), indices.tolist())
+                      if _d <= radius)
+
+    def nearest(self, lat, lon, k=1):
+        """
+        Returns the k locations nearest to the given coordinates.
+
+        Returns:
+            list of (distance in km, name) sorted by distance and name
+        """
+        k = min(k, len(self))
+        if k <= 0 or not np.isfinite([lat, lon]).all():
+            return []
+        # the k nearest normals are k locations, the farthest of which bounds the k nearest
+        indices = np.atleast_1d(self.tree.query(_unit_vectors(lat, lon), k)[1])
+        radius = _distances_from(lat, lon, self.lats[indices], self.lons[indices]).max()
+        return self.within(lat, lon, radius)[:k]
+
+
 def fix_angle(ang):
     """
     Normalizes an angle between -180 and 180 degree.
@@ -112,157 +233,234 @@ def rotate_point(point, angle, origin=(0, 0)):
 
 
 def get_projection_params(proj):
-    proj = proj.lower()
-    if proj.startswith("crs:"):
-        raise ValueError("CRS not supported")
-
-        projid = proj[4:]
-        if projid == "84":
-            proj_params = {
-                "basemap": {"projection": "cyl"},
-                "bbox": "degree"}
-        else:
-            raise ValueError("unsupported CRS code: '%s'", proj)
-
-    elif proj.startswith("auto:"):
-        raise ValueError("AUTO not supported")
-
-        projid, unitsid, lon0, lat0 = proj[5:].split(",")
-        if projid == "42001":
-            proj_params = {
-                "basemap": {"projection": "tmerc", "lon_0": lon0, "lat_0": lat0},
-                "bbox": f"meter({lon0},{lat0})"}
-        elif projid == "42002":
-            proj_params = {
-                "basemap": {"projection": "tmerc", "lon_0": lon0, "lat_0": lat0},
-                "bbox": f"meter({lon0},{lat0})"}
-        elif projid == "42003":
-            proj_params = {
-                "basemap": {"projection": "ortho", "lon_0": lon0, "lat_0": lat0},
-                "bbox": f"meter({lon0},{lat0})"}
-        else:
-            raise ValueError("unspecified AUTO code: '%s'", proj)
-
-    elif proj.startswith("auto2:"):
-        raise ValueError("AUTO2 not supported")
-
-        projid, factor, lon0, lat0 = proj[6:].split(",")
-        if projid == "42001":
-            proj_params = {
-                "basemap": {"projection": "tmerc", "lon_0": lon0, "lat_0": lat0},
-                "bbox": f"meter({lon0},{lat0})"}
-        elif projid == "42002":
-            proj_params = {
-                "basemap": {"projection": "tmerc", "lon_0": lon0, "lat_0": lat0},
-                "bbox": f"meter({lon0},{lat0})"}
-        elif projid == "42003":
-            proj_params = {
-                "basemap": {"projection": "ortho", "lon_0": lon0, "lat_0": lat0},
-                "bbox": f"meter({lon0},{lat0})"}
-        elif projid == "42004":
-            proj_params = {
-                "basemap": {"projection": "cyl"},
-                "bbox": f"meter({lon0},{lat0})"}
-        elif projid == "42005":
-            proj_params = {
-                "basemap": {"projection": "moll", "lon_0": lon0, "lat_0": lat0},
-                "bbox": "meter???"}
-        else:
-            raise ValueError("unspecified AUTO2 code: '%s'", proj)
-
-    elif proj.startswith("epsg:"):
-        epsg = proj[5:]
-        if epsg.startswith("777") and len(epsg) == 8:  # user defined MSS code. deprecated.
-            logging.warning("Using deprecated MSS-specific EPSG code. Switch to 'MSS:stere' instead.")
-            lat_0, lon_0 = int(epsg[3:5]), int(epsg[5:])
-            proj_params = {
-                "basemap": {"projection": "stere", "lat_0": lat_0, "lon_0": lon_0},
-                "bbox": "degree"}
-        elif epsg.startswith("778") and len(epsg) == 8:  # user defined MSS code. deprecated.
-            logging.warning("Using deprecated MSS-specific EPSG code. Switch to 'MSS:stere' instead.")
-            lat_0, lon_0 = int(epsg[3:5]), int(epsg[5:])
-            proj_params = {
-                "basemap": {"projection": "stere", "lat_0": -lat_0, "lon_0": lon_0},
-                "bbox": "degree"}
-        elif epsg in ("4258", "4326"):
-            proj_params = {"basemap": {"epsg": epsg}, "bbox": "degree"}
-        elif epsg in ("3031", "3412"):
-            proj_params = {"basemap": {"epsg": epsg}, "bbox": "meter(0,-90)"}
-        elif epsg in ("3411", "3413", "3575", "3995"):
-            proj_params = {"basemap": {"epsg": epsg}, "bbox": "meter(0,90)"}
-        elif epsg in ("3395", "3857"):
-            proj_params = {"basemap": {"epsg": epsg}, "bbox": "meter(0,0)"}
-        elif epsg in ("4839"):
-            proj_params = {"basemap": {"epsg": epsg}, "bbox": "meter(10.5,51)"}
-        elif epsg in ("31467"):
-            proj_params = {"basemap": {"epsg": epsg}, "bbox": "meter(-20.9631343,0.0037502)"}
-        elif epsg in ("31468"):
-            proj_params = {"basemap": {"epsg": epsg}, "bbox": "meter(-25.4097892,0.0037466)"}
-        else:
-            raise ValueError("EPSG code not supported by basemap module: '%s'", proj)
-
-    elif proj.startswith("mss:"):
-        # some MSS-specific codes
-        params = proj[4:].split(",")
-        name = params[0]
-        if name == "stere":
-            lon0, lat0, lat_ts = params[1:]
-            proj_params = {
-                "basemap": {"projection": name, "lat_0": lat0, "lon_0": lon0, "lat_ts": lat_ts},
-                "bbox": "degree"}
-        elif name == "cass":
-            lon0, lat0 = params[1:]
-            proj_params = {
-                "basemap": {"projection": name, "lon_0": lon0, "lat_0": lat0},
-                "bbox": "degree"}
-        elif name == "lcc":
-            lon0, lat0, lat1, lat2 = params[1:]
-            proj_params = {
-                "basemap": {"projection": name, "lon_0": lon0, "lat_0": lat0, "lat_1": lat1, "lat_2": lat2},
-                "bbox": "degree"}
-        elif name == "merc":
-            lat_ts = params[1]
-            proj_params = {
-                "basemap": {"projection": name, "lat_ts": lat_ts},
-                "bbox": "degree"}
-        else:
-            raise ValueError("unknown MSS projection: '%s'", proj)
+    """
+    Returns the keyword arguments of Basemap for a CRS code and the units of
+    its bboxes as dictionary with the keys "basemap" and "bbox".
 
-    else:
+    The code is parsed by the parser registered for its family, i.e. the part
+    before the colon, see register_crs_family. The parsed codes are memoised,
+    every call returns a new dictionary.
+    """
+    proj_params = _parse_projection(proj.lower())
+    return {_key: dict(_value) if isinstance(_value, dict) else _value for _key, _value in proj_params.items()}
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_projection(proj):
+    family, separator, code = proj.partition(":")
+    if family not in _CRS_FAMILIES or not separator:
         raise ValueError("unknown projection: '%s'", proj)
+    proj_params = _CRS_FAMILIES[family](code)
     logging.debug("Identified CRS '%s' as '%s'", proj, proj_params)
     return proj_params
 
 
+def register_crs_family(family, parser):
+    """
+    Registers the parser of the CRS codes '<family>:<code>' for
+    get_projection_params, replacing a previous parser of the family.
+
+    Args:
+        family: the part of the CRS codes before the colon, e.g. "epsg"
+        parser: function taking the lower case code after the colon and
+            returning a dictionary with the keyword arguments of Basemap under
+            "basemap" and the units of bboxes under "bbox", or raising
+            ValueError for unsupported codes
+    """
+    _CRS_FAMILIES[family.lower()] = parser
+    _parse_projection.cache_clear()
+
+
+def _parse_crs_code(code):
+    raise ValueError("CRS not supported")
+
+
+def _parse_auto_code(code):
+    raise ValueError("AUTO not supported")
+
+
+def _parse_auto2_code(code):
+    raise ValueError("AUTO2 not supported")
+
+
+# bbox units of the EPSG codes passed to basemap
+_EPSG_BBOX_UNITS = {
+    "4258": "degree",
+    "4326": "degree",
+    "3031": "meter(0,-90)",
+    "3412": "meter(0,-90)",
+    "3411": "meter(0,90)",
+    "3413": "meter(0,90)",
+    "3575": "meter(0,90)",
+    "3995": "meter(0,90)",
+    "3395": "meter(0,0)",
+    "3857": "meter(0,0)",
+    "4839": "meter(10.5,51)",
+    "31467": "meter(-20.9631343,0.0037502)",
+    "31468": "meter(-25.4097892,0.0037466)",
+}
+
+
+def _parse_epsg_code(code):
+    if code[:3] in ("777", "778") and len(code) == 8:  # user defined MSS code. deprecated.
+        logging.warning("Using deprecated MSS-specific EPSG code. Switch to 'MSS:stere' instead.")
+        lat_0, lon_0 = int(code[3:5]), int(code[5:])
+        return {
+            "basemap": {"projection": "stere", "lat_0": lat_0 if code[:3] == "777" else -lat_0, "lon_0": lon_0},
+            "bbox": "degree"}
+    if code not in _EPSG_BBOX_UNITS:
+        raise ValueError("EPSG code not supported by basemap module: '%s'", f"epsg:{code}")
+    return {"basemap": {"epsg": code}, "bbox": _EPSG_BBOX_UNITS[code]}
+
+
+# Basemap keywords of the values of the MSS-specific codes 'mss:<projection>,<values>'
+_MSS_PROJECTION_KEYWORDS = {
+    "stere": ("lon_0", "lat_0", "lat_ts"),
+    "cass": ("lon_0", "lat_0"),
+    "lcc": ("lon_0", "lat_0", "lat_1", "lat_2"),
+    "merc": ("lat_ts",),
+}
+
+
+def _parse_mss_code(code):
+    name, *values = code.split(",")
+    if name not in _MSS_PROJECTION_KEYWORDS:
+        raise ValueError("unknown MSS projection: '%s'", f"mss:{code}")
+    keywords = _MSS_PROJECTION_KEYWORDS[name]
+    if len(values) != len(keywords):
+        raise ValueError(f"MSS projection '{name}' requires the values {', '.join(keywords)}: 'mss:{code}'")
+    return {"basemap": dict(projection=name, **dict(zip(keywords, values))), "bbox": "degree"}
+
+
+# parsers of the CRS codes by family, see register_crs_family
+_CRS_FAMILIES = {
+    "crs": _parse_crs_code,
+    "auto": _parse_auto_code,
+    "auto2": _parse_auto2_code,
+    "epsg": _parse_epsg_code,
+    "mss": _parse_mss_code,
+}
+
+
+def get_horizontal_interpolation_factors(coords, points, period=None):
+    """
+    Compute indices and weights to linearly interpolate along one horizontal
+    grid axis.
+
+    The grid coordinates may be in arbitrary order, they do not have to be
+    uniform. Points outside of the grid get NaN weights. If a period is given
+    (e.g. 360 for longitudes), the points are mapped into the period starting
+    at the smallest grid coordinate. Points beyond the largest coordinate of
+    a grid covering the whole period are interpolated across the seam.
+
+    Returns a tuple (lower, upper, weights) of the indices of the neighbouring
+    grid points of each point into the original coordinates and the weights of
+    the upper neighbours.
+    """
+    coords = np.asarray(coords, dtype=float)
+    points = np.asarray(points, dtype=float)
+    order = np.argsort(coords, kind="stable")
+    sorted_coords = coords[order]
+    if period is not None:
+        # points within the grid are kept as they are to avoid rounding errors
+        outside = (points < sorted_coords[0]) | (points > sorted_coords[-1])
+        points = np.where(outside, ((points - sorted_coords[0]) % period) + sorted_coords[0], points)
+        gap = sorted_coords[0] + period - sorted_coords[-1]
+        if len(coords) > 1 and 0 < gap <= np.diff(sorted_coords).max() * (1 + 1e-6):
+            sorted_coords = np.append(sorted_coords, sorted_coords[0] + period)
+            order = np.append(order, order[0])
+    positions = np.interp(points, sorted_coords, np.arange(len(sorted_coords)), left=np.nan, right=np.nan)
+    valid = ~np.isnan(positions)
+    # the last grid point is interpolated from its lower neighbour, like in
+    # scipy.ndimage.map_coordinates()
+    lower = np.clip(np.floor(np.where(valid, positions, 0)).astype(int), 0, max(len(sorted_coords) - 2, 0))
+    upper = np.minimum(lower + 1, len(sorted_coords) - 1)
+    weights = np.where(valid, positions - lower, np.nan)
+    return order[lower], order[upper], weights
+
+
 def interpolate_vertsec(data3D, data3D_lats, data3D_lons, lats, lons):
     """
     Interpolate curtain[z,pos] (curtain[level,pos]) from data3D[z,y,x]
     (data3D[level,lat,lon]).
 
-    This method is based on scipy.ndimage.map_coordinates().
+    The curtain is bilinearly interpolated for all levels at once from the
+    four grid points surrounding each position. Positions outside of the grid
+    and positions next to a masked or NaN grid point are masked.
 
     data3D can be on an IRREGULAR lat/lon grid, coordinates given by lats, lons.
     The lats, lons arrays can have arbitrary order, they do not have to be uniform.
+    Longitudes are periodic, so a global grid is also interpolated across its
+    seam.
     """
-    # Create an empty field to accommodate the curtain.
-    curtain = np.zeros([data3D.shape[0], len(lats)])
+    lat_lower, lat_upper, lat_weights = get_horizontal_interpolation_factors(data3D_lats, lats)
+    lon_lower, lon_upper, lon_weights = get_horizontal_interpolation_factors(data3D_lons, lons, period=360)
+
+    data = np.ma.getdata(data3D)
+    mask = np.ma.getmask(data3D)
+    curtain = np.zeros((data.shape[0], len(lat_weights)))
+    for lat_indices, lat_factors in ((lat_lower, 1 - lat_weights), (lat_upper, lat_weights)):
+        for lon_indices, lon_factors in ((lon_lower, 1 - lon_weights), (lon_upper, lon_weights)):
+            values = data[:, lat_indices, lon_indices].astype(float)
+            if mask is not np.ma.nomask:
+                values[mask[:, lat_indices, lon_indices]] = np.nan
+            # NaN values spread even with a weight of zero
+            curtain += values * (lat_factors * lon_factors)
+    if data.dtype.kind == "f" and data.dtype.itemsize < curtain.dtype.itemsize:
+        # keep the precision of the data, as map_coordinates() did
+        curtain = curtain.astype(data.dtype).astype(curtain.dtype)
+    return np.ma.masked_invalid(curtain)
 
-    # Transform lat/lon values to array index space. This is necessary to use
-    # scipy.ndimage.map_coordinates().
-    interp_lat = interp1d(data3D_lats, np.arange(len(data3D_lats)), bounds_error=False)
-    ind_lats = interp_lat(lats)
-    interp_lon = interp1d(data3D_lons, np.arange(len(data3D_lons)), bounds_error=False)
-    ind_lons = interp_lon(lons)
-    ind_coords = np.array([ind_lats, ind_lons])
 
-    # One horizontal interpolation for each model level. The order
-    # parameter controls the degree of the splines used, i.e. order=1
-    # stands for linear interpolation.
-    for ml in range(data3D.shape[0]):
-        curtain[ml, :] = map_coordinates(data3D[ml, :, :].filled(np.nan), ind_coords, order=1)
+def get_vertical_interpolation_factors(pressures, alts):
+    """
+    Compute indices and weights to interpolate a curtain[level,pos] to one
+    vertical coordinate value per position.
 
-    curtain[:, np.isnan(ind_lats) | np.isnan(ind_lons)] = np.nan
-    return np.ma.masked_invalid(curtain)
+    For each position, the level closest to the requested value is combined
+    with its neighbour on the far side of the requested value. Values outside
+    of the column are assigned to the closest level. Invalid (NaN or masked)
+    pressures are never selected, unless the first level is invalid.
+
+    Arguments:
+    pressures -- vertical coordinate (e.g. pressure) of the levels, either as
+                 curtain[level,pos] or as profile[level] valid for all positions
+    alts -- requested vertical coordinate value for each position
+
+    Returns a tuple (indices, weights) of [2,pos] arrays, which can be applied
+    by interpolate_vertical().
+    """
+    alts = np.asarray(alts)
+    pressures = np.ma.filled(np.ma.asarray(pressures, dtype=float), np.nan)
+    if pressures.ndim == 1:
+        pressures = np.broadcast_to(pressures[:, np.newaxis], (len(pressures), len(alts)))
+    positions = np.arange(len(alts))
+    distances = np.abs(pressures - alts[np.newaxis, :])
+    closest = np.where(np.isnan(distances), np.inf, distances).argmin(axis=0)
+    # an invalid first level can never be replaced by a closer one
+    closest[np.isnan(distances[0])] = 0
+    direction = np.where(pressures[closest, positions] - alts > 0, 1, -1)
+    direction[closest == 0] = 1
+    next_closest = closest + direction
+    outside = (next_closest >= len(pressures)) | (next_closest < 0)
+    next_closest[outside] = closest[outside]
+
+    distance_closest = distances[closest, positions]
+    distance_next = distances[next_closest, positions]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total = distance_closest + distance_next
+        weights = np.array([1 - distance_closest / total, 1 - distance_next / total])
+    weights[:, outside] = 0.5
+    return np.array([closest, next_closest]), weights
+
+
+def interpolate_vertical(curtain, indices, weights):
+    """
+    Interpolate curtain[level,pos] to one value per position using the
+    indices and weights returned by get_vertical_interpolation_factors().
+    """
+    curtain = np.ma.filled(np.ma.asarray(curtain, dtype=float), np.nan)
+    return (np.take_along_axis(curtain, indices, axis=0) * weights).sum(axis=0)
 
 
 def latlon_points(lat0, lon0, lat1, lon1, numpoints=100, connection='linear'):
@@ -324,13 +522,12 @@ def path_points(lats, lons, numpoints=100, times=None, alts=None, connection='li
 
     # First compute the lengths of the individual path segments, i.e.
     # the distances between the points.
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
     if connection == 'linear':
-        lats, lons = np.asarray(lats), np.asarray(lons)
         distances = np.hypot(lats[:-1] - lats[1:], lons[:-1] - lons[1:])
     else:
-        distances = [
-            get_distance(lats[i], lons[i], lats[i + 1], lons[i + 1])
-            for i in range(len(lats) - 1)]
+        azimuths, _, meters = _geod_arrays(__PR.inv, lons[:-1], lats[:-1], lons[1:], lats[1:])
+        distances = meters / 1000.
 
     # Compute the total length of the path and the length of the point
     # segments to be computed.
@@ -350,26 +547,46 @@ def path_points(lats, lons, numpoints=100, times=None, alts=None, connection='li
 
     # For each segment, determine the number of points to be computed
     # from the distance between the two bounding points and the
-    # length of the point segments. Then compute the intermediate
-    # points. Cut the first point from each segment other than the
-    # first segment to avoid double points.
-    r_lats, r_lons, r_times, r_alts = [], [], [], []
-    startidx = 0
-    for i in range(len(lats) - 1):
-        segment_points = int(round(distances[i] / length_point_segment))
-        # Enforce that a segment consists of at least two points
-        # (otherwise latlon_points will throw an exception).
-        segment_points = max(segment_points, 2)
-        lats_, lons_ = latlon_points(
-            lats[i], lons[i], lats[i + 1], lons[i + 1],
-            numpoints=segment_points, connection=connection)
-        r_lons.extend(lons_[startidx:])
-        r_lats.extend(lats_[startidx:])
-        if times is not None:
-            r_times.extend(np.linspace(times[i], times[i + 1], segment_points)[startidx:])
-        if alts is not None:
-            r_alts.extend(np.linspace(alts[i], alts[i + 1], segment_points)[startidx:])
-        startidx = 1
+    # length of the point segments. Enforce that a segment consists of at
+    # least two points. The first point of each segment other than the
+    # first segment is cut to avoid double points. All points are then
+    # computed at once: <segments> holds the segment of each point and
+    # <steps> its position within the segment.
+    segment_points = np.maximum(np.round(distances / length_point_segment).astype(int), 2)
+    counts = segment_points - 1
+    counts[0] += 1
+    segments = np.repeat(np.arange(len(segment_points)), counts)
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    steps[counts[0]:] += 1
+    divisors = (segment_points - 1)[segments]
+    last = steps == divisors
+
+    def linspace(values):
+        # same as np.linspace(values[i], values[i + 1], segment_points[i]) for all segments
+        values = np.asarray(values, dtype=float)
+        starts, stops = values[:-1][segments], values[1:][segments]
+        result = steps * ((stops - starts) / divisors) + starts
+        result[last] = stops[last]
+        return result
+
+    if connection == 'linear':
+        r_lats, r_lons = linspace(lats), linspace(lons)
+    else:
+        # intermediate points on the geodesic of each segment, equally spaced
+        # like the ones of Geod.npts()
+        r_lats, r_lons = lats[:-1][segments], lons[:-1][segments]
+        inner = (steps > 0) & ~last
+        r_lons[last], r_lats[last] = lons[1:][segments[last]], lats[1:][segments[last]]
+        if inner.any():
+            inner_segments = segments[inner]
+            r_lons[inner], r_lats[inner], _ = _geod_arrays(
+                __PR.fwd, r_lons[inner], r_lats[inner], azimuths[inner_segments],
+                steps[inner] * (meters[inner_segments] / divisors[inner]))
+    r_lats, r_lons = r_lats.tolist(), r_lons.tolist()
+    if times is not None:
+        r_times = linspace(times)
+    if alts is not None:
+        r_alts = linspace(alts).tolist()
 
     result = [r_lats, r_lons]
     if times is not None:
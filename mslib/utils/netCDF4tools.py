@@ -27,6 +27,9 @@
 """
 
 import glob
+import hashlib
+import threading
+import weakref
 import numpy as np
 import netCDF4
 
@@ -40,9 +43,121 @@ VERTICAL_AXIS = {
     "fl": "fligth_level_coordinate",
 }
 
+# The netCDF-C library is not thread-safe. Threads accessing NetCDF files
+# concurrently (e.g. the plot drivers of a multi-threaded WMS server) need
+# to hold this lock while calling into the library.
+netcdf_lock = threading.RLock()
+
 # NETCDF FILE TOOLS
 
 
+class VariableIndex(object):
+    """
+    Index of the variables of an open netCDF4.Dataset (or MFDataset) by their
+    standard_name, units and axis attributes.
+
+    The attributes of all variables are read once on construction, lookups
+    are dictionary accesses. Hence, the index does not see variables or
+    attributes added later. Only variable names are stored, so that the
+    index does not keep the dataset alive. Use get_variable_index() to get
+    the index shared by all users of a dataset.
+    """
+
+    ATTRIBUTES = ("standard_name", "units", "axis")
+
+    def __init__(self, ncfile):
+        # attribute -> value -> names of the variables in file order
+        self._index = {attribute: {} for attribute in self.ATTRIBUTES}
+        self._positions = {}
+        for position, (var_name, variable) in enumerate(ncfile.variables.items()):
+            self._positions[var_name] = position
+            attributes = variable.ncattrs()
+            for attribute in self.ATTRIBUTES:
+                if attribute in attributes:
+                    value = variable.getncattr(attribute)
+                    if isinstance(value, str):
+                        self._index[attribute].setdefault(value, []).append(var_name)
+        self._vertical_axis = None
+
+    def find(self, attribute, values):
+        """
+        Returns the names of all variables, whose <attribute> ("standard_name",
+        "units" or "axis") is one of <values> (a string or a list), in file order.
+        """
+        if not isinstance(values, list):
+            values = [values]
+        index = self._index[attribute]
+        names = [_name for _value in values for _name in index.get(_value, [])]
+        return sorted(set(names), key=self._positions.get)
+
+    def identify_variable(self, ncfile, standard_names, check=False):
+        """
+        See identify_variable(); returns the first variable in file order.
+        """
+        names = self.find("standard_name", standard_names)
+        if names:
+            return names[0], ncfile.variables[names[0]]
+        if check:
+            raise IOError("cannot identify NetCDF variable "
+                          f"specified by {standard_names}")
+        return None, None
+
+    def identify_vertical_axis(self, ncfile):
+        """
+        See identify_vertical_axis(); the result is determined only once.
+        """
+        if self._vertical_axis is None:
+            result = []
+            for layertype, standard_name in VERTICAL_AXIS.items():
+                name, var = self.identify_variable(ncfile, standard_name)
+                if var is not None:
+                    units = getattr(var, "units", "dimensionless")
+                    result.append((name, hybrid_orientation(var), units, layertype))
+            if len(result) > 1:
+                raise IOError("Identified more than one vertical axis: "
+                              f"{[(_x[0], ncfile.variables[_x[0]]) + _x[1:] for _x in result]}")
+            self._vertical_axis = result
+        if len(self._vertical_axis) == 0:
+            return None, None, None, None, "sfc"
+        name, orientation, units, layertype = self._vertical_axis[0]
+        return name, ncfile.variables[name], orientation, units, layertype
+
+
+_variable_indices = weakref.WeakKeyDictionary()
+
+
+def share_variable_index(ncfile):
+    """
+    Builds the VariableIndex of the open dataset <ncfile> and shares it with
+    all following calls of get_variable_index() until the dataset is garbage
+    collected. The caller guarantees that the variables and their attributes
+    do not change, e.g. as the dataset was opened read-only.
+    """
+    with netcdf_lock:
+        index = VariableIndex(ncfile)
+        _variable_indices[ncfile] = index
+        return index
+
+
+def get_variable_index(ncfile):
+    """
+    Returns the VariableIndex of the open dataset <ncfile>.
+
+    The index of a MFDataset (e.g. MFDatasetCommonDims), which is always
+    opened read-only, is shared, see share_variable_index(). A plain
+    netCDF4.Dataset may have been opened for writing and does not tell so,
+    hence its index is built for each call unless it was shared explicitly.
+    """
+    with netcdf_lock:
+        index = _variable_indices.get(ncfile)
+        if index is None:
+            if isinstance(ncfile, netCDF4.MFDataset):
+                index = share_variable_index(ncfile)
+            else:
+                index = VariableIndex(ncfile)
+        return index
+
+
 def identify_variable(ncfile, standard_names, check=False):
     """
     Identify the variable in ncfile that is described by specified rules.
@@ -54,16 +169,7 @@ def identify_variable(ncfile, standard_names, check=False):
                              found. If False, return None.
 
     """
-    if not isinstance(standard_names, list):
-        standard_names = [standard_names]
-
-    for var_name, variable in ncfile.variables.items():
-        if "standard_name" in variable.ncattrs() and variable.standard_name in standard_names:
-            return var_name, variable
-    if check:
-        raise IOError("cannot identify NetCDF variable "
-                      f"specified by {standard_names}")
-    return None, None
+    return get_variable_index(ncfile).identify_variable(ncfile, standard_names, check=check)
 
 
 def identify_CF_lonlat(ncfile):
@@ -106,19 +212,7 @@ def identify_vertical_axis(dataset):
     NOTE: This code assumes that a file contains data on exactly one level
     type, not on more that one!
     """
-
-    result = []
-    for layertype, standard_name in VERTICAL_AXIS.items():
-        name, var = identify_variable(dataset, standard_name)
-        orientation = hybrid_orientation(var)
-        if var is not None:
-            units = getattr(var, "units", "dimensionless")
-            result.append((name, var, orientation, units, layertype))
-    if len(result) == 0:
-        return None, None, None, None, "sfc"
-    if len(result) > 1:
-        raise IOError(f"Identified more than one vertical axis: {result}")
-    return result[0]
+    return get_variable_index(dataset).identify_vertical_axis(dataset)
 
 
 def identify_CF_time(ncfile):
@@ -185,21 +279,101 @@ def get_latlon_data(ncfile, autoreverse=True):
     return lat_data, lon_data, lat_order
 
 
+def coordinate_hashes(ncfile):
+    """
+    Returns a dictionary mapping the names of all dimensions of <ncfile> that
+    have a coordinate variable to a hash of the values of this variable.
+
+    Equal hashes of two files allow MFDatasetCommonDims to skip comparing
+    their coordinate variables element-wise.
+    """
+    hashes = {}
+    for name in ncfile.dimensions:
+        if name not in ncfile.variables:
+            continue
+        data = np.ascontiguousarray(np.ma.getdata(ncfile.variables[name][:]))
+        digest = hashlib.sha1(f"{data.dtype.str} {data.shape}".encode("utf-8"))
+        digest.update(data.tobytes())
+        hashes[name] = digest.hexdigest()
+    return hashes
+
+
+def set_chunk_cache(var, chunk_cache):
+    """
+    Sets the chunk cache of the chunked (NETCDF4/HDF5) variable <var> to
+    <chunk_cache>, a tuple (size, nelems, preemption) or a dictionary mapping
+    standard names to such tuples. Other variables are left untouched.
+    """
+    if var.chunking() in (None, "contiguous"):
+        return
+    if isinstance(chunk_cache, dict):
+        chunk_cache = chunk_cache.get(getattr(var, "standard_name", None))
+        if chunk_cache is None:
+            return
+    var.set_var_chunk_cache(*chunk_cache)
+
+
+def read_hyperslab(var, index):
+    """
+    Returns var[index] for a tuple <index> of integers and slices.
+
+    Slices with a step of 1 or -1 into chunked (NETCDF4/HDF5) variables are
+    widened to the chunk boundaries, so that HDF5 reads each touched chunk
+    as a whole straight into the result instead of through the chunk cache,
+    and cut to the requested size in memory. This is only done if it does
+    not more than double the read data; all other reads are passed on.
+    """
+    chunking = var.chunking()
+    if chunking in (None, "contiguous") or not isinstance(index, tuple) or len(index) != var.ndim:
+        return var[index]
+    read, crop = [], []
+    requested, aligned = 1, 1
+    for item, chunk, size in zip(index, chunking, var.shape):
+        if isinstance(item, (int, np.integer)):
+            read.append(item)
+            continue
+        if not isinstance(item, slice):
+            return var[index]
+        start, stop, step = item.indices(size)
+        if step == 1:
+            low, high = start, stop
+        elif step == -1:
+            low, high = stop + 1, start + 1
+        else:
+            return var[index]
+        if low >= high:
+            return var[index]
+        first = (low // chunk) * chunk
+        last = min(-(-high // chunk) * chunk, size)
+        requested *= high - low
+        aligned *= last - first
+        read.append(slice(first, last))
+        if step == 1:
+            crop.append(slice(low - first, high - first))
+        else:
+            crop.append(slice(high - 1 - first, low - 1 - first if low > first else None, -1))
+    if aligned > 2 * requested:
+        return var[index]
+    return var[tuple(read)][tuple(crop)]
+
+
 class MFDatasetCommonDims(netCDF4.MFDataset):
-    """MFDatasetCommonDims(self, files, exclude=[], require_dim_num=False)
+    """MFDatasetCommonDims(self, files, exclude=[], require_dim_num=False, chunk_cache=None,
+                           coordinate_hashes=None)
 
     Class for reading multi-file netCDF Datasets with common dimensions,
     making variables in different files appear as if they were in one file.
 
-    Datasets must be in C{NETCDF4_CLASSIC, NETCDF3_CLASSIC or NETCDF3_64BIT}
-    format (C{NETCDF4} Datasets won't work).
+    Datasets may be in C{NETCDF4, NETCDF4_CLASSIC, NETCDF3_CLASSIC or
+    NETCDF3_64BIT} format. Of C{NETCDF4} Datasets only the variables of the
+    root group are used.
 
     Inherits MFDataset from the U{netcdf4-python
     <http://netcdf4-python.googlecode.com/>} library by Jeffrey Whitaker.
     """
 
     def __init__(self, files, exclude=None, skip_dim_check=None,
-                 require_dim_num=False):
+                 require_dim_num=False, chunk_cache=None, coordinate_hashes=None):
         """
         Open a Dataset spanning multiple files sharing common dimensions but
         containing different record variables, making it look as if it was a
@@ -211,7 +385,8 @@ class MFDatasetCommonDims(netCDF4.MFDataset):
         Usage:
 
         nc = MFDatasetCommonDims(files, exclude=[], skip_dim_check=[],
-                                 require_dim_num=False)
+                                 require_dim_num=False, chunk_cache=None,
+                                 coordinate_hashes=None)
 
         @param files: either a sequence of netCDF files or a string with a
         wildcard (converted to a sorted list of files using glob)  The first file
@@ -234,6 +409,15 @@ class MFDatasetCommonDims(netCDF4.MFDataset):
         numerical inaccuracies when opening NetCDF files converted from mixed
         GRIB1/2 files. (mr 03Aug2012)
         @param require_dim_num: see above.
+        @param chunk_cache: Size of the HDF5 chunk cache of the chunked
+        variables as tuple (size in bytes, number of chunk slots, preemption),
+        see netCDF4.Variable.set_var_chunk_cache, or a dictionary mapping
+        standard names to such tuples for tuning single variables. Entries
+        of None keep the default of the netCDF library.
+        @param coordinate_hashes: A dictionary mapping file names to the
+        coordinate_hashes() of the files, e.g. as recorded by the data access
+        on setup. Dimensions, whose hashes agree with the ones of the master,
+        are not compared element-wise. All others are checked as usual.
         """
         # Open the master file in the base class, so that the CDFMF instance
         # can be used like a CDF instance.
@@ -273,11 +457,15 @@ class MFDatasetCommonDims(netCDF4.MFDataset):
         if len(cdfVar) == 0:
             raise IOError(f"master dataset '{master}' does not have any variable")
 
+        coordinate_hashes = coordinate_hashes or {}
+        master_hashes = coordinate_hashes.get(master, {})
+
         # Open each remaining file in read-only mode.
         # Make sure each file defines the same record variables as the master
         # and that the variables are defined in the same way (name, shape and type)
         for f in files[1:]:
             part = netCDF4.Dataset(f)
+            part_hashes = coordinate_hashes.get(f, {})
             # Make sure dimension of new dataset are contained in the master.
             for dimName in part.dimensions:
                 # (..except those that shall not be tested..)
@@ -286,6 +474,8 @@ class MFDatasetCommonDims(netCDF4.MFDataset):
                         raise IOError(f"dimension '{dimName}' not defined in master '{master}'")
                     if dimName not in part.variables:
                         raise IOError(f"dimension '{dimName}' has no coordinate variable in file '{f}'")
+                    if part_hashes.get(dimName) is not None and part_hashes[dimName] == master_hashes.get(dimName):
+                        continue
                     if len(part.dimensions[dimName]) != len(cdfm.dimensions[dimName]) or \
                             (part.variables[dimName][:] != cdfm.variables[dimName][:]).any():
                         raise IOError(f"dimension '{dimName}' differs in master '{master}' and "
@@ -312,13 +502,11 @@ class MFDatasetCommonDims(netCDF4.MFDataset):
         self._vars = cdfVar
         self._cdfOrigin = cdfOrigin
 
-        self._file_format = []
-        for dset in self._cdf:
-            if dset.file_format == "NETCDF4":
-                raise ValueError("MFNetCDF4 only works with NETCDF3_CLASSIC, "
-                                 "NETCDF3_64BIT and NETCDF4_CLASSIC "
-                                 "formatted files, not NETCDF4")
-            self._file_format.append(dset.file_format)
+        self._file_format = [dset.file_format for dset in self._cdf]
+
+        if chunk_cache is not None:
+            for v in cdfVar.values():
+                set_chunk_cache(v, chunk_cache)
 
     def getOriginFile(self, varname):
         """Returns filename and NetCDF4.Dataset-instance of the file that
@@ -26,7 +26,10 @@
     limitations under the License.
 """
 
+import functools
+
 import numpy as np
+import pint
 
 from mslib.utils.units import units, check_units
 
@@ -86,7 +89,7 @@ def pot_temp(p, t):
     Returns: potential temperature in [K].
     """
     return mpcalc.potential_temperature(
-        units.Pa * p, units.K * t).to("K").m
+        units.Quantity(p, units.Pa), units.Quantity(t, units.K)).m_as(units.K)
 
 
 def eqpt_approx(p, t, q):
@@ -103,10 +106,9 @@ def eqpt_approx(p, t, q):
 
     Returns: equivalent potential temperature in [K].
     """
-
+    p, t = units.Quantity(p, units.Pa), units.Quantity(t, units.K)
     return mpcalc.equivalent_potential_temperature(
-        units.Pa * p, units.K * t,
-        mpcalc.dewpoint_from_specific_humidity(units.Pa * p, units.K * t, q)).to("K").m
+        p, t, mpcalc.dewpoint_from_specific_humidity(p, t, q)).m_as(units.K)
 
 
 def omega_to_w(omega, p, t):
@@ -123,7 +125,7 @@ def omega_to_w(omega, p, t):
     Returns the vertical velocity in geometric coordinates, [m/s].
     """
     return mpcalc.vertical_velocity(
-        units("Pa/s") * omega, units.Pa * p, units.K * t).to("m/s").m
+        units.Quantity(omega, "Pa/s"), units.Quantity(p, units.Pa), units.Quantity(t, units.K)).m_as("m/s")
 
 
 # Values according to the 1976 U.S. Standard atmosphere [NOAA1976]_.
@@ -139,8 +141,131 @@ _STANDARD_ATMOSPHERE = [
 ]
 _HEIGHT, _TEMPERATURE, _PRESSURE, _TEMPERATURE_GRADIENT = 0, 1, 2, 3
 
+# Per-layer constants of _STANDARD_ATMOSPHERE as plain arrays in SI units for
+# the array based conversions below. The last entry only bounds the top layer.
+_ISA_HEIGHTS = np.array([_x[_HEIGHT].m_as(units.m) for _x in _STANDARD_ATMOSPHERE])
+_ISA_TEMPERATURES = np.array([_x[_TEMPERATURE].m_as(units.K) for _x in _STANDARD_ATMOSPHERE])
+_ISA_PRESSURES = np.array([_x[_PRESSURE].m_as(units.Pa) for _x in _STANDARD_ATMOSPHERE])
+_ISA_GRADIENTS = np.array([_x[_TEMPERATURE_GRADIENT].m_as(units.K / units.m) for _x in _STANDARD_ATMOSPHERE])
+_ISA_ISOTHERMAL = _ISA_GRADIENTS == 0
+# gradients of isothermal layers are replaced by one to avoid divisions by zero,
+# the results of the power law are discarded for these layers
+_ISA_SAFE_GRADIENTS = np.where(_ISA_ISOTHERMAL, 1., _ISA_GRADIENTS)
+_G = g.m_as(units.m / units.s ** 2)
+_RD = Rd.m_as(units.J / units.kg / units.K)
+_ISA_EXPONENTS = _G / (_ISA_SAFE_GRADIENTS * _RD)
+_ISA_SCALE_HEIGHTS = _RD * _ISA_TEMPERATURES / _G
+
+
+def _isa_layers_by_height(height):
+    """
+    Returns the index of the standard atmosphere layer of each height (m).
+    Heights below the surface belong to the lowest layer, heights above the
+    top of the highest layer and NaN to the invalid top entry.
+    """
+    return np.maximum(np.searchsorted(_ISA_HEIGHTS, height, side="right") - 1, 0)
+
+
+def _isa_pressure(height):
+    """
+    Array based conversion of heights (m) to standard atmosphere pressures (Pa),
+    see flightlevel2pressure. Heights that cannot be converted yield NaN.
+    """
+    height = np.asarray(height, dtype=float)
+    layer = _isa_layers_by_height(height)
+    z0, t0, p0 = _ISA_HEIGHTS[layer], _ISA_TEMPERATURES[layer], _ISA_PRESSURES[layer]
+    dz = height - z0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = p0 * np.where(
+            _ISA_ISOTHERMAL[layer], np.exp(-dz / _ISA_SCALE_HEIGHTS[layer]),
+            ((t0 - _ISA_SAFE_GRADIENTS[layer] * dz) / t0) ** _ISA_EXPONENTS[layer])
+    return np.where(layer == len(_ISA_HEIGHTS) - 1, np.nan, p)[()]
+
+
+def _isa_height(pressure):
+    """
+    Array based conversion of standard atmosphere pressures (Pa) to heights (m),
+    see pressure2flightlevel. Pressures that cannot be converted yield NaN.
+    """
+    pressure = np.asarray(pressure, dtype=float)
+    # the pressures decrease with the layers, a layer includes its lower boundary
+    layer = np.maximum(np.searchsorted(-_ISA_PRESSURES, -pressure, side="right") - 1, 0)
+    z0, t0 = _ISA_HEIGHTS[layer], _ISA_TEMPERATURES[layer]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log_ratio = np.log(pressure / _ISA_PRESSURES[layer])
+        z = z0 + np.where(
+            _ISA_ISOTHERMAL[layer], -_ISA_SCALE_HEIGHTS[layer] * log_ratio,
+            (t0 - t0 * np.exp(log_ratio / _ISA_EXPONENTS[layer])) / _ISA_SAFE_GRADIENTS[layer])
+    return np.where(layer == len(_ISA_HEIGHTS) - 1, np.nan, z)[()]
+
+
+def _isa_temperature(height):
+    """
+    Array based standard atmosphere temperature (K) at the given heights (m),
+    see isa_temperature. Heights that cannot be converted yield NaN.
+    """
+    height = np.asarray(height, dtype=float)
+    layer = _isa_layers_by_height(height)
+    t = _ISA_TEMPERATURES[layer] - _ISA_GRADIENTS[layer] * (height - _ISA_HEIGHTS[layer])
+    return np.where(layer == len(_ISA_HEIGHTS) - 1, np.nan, t)[()]
+
+
+# types of magnitudes, which _unit_fast_path passes to the kernel
+_PLAIN_MAGNITUDES = (np.ndarray, float, int, np.float64, np.float32, np.int64)
+
+
+def _conversion_factor(from_unit, to_unit):
+    """
+    Returns the factor converting magnitudes in from_unit to to_unit, or None
+    for units of other dimensionality or with an offset.
+    """
+    try:
+        if units.Quantity(0., from_unit).m_as(to_unit) != 0:
+            return None
+        return units.Quantity(1., from_unit).m_as(to_unit)
+    except (pint.DimensionalityError, pint.UndefinedUnitError):
+        return None
+
+
+def _unit_fast_path(kernel, kernel_units, kernel_result_unit, result_unit):
+    """
+    Returns a decorator adding a fast path to a pint-aware function of this
+    module. Quantities with numbers or ndarrays as magnitudes skip
+    preprocess_and_wrap and check_units: their magnitudes are converted to
+    kernel_units by factors, which are cached for each signature of argument
+    units, and passed to the kernel, which works on arrays in these units.
+    Everything else, e.g. xarray DataArrays, masked arrays, units with offset
+    or results containing NaN, takes the pint-aware path, which also raises
+    all errors.
+    """
+    result_factor = _conversion_factor(kernel_result_unit, result_unit)
+
+    def decorator(func):
+        factors = {}
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if kwargs or len(args) != len(kernel_units) or not all(
+                    type(_x) is units.Quantity and type(_x.magnitude) in _PLAIN_MAGNITUDES for _x in args):
+                return func(*args, **kwargs)
+            signature = tuple(_x.units for _x in args)
+            try:
+                signature_factors = factors[signature]
+            except KeyError:
+                signature_factors = factors[signature] = [
+                    _conversion_factor(_x, _y) for _x, _y in zip(signature, kernel_units)]
+            if None in signature_factors:
+                return func(*args)
+            result = kernel(*[_x.magnitude * _y for _x, _y in zip(args, signature_factors)])
+            if np.isnan(result).any():
+                return func(*args)
+            return units.Quantity(result * result_factor, result_unit)
+        return wrapper
+    return decorator
+
 
 @exporter.export
+@_unit_fast_path(_isa_pressure, (units.m,), units.Pa, units.Pa)
 @preprocess_and_wrap(wrap_like='height')
 @check_units('[length]')
 def flightlevel2pressure(height):
@@ -168,31 +293,15 @@ def flightlevel2pressure(height):
               p_0 \cdot \exp\left(\frac{-g \cdot (Z - Z_0)}{R \cdot T_0}\right) &\text{else}
               \end{cases}
     """
-    is_array = hasattr(height.magnitude, "__len__")
-    if not is_array:
-        height = [height.magnitude] * height.units
-
-    # Initialize the return array.
-    p = np.full_like(height, np.nan) * units.Pa
-
-    for i, ((z0, t0, p0, gamma), (z1, t1, p1, _)) in enumerate(zip(_STANDARD_ATMOSPHERE[:-1],
-                                                                   _STANDARD_ATMOSPHERE[1:])):
-        indices = (height >= z0) & (height < z1)
-        if i == 0:
-            indices |= height < z0
-        if gamma != 0:
-            p[indices] = p0 * ((t0 - gamma * (height[indices] - z0)) / t0) ** (g / (gamma * Rd))
-        else:
-            p[indices] = p0 * np.exp(-g * (height[indices] - z0) / (Rd * t0))
-
+    p = _isa_pressure(height.m_as(units.m))
     if np.isnan(p).any():
         raise ValueError("flight level to pressure conversion not "
                          "implemented for z > 71km")
-
-    return p if is_array else p[0]
+    return units.Quantity(p, units.Pa)
 
 
 @exporter.export
+@_unit_fast_path(_isa_height, (units.Pa,), units.m, units.hft)
 @preprocess_and_wrap(wrap_like='pressure')
 @check_units('[pressure]')
 def pressure2flightlevel(pressure):
@@ -220,32 +329,15 @@ def pressure2flightlevel(pressure):
               Z_0 - \frac{R \cdot T_0}{g \cdot \log(\frac{p}{p_0})} &\text{else}
               \end{cases}
     """
-    is_array = hasattr(pressure.magnitude, "__len__")
-    if not is_array:
-        pressure = [pressure.magnitude] * pressure.units
-
-    # Initialize the return array.
-    z = np.full_like(pressure, np.nan) * units.hft
-
-    for i, ((z0, t0, p0, gamma), (z1, t1, p1, _)) in enumerate(zip(_STANDARD_ATMOSPHERE[:-1],
-                                                                   _STANDARD_ATMOSPHERE[1:])):
-        p1 = _STANDARD_ATMOSPHERE[i + 1][_PRESSURE]
-        indices = (pressure > p1) & (pressure <= p0)
-        if i == 0:
-            indices |= (pressure >= p0)
-        if gamma != 0:
-            z[indices] = z0 + 1. / gamma * (t0 - t0 * np.exp(gamma * Rd / g * np.log(pressure[indices] / p0)))
-        else:
-            z[indices] = z0 - (Rd * t0) / g * np.log(pressure[indices] / p0)
-
+    z = _isa_height(pressure.m_as(units.Pa))
     if np.isnan(z).any():
         raise ValueError("flight level to pressure conversion not "
                          "implemented for z > 71km")
-
-    return z if is_array else z[0]
+    return units.Quantity(z, units.m).to(units.hft)
 
 
 @exporter.export
+@_unit_fast_path(_isa_temperature, (units.m,), units.K, units.K)
 @preprocess_and_wrap(wrap_like='height')
 @check_units('[length]')
 def isa_temperature(height):
@@ -257,17 +349,15 @@ def isa_temperature(height):
         470pp., Sections II.1.4. and II.6.1.2.
 
     Arguments:
-        flightlevel -- flight level in hft
+        flightlevel -- flight level in hft, scalar or array
     Returns:
         temperature (K)
     """
-    for i, ((z0, t0, p0, gamma), (z1, t1, p1, _)) in enumerate(zip(_STANDARD_ATMOSPHERE[:-1],
-                                                                   _STANDARD_ATMOSPHERE[1:])):
-        if ((i == 0) and (height < z0)) or (z0 <= height < z1):
-            return t0 - gamma * (height - z0)
-
-    raise ValueError("ISA temperature from flight level not "
-                     "implemented for z > 71km")
+    t = _isa_temperature(height.m_as(units.m))
+    if np.isnan(t).any():
+        raise ValueError("ISA temperature from flight level not "
+                         "implemented for z > 71km")
+    return units.Quantity(t, units.K)
 
 
 def convert_pressure_to_vertical_axis_measure(vertical_axis, pressure):
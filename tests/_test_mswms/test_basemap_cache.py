@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+
+    tests._test_mswms.test_basemap_cache
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module provides pytest functions to tests mswms.basemap_cache
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import mpl_toolkits.basemap as basemap
+
+from mslib.mswms.basemap_cache import BasemapCache, _estimate_size
+
+
+class FakeBasemap(object):
+    def __init__(self, points):
+        self.coastsegs = [[(0., 0.)] * points]
+        self.ax = None
+
+
+class Test_BasemapCache(object):
+    def test_key(self):
+        key = BasemapCache.key({"projection": "cyl"}, [-22.5, 27.5, 55, 62.5], "degree", "l")
+        assert key == BasemapCache.key({"projection": "cyl"}, [-22.5, 27.5 + 1e-9, 55, 62.5], "degree", "l")
+        assert key != BasemapCache.key({"projection": "cyl"}, [-22.5, 27.5, 55, 62.6], "degree", "l")
+        assert key != BasemapCache.key({"projection": "cyl"}, [-22.5, 27.5, 55, 62.5], "degree", "i")
+
+    def test_get(self):
+        cache = BasemapCache()
+        first = cache.get("a", lambda: FakeBasemap(10))
+        first.ax = "axes"
+        second = cache.get("a", lambda: FakeBasemap(20))
+        # copies share the geometry of the cached instance, but not their axes
+        assert second.ax is None
+        assert second.coastsegs is first.coastsegs
+        assert cache.info() == {"hits": 1, "misses": 1, "evictions": 0, "entries": 1,
+                                "bytes": _estimate_size(first)}
+
+    def test_lru_eviction(self):
+        cache = BasemapCache(max_entries=2)
+        for key in ["a", "b", "a", "c"]:
+            cache.get(key, lambda: FakeBasemap(10))
+        assert list(cache._entries) == ["a", "c"]
+        assert cache.info()["evictions"] == 1
+        cache.clear()
+        assert cache.info() == {"hits": 0, "misses": 0, "evictions": 0, "entries": 0, "bytes": 0}
+
+    def test_memory_bound(self):
+        size = _estimate_size(FakeBasemap(100))
+        cache = BasemapCache(max_bytes=int(2.5 * size))
+        for key in ["a", "b", "c"]:
+            cache.get(key, lambda: FakeBasemap(100))
+        assert list(cache._entries) == ["b", "c"]
+        assert cache.info()["bytes"] == 2 * size
+        # too large instances are returned, but not stored
+        assert len(cache.get("d", lambda: FakeBasemap(1000)).coastsegs[0]) == 1000
+        assert list(cache._entries) == ["b", "c"]
+
+    def test_estimate_size(self):
+        bm = basemap.Basemap(resolution="c", projection="cyl", llcrnrlon=-30, llcrnrlat=20, urcrnrlon=60,
+                             urcrnrlat=70)
+        assert _estimate_size(bm) > 0
+        assert _estimate_size(basemap.Basemap(resolution=None, projection="cyl")) == 0
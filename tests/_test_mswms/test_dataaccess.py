@@ -26,12 +26,21 @@
     limitations under the License.
 """
 
+import concurrent.futures
 import os
+import shutil
+import sqlite3
+import time
+from copy import deepcopy
 from datetime import datetime
 
 import mock
+import netCDF4
+import pytest
 
-from mslib.mswms.dataaccess import DefaultDataAccess, CachedDataAccess
+from mslib.mswms import filewatcher
+from mslib.mswms.dataaccess import DefaultDataAccess, CachedDataAccess, WatchModificationDataAccess
+from mslib.utils import netCDF4tools
 from tests.constants import DATA_DIR
 
 
@@ -90,6 +99,47 @@ class Test_DefaultDataAccess(object):
                     datetime(2012, 10, 18, 12, 0),
                     datetime(2012, 10, 19, 0, 0)])
 
+    def test_get_inventory_hash(self):
+        inventory = self.dut.get_inventory_hash()
+        self.dut.setup()
+        assert self.dut.get_inventory_hash() == inventory
+        other = DefaultDataAccess(DATA_DIR, "EUR_LL015", uses_init_time=False)
+        other.setup()
+        assert other.get_inventory_hash() != inventory
+
+    def test_get_coordinate_hashes(self):
+        filenames = [os.path.join(DATA_DIR, _x) for _x in sorted(self.dut.get_all_datafiles())[:3]]
+        hashes = self.dut.get_coordinate_hashes(filenames + [os.path.join(DATA_DIR, "unknown.nc")])
+        assert sorted(hashes) == filenames
+        for filename in filenames:
+            with netCDF4.Dataset(filename) as ncfile:
+                assert hashes[filename] == netCDF4tools.coordinate_hashes(ncfile)
+                assert {"time", "lat", "lon"} <= set(hashes[filename])
+
+    def test_concurrent_requests(self):
+        # requests for a missing time trigger a setup() while other threads read the tree
+        add_to_filetree = self.dut._add_to_filetree
+
+        def slow_add_to_filetree(*args, **kwargs):
+            time.sleep(0.001)
+            return add_to_filetree(*args, **kwargs)
+
+        self.dut._add_to_filetree = slow_add_to_filetree
+        init_time = datetime(2012, 10, 17, 12, 0)
+        expected = "20121017_12_ecmwf_forecast.P_derived.EUR_LL015.036.ml.nc"
+
+        def request(index):
+            if index % 4 == 0:
+                with pytest.raises(ValueError):
+                    self.dut.get_filename("air_pressure", "ml", init_time, datetime(2000, 1, 1))
+                return expected
+            return self.dut.get_filename("air_pressure", "ml", init_time, datetime(2012, 10, 17, 18, 0))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(request, range(64)))
+        assert results == [expected] * 64
+        assert self.dut.get_init_times() == [init_time]
+
 
 class Test_CachedDataAccess(Test_DefaultDataAccess):
     """
@@ -142,3 +192,306 @@ class Test_DefaultDataAccessNoInit(object):
     def test_get_init_times(self):
         all_init_times = self.dut.get_init_times()
         assert all_init_times == [None]
+
+
+class Test_DefaultDataAccessIndex(object):
+    def setup_method(self):
+        self.filenames = sorted(_x for _x in os.listdir(DATA_DIR) if _x.endswith((".ml.nc", ".pl.nc")))[:3]
+
+    def _copy_data(self, path):
+        for filename in self.filenames:
+            shutil.copy2(os.path.join(DATA_DIR, filename), path)
+
+    def test_warm_start(self, tmp_path):
+        index_path = str(tmp_path / "index.sqlite")
+        cold = DefaultDataAccess(DATA_DIR, "EUR_LL015", index_path=index_path)
+        cold.setup()
+        warm = DefaultDataAccess(DATA_DIR, "EUR_LL015", index_path=index_path)
+        warm._parse_file = mock.MagicMock()
+        warm.setup()
+        assert warm._parse_file.call_count == 0
+        assert warm.get_init_times() == cold.get_init_times()
+        for vartype in ["ml", "pl", "sfc"]:
+            assert warm.get_elevation_units(vartype) == cold.get_elevation_units(vartype)
+            assert list(warm.get_elevations(vartype)) == list(cold.get_elevations(vartype))
+        assert warm.get_all_valid_times("air_pressure", "ml") == cold.get_all_valid_times("air_pressure", "ml")
+        filename = warm.get_filename("air_pressure", "ml", datetime(2012, 10, 17, 12, 0), datetime(2012, 10, 17, 18, 0))
+        assert filename == "20121017_12_ecmwf_forecast.P_derived.EUR_LL015.036.ml.nc"
+        filenames = [os.path.join(DATA_DIR, _x) for _x in warm.get_all_datafiles()]
+        assert warm.get_coordinate_hashes(filenames) == cold.get_coordinate_hashes(filenames)
+
+    def test_modified_file(self, tmp_path):
+        data_path = tmp_path / "data"
+        data_path.mkdir()
+        self._copy_data(data_path)
+        index_path = str(tmp_path / "index.sqlite")
+        DefaultDataAccess(str(data_path), "EUR_LL015", index_path=index_path).setup()
+
+        modified = os.path.join(data_path, self.filenames[0])
+        mtime = os.path.getmtime(modified)
+        os.utime(modified, (mtime + 10, mtime + 10))
+        dut = DefaultDataAccess(str(data_path), "EUR_LL015", index_path=index_path)
+        dut._parse_file = mock.MagicMock(wraps=dut._parse_file)
+        dut.setup()
+        dut._parse_file.assert_called_once_with(self.filenames[0])
+
+    def test_modified_file_coordinate_hashes(self, tmp_path):
+        self._copy_data(tmp_path)
+        dut = DefaultDataAccess(str(tmp_path), "EUR_LL015")
+        dut.setup()
+        filenames = [os.path.join(tmp_path, _x) for _x in self.filenames]
+        assert sorted(dut.get_coordinate_hashes(filenames)) == filenames
+        # hashes of files modified since the setup are not used anymore
+        mtime = os.path.getmtime(filenames[0])
+        os.utime(filenames[0], (mtime + 10, mtime + 10))
+        assert sorted(dut.get_coordinate_hashes(filenames)) == filenames[1:]
+        dut.setup()
+        assert sorted(dut.get_coordinate_hashes(filenames)) == filenames
+
+    def test_removed_file(self, tmp_path):
+        data_path = tmp_path / "data"
+        data_path.mkdir()
+        self._copy_data(data_path)
+        index_path = str(tmp_path / "index.sqlite")
+        DefaultDataAccess(str(data_path), "EUR_LL015", index_path=index_path).setup()
+
+        os.remove(os.path.join(data_path, self.filenames[0]))
+        DefaultDataAccess(str(data_path), "EUR_LL015", index_path=index_path).setup()
+        with sqlite3.connect(index_path) as connection:
+            paths = [os.path.basename(_x) for (_x,) in connection.execute("SELECT path FROM files")]
+        assert sorted(paths) == self.filenames[1:]
+
+
+class Test_DefaultDataAccessRefresh(object):
+    def test_refresh(self, tmp_path):
+        filenames = sorted(_x for _x in os.listdir(DATA_DIR) if ".ml." in _x)
+        for filename in filenames[1:]:
+            shutil.copy(os.path.join(DATA_DIR, filename), tmp_path)
+        dut = DefaultDataAccess(str(tmp_path), "EUR_LL015")
+        dut.setup()
+        dut._parse_file = mock.MagicMock(wraps=dut._parse_file)
+        inventory = dut.get_inventory_hash()
+        assert dut.refresh() == set()
+        assert dut._inventory_hash == inventory
+
+        # a file that cannot be parsed yet is tried again once it is modified
+        with open(os.path.join(tmp_path, filenames[0]), "w") as broken:
+            broken.write("incomplete")
+        assert dut.refresh() == {filenames[0]}
+        assert dut.refresh() == set()
+        assert dut.get_inventory_hash() == inventory
+        shutil.copy(os.path.join(DATA_DIR, filenames[0]), tmp_path)
+        os.utime(os.path.join(tmp_path, filenames[0]), (time.time() + 10, time.time() + 10))
+        assert dut.refresh() == {filenames[0]}
+        assert dut._parse_file.call_count == 2
+
+        os.remove(os.path.join(tmp_path, filenames[1]))
+        assert dut.refresh() == {filenames[1]}
+        fresh = DefaultDataAccess(str(tmp_path), "EUR_LL015")
+        fresh.setup()
+        assert dut._filetree == fresh._filetree
+        assert dut.get_all_datafiles() == fresh.get_all_datafiles()
+        assert dut.get_inventory_hash() == fresh.get_inventory_hash() != inventory
+
+
+class Test_DefaultDataAccessParallel(object):
+    def test_identical_filetree(self):
+        serial = DefaultDataAccess(DATA_DIR, "EUR_LL015")
+        serial.setup()
+        parallel = DefaultDataAccess(DATA_DIR, "EUR_LL015", setup_workers=4)
+        parallel.setup()
+        assert parallel._filetree == serial._filetree
+        assert parallel.get_all_datafiles() == serial.get_all_datafiles()
+        assert sorted(parallel._file_cache) == sorted(serial._file_cache)
+        for vert_type in serial._elevations:
+            assert parallel.get_elevation_units(vert_type) == serial.get_elevation_units(vert_type)
+            assert list(parallel.get_elevations(vert_type)) == list(serial.get_elevations(vert_type))
+
+    def test_elevation_mismatch(self, tmp_path):
+        filenames = sorted(_x for _x in os.listdir(DATA_DIR) if _x.endswith(".ml.nc"))[:3]
+        for filename in filenames:
+            shutil.copy(os.path.join(DATA_DIR, filename), tmp_path)
+        with netCDF4.Dataset(os.path.join(tmp_path, filenames[1]), "a") as dataset:
+            dataset.variables["hybrid"][:] = dataset.variables["hybrid"][:] + 1
+        serial = DefaultDataAccess(str(tmp_path), "EUR_LL015")
+        serial.setup()
+        parallel = DefaultDataAccess(str(tmp_path), "EUR_LL015", setup_workers=2)
+        parallel.setup()
+        assert parallel._filetree == serial._filetree
+        assert sorted(parallel._file_cache) == sorted(serial._file_cache) == [filenames[0], filenames[2]]
+
+
+@pytest.mark.parametrize("backend", [
+    "polling",
+    pytest.param("inotify", marks=pytest.mark.skipif(
+        filewatcher.inotify_simple is None, reason="inotify_simple is not installed"))])
+class Test_WatchModificationDataAccess(object):
+    init_time = datetime(2012, 10, 17, 12, 0)
+    new_init_time = datetime(2012, 10, 18, 12, 0)
+
+    def _setup(self, tmp_path, backend):
+        self.filenames = sorted(_x for _x in os.listdir(DATA_DIR) if ".ml." in _x)
+        for filename in self.filenames:
+            shutil.copy(os.path.join(DATA_DIR, filename), tmp_path)
+        self.dut = WatchModificationDataAccess(
+            str(tmp_path), "EUR_LL015", watcher_backend=backend, poll_interval=0)
+        self.dut.setup()
+        self.dut._parse_file = mock.MagicMock(wraps=self.dut._parse_file)
+
+    def _create_copy(self, tmp_path, filename):
+        """
+        Copies an existing file, shifting its times by one day
+        """
+        new_filename = filename.replace("20121017", "20121018").replace(".036.", ".037.")
+        shutil.copy(os.path.join(tmp_path, filename), os.path.join(tmp_path, new_filename + ".tmp"))
+        with netCDF4.Dataset(os.path.join(tmp_path, new_filename + ".tmp"), "a") as dataset:
+            dataset.variables["time"].units = "hours since 2012-10-18T12:00:00.000Z"
+        os.rename(os.path.join(tmp_path, new_filename + ".tmp"), os.path.join(tmp_path, new_filename))
+        return new_filename
+
+    def test_no_changes(self, tmp_path, backend):
+        self._setup(tmp_path, backend)
+        self.dut.setup()
+        assert self.dut.get_filename("air_pressure", "ml", self.init_time, datetime(2012, 10, 17, 18, 0)) == \
+            "20121017_12_ecmwf_forecast.P_derived.EUR_LL015.036.ml.nc"
+        assert not self.dut.is_reload_required([os.path.join(tmp_path, _x) for _x in self.filenames])
+        assert self.dut._parse_file.call_count == 0
+
+    def test_create(self, tmp_path, backend):
+        self._setup(tmp_path, backend)
+        new_filename = self._create_copy(tmp_path, "20121017_12_ecmwf_forecast.P_derived.EUR_LL015.036.ml.nc")
+        assert self.dut.get_filename("air_pressure", "ml", self.new_init_time, datetime(2012, 10, 19, 12, 0)) == \
+            new_filename
+        self.dut._parse_file.assert_called_once_with(new_filename)
+        assert self.dut.get_init_times() == [self.init_time, self.new_init_time]
+        assert len(self.dut.get_all_valid_times("air_pressure", "ml")) == 11
+        assert new_filename in self.dut.get_all_datafiles()
+
+    def test_touch(self, tmp_path, backend):
+        self._setup(tmp_path, backend)
+        filename = "20121017_12_ecmwf_forecast.P_derived.EUR_LL015.036.ml.nc"
+        mtime = os.path.getmtime(os.path.join(tmp_path, filename))
+        os.utime(os.path.join(tmp_path, filename), (mtime + 10, mtime + 10))
+        assert self.dut.is_reload_required([os.path.join(tmp_path, filename)])
+        self.dut._parse_file.assert_called_once_with(filename)
+        assert self.dut.get_filename("air_pressure", "ml", self.init_time, datetime(2012, 10, 17, 18, 0)) == filename
+        assert self.dut._file_cache[filename][0] == mtime + 10
+
+    def test_delete(self, tmp_path, backend):
+        self._setup(tmp_path, backend)
+        new_filename = self._create_copy(tmp_path, "20121017_12_ecmwf_forecast.T.EUR_LL015.036.ml.nc")
+        self.dut.setup()
+        assert len(self.dut.get_all_valid_times("air_temperature", "ml")) == 11
+
+        os.remove(os.path.join(tmp_path, new_filename))
+        self.dut.setup()
+        assert self.dut.get_all_valid_times("air_temperature", "ml") == \
+            self.dut.get_valid_times("air_temperature", "ml", self.init_time)
+        assert self.dut.get_init_times() == [self.init_time]
+        assert new_filename not in self.dut.get_all_datafiles()
+        assert new_filename not in self.dut._file_cache
+        with pytest.raises(ValueError):
+            self.dut.get_filename("air_temperature", "ml", self.new_init_time, datetime(2012, 10, 19, 12, 0))
+
+        os.remove(os.path.join(tmp_path, "20121017_12_ecmwf_forecast.T.EUR_LL015.036.ml.nc"))
+        assert self.dut.get_all_valid_times("air_pressure", "ml") != []
+        self.dut.setup()
+        assert self.dut.get_all_valid_times("air_temperature", "ml") == []
+        assert self.dut._parse_file.call_count == 1
+
+    def test_inventory_hash(self, tmp_path, backend):
+        self._setup(tmp_path, backend)
+        inventory = self.dut.get_inventory_hash()
+        filename = "20121017_12_ecmwf_forecast.P_derived.EUR_LL015.036.ml.nc"
+        mtime = os.path.getmtime(os.path.join(tmp_path, filename))
+        os.utime(os.path.join(tmp_path, filename), (mtime + 10, mtime + 10))
+        self.dut.setup()
+        assert self.dut.get_inventory_hash() == inventory
+
+        self._create_copy(tmp_path, filename)
+        self.dut.setup()
+        assert self.dut.get_inventory_hash() != inventory
+        # the incrementally updated file tree equals a freshly built one
+        fresh = DefaultDataAccess(str(tmp_path), "EUR_LL015")
+        fresh.setup()
+        assert self.dut.get_inventory_hash() == fresh.get_inventory_hash()
+
+    def test_duplicate_files(self, tmp_path, backend):
+        self._setup(tmp_path, backend)
+        filename = "20121017_12_ecmwf_forecast.P_derived.EUR_LL015.036.ml.nc"
+        valid_time = datetime(2012, 10, 17, 18, 0)
+        # the copies hold the same data and sort before and after the original
+        copies = [filename.replace(".036.", ".035."), filename.replace(".036.", ".037.")]
+        for copy in copies:
+            shutil.copy(os.path.join(tmp_path, filename), os.path.join(tmp_path, copy))
+
+        def check(expected):
+            self.dut.setup()
+            assert self.dut.get_filename("air_pressure", "ml", self.init_time, valid_time) == expected
+            fresh = DefaultDataAccess(str(tmp_path), "EUR_LL015")
+            fresh.setup()
+            assert self.dut._filetree == fresh._filetree
+            assert self.dut.get_all_datafiles() == fresh.get_all_datafiles()
+
+        check(copies[0])
+        for name in [filename] + copies:
+            mtime = os.path.getmtime(os.path.join(tmp_path, name))
+            os.utime(os.path.join(tmp_path, name), (mtime + 10, mtime + 10))
+            check(copies[0])
+        os.remove(os.path.join(tmp_path, copies[0]))
+        check(filename)
+        shutil.copy(os.path.join(tmp_path, filename), os.path.join(tmp_path, copies[0]))
+        check(copies[0])
+
+    def test_incremental_update(self, tmp_path, backend):
+        self._setup(tmp_path, backend)
+        self.dut._build_filetree = mock.MagicMock(side_effect=AssertionError("tree rebuilt"))
+        filename = "20121017_12_ecmwf_forecast.P_derived.EUR_LL015.036.ml.nc"
+        first = self.filenames[0]
+
+        def check():
+            filetree = self.dut._filetree
+            snapshot = deepcopy(filetree)
+            self.dut.setup()
+            # readers of the old tree are not affected by the update
+            assert filetree == snapshot
+            fresh = DefaultDataAccess(str(tmp_path), "EUR_LL015")
+            fresh.setup()
+            assert self.dut._filetree == fresh._filetree
+            assert self.dut.get_all_datafiles() == fresh.get_all_datafiles()
+            assert self.dut.get_inventory_hash() == fresh.get_inventory_hash()
+            assert self.dut._elevations["ml"]["filename"] == fresh._elevations["ml"]["filename"]
+
+        self._create_copy(tmp_path, filename)
+        check()
+        mtime = os.path.getmtime(os.path.join(tmp_path, filename))
+        os.utime(os.path.join(tmp_path, filename), (mtime + 10, mtime + 10))
+        check()
+        # the file defining the vertical levels is replaced by one with the same levels
+        os.remove(os.path.join(tmp_path, first))
+        check()
+        assert self.dut._parse_file.call_count == 2
+
+    def test_levels_changed(self, tmp_path, backend):
+        self._setup(tmp_path, backend)
+        for filename in self.filenames[:2]:
+            # the first file defines the vertical levels, the tree is rebuilt if they change
+            with netCDF4.Dataset(os.path.join(tmp_path, filename), "a") as dataset:
+                dataset.variables["hybrid"][:] = dataset.variables["hybrid"][:] + 1
+            self.dut.setup()
+            fresh = DefaultDataAccess(str(tmp_path), "EUR_LL015")
+            fresh.setup()
+            assert self.dut._filetree == fresh._filetree
+            assert list(self.dut.get_elevations("ml")) == list(fresh.get_elevations("ml"))
+            assert self.dut.get_inventory_hash() == fresh.get_inventory_hash()
+
+    def test_poll_interval(self, tmp_path, backend):
+        if backend != "polling":
+            pytest.skip("only the polling backend scans the directory")
+        shutil.copy(os.path.join(DATA_DIR, "20121017_12_ecmwf_forecast.P_derived.EUR_LL015.036.ml.nc"), tmp_path)
+        dut = WatchModificationDataAccess(str(tmp_path), "EUR_LL015", watcher_backend=backend)
+        dut.setup()
+        with mock.patch("mslib.mswms.filewatcher.os.listdir", wraps=os.listdir) as listdir:
+            for _ in range(10):
+                assert not dut.is_reload_required([os.path.join(tmp_path, "unknown.nc")])
+        assert listdir.call_count == 0
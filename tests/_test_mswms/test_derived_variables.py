@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+
+    tests._test_mswms.test_derived_variables
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module provides pytest functions to test the derived variables of
+    mswms.derived_variables, their availability in the data access and their
+    computation by the plot drivers.
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from datetime import datetime
+import os
+
+import netCDF4
+import numpy as np
+import pytest
+
+import mswms_settings
+from mslib.mswms import derived_variables, generics
+from mslib.mswms.mss_plot_driver import DatasetPool, HorizontalSectionDriver, VerticalSectionDriver
+import mslib.mswms.mpl_hsec_styles as mpl_hsec_styles
+import mslib.mswms.mpl_vsec_styles as mpl_vsec_styles
+from mslib.utils import thermolib
+
+INIT_TIME = datetime(2012, 10, 17, 12)
+VALID_TIME = datetime(2012, 10, 17, 18)
+
+
+def _offline(filenames, function, names, timestep):
+    """
+    Computes a derived variable from the given variables read from the files
+    without the plot drivers.
+    """
+    arrays = {}
+    for filename in filenames:
+        with netCDF4.Dataset(filename) as dataset:
+            for variable in dataset.variables.values():
+                if getattr(variable, "standard_name", None) in names:
+                    arrays[variable.standard_name] = variable[timestep].astype(float)
+    return function(*[arrays[_name] for _name in names])
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """
+    Lets a test register derived variables and standard_names temporarily.
+    """
+    monkeypatch.setattr(derived_variables, "_DERIVED_VARIABLES", dict(derived_variables._DERIVED_VARIABLES))
+    monkeypatch.setattr(generics, "_TARGETS", list(generics._TARGETS))
+    monkeypatch.setattr(generics, "_UNITS", dict(generics._UNITS))
+
+
+def test_registered_standard_names():
+    assert derived_variables.get_derived_names() == [
+        "air_potential_temperature", "equivalent_potential_temperature", "relative_humidity",
+        "upward_air_velocity"]
+    for name in derived_variables.get_derived_names():
+        assert name in generics.get_standard_names()
+        assert generics.get_unit(name) == derived_variables.get_derived_variable(name).unit
+        assert f"HS_GenericStyle_PL_{name}" in mpl_hsec_styles._GENERIC_CLASSES
+        assert f"VS_GenericStyle_ML_{name}" in mpl_vsec_styles._GENERIC_CLASSES
+    assert derived_variables.get_derived_variable("air_temperature") is None
+
+
+def test_register_derived_variable(registry):
+    derived_variables.register_derived_variable(
+        "test_virtual_temperature", [("air_temperature", "K"), ("specific_humidity", "kg/kg")],
+        lambda t, q: t * (1 + 0.608 * q), "K", title="virtual temperature")
+    assert "test_virtual_temperature" in derived_variables.get_derived_names()
+    assert generics.get_unit("test_virtual_temperature") == "K"
+    assert generics.get_title("test_virtual_temperature") == "virtual temperature"
+
+    derived_variables.register_derived_variable(
+        "test_a", [("test_b", "K")], np.negative, "K")
+    with pytest.raises(ValueError):
+        derived_variables.register_derived_variable("test_b", [("test_a", "K")], np.negative, "K")
+    with pytest.raises(ValueError):
+        derived_variables.register_derived_variable("test_c", [("test_c", "K")], np.negative, "K")
+    assert derived_variables.get_derived_variable("test_b") is None
+
+
+def test_compute():
+    derived = derived_variables.get_derived_variable("air_potential_temperature")
+    pressure = np.ma.masked_array([1000., 500., 250., 100.], mask=[False, True, False, False])
+    temperature = np.ma.masked_array([15., -20., -50., np.nan])
+    result = derived.compute([pressure, temperature], ["hPa", "degC"])
+    expected = thermolib.pot_temp(pressure.data * 100, temperature.data + 273.15)
+    assert isinstance(result, np.ma.MaskedArray)
+    assert result.mask.tolist() == [False, True, False, True]
+    np.testing.assert_allclose(result.compressed(), expected[[0, 2]], rtol=1e-12)
+
+    # the logarithm of the mixing ratio is undefined
+    derived = derived_variables.get_derived_variable("equivalent_potential_temperature")
+    result = derived.compute([np.array([50000.]), np.array([250.]), np.array([-1.])], ["Pa", "K", "kg/kg"])
+    assert result.mask.all()
+
+
+class TestDataAccess(object):
+    def setup_method(self):
+        self.data = mswms_settings.data["ecmwf_EUR_LL015"]
+        self.data.setup()
+
+    def test_have_data(self):
+        for vartype in ["pl", "ml"]:
+            for name in derived_variables.get_derived_names():
+                assert self.data.have_data(name, vartype, INIT_TIME, VALID_TIME)
+        # the altitude levels lack the temperature
+        assert not self.data.have_data("equivalent_potential_temperature", "al", INIT_TIME, VALID_TIME)
+        assert not self.data.have_data("equivalent_potential_temperature", "ml", INIT_TIME, datetime(2000, 1, 1))
+
+    def test_get_filenames(self):
+        filenames = self.data.get_filenames("equivalent_potential_temperature", "ml", INIT_TIME, VALID_TIME)
+        assert filenames == [self.data.get_filename(_name, "ml", INIT_TIME, VALID_TIME)
+                             for _name in ["air_pressure", "air_temperature", "specific_humidity"]]
+        assert len(set(filenames)) == 3
+        filenames = self.data.get_filenames("equivalent_potential_temperature", "pl", INIT_TIME, VALID_TIME,
+                                            fullpath=True)
+        assert filenames == [self.data.get_filename("air_temperature", "pl", INIT_TIME, VALID_TIME, fullpath=True)]
+        # stored variables are preferred
+        assert self.data.get_filenames("air_potential_temperature", "ml", INIT_TIME, VALID_TIME) == [
+            self.data.get_filename("air_potential_temperature", "ml", INIT_TIME, VALID_TIME)]
+        with pytest.raises(ValueError):
+            self.data.get_filenames("equivalent_potential_temperature", "al", INIT_TIME, VALID_TIME)
+
+    def test_valid_times(self):
+        valid_times = self.data.get_valid_times("air_temperature", "ml", INIT_TIME)
+        assert len(valid_times) > 1
+        assert self.data.get_valid_times("relative_humidity", "ml", INIT_TIME) == valid_times
+        assert self.data.get_all_valid_times("relative_humidity", "ml") == \
+            self.data.get_all_valid_times("air_temperature", "ml")
+        assert self.data.get_valid_times("relative_humidity", "al", INIT_TIME) == []
+        assert self.data.get_all_valid_times("relative_humidity", "al") == []
+
+
+class TestDerivedField(object):
+    def setup_method(self):
+        self.data = mswms_settings.data["ecmwf_EUR_LL015"]
+        self.data.setup()
+        self.hsec = HorizontalSectionDriver(self.data)
+
+    def _set_plot_parameters(self, plot_object, bbox=(-22.5, 27.5, 55, 62.5), level=300):
+        self.hsec.set_plot_parameters(
+            plot_object=plot_object, bbox=list(bbox), level=level, crs="EPSG:4326",
+            init_time=INIT_TIME, valid_time=VALID_TIME, style="default", show=False)
+
+    @pytest.mark.parametrize("name, vartype, function, dependencies", [
+        ("equivalent_potential_temperature", "pl", thermolib.eqpt_approx,
+         ["air_pressure", "air_temperature", "specific_humidity"]),
+        ("relative_humidity", "ml", thermolib.rel_hum, ["air_pressure", "air_temperature", "specific_humidity"]),
+        ("upward_air_velocity", "pl", thermolib.omega_to_w,
+         ["lagrangian_tendency_of_air_pressure", "air_pressure", "air_temperature"]),
+    ])
+    def test_offline_computation(self, name, vartype, function, dependencies):
+        style = getattr(mpl_hsec_styles, f"HS_GenericStyle_{vartype.upper()}_{name}")
+        self._set_plot_parameters(style(driver=self.hsec), level=None)
+        var = self.hsec.data_vars[name]
+        assert isinstance(var, derived_variables.DerivedField)
+        assert self.hsec.data_units[name] == generics.get_unit(name)
+        timestep = self.hsec.times.searchsorted(VALID_TIME)
+        field = var[timestep]
+        assert field.shape == var.shape[1:]
+        expected = _offline(self.hsec.filenames, function, dependencies, timestep)
+        np.testing.assert_allclose(field, expected, rtol=1e-12)
+
+    def test_stored_variable(self):
+        self._set_plot_parameters(mpl_hsec_styles.HS_GenericStyle_PL_air_potential_temperature(driver=self.hsec))
+        var = self.hsec.data_vars["air_potential_temperature"]
+        assert not isinstance(var, derived_variables.DerivedField)
+        assert var.standard_name == "air_potential_temperature"
+
+    def test_plot(self):
+        for level in [300, 700]:
+            self._set_plot_parameters(
+                mpl_hsec_styles.HS_GenericStyle_PL_equivalent_potential_temperature(driver=self.hsec), level=level)
+            assert self.hsec.plot() is not None
+
+    def test_cache(self, monkeypatch):
+        # with a fixed colour scale, only the bounding box is read
+        monkeypatch.setitem(generics._RANGES, "equivalent_potential_temperature",
+                            {"pl": {300.: ("K", (280., 360.)), 500.: ("K", (280., 360.))}})
+        cache = self.hsec.dataset_pool.derived_cache
+        plot_object = mpl_hsec_styles.HS_GenericStyle_PL_equivalent_potential_temperature(driver=self.hsec)
+        self._set_plot_parameters(plot_object)
+        first = self.hsec._load_timestep()["equivalent_potential_temperature"]
+        assert cache.info()["misses"] == 1
+        assert cache.info()["hits"] == 0
+        self._set_plot_parameters(plot_object)
+        second = self.hsec._load_timestep()["equivalent_potential_temperature"]
+        assert cache.info()["hits"] == 1
+        np.testing.assert_array_equal(first, second)
+        # the cached field is not changed by modifications of the returned one
+        second[:] = 0
+        self._set_plot_parameters(plot_object)
+        np.testing.assert_array_equal(self.hsec._load_timestep()["equivalent_potential_temperature"], first)
+
+        self._set_plot_parameters(plot_object, bbox=(0, 40, 20, 55))
+        third = self.hsec._load_timestep()["equivalent_potential_temperature"]
+        assert cache.info()["misses"] == 2
+        assert third.shape != first.shape
+        self._set_plot_parameters(plot_object, level=500)
+        self.hsec._load_timestep()
+        assert cache.info()["misses"] == 3
+        assert cache.info()["entries"] == 3
+
+        self.hsec.dataset_pool.invalidate(self.hsec.filenames)
+        assert cache.info()["entries"] == 0
+
+    def test_cache_limit(self):
+        cache = derived_variables.DerivedFieldCache(max_bytes=1000)
+        field = cache.get(("key", "name", (0,)), lambda: np.ma.masked_invalid(np.zeros(50)))
+        assert field.shape == (50,)
+        assert cache.info()["entries"] == 1
+        cache.get(("key", "name", (1,)), lambda: np.ma.masked_invalid(np.zeros(50)))
+        assert cache.info()["entries"] == 2
+        cache.get(("key", "name", (2,)), lambda: np.ma.masked_invalid(np.zeros(50)))
+        assert cache.info()["entries"] == 2
+        assert cache.info()["evictions"] == 1
+        cache.get(("key", "name", (3,)), lambda: np.ma.masked_invalid(np.zeros(1000)))
+        assert cache.info()["entries"] == 2
+        cache.discard("key")
+        assert cache.info() == {"hits": 0, "misses": 4, "evictions": 1, "entries": 0, "bytes": 0}
+
+
+def test_vertical_section():
+    data = mswms_settings.data["ecmwf_EUR_LL015"]
+    data.setup()
+    vsec = VerticalSectionDriver(data, dataset_pool=DatasetPool())
+    vsec.set_plot_parameters(
+        plot_object=mpl_vsec_styles.VS_GenericStyle_ML_equivalent_potential_temperature(driver=vsec),
+        bbox=[3, 500, 3, 10], vsec_path=[[45., 8.], [50., 12.], [51., 15.]], vsec_numpoints=101,
+        vsec_path_connection="greatcircle", init_time=INIT_TIME, valid_time=VALID_TIME, style="default",
+        show=False)
+    assert {os.path.basename(_x).split(".")[1] for _x in vsec.filenames} >= {"T", "Q", "P_derived"}
+    assert vsec.plot() is not None
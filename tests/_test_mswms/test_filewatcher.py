@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+
+    tests._test_mswms.test_filewatcher
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module provides pytest functions to tests mswms.filewatcher
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import os
+
+import pytest
+
+from mslib.mswms import filewatcher
+
+
+def _write(path, text="data"):
+    with open(path, "w") as fid:
+        fid.write(text)
+
+
+@pytest.mark.parametrize("backend", [
+    "polling",
+    pytest.param("inotify", marks=pytest.mark.skipif(
+        filewatcher.inotify_simple is None, reason="inotify_simple is not installed"))])
+def test_watcher(tmp_path, backend):
+    _write(tmp_path / "a.EUR.nc")
+    _write(tmp_path / "b.EUR.nc")
+    watcher = filewatcher.create_file_watcher(str(tmp_path), "EUR", backend=backend)
+    try:
+        assert watcher.poll() == (set(), set())
+
+        _write(tmp_path / "c.EUR.nc")
+        _write(tmp_path / "c.OTHER.nc")
+        assert watcher.poll() == ({"c.EUR.nc"}, set())
+
+        mtime = os.path.getmtime(tmp_path / "a.EUR.nc")
+        os.utime(tmp_path / "a.EUR.nc", (mtime + 10, mtime + 10))
+        os.remove(tmp_path / "b.EUR.nc")
+        assert watcher.poll() == ({"a.EUR.nc"}, {"b.EUR.nc"})
+        assert watcher.poll() == (set(), set())
+    finally:
+        watcher.close()
+
+
+def test_polling_interval(tmp_path):
+    watcher = filewatcher.PollingFileWatcher(str(tmp_path), "EUR", interval=3600)
+    _write(tmp_path / "a.EUR.nc")
+    assert watcher.poll() == (set(), set())
+
+
+def test_unknown_backend(tmp_path):
+    with pytest.raises(ValueError):
+        filewatcher.create_file_watcher(str(tmp_path), "EUR", backend="unknown")
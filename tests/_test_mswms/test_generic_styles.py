@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+
+    tests._test_mswms.test_generic_styles
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module provides pytest functions to test the lazy creation of the
+    generic plotting layers of mswms.mpl_hsec_styles and mswms.mpl_vsec_styles
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import inspect
+import os
+import pickle
+import subprocess
+import sys
+
+import pytest
+
+import mswms_settings
+from mslib.mswms import mpl_hsec_styles, mpl_vsec_styles
+import mslib.mswms.generics as generics
+from tests.constants import SERVER_CONFIG_FS
+
+
+@pytest.mark.parametrize("module, prefix", [(mpl_hsec_styles, "HS"), (mpl_vsec_styles, "VS")])
+def test_registered_names(module, prefix):
+    for vert in ["AL", "ML", "PL", "TL"]:
+        for sn in generics.get_standard_names():
+            assert f"{prefix}_GenericStyle_{vert}_{sn}" in module._GENERIC_CLASSES
+    assert set(module._GENERIC_CLASSES) <= set(dir(module))
+
+
+@pytest.mark.parametrize("module, name", [
+    (mpl_hsec_styles, "HS_GenericStyle_PL_air_temperature"),
+    (mpl_hsec_styles, "HS_GenericStyle_SFC_tropopause_altitude"),
+    (mpl_vsec_styles, "VS_GenericStyle_TL_mole_fraction_of_ozone_in_air"),
+    (mpl_vsec_styles, "VS_GenericStyle_PL_cloud_ice_mixing_ratio")])
+def test_getattr(module, name):
+    style = getattr(module, name)
+    assert inspect.isclass(style)
+    assert style.__name__ == name
+    assert getattr(module, name) is style
+    assert vars(module)[name] is style
+    exec(f"from {module.__name__} import {name} as imported", globals())
+    assert imported is style  # noqa: F821
+
+
+@pytest.mark.parametrize("module, name", [
+    (mpl_hsec_styles, "HS_GenericStyle_PL_air_temperature"),
+    (mpl_vsec_styles, "VS_GenericStyle_ML_air_temperature")])
+def test_pickle(module, name):
+    # the classes are passed by reference to the render worker processes
+    style = getattr(module, name)
+    assert style.__qualname__ == name
+    assert pickle.loads(pickle.dumps(style)) is style
+
+
+def test_getattr_arguments():
+    style = mpl_hsec_styles.HS_GenericStyle_PL_equivalent_latitude
+    assert style.name == "equivalent_latitude_pl"
+    assert style.required_datafields == [("pl", "equivalent_latitude", generics.get_unit("equivalent_latitude"))]
+    assert [_x[0] for _x in style.styles] == ["equivalent_latitude_nh", "equivalent_latitude_sh"]
+    style = mpl_vsec_styles.VS_GenericStyle_ML_air_temperature
+    assert style.name == "VS_air_temperature_ml"
+    assert style.required_datafields[1:] == mpl_vsec_styles._ADD_DATA["ml"]
+
+
+@pytest.mark.parametrize("module", [mpl_hsec_styles, mpl_vsec_styles])
+def test_getattr_unknown(module):
+    with pytest.raises(AttributeError):
+        module.HS_GenericStyle_PL_unknown_quantity
+    assert not hasattr(module, "fnord")
+
+
+def test_make_generic_class():
+    mpl_hsec_styles.make_generic_class("HS_GenericStyle_PL_test_air_temperature", "air_temperature", "pl", [], [])
+    style = mpl_hsec_styles.HS_GenericStyle_PL_test_air_temperature
+    assert style.required_datafields == [("pl", "air_temperature", "K")]
+    assert "HS_GenericStyle_PL_test_air_temperature" not in mpl_hsec_styles._GENERIC_CLASSES
+
+
+def test_generic_class_registry():
+    module_globals = {"__name__": "styles"}
+    calls = []
+
+    def make_generic_class(name, *args, **kwargs):
+        calls.append((name, args, kwargs))
+        module_globals[name] = type(name, (object,), {})
+
+    registry = generics.GenericClassRegistry(module_globals, make_generic_class)
+    registry.register("Style_A", "air_temperature", "pl", fix_styles=[])
+    assert "Style_A" in registry.dir() and "Style_A" not in module_globals
+    style = registry.getattr("Style_A")
+    assert registry.getattr("Style_A") is style is module_globals["Style_A"]
+    assert calls == [("Style_A", ("air_temperature", "pl"), {"fix_styles": []})]
+    with pytest.raises(AttributeError, match="styles"):
+        registry.getattr("Style_B")
+
+
+def test_getmembers():
+    classes = dict(inspect.getmembers(mpl_vsec_styles, inspect.isclass))
+    assert set(mpl_vsec_styles._GENERIC_CLASSES) <= set(classes)
+    assert "VS_TemperatureStyle_01" in classes
+
+
+def test_configured_layers():
+    for registration, module in [("register_horizontal_layers", mpl_hsec_styles),
+                                 ("register_vertical_layers", mpl_vsec_styles)]:
+        for layer in getattr(mswms_settings, registration):
+            assert inspect.isclass(layer[0])
+            assert getattr(module, layer[0].__name__, layer[0]) is layer[0]
+
+
+def test_lazy_import(tmp_path):
+    # a fresh interpreter, as other tests may have created the classes already
+    with SERVER_CONFIG_FS.open("mswms_settings.py") as fid:
+        settings = fid.read()
+    settings += (
+        "\nregister_horizontal_layers.append((mpl_hsec_styles.HS_GenericStyle_PL_air_temperature, ['ecmwf']))"
+        "\nregister_vertical_layers.append((mpl_vsec_styles.VS_GenericStyle_ML_air_temperature, ['ecmwf']))\n")
+    (tmp_path / "mswms_settings.py").write_text(settings)
+    script = (
+        "import mswms_settings\n"
+        "from mslib.mswms import mpl_hsec_styles, mpl_vsec_styles\n"
+        "assert mswms_settings.register_horizontal_layers[-1][0].__name__ == 'HS_GenericStyle_PL_air_temperature'\n"
+        "assert mswms_settings.register_vertical_layers[-1][0].__name__ == 'VS_GenericStyle_ML_air_temperature'\n"
+        "for module in (mpl_hsec_styles, mpl_vsec_styles):\n"
+        "    assert len(module._GENERIC_CLASSES) > 100\n"
+        "    assert len(set(module._GENERIC_CLASSES) & set(vars(module))) == 1\n")
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), root]))
+    subprocess.run([sys.executable, "-c", script], env=env, check=True)
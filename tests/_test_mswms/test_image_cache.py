@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+
+    tests._test_mswms.test_image_cache
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module provides pytest functions to tests mswms.image_cache
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import os
+
+import pytest
+
+from mslib.mswms.image_cache import MemoryImageCache, DirectoryImageCache
+
+
+@pytest.fixture(params=["memory", "directory"])
+def create_cache(request, tmpdir):
+    def create(max_bytes):
+        if request.param == "memory":
+            return MemoryImageCache(max_bytes=max_bytes)
+        return DirectoryImageCache(str(tmpdir.join("cache")), max_bytes=max_bytes)
+    return create
+
+
+def test_get_put(create_cache):
+    cache = create_cache(100)
+    assert cache.get("a") is None
+    cache.put("a", b"first")
+    assert cache.get("a") == b"first"
+    cache.put("a", b"second")
+    assert cache.get("a") == b"second"
+    assert (cache.hits, cache.misses) == (2, 1)
+    cache.clear()
+    assert cache.get("a") is None
+
+
+def test_lru_eviction(create_cache):
+    cache = create_cache(25)
+    for key in ["a", "b"]:
+        cache.put(key, 10 * key.encode())
+    cache.get("a")
+    cache.put("c", 10 * b"c")
+    assert cache.get("b") is None
+    assert cache.get("a") == 10 * b"a"
+    assert cache.get("c") == 10 * b"c"
+    # images exceeding the limit are not stored at all
+    cache.put("d", 30 * b"d")
+    assert cache.get("d") is None
+    assert cache.get("a") is not None
+
+
+def test_directory_persistence(tmpdir):
+    path = str(tmpdir.join("cache"))
+    cache = DirectoryImageCache(path, max_bytes=25)
+    cache.put("a", 10 * b"a")
+    cache.put("b", 10 * b"b")
+    assert sorted(os.listdir(path)) == ["a.cache", "b.cache"]
+
+    cache = DirectoryImageCache(path, max_bytes=25)
+    assert cache.get("b") == 10 * b"b"
+    cache.put("c", 10 * b"c")
+    assert sorted(os.listdir(path)) == ["b.cache", "c.cache"]
+
+    os.remove(os.path.join(path, "c.cache"))
+    assert cache.get("c") is None
@@ -28,7 +28,10 @@
 
 import importlib
 
-from mslib.mswms.mpl_hsec import MPLBasemapHorizontalSectionStyle
+import mpl_toolkits.basemap as basemap
+import pytest
+
+from mslib.mswms.mpl_hsec import MPLBasemapHorizontalSectionStyle, get_meter_projection
 from tests.constants import SERVER_CONFIG_FILE
 
 
@@ -43,3 +46,20 @@ class TestMPLBasemapHorizontalSectionStyle(object):
         example = MPLBasemapHorizontalSectionStyle()
         assert sorted(example.supported_crs()) == \
             sorted(["EPSG:3031", "EPSG:3995", "EPSG:3857", "EPSG:4326", "MSS:stere"])
+
+
+@pytest.mark.parametrize("bm_params", [
+    {"area_thresh": 1000., "epsg": "3857"},
+    {"area_thresh": 1000., "epsg": "3031"},
+    {"area_thresh": 1000., "projection": "stere", "lat_0": 90, "lon_0": 10}])
+def test_get_meter_projection(bm_params):
+    projection = get_meter_projection(bm_params)
+    assert get_meter_projection(dict(reversed(list(bm_params.items())))) is projection
+    try:
+        reference = basemap.Basemap(resolution=None, **bm_params)
+    except ValueError:
+        reference = basemap.Basemap(resolution=None, width=1e7, height=1e7, **bm_params)
+    assert projection(10, 50) == reference(10, 50)
+    assert projection(1e6, 2e6, inverse=True) == reference(1e6, 2e6, inverse=True)
+    unhashable = dict(bm_params, llcrnrlon=[-10])
+    assert get_meter_projection(unhashable) is not get_meter_projection(unhashable)
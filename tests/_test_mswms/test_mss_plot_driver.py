@@ -29,14 +29,22 @@
 
 from datetime import datetime
 import os
+import threading
 import warnings
 import sys
 
+import numpy as np
 import pytest
 from PIL import Image
 from xml.etree import ElementTree
 import io
-from mslib.mswms.mss_plot_driver import VerticalSectionDriver, HorizontalSectionDriver, LinearSectionDriver
+import mock
+import netCDF4
+from mslib.mswms.mss_plot_driver import VerticalSectionDriver, HorizontalSectionDriver, LinearSectionDriver, \
+    DatasetPool, DriverPool
+from mslib.mswms.basemap_cache import BasemapCache
+from mslib.mswms.dataaccess import DefaultDataAccess
+from mslib.utils import netCDF4tools
 import mswms_settings
 import mslib.mswms.mpl_vsec_styles as mpl_vsec_styles
 import mslib.mswms.mpl_hsec_styles as mpl_hsec_styles
@@ -116,6 +124,40 @@ class Test_VSec(object):
         assert img is not None
         ElementTree.fromstring(img)
 
+    @pytest.mark.parametrize("path", [
+        [[45.00, 8.], [50.00, 12.], [51.00, 15.], [48.00, 11.]],
+        [[45.00, 8.], [45.10, 8.10]],
+        [[30.00, -60.], [70.00, 49.]],
+        [[45.00, 170.], [50.00, -170.]]])
+    def test_path_subset(self, path):
+        self.path = path
+        for plot_object in [mpl_vsec_styles.VS_TemperatureStyle_01(driver=self.vsec),
+                            mpl_vsec_styles.VS_GenericStyle_PL_air_temperature(driver=self.vsec)]:
+            self.plot(plot_object)
+            subset = self.vsec._load_interpolate_timestep()
+            with mock.patch.object(VerticalSectionDriver, "_get_path_window", return_value=None):
+                full = self.vsec._load_interpolate_timestep()
+            assert sorted(subset) == sorted(full)
+            for name in full:
+                np.testing.assert_allclose(subset[name].filled(np.nan), full[name].filled(np.nan),
+                                           rtol=1e-10, equal_nan=True)
+
+    def test_path_window(self):
+        self.vsec.lat_data = np.arange(-90, 90.5, 1.)
+        self.vsec.lats = np.array([40.5, 45.])
+        # global grid stored from 0 to 360, path crossing its seam
+        lon_data = ((np.arange(0, 360, 1.) + 180) % 360) - 180
+        lon_data = ((lon_data + 11) % 360) - 11
+        lon_indices = lon_data.argsort()
+        lat_window, lon_window, lon_slices = self.vsec._get_path_window(
+            lon_data[lon_indices], lon_indices, np.array([-10., 10.]))
+        assert lat_window == (129, 138)
+        assert lon_window == (0, 24)
+        assert lon_slices == [slice(349, 360), slice(0, 13)]
+        # the window is too large for a subset read
+        self.vsec.lats = np.array([-80., 80.])
+        assert self.vsec._get_path_window(lon_data[lon_indices], lon_indices, np.array([-10., 300.])) is None
+
     def test_VS_wrong_mime_type(self):
         with pytest.raises(RuntimeError):
             self.plot(mpl_vsec_styles.VS_TemperatureStyle_01(driver=self.vsec), mime_type="stupid/stuff")
@@ -271,6 +313,25 @@ class Test_LSec(object):
         img = self.plot(mpl_lsec_styles.LS_VerticalVelocityStyle_01(driver=self.lsec))
         assert img is not None
 
+    def test_reference_output(self):
+        """
+        Compares the interpolated data with the output of the former loop-based implementation.
+        """
+        reference = np.load(os.path.join(os.path.dirname(__file__), "..", "data", "lsec_reference.npz"))
+        self.path = [[45.0, 8.0, 25000], [50.0, 12.0, 60000], [51.0, 15.0, 1000], [48.0, 11.0, 110000],
+                     [30.0, -60.0, 50000]]
+        self.bbox = [101]
+        for key, plot_object in [
+                ("ml", mpl_lsec_styles.LS_DefaultStyle(driver=self.lsec, variable="air_temperature")),
+                ("pl", mpl_lsec_styles.LS_DefaultStyle(driver=self.lsec, variable="air_potential_temperature",
+                                                       filetype="pl")),
+                ("hv", mpl_lsec_styles.LS_HorizontalVelocityStyle_01(driver=self.lsec))]:
+            self.plot(plot_object)
+            data = self.lsec._load_interpolate_timestep()
+            assert sorted(data) == sorted(_x.split(":")[1] for _x in reference if _x.startswith(key + ":"))
+            for name, values in data.items():
+                np.testing.assert_allclose(values, reference[f"{key}:{name}"], rtol=1e-10, equal_nan=True)
+
     def test_LS_wrong_mime_type(self):
         with pytest.raises(RuntimeError):
             self.plot(mpl_lsec_styles.LS_RelativeHumdityStyle_01(driver=self.lsec), mime_type="stupid/stuff")
@@ -332,6 +393,23 @@ class Test_HSec(object):
         img = self.plot(mpl_hsec_styles.HS_TemperatureStyle_ML_01(driver=self.hsec), level=10)
         assert img is not None
 
+    @pytest.mark.parametrize("crs, bbox", [("EPSG:4326", None), ("EPSG:3857", [-2e6, 3e6, 4e6, 9e6])])
+    def test_basemap_cache(self, crs, bbox):
+        cache = BasemapCache()
+        with mock.patch.object(mswms_settings, "basemap_use_cache", False, create=True):
+            reference = self.plot(mpl_hsec_styles.HS_MSLPStyle_01(driver=self.hsec), crs=crs, bbox=bbox)
+            reference_noframe = self.plot(
+                mpl_hsec_styles.HS_MSLPStyle_01(driver=self.hsec), crs=crs, bbox=bbox, noframe=True)
+        with mock.patch.object(mswms_settings, "basemap_use_cache", True, create=True), \
+                mock.patch("mslib.mswms.mpl_hsec.BASEMAP_CACHE", cache):
+            images = [self.plot(mpl_hsec_styles.HS_MSLPStyle_01(driver=self.hsec), crs=crs, bbox=bbox)
+                      for _ in range(3)]
+            noframe = self.plot(mpl_hsec_styles.HS_MSLPStyle_01(driver=self.hsec), crs=crs, bbox=bbox, noframe=True)
+        assert cache.info()["misses"] == 1
+        assert cache.info()["hits"] == 3
+        assert images == [reference] * 3
+        assert noframe == reference_noframe
+
     def test_HS_CloudsStyle_01(self):
         for style in ["TOT", "HIGH", "MED", "LOW"]:
             img = self.plot(mpl_hsec_styles.HS_CloudsStyle_01(driver=self.hsec), style=style)
@@ -503,6 +581,53 @@ class Test_HSec(object):
         noframe = self.plot(mpl_hsec_styles.HS_Meteosat_BT108_01(driver=self.hsec), noframe=True)
         assert noframe != img
 
+    def _image(self, plot_object, bbox, level, noframe=False):
+        img = self.plot(plot_object, bbox=bbox, level=level, noframe=noframe)
+        with Image.open(io.BytesIO(img)) as image:
+            return np.asarray(image.convert("RGB")).astype(int)
+
+    @pytest.mark.parametrize("bbox", [[-10, 40, 20, 60], [330, 40, 370, 65], [-60, 20, 60, 80]])
+    @pytest.mark.parametrize("style, level, exact", [
+        (mpl_hsec_styles.HS_MSLPStyle_01, None, True),
+        (mpl_hsec_styles.HS_CloudsStyle_01, None, True),
+        (mpl_hsec_styles.HS_TemperatureStyle_PL_01, 300, False)])
+    def test_bbox_subset(self, bbox, style, level, exact):
+        for noframe in [False, True]:
+            subset = self._image(style(driver=self.hsec), bbox, level, noframe=noframe)
+            assert self.hsec._get_bbox_window() is not None
+            with mock.patch.object(HorizontalSectionDriver, "_get_bbox_window", return_value=None):
+                full = self._image(style(driver=self.hsec), bbox, level, noframe=noframe)
+            difference = np.abs(subset - full).max(axis=-1)
+            if exact:
+                assert (difference == 0).all()
+            else:
+                # contour labels may be placed differently
+                assert (difference > 64).mean() < 0.01
+
+    def test_bbox_window(self):
+        self.plot(mpl_hsec_styles.HS_MSLPStyle_01(driver=self.hsec), bbox=[-10, 40, 20, 60])
+        lat_window, lon_slices = self.hsec._get_bbox_window()
+        assert self.hsec.lat_data[lat_window[0]] <= 40 - 2 and self.hsec.lat_data[lat_window[1] - 1] >= 60 + 2
+        assert len(lon_slices) == 1
+        assert self.hsec.lon_data[lon_slices[0]][0] <= -10 - 3 and self.hsec.lon_data[lon_slices[0]][-1] >= 20 + 3
+
+        # global grid stored from 0 to 360, window crossing its seam
+        self.hsec.lon_data = ((np.arange(0, 360, 1.) + 180) % 360) - 180
+        lat_window, lon_slices = self.hsec._get_bbox_window()
+        assert lon_slices == [slice(344, None), slice(None, 27)]
+        self.hsec.bbox = [-170, 40, 170, 60]
+        assert self.hsec._get_bbox_window()[1] == [slice(None)]
+        self.hsec.bbox = [170, 40, 200, 60]
+        assert self.hsec._get_bbox_window()[1] == [slice(164, 207)]
+
+        self.hsec.crs = "MSS:stere,20,40,40"
+        assert self.hsec._get_bbox_window() is None
+
+    def test_bbox_subset_generic_auto(self):
+        plot_object = mpl_hsec_styles.HS_GenericStyle_PL_air_temperature(driver=self.hsec)
+        assert plot_object.requires_full_domain("auto", 300)
+        assert not mpl_hsec_styles.HS_MSLPStyle_01(driver=self.hsec).requires_full_domain("default", None)
+
     def test_HS_gallery_template(self):
         pytest.skip('Test can be biased. In pytest-reverse when there is not a plot_examples it can''t import')
         # ToDo Test Data have to be written to a random tmp dir and that may become purged afterwards
@@ -512,3 +637,247 @@ class Test_HSec(object):
 
         img = self.plot(HS_Template(driver=self.hsec), level=300)
         assert img is not None
+
+
+class Test_DatasetPool(object):
+    def setup_method(self):
+        self.data = mswms_settings.data["ecmwf_EUR_LL015"]
+        self.data.setup()
+        init_time = datetime(2012, 10, 17, 12)
+        self.sfc = [self.data.get_filename("air_pressure_at_sea_level", "sfc", init_time, init_time, fullpath=True)]
+        self.ml = [self.data.get_filename("air_temperature", "ml", init_time, init_time, fullpath=True),
+                   self.data.get_filename("air_pressure", "ml", init_time, init_time, fullpath=True)]
+
+    def test_reuse(self):
+        pool = DatasetPool()
+        first = pool.acquire(self.ml)
+        second = pool.acquire(self.ml)
+        assert first is second
+        assert first.users == 2
+        assert first.times[0] == datetime(2012, 10, 17, 12)
+        assert first.vert_data is not None
+        pool.release(first)
+        pool.release(second)
+        assert pool.acquire(self.ml) is first
+        assert pool.acquire(self.sfc) is not first
+
+    def test_eviction(self):
+        pool = DatasetPool(max_open_files=2)
+        ml = pool.acquire(self.ml)
+        sfc = pool.acquire(self.sfc)
+        # both are in use and must not be closed
+        assert pool._open_files() == 3
+        pool.release(ml)
+        assert pool._open_files() == 1
+        assert pool.acquire(self.sfc) is sfc
+        assert pool.acquire(self.ml) is not ml
+
+    def test_modified_file(self, tmp_path):
+        filenames = []
+        for filename in self.ml:
+            filenames.append(os.path.join(tmp_path, os.path.basename(filename)))
+            with open(filename, "rb") as source, open(filenames[-1], "wb") as target:
+                target.write(source.read())
+        pool = DatasetPool()
+        first = pool.acquire(filenames)
+        pool.release(first)
+        os.utime(filenames[1], (os.path.getmtime(filenames[1]) + 10,) * 2)
+        second = pool.acquire(filenames)
+        assert second is not first
+        assert len(pool._entries) == 1
+
+    def test_invalidate(self):
+        pool = DatasetPool()
+        entry = pool.acquire(self.ml)
+        pool.invalidate(self.ml[1:])
+        assert entry.invalid
+        assert len(pool._entries) == 0
+        # still usable until released
+        assert entry.dataset.variables["time"][0] == entry.dataset.variables["time"][0]
+        pool.release(entry)
+        assert pool.acquire(self.ml) is not entry
+
+    def test_coordinate_hashes(self):
+        hsec = HorizontalSectionDriver(self.data, dataset_pool=DatasetPool())
+        with mock.patch("mslib.utils.netCDF4tools.MFDatasetCommonDims",
+                        wraps=netCDF4tools.MFDatasetCommonDims) as opened:
+            hsec.set_plot_parameters(
+                plot_object=mpl_hsec_styles.HS_MSLPStyle_01(driver=hsec), bbox=[-22.5, 27.5, 55, 62.5],
+                crs="EPSG:4326", init_time=datetime(2012, 10, 17, 12), valid_time=datetime(2012, 10, 17, 12),
+                show=False)
+            assert hsec.plot() is not None
+        hashes = opened.call_args.kwargs["coordinate_hashes"]
+        assert sorted(hashes) == sorted(hsec.filenames)
+
+    def test_mismatched_coordinates(self, tmp_path):
+        for filename in os.listdir(self.data._root_path):
+            with open(os.path.join(self.data._root_path, filename), "rb") as source, \
+                    open(os.path.join(tmp_path, filename), "wb") as target:
+                target.write(source.read())
+        data = DefaultDataAccess(str(tmp_path), "EUR_LL015")
+        data.setup()
+        init_time = datetime(2012, 10, 17, 12)
+        filename = data.get_filename("air_pressure", "ml", init_time, init_time, fullpath=True)
+        with netCDF4.Dataset(filename, "a") as ncfile:
+            ncfile.variables["lon"][0] -= 0.5
+        # the file was modified after the setup, so its recorded hashes are not used
+        assert filename not in data.get_coordinate_hashes([filename])
+        vsec = VerticalSectionDriver(data, dataset_pool=DatasetPool())
+        for known in [False, True]:
+            if known:
+                data.setup()
+                assert filename in data.get_coordinate_hashes([filename])
+            with pytest.raises(IOError, match="dimension 'lon' differs"):
+                vsec.set_plot_parameters(
+                    plot_object=mpl_vsec_styles.VS_TemperatureStyle_01(driver=vsec), bbox=[3, 500, 3, 10],
+                    vsec_path=[[45., 8.], [50., 12.]], vsec_numpoints=11, vsec_path_connection="greatcircle",
+                    init_time=init_time, valid_time=init_time, show=False)
+
+    def test_shared_by_drivers(self):
+        pool = DatasetPool()
+        hsec = HorizontalSectionDriver(self.data, dataset_pool=pool)
+        vsec = VerticalSectionDriver(self.data, dataset_pool=pool)
+        init_time = valid_time = datetime(2012, 10, 17, 12)
+        with mock.patch("mslib.utils.netCDF4tools.MFDatasetCommonDims",
+                        wraps=netCDF4tools.MFDatasetCommonDims) as opened:
+            for _ in range(2):
+                for level, plot_object in [
+                        (None, mpl_hsec_styles.HS_MSLPStyle_01(driver=hsec)),
+                        (300, mpl_hsec_styles.HS_TemperatureStyle_PL_01(driver=hsec))]:
+                    hsec.set_plot_parameters(
+                        plot_object=plot_object, bbox=[-22.5, 27.5, 55, 62.5], level=level, crs="EPSG:4326",
+                        init_time=init_time, valid_time=valid_time, show=False)
+                    assert hsec.plot() is not None
+                vsec.set_plot_parameters(
+                    plot_object=mpl_vsec_styles.VS_TemperatureStyle_01(driver=vsec), bbox=[3, 500, 3, 10],
+                    vsec_path=[[45., 8.], [50., 12.]], vsec_numpoints=11, vsec_path_connection="greatcircle",
+                    init_time=init_time, valid_time=valid_time, show=False)
+                assert vsec.plot() is not None
+            assert opened.call_count == 3
+
+
+class Test_DriverPool(object):
+    def setup_method(self):
+        self.data = mswms_settings.data["ecmwf_EUR_LL015"]
+        self.data.setup()
+
+    def test_checkout(self):
+        pool = DriverPool(HorizontalSectionDriver, self.data, size=2)
+        first = pool.checkout()
+        second = pool.checkout()
+        assert first is not second
+        assert first.dataset_pool is second.dataset_pool
+        with pytest.raises(RuntimeError):
+            pool.checkout(timeout=0.01)
+        pool.checkin(first)
+        assert pool.checkout(timeout=0.01) is first
+
+    def test_wait_for_checkin(self):
+        pool = DriverPool(HorizontalSectionDriver, self.data, size=1)
+        driver = pool.checkout()
+        timer = threading.Timer(0.1, pool.checkin, args=(driver,))
+        timer.start()
+        with pool.driver(timeout=10) as other:
+            assert other is driver
+        timer.join()
+        with pool.driver() as other:
+            assert other is driver
+
+    def test_bind(self):
+        pool = DriverPool(HorizontalSectionDriver, self.data)
+        layer = mpl_hsec_styles.HS_MSLPStyle_01(driver=None)
+        with pool.driver() as first:
+            with pool.driver() as second:
+                bound = pool.bind(first, layer)
+                assert bound is not layer and bound.driver is first
+                assert pool.bind(first, layer) is bound
+                assert pool.bind(second, layer).driver is second
+        assert layer.driver is None
+
+
+def convert_to_netcdf4(source, target, chunk=16):
+    """
+    Writes the NetCDF files of directory source as zlib compressed NETCDF4
+    files to directory target, chunked by chunk x chunk horizontal tiles.
+    """
+    for filename in os.listdir(source):
+        if not filename.endswith(".nc"):
+            continue
+        with netCDF4.Dataset(os.path.join(source, filename)) as src, \
+                netCDF4.Dataset(os.path.join(target, filename), "w", format="NETCDF4") as dst:
+            dst.setncatts({_x: src.getncattr(_x) for _x in src.ncattrs()})
+            for name, dim in src.dimensions.items():
+                dst.createDimension(name, None if dim.isunlimited() else len(dim))
+            for name, var in src.variables.items():
+                attrs = {_x: var.getncattr(_x) for _x in var.ncattrs()}
+                chunksizes = None
+                if len(var.dimensions) >= 3:
+                    chunksizes = [1] * (len(var.dimensions) - 2) + [
+                        min(chunk, len(src.dimensions[_x])) for _x in var.dimensions[-2:]]
+                new = dst.createVariable(name, var.dtype, var.dimensions, zlib=chunksizes is not None,
+                                         chunksizes=chunksizes, fill_value=attrs.pop("_FillValue", None))
+                new.setncatts(attrs)
+                var.set_auto_maskandscale(False)
+                new.set_auto_maskandscale(False)
+                new[:] = var[:]
+
+
+class Test_NetCDF4Format(object):
+    def setup_method(self):
+        self.data = mswms_settings.data["ecmwf_EUR_LL015"]
+        self.data.setup()
+        self.init_time = datetime(2012, 10, 17, 12)
+        self.valid_time = datetime(2012, 10, 17, 12)
+
+    def _data_access(self, tmp_path, **kwargs):
+        convert_to_netcdf4(self.data._root_path, tmp_path)
+        data = DefaultDataAccess(str(tmp_path), "EUR_LL015", **kwargs)
+        data.setup()
+        filename = data.get_filename("air_temperature", "ml", self.init_time, self.valid_time, fullpath=True)
+        with netCDF4.Dataset(filename) as ncfile:
+            assert ncfile.file_format == "NETCDF4"
+        return data
+
+    @staticmethod
+    def _pixels(img):
+        with Image.open(io.BytesIO(img)) as image:
+            return np.asarray(image.convert("RGBA"))
+
+    @pytest.mark.parametrize("style, level", [
+        (mpl_hsec_styles.HS_MSLPStyle_01, None),
+        (mpl_hsec_styles.HS_TemperatureStyle_ML_01, 10),
+        (mpl_hsec_styles.HS_TemperatureStyle_PL_01, 300)])
+    def test_hsec(self, tmp_path, style, level):
+        images = []
+        for data in [self.data, self._data_access(tmp_path)]:
+            hsec = HorizontalSectionDriver(data)
+            for bbox in [[-15, 35, 25, 65], [-22.5, 27.5, 55, 62.5]]:
+                hsec.set_plot_parameters(plot_object=style(driver=hsec), bbox=bbox, level=level, crs="EPSG:4326",
+                                         init_time=self.init_time, valid_time=self.valid_time, show=False)
+                images.append(self._pixels(hsec.plot()))
+        assert (images[0] == images[2]).all()
+        assert (images[1] == images[3]).all()
+
+    @pytest.mark.parametrize("style", [mpl_vsec_styles.VS_TemperatureStyle_01, mpl_vsec_styles.VS_CloudsStyle_01])
+    def test_vsec(self, tmp_path, style):
+        images = []
+        for data in [self.data, self._data_access(tmp_path, chunk_cache=(2 ** 22, 1009, 0.75))]:
+            vsec = VerticalSectionDriver(data)
+            vsec.set_plot_parameters(plot_object=style(driver=vsec), bbox=[3, 500, 3, 10],
+                                     vsec_path=[[45, 8], [50, 12], [51, 15], [48, 11]], vsec_numpoints=101,
+                                     vsec_path_connection="greatcircle", init_time=self.init_time,
+                                     valid_time=self.valid_time, show=False)
+            images.append(self._pixels(vsec.plot()))
+        assert (images[0] == images[1]).all()
+
+    def test_lsec(self, tmp_path):
+        results = []
+        for data in [self.data, self._data_access(tmp_path, chunk_cache={"air_temperature": (2 ** 20, 521, None)})]:
+            lsec = LinearSectionDriver(data)
+            for variable, filetype in [("air_temperature", "ml"), ("air_potential_temperature", "pl")]:
+                lsec.set_plot_parameters(
+                    plot_object=mpl_lsec_styles.LS_DefaultStyle(driver=lsec, variable=variable, filetype=filetype),
+                    bbox=[500], lsec_path=[[45, 8, 25000], [50, 12, 25000], [51, 15, 25000]], lsec_numpoints=500,
+                    init_time=self.init_time, valid_time=self.valid_time, mime_type="text/xml")
+                results.append(lsec.plot())
+        assert results[:2] == results[2:]
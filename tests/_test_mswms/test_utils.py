@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+
+    tests._test_mswms.test_utils
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module provides pytest functions to tests mswms.utils
+
+    This file is part of MSS.
+
+    :copyright: Copyright 2016-2023 by the MSS team, see AUTHORS.
+    :license: APACHE-2.0, see LICENSE for details.
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import collections
+import io
+import sys
+
+import matplotlib.figure
+import mock
+from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+import numpy as np
+import PIL.Image
+import pytest
+
+import mslib.mswms.utils
+from mslib.mswms.utils import encode_png
+
+
+def _create_canvas(transparent):
+    fig = matplotlib.figure.Figure(figsize=(6, 4), dpi=80, facecolor="white")
+    ax = fig.add_axes([0.1, 0.1, 0.8, 0.8])
+    x, y = np.meshgrid(np.linspace(0, 5, 120), np.linspace(0, 3, 80))
+    ax.contourf(x, y, np.sin(x) * np.cos(y), 20, cmap="viridis")
+    ax.plot([0, 5], [0, 3], "r")
+    if transparent:
+        fig.patch.set_alpha(0.)
+    return FigureCanvas(fig)
+
+
+def _encode_png_twice(canvas, transparent):
+    """
+    The former encoding of the plot styles: an RGBA PNG is written, decoded
+    and converted to a palette image, which is encoded again.
+    """
+    output = io.BytesIO()
+    canvas.print_png(output)
+    output.seek(0)
+    palette_img = PIL.Image.open(output).convert(mode="RGB").convert("P", palette=PIL.Image.Palette.ADAPTIVE)
+    output = io.BytesIO()
+    if not transparent:
+        palette_img.save(output, format="PNG")
+    else:
+        lut = palette_img.resize((256, 1))
+        lut.putdata(list(range(256)))
+        lut = [c[1] for c in lut.convert("RGB").getcolors()]
+        palette_img.save(output, format="PNG", transparency=lut.index((255, 255, 255)))
+    return output.getvalue()
+
+
+def _pixels(data):
+    with PIL.Image.open(io.BytesIO(data)) as image:
+        assert image.mode == "P"
+        return np.asarray(image.convert("RGBA"))
+
+
+@pytest.mark.parametrize("transparent", [False, True])
+def test_encode_png(transparent):
+    canvas = _create_canvas(transparent)
+    reference = _encode_png_twice(canvas, transparent)
+    data = encode_png(canvas, transparent=transparent)
+    assert data == reference
+    pixels = _pixels(data)
+    assert np.array_equal(pixels, _pixels(reference))
+    # the transparent background
+    assert (pixels[0, 0, 3] == 0) == transparent
+
+
+def test_encode_png_compress_level():
+    canvas = _create_canvas(False)
+    fast, small = encode_png(canvas, compress_level=1), encode_png(canvas, compress_level=9)
+    assert len(small) < len(fast)
+    assert np.array_equal(_pixels(fast), _pixels(small))
+
+
+def test_encode_png_compress_level_setting(monkeypatch):
+    canvas = _create_canvas(False)
+    monkeypatch.setattr(sys.modules["mswms_settings"], "png_compress_level", 1, raising=False)
+    assert encode_png(canvas) == encode_png(canvas, compress_level=1)
+    monkeypatch.delitem(sys.modules, "mswms_settings")
+    assert encode_png(canvas) == encode_png(canvas, compress_level=6)
+
+
+def test_encode_png_palette():
+    canvas = _create_canvas(True)
+    data = encode_png(canvas, transparent=True)
+    with PIL.Image.open(io.BytesIO(data)) as palette:
+        palette.load()
+        reused = encode_png(canvas, transparent=True, palette=palette)
+        with PIL.Image.open(io.BytesIO(reused)) as image:
+            assert image.getpalette() == palette.getpalette()
+            assert image.info["transparency"] == palette.info["transparency"]
+    # the colours are mapped to the nearest palette entry, which may differ slightly
+    pixels, reused_pixels = _pixels(data).astype(int), _pixels(reused)
+    assert np.abs(pixels - reused_pixels).max() <= 4
+    assert np.array_equal(pixels[..., 3], reused_pixels[..., 3])
+
+
+def test_encode_png_palette_key(monkeypatch):
+    monkeypatch.setattr(mslib.mswms.utils, "_PALETTES", collections.OrderedDict())
+    monkeypatch.setattr(mslib.mswms.utils, "_PALETTES_SIZE", 1)
+    canvas = _create_canvas(False)
+    # palettes are only reused if enabled
+    encode_png(canvas, palette_key="style")
+    assert len(mslib.mswms.utils._PALETTES) == 0
+    monkeypatch.setattr(sys.modules["mswms_settings"], "png_reuse_palette", True, raising=False)
+    data = encode_png(canvas, palette_key="style")
+    # the first image of a key gets the adaptive palette
+    assert data == encode_png(canvas)
+    with PIL.Image.open(io.BytesIO(data)) as palette:
+        palette.load()
+        with mock.patch.object(PIL.Image.Image, "convert", wraps=PIL.Image.Image.convert, autospec=True) as convert:
+            assert encode_png(canvas, palette_key="style") == encode_png(canvas, palette=palette)
+            # no adaptive palette was computed
+            assert all(_call.args[1:2] != ("P",) for _call in convert.call_args_list)
+    encode_png(canvas, palette_key="other")
+    assert list(mslib.mswms.utils._PALETTES) == ["other"]
@@ -26,15 +26,25 @@
     limitations under the License.
 """
 
+import concurrent.futures
+import datetime
 import os
+import pickle
+import shutil
+from collections import OrderedDict
 from shutil import move
 
 import mock
+import netCDF4
 from nco import Nco
 import pytest
 
+import mslib.mswms.dataaccess
 import mslib.mswms.wms
 import mslib.mswms.gallery_builder
+from mslib.mswms.basemap_cache import BasemapCache
+from mslib.mswms.image_cache import MemoryImageCache
+from mslib.mswms.mss_plot_driver import DriverPool, HorizontalSectionDriver
 import mslib.mswms.mswms as mswms
 from importlib import reload
 from tests.utils import callback_ok_image, callback_ok_xml, callback_ok_html, callback_404_plain
@@ -419,13 +429,276 @@ class Test_WMS(object):
             do_test()
 
         watch_access = mslib.mswms.dataaccess.WatchModificationDataAccess(
-            mslib.mswms.wms.mswms_settings._datapath, "EUR_LL015")
+            mslib.mswms.wms.mswms_settings._datapath, "EUR_LL015", poll_interval=0)
         watch_access.setup()
-        with mock.patch.object(
-            mslib.mswms.wms.server.hsec_layer_registry["ecmwf_EUR_LL015"]["PLDiv01"].driver,
-            "data_access", new=watch_access):
+        with mock.patch.dict(mslib.mswms.wms.server.hsec_driver_pools, {
+                "ecmwf_EUR_LL015": DriverPool(HorizontalSectionDriver, watch_access)}):
             do_test()
 
+    def test_capabilities_cache(self):
+        query = '/?request=GetCapabilities&service=WMS&version=1.1.1'
+        self.client = mswms.application.test_client()
+        server = mslib.mswms.wms.server
+        with mock.patch.object(server, "_render_capabilities", wraps=server._render_capabilities) as render, \
+                mock.patch.object(server, "_capabilities_cache", OrderedDict()):
+            first = self.client.get(query)
+            # unchanged data is neither set up nor hashed again
+            with mock.patch("mslib.mswms.dataaccess._inventory_items") as inventory_items, \
+                    mock.patch.object(mslib.mswms.dataaccess.DefaultDataAccess, "setup",
+                                      side_effect=AssertionError("setup() called")):
+                second = self.client.get(query)
+                assert self.client.get(query).data == second.data
+            assert inventory_items.call_count == 0
+            assert render.call_count == 1
+        callback_ok_xml(second.status, second.headers)
+        assert first.data == second.data
+        assert first.headers["ETag"] == second.headers["ETag"]
+        assert "Last-Modified" in second.headers
+
+        # a conditional request is answered without a document
+        result = self.client.get(query, headers={"If-None-Match": first.headers["ETag"]})
+        assert result.status_code == 304
+        assert result.data == b""
+        result = self.client.get(query, headers={"If-None-Match": '"outdated"'})
+        assert result.status_code == 200
+        assert result.data == first.data
+
+    def test_capabilities_cache_invalidation(self):
+        query = '/?request=GetCapabilities&service=WMS&version=1.3.0'
+        self.client = mswms.application.test_client()
+        first = self.client.get(query)
+        filename = next(_x for _x in sorted(os.listdir(DATA_DIR)) if ".pl." in _x)
+        new_filename = filename.replace("20121017", "20121018")
+        shutil.copy(os.path.join(DATA_DIR, filename), os.path.join(DATA_DIR, new_filename))
+        try:
+            with netCDF4.Dataset(os.path.join(DATA_DIR, new_filename), "a") as dataset:
+                dataset.variables["time"].units = "hours since 2012-10-18T12:00:00.000Z"
+            second = self.client.get(query)
+            assert second.headers["ETag"] != first.headers["ETag"]
+            assert b"2012-10-18T12:00:00Z" in second.data
+            result = self.client.get(query, headers={"If-None-Match": first.headers["ETag"]})
+            assert result.status_code == 200
+        finally:
+            os.remove(os.path.join(DATA_DIR, new_filename))
+        assert self.client.get(query).headers["ETag"] == first.headers["ETag"]
+
+    def test_concurrent_requests(self):
+        queries = [
+            'layers=ecmwf_EUR_LL015.PLDiv01&styles=&elevation=200&srs=EPSG%3A4326&format=image%2Fpng&'
+            'request=GetMap&bgcolor=0xFFFFFF&height=376&dim_init_time=2012-10-17T12%3A00%3A00Z&width=479&'
+            'version=1.1.1&bbox=-50.0%2C20.0%2C20.0%2C75.0&time=2012-10-17T12%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&transparent=FALSE',
+            'layers=ecmwf_EUR_LL015.PLTemp01&styles=&elevation=300&srs=EPSG%3A4326&format=image%2Fpng&'
+            'request=GetMap&bgcolor=0xFFFFFF&height=376&dim_init_time=2012-10-17T12%3A00%3A00Z&width=479&'
+            'version=1.1.1&bbox=-20.0%2C40.0%2C20.0%2C60.0&time=2012-10-17T18%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&transparent=FALSE',
+            'layers=ecmwf_EUR_LL015.PLDiv01&styles=&elevation=500&srs=EPSG%3A4326&format=image%2Fpng&'
+            'request=GetMap&bgcolor=0xFFFFFF&height=300&dim_init_time=2012-10-17T12%3A00%3A00Z&width=400&'
+            'version=1.1.1&bbox=0.0%2C40.0%2C30.0%2C65.0&time=2012-10-18T00%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&transparent=FALSE',
+            'layers=ecmwf_EUR_LL015.VS_HV01&styles=&srs=VERT%3ALOGP&format=image%2Fpng&'
+            'request=GetMap&bgcolor=0xFFFFFF&height=245&dim_init_time=2012-10-17T12%3A00%3A00Z&width=842&'
+            'version=1.1.1&bbox=201%2C500.0%2C10%2C100.0&time=2012-10-17T12%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&path=52.78%2C-8.93%2C48.08%2C11.28&transparent=FALSE',
+            'layers=ecmwf_EUR_LL015.LS_HV01&styles=&srs=LINE%3A1&format=text%2Fxml&'
+            'request=GetMap&dim_init_time=2012-10-17T12%3A00%3A00Z&'
+            'version=1.1.1&bbox=201&time=2012-10-17T12%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&path=52.78%2C-8.93%2C25000%2C48.08%2C11.28%2C25000']
+
+        def get(query):
+            result = mswms.application.test_client().get(f"/?{query}")
+            assert result.status == "200 OK"
+            return result.data
+
+        serial = [get(_query) for _query in queries]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            parallel = list(executor.map(get, queries * 4))
+        for index, data in enumerate(parallel):
+            assert data == serial[index % len(queries)], queries[index % len(queries)]
+
+    def test_render_processes(self):
+        query = (
+            'layers=ecmwf_EUR_LL015.PLDiv01,ecmwf_EUR_LL015.PLTemp01,ecmwf_EUR_LL015.PLDiv01,'
+            'ecmwf_EUR_LL015.PLTemp01&styles=&elevation=200&srs=EPSG%3A4326&format=image%2Fpng&'
+            'request=GetMap&bgcolor=0xFFFFFF&height=376&dim_init_time=2012-10-17T12%3A00%3A00Z&width=479&'
+            'version=1.1.1&bbox=-50.0%2C20.0%2C20.0%2C75.0&time=2012-10-17T12%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&transparent=FALSE')
+        xml_query = (
+            'layers=ecmwf_EUR_LL015.LS_HV01,ecmwf_EUR_LL015.LS_HV01&styles=&srs=LINE%3A1&format=text%2Fxml&'
+            'request=GetMap&dim_init_time=2012-10-17T12%3A00%3A00Z&'
+            'version=1.1.1&bbox=201&time=2012-10-17T12%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&path=52.78%2C-8.93%2C25000%2C48.08%2C11.28%2C25000')
+        client = mswms.application.test_client()
+        serial = [client.get(f"/?{_query}").data for _query in (query, xml_query)]
+
+        server = mslib.mswms.wms.server
+        with mock.patch.object(server, "render_processes", 2), \
+                mock.patch.object(server, "render_layer", side_effect=AssertionError("rendered in the server")):
+            try:
+                parallel = [client.get(f"/?{_query}").data for _query in (query, xml_query)]
+                result = client.get("/?{}".format(query.replace(
+                    "time=2012-10-17T12%3A00%3A00Z", "time=2012-01-17T12%3A00%3A00Z")))
+            finally:
+                server._render_executor.shutdown()
+                server._render_executor = None
+        assert parallel == serial
+        callback_ok_xml(result.status, result.headers)
+        assert result.data.count(b"ServiceExceptionReport") > 0, result
+
+    def test_render_processes_runtime_layer(self):
+        from mslib.mswms import mpl_hsec_styles
+        query = (
+            'layers=ecmwf_EUR_LL015.mole_fraction_of_ozone_in_air_pl,ecmwf_EUR_LL015.PLTemp01&styles=auto,&'
+            'elevation=200&srs=EPSG%3A4326&format=image%2Fpng&'
+            'request=GetMap&bgcolor=0xFFFFFF&height=376&dim_init_time=2012-10-17T12%3A00%3A00Z&width=479&'
+            'version=1.1.1&bbox=-50.0%2C20.0%2C20.0%2C75.0&time=2012-10-17T12%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&transparent=FALSE')
+        client = mswms.application.test_client()
+        server = mslib.mswms.wms.server
+        registrations = list(server._layer_registrations)
+        # the layer is not part of the settings, i.e. unknown to the workers on their own
+        server.register_hsec_layer(
+            ["ecmwf_EUR_LL015"], mpl_hsec_styles.HS_GenericStyle_PL_mole_fraction_of_ozone_in_air)
+        try:
+            serial = client.get(f"/?{query}")
+            callback_ok_image(serial.status, serial.headers)
+            with mock.patch.object(server, "render_processes", 2), \
+                    mock.patch.object(server, "render_layer", side_effect=AssertionError("rendered in the server")):
+                try:
+                    parallel = client.get(f"/?{query}").data
+                finally:
+                    server._render_executor.shutdown()
+                    server._render_executor = None
+        finally:
+            del server.hsec_layer_registry["ecmwf_EUR_LL015"]["mole_fraction_of_ozone_in_air_pl"]
+            server._layer_registrations = registrations
+        assert parallel == serial.data
+
+    def test_render_processes_failure(self):
+        query = (
+            'layers=ecmwf_EUR_LL015.PLDiv01,ecmwf_EUR_LL015.PLTemp01&styles=&elevation=200&srs=EPSG%3A4326&'
+            'format=image%2Fpng&request=GetMap&bgcolor=0xFFFFFF&height=376&dim_init_time=2012-10-17T12%3A00%3A00Z&'
+            'width=479&version=1.1.1&bbox=-50.0%2C20.0%2C20.0%2C75.0&time=2012-10-17T12%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&transparent=FALSE')
+        client = mswms.application.test_client()
+        server = mslib.mswms.wms.server
+        broken = concurrent.futures.Future()
+        broken.set_exception(concurrent.futures.process.BrokenProcessPool("worker died"))
+        for submit in ({"return_value": broken}, {"side_effect": pickle.PicklingError("cannot pickle layer")}):
+            executor = mock.Mock(**{f"submit.{key}": value for key, value in submit.items()})
+            with mock.patch.object(server, "render_processes", 2), \
+                    mock.patch.object(server, "_render_executor", executor):
+                result = client.get(f"/?{query}")
+                # the broken executor is replaced by a new one for the next request
+                assert server._render_executor is None
+            executor.shutdown.assert_called_once_with(wait=False)
+            callback_ok_xml(result.status, result.headers)
+            assert result.data.count(b"ServiceExceptionReport") > 0, result
+            assert b"could not render your request" in result.data
+
+    def test_basemap_cache(self):
+        query = (
+            'layers=ecmwf_EUR_LL015.PLDiv01&styles=&elevation=200&srs=EPSG%3A4326&format=image%2Fpng&'
+            'request=GetMap&bgcolor=0xFFFFFF&height=376&dim_init_time=2012-10-17T12%3A00%3A00Z&width=479&'
+            'version=1.1.1&bbox=-50.0%2C20.0%2C20.0%2C75.0&time=2012-10-17T12%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&transparent=FALSE')
+        client = mswms.application.test_client()
+        cache = BasemapCache()
+        with mock.patch("mslib.mswms.mpl_hsec.BASEMAP_CACHE", cache):
+            results = [client.get(f"/?{query}").data for _ in range(3)]
+            # another layer on the same map
+            client.get("/?{}".format(query.replace("PLDiv01", "PLTemp01")))
+        assert cache.info()["misses"] == 1
+        assert cache.info()["hits"] == 3
+        assert results[0] == results[1] == results[2]
+
+    def test_image_cache(self):
+        query = (
+            '/?layers=ecmwf_EUR_LL015.PLDiv01&styles=&elevation=200&srs=EPSG%3A4326&format=image%2Fpng&'
+            'request=GetMap&bgcolor=0xFFFFFF&height=376&dim_init_time=2012-10-17T12%3A00%3A00Z&width=479&'
+            'version=1.1.1&bbox=-50.0%2C20.0%2C20.0%2C75.0&time=2012-10-17T12%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&transparent=FALSE')
+        self.client = mswms.application.test_client()
+        uncached = self.client.get(query).data
+        server = mslib.mswms.wms.server
+        cache = MemoryImageCache()
+        with mock.patch.object(server, "image_cache", cache), \
+                mock.patch.object(server, "render_layer", wraps=server.render_layer) as render_layer:
+            first = self.client.get(query)
+            callback_ok_image(first.status, first.headers)
+            # parameters are normalised, e.g. upper case names and values
+            second = self.client.get(query.replace("srs=EPSG", "SRS=epsg").replace("2Fpng", "2FPNG"))
+            assert render_layer.call_count == 1
+            assert (cache.misses, cache.hits) == (1, 1)
+            assert first.data == second.data == uncached
+
+            # other parameters, errors are not cached
+            self.client.get(query.replace("elevation=200", "elevation=300"))
+            for _ in range(2):
+                result = self.client.get(query.replace("time=2012-10-17T12", "time=2012-01-17T12"))
+                assert result.data.count(b"ServiceExceptionReport") > 0
+            assert render_layer.call_count == 4
+            assert (cache.misses, cache.hits) == (2, 1)
+
+    def test_image_cache_invalidation(self):
+        query = (
+            '/?layers=ecmwf_EUR_LL015.PLDiv01&styles=&elevation=200&srs=EPSG%3A4326&format=image%2Fpng&'
+            'request=GetMap&bgcolor=0xFFFFFF&height=376&dim_init_time=2012-10-17T12%3A00%3A00Z&width=479&'
+            'version=1.1.1&bbox=-50.0%2C20.0%2C20.0%2C75.0&time=2012-10-17T12%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&transparent=FALSE')
+        self.client = mswms.application.test_client()
+        server = mslib.mswms.wms.server
+        cache = MemoryImageCache()
+        valid_time = datetime.datetime(2012, 10, 17, 12)
+        filename = mslib.mswms.wms.mswms_settings.data["ecmwf_EUR_LL015"].get_filename(
+            "divergence_of_wind", "pl", valid_time, valid_time, fullpath=True)
+        stat = os.stat(filename)
+        with mock.patch.object(server, "image_cache", cache):
+            self.client.get(query)
+            # a modified data file invalidates the images using it
+            os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            try:
+                self.client.get(query)
+                assert (cache.misses, cache.hits) == (2, 0)
+                self.client.get(query)
+                assert (cache.misses, cache.hits) == (2, 1)
+            finally:
+                os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+            # a changed file tree clears the cache
+            self.client.get('/?request=GetCapabilities&service=WMS&version=1.3.0')
+            new_filename = os.path.join(DATA_DIR, os.path.basename(filename).replace("20121017", "20121018"))
+            shutil.copy(filename, new_filename)
+            try:
+                with netCDF4.Dataset(new_filename, "a") as dataset:
+                    dataset.variables["time"].units = "hours since 2012-10-18T12:00:00.000Z"
+                self.client.get('/?request=GetCapabilities&service=WMS&version=1.3.0')
+                assert len(cache._entries) == 0
+            finally:
+                os.remove(new_filename)
+            self.client.get('/?request=GetCapabilities&service=WMS&version=1.3.0')
+
+    def test_image_cache_concurrency(self):
+        query = (
+            '/?layers=ecmwf_EUR_LL015.PLTemp01&styles=&elevation=300&srs=EPSG%3A4326&format=image%2Fpng&'
+            'request=GetMap&bgcolor=0xFFFFFF&height=376&dim_init_time=2012-10-17T12%3A00%3A00Z&width=479&'
+            'version=1.1.1&bbox=-20.0%2C40.0%2C20.0%2C60.0&time=2012-10-17T18%3A00%3A00Z&'
+            'exceptions=application%2Fvnd.ogc.se_xml&transparent=FALSE')
+        server = mslib.mswms.wms.server
+
+        def get(query):
+            result = mswms.application.test_client().get(query)
+            assert result.status == "200 OK"
+            return result.data
+
+        with mock.patch.object(server, "image_cache", MemoryImageCache()), \
+                mock.patch.object(server, "render_layer", wraps=server.render_layer) as render_layer:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(get, [query] * 8))
+            # concurrent requests wait for the image rendered by the first one
+            assert render_layer.call_count == 1
+        assert len(set(results)) == 1
+
     def test_gallery(self, tmpdir):
         tempdir = tmpdir.mkdir("static")
         docsdir = tmpdir.mkdir("docs")
@@ -465,3 +738,41 @@ class Test_WMS(object):
         assert os.path.exists(os.path.join(docsdir, "code"))
         assert os.path.exists(os.path.join(docsdir, "plots.html"))
         mslib.mswms.gallery_builder.plot_htmls = {}
+
+    def test_gallery_processes(self, tmpdir):
+        linear_plots = [[mslib.mswms.wms.server.lsec_drivers, mslib.mswms.wms.server.lsec_layer_registry]]
+        results = []
+        for processes in [0, 2]:
+            tempdir = tmpdir.mkdir(f"static{processes}")
+            mslib.mswms.wms.STATIC_LOCATION = tempdir
+            mslib.mswms.gallery_builder.STATIC_LOCATION = tempdir
+            mslib.mswms.wms.server.generate_gallery(create=True, plot_list=linear_plots, processes=processes)
+            assert os.path.exists(os.path.join(tempdir, "plots.html"))
+            results.append(sorted(os.listdir(os.path.join(tempdir, "plots"))))
+        assert len(results[0]) > 0
+        assert results[0] == results[1]
+
+    def test_gallery_outdated(self, tmpdir):
+        tempdir = tmpdir.mkdir("static")
+        mslib.mswms.wms.STATIC_LOCATION = tempdir
+        mslib.mswms.gallery_builder.STATIC_LOCATION = tempdir
+        linear_plots = [[mslib.mswms.wms.server.lsec_drivers, mslib.mswms.wms.server.lsec_layer_registry]]
+        gallery_plots = mslib.mswms.wms.server.plan_gallery(linear_plots, tempdir)
+        assert all(gallery_plot.render for gallery_plot in gallery_plots)
+
+        mslib.mswms.wms.server.generate_gallery(create=True, plot_list=linear_plots)
+        assert not any(gallery_plot.render for gallery_plot in
+                       mslib.mswms.wms.server.plan_gallery(linear_plots, tempdir))
+        assert all(gallery_plot.render for gallery_plot in
+                   mslib.mswms.wms.server.plan_gallery(linear_plots, tempdir, clear=True))
+
+        # an image older than its data is plotted again, the others are kept
+        outdated = os.path.join(tempdir, "plots", gallery_plots[0].filename + ".png")
+        current = os.path.join(tempdir, "plots", gallery_plots[1].filename + ".png")
+        os.utime(outdated, (0, 0))
+        modified_at = os.path.getmtime(current)
+        assert [gallery_plot.render for gallery_plot in mslib.mswms.wms.server.plan_gallery(
+            linear_plots, tempdir)] == [True] + [False] * (len(gallery_plots) - 1)
+        mslib.mswms.wms.server.generate_gallery(create=True, plot_list=linear_plots)
+        assert os.path.getmtime(outdated) > 0
+        assert os.path.getmtime(current) == modified_at
@@ -25,10 +25,14 @@
     limitations under the License.
 """
 import logging
+import warnings
 import datetime
 
+import netCDF4 as nc
 import numpy as np
 import pytest
+from scipy.interpolate import interp1d
+from scipy.ndimage import map_coordinates
 
 import mslib.utils.coordinate as coordinate
 
@@ -52,6 +56,74 @@ class TestGetDistance(object):
         assert coordinate.find_location(50.9200002, 6.36) == ([50.92, 6.36], 'Juelich')
 
 
+def _find_locations_brute_force(locations, lat, lon):
+    """
+    Distances to all locations sorted as by the former find_location.
+    """
+    return sorted([(coordinate.get_distance(lat, lon, loc_lat, loc_lon), loc)
+                   for loc, (loc_lat, loc_lon) in locations.items()])
+
+
+def _random_locations(rng, size):
+    locations = {f"loc{_i}": [float(_x), float(_y)] for _i, (_x, _y) in enumerate(zip(
+        np.degrees(np.arcsin(rng.uniform(-1, 1, size))), rng.uniform(-180, 180, size)))}
+    # duplicates, poles and the date line
+    locations.update({"a": [50., 6.], "b": [50., 6.], "north": [90., 0.], "south": [-90., 10.],
+                      "east": [10., 180.], "west": [10., -179.99]})
+    return locations
+
+
+class TestLocationIndex(object):
+    @pytest.mark.parametrize("seed", range(5))
+    def test_brute_force(self, seed):
+        rng = np.random.default_rng(seed)
+        locations = _random_locations(rng, 500)
+        index = coordinate.LocationIndex(locations)
+        assert len(index) == len(locations)
+        queries = [(50., 6.), (89.9, 100.), (-89.99, -30.), (10., -180.), (10.01, 179.98), (0., 0.)] + [
+            (float(np.degrees(np.arcsin(rng.uniform(-1, 1)))), float(rng.uniform(-180, 180))) for _ in range(20)]
+        for lat, lon in queries:
+            reference = _find_locations_brute_force(locations, lat, lon)
+            for k in [1, 2, 7, 100]:
+                assert index.nearest(lat, lon, k) == reference[:k]
+            for radius in [0, 1e-3, 10, 300, 1000, 5000, 20000, 25000]:
+                assert index.within(lat, lon, radius) == [_x for _x in reference if _x[0] <= radius]
+            radius = reference[5][0]
+            assert index.within(lat, lon, radius) == [_x for _x in reference if _x[0] <= radius]
+            assert len(index.within(lat, lon, radius)) >= 6
+
+    def test_edge_cases(self):
+        index = coordinate.LocationIndex({})
+        assert index.nearest(50, 6, 3) == []
+        assert index.within(50, 6, 1e5) == []
+        index = coordinate.LocationIndex({"a": (50, 6), "b": (51, 7)})
+        assert [_x[1] for _x in index.nearest(50, 6, 5)] == ["a", "b"]
+        assert index.nearest(50, 6, 0) == []
+        assert index.nearest(np.nan, 6) == []
+        assert index.within(50, 6, -1) == []
+        assert index.within(50, np.nan, 10) == []
+
+    @pytest.mark.filterwarnings("error:Conversion of an array:DeprecationWarning")
+    def test_single_candidate(self):
+        index = coordinate.LocationIndex({"a": (50, 6)})
+        assert index.nearest(50, 6.1) == [(pytest.approx(coordinate.get_distance(50, 6, 50, 6.1)), "a")]
+        assert index.within(50, 6, 10) == [(0, "a")]
+
+    def test_config_changes(self, monkeypatch):
+        locations = {"here": [10., 20.], "there": [-10., -20.]}
+        monkeypatch.setattr(coordinate, "config_loader", lambda dataset: locations)
+        index = coordinate.get_location_index()
+        assert index.locations == locations
+        assert coordinate.get_location_index() is index
+        locations = dict(locations)
+        assert coordinate.get_location_index() is index
+        assert coordinate.find_location(10., 20.) == ([10., 20.], "here")
+        locations = {"elsewhere": [10., 20.]}
+        assert coordinate.get_location_index() is not index
+        assert coordinate.find_location(10., 20.0001) == ([10., 20.], "elsewhere")
+        assert coordinate.find_location(-10., -20.) is None
+
+
 class TestProjections(object):
     def test_get_projection_params(self):
         assert coordinate.get_projection_params("epsg:4839") == {'basemap': {'epsg': '4839'}, 'bbox': 'meter(10.5,51)'}
@@ -62,6 +134,66 @@ class TestProjections(object):
         with pytest.raises(ValueError):
             coordinate.get_projection_params('crs:84')
 
+    @pytest.mark.parametrize("crs, basemap, bbox", [
+        ("EPSG:4258", {"epsg": "4258"}, "degree"),
+        ("EPSG:4326", {"epsg": "4326"}, "degree"),
+        ("EPSG:3031", {"epsg": "3031"}, "meter(0,-90)"),
+        ("EPSG:3412", {"epsg": "3412"}, "meter(0,-90)"),
+        ("EPSG:3411", {"epsg": "3411"}, "meter(0,90)"),
+        ("EPSG:3413", {"epsg": "3413"}, "meter(0,90)"),
+        ("EPSG:3575", {"epsg": "3575"}, "meter(0,90)"),
+        ("EPSG:3995", {"epsg": "3995"}, "meter(0,90)"),
+        ("EPSG:3395", {"epsg": "3395"}, "meter(0,0)"),
+        ("EPSG:3857", {"epsg": "3857"}, "meter(0,0)"),
+        ("EPSG:4839", {"epsg": "4839"}, "meter(10.5,51)"),
+        ("EPSG:31467", {"epsg": "31467"}, "meter(-20.9631343,0.0037502)"),
+        ("EPSG:31468", {"epsg": "31468"}, "meter(-25.4097892,0.0037466)"),
+        ("EPSG:77790010", {"projection": "stere", "lat_0": 90, "lon_0": 10}, "degree"),
+        ("EPSG:77845-20", {"projection": "stere", "lat_0": -45, "lon_0": -20}, "degree"),
+        ("MSS:stere,10,90,70", {"projection": "stere", "lon_0": "10", "lat_0": "90", "lat_ts": "70"}, "degree"),
+        ("MSS:cass,10,50", {"projection": "cass", "lon_0": "10", "lat_0": "50"}, "degree"),
+        ("MSS:lcc,10,50,40,60",
+         {"projection": "lcc", "lon_0": "10", "lat_0": "50", "lat_1": "40", "lat_2": "60"}, "degree"),
+        ("MSS:merc,40", {"projection": "merc", "lat_ts": "40"}, "degree")])
+    def test_crs_codes(self, crs, basemap, bbox):
+        for code in [crs, crs.lower()]:
+            params = coordinate.get_projection_params(code)
+            assert params == {"basemap": basemap, "bbox": bbox}
+            # the memoised parameters are not changed through the results
+            params["basemap"]["lat_0"] = 1000
+            params["bbox"] = "no"
+            assert coordinate.get_projection_params(code) == {"basemap": basemap, "bbox": bbox}
+
+    @pytest.mark.parametrize("crs", [
+        "crs:84", "auto:42001,9001,10,50", "auto2:42003,1,10,50", "epsg:9999", "epsg:48", "epsg:",
+        "epsg:7779001", "mss:stere,10,90", "mss:merc", "mss:lagranto", "fnord", "fnord:1", "4326", ""])
+    def test_unsupported_crs_codes(self, crs):
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                coordinate.get_projection_params(crs)
+
+    def test_register_crs_family(self, monkeypatch):
+        monkeypatch.setattr(coordinate, "_CRS_FAMILIES", dict(coordinate._CRS_FAMILIES))
+        with pytest.raises(ValueError):
+            coordinate.get_projection_params("test:10")
+
+        def parse(code):
+            if not code.isdigit():
+                raise ValueError("no number")
+            return {"basemap": {"projection": "ortho", "lon_0": int(code)}, "bbox": "meter(0,0)"}
+        coordinate.register_crs_family("TEST", parse)
+        assert coordinate.get_projection_params("Test:10") == {
+            "basemap": {"projection": "ortho", "lon_0": 10}, "bbox": "meter(0,0)"}
+        with pytest.raises(ValueError):
+            coordinate.get_projection_params("test:x")
+        coordinate.register_crs_family("test", lambda code: {"basemap": {"projection": "cyl"}, "bbox": "degree"})
+        assert coordinate.get_projection_params("test:10") == {"basemap": {"projection": "cyl"}, "bbox": "degree"}
+        coordinate.register_crs_family("epsg", parse)
+        assert coordinate.get_projection_params("epsg:4326")["basemap"] == {"projection": "ortho", "lon_0": 4326}
+        monkeypatch.undo()
+        coordinate._parse_projection.cache_clear()
+        assert coordinate.get_projection_params("epsg:4326")["basemap"] == {"epsg": "4326"}
+
 
 class TestAngles(object):
     """
@@ -190,3 +322,229 @@ def test_pathpoints():
     for i in range(3):
         assert pytest.approx(result[i][0]) == ref[i][0]
         assert pytest.approx(result[i][-1]) == ref[i][-1]
+
+
+def _path_points_reference(lats, lons, numpoints, times, alts, connection):
+    """
+    Former implementation of path_points computing each segment separately.
+    """
+    times = nc.date2num(times, "seconds since 2000-01-01")
+    if connection == "linear":
+        lats, lons = np.asarray(lats), np.asarray(lons)
+        distances = np.hypot(lats[:-1] - lats[1:], lons[:-1] - lons[1:])
+    else:
+        distances = [coordinate.get_distance(lats[i], lons[i], lats[i + 1], lons[i + 1])
+                     for i in range(len(lats) - 1)]
+    length_point_segment = sum(distances) / (numpoints + len(lats) - 2)
+    r_lats, r_lons, r_times, r_alts = [], [], [], []
+    startidx = 0
+    for i in range(len(lats) - 1):
+        segment_points = max(int(round(distances[i] / length_point_segment)), 2)
+        lats_, lons_ = coordinate.latlon_points(
+            lats[i], lons[i], lats[i + 1], lons[i + 1], numpoints=segment_points, connection=connection)
+        r_lons.extend(lons_[startidx:])
+        r_lats.extend(lats_[startidx:])
+        r_times.extend(np.linspace(times[i], times[i + 1], segment_points)[startidx:])
+        r_alts.extend(np.linspace(alts[i], alts[i + 1], segment_points)[startidx:])
+        startidx = 1
+    return [r_lats, r_lons, nc.num2date(r_times, "seconds since 2000-01-01"), r_alts]
+
+
+def _random_path(rng, size):
+    lats = rng.uniform(-85, 85, size)
+    lons = rng.uniform(-200, 200, size)
+    # repeated waypoints, short and long legs
+    if size > 3:
+        lats[2], lons[2] = lats[1], lons[1]
+        lats[3], lons[3] = lats[2] + 1e-6, lons[2]
+    times = [datetime.datetime(2012, 7, 1, 10) + datetime.timedelta(minutes=int(_x))
+             for _x in np.sort(rng.integers(0, 1000, size))]
+    alts = rng.uniform(0, 15000, size)
+    return lats.tolist(), lons.tolist(), times, alts.tolist()
+
+
+class TestBatchGeodesics(object):
+    @pytest.mark.parametrize("seed", range(10))
+    def test_get_distances(self, seed):
+        lats, lons, _, _ = _random_path(np.random.default_rng(seed), 50)
+        distances = coordinate.get_distances(lats, lons)
+        assert distances.tolist() == [
+            coordinate.get_distance(lats[i], lons[i], lats[i + 1], lons[i + 1]) for i in range(len(lats) - 1)]
+        assert len(coordinate.get_distances(lats[:1], lons[:1])) == 0
+
+    @pytest.mark.filterwarnings("error:Conversion of an array:DeprecationWarning")
+    def test_single_segment(self):
+        assert coordinate.get_distances([50, 51], [6, 7]).tolist() == [coordinate.get_distance(50, 6, 51, 7)]
+        for numpoints in [2, 3, 10]:
+            lats, lons = coordinate.path_points([50, 51], [6, 7], numpoints=numpoints, connection="greatcircle")
+            assert len(lats) == len(lons) == numpoints
+            assert (lats[0], lons[0], lats[-1], lons[-1]) == (50, 6, 51, 7)
+
+    @pytest.mark.parametrize("seed", range(20))
+    @pytest.mark.parametrize("connection", ["linear", "greatcircle"])
+    def test_path_points(self, seed, connection):
+        rng = np.random.default_rng(seed)
+        lats, lons, times, alts = _random_path(rng, int(rng.integers(2, 20)))
+        numpoints = int(rng.integers(2, 500))
+        result = coordinate.path_points(lats, lons, numpoints, times=times, alts=alts, connection=connection)
+        reference = _path_points_reference(lats, lons, numpoints, times, alts, connection)
+        assert all(isinstance(_x, list) for _x in result[:2] + result[3:])
+        assert [len(_x) for _x in result] == [len(_x) for _x in reference]
+        assert list(result[2]) == list(reference[2])
+        assert result[3] == reference[3]
+        if connection == "linear":
+            assert result[:2] == reference[:2]
+        else:
+            # the waypoints are kept, Geod.fwd and Geod.npts differ by rounding errors only
+            np.testing.assert_allclose(result[0], reference[0], rtol=0, atol=1e-9)
+            np.testing.assert_allclose(result[1], reference[1], rtol=0, atol=1e-9)
+            assert set(zip(lats, lons)) <= set(zip(result[0], result[1]))
+
+
+def _vertical_interpolation_reference(curtain, pressures, alts):
+    """
+    Former loop-based implementation of the vertical interpolation of linear sections.
+    """
+    result = []
+    for index_lonlat, alt in enumerate(alts):
+        column = pressures[:, index_lonlat] if pressures.ndim == 2 else pressures
+        closest = 0
+        direction = 1
+        for index_altitude, pressure in enumerate(column):
+            if abs(pressure - alt) < abs(column[closest] - alt):
+                closest = index_altitude
+                direction = 1 if pressure - alt > 0 else -1
+        next_closest = closest + direction
+        if next_closest >= len(column) or next_closest < 0:
+            next_closest = closest
+        if closest == next_closest:
+            factors = [[closest, 0.5], [closest, 0.5]]
+        else:
+            distance = abs(column[closest] - alt) + abs(column[next_closest] - alt)
+            factors = [[closest, 1 - (abs(column[closest] - alt) / distance)],
+                       [next_closest, 1 - (abs(column[next_closest] - alt) / distance)]]
+        result.append(curtain[factors[0][0], index_lonlat] * factors[0][1] +
+                      curtain[factors[1][0], index_lonlat] * factors[1][1])
+    return np.array(result)
+
+
+class TestVerticalInterpolation(object):
+    def test_profile(self):
+        pressures = np.array([100000., 85000., 70000., 50000.])
+        curtain = np.array([[1., 2., 3., 4., 5.]]).repeat(4, axis=0) * np.array([[1], [2], [3], [4]])
+        alts = np.array([100000., 92500., 50000., 20000., 110000.])
+        indices, weights = coordinate.get_vertical_interpolation_factors(pressures, alts)
+        assert indices.tolist() == [[0, 0, 3, 3, 0], [1, 1, 2, 3, 1]]
+        result = coordinate.interpolate_vertical(curtain, indices, weights)
+        assert result == pytest.approx([1., 3., 12., 16., 5. * (1 - 10 / 35) + 10. * (1 - 25 / 35)])
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_against_reference(self, seed):
+        rng = np.random.default_rng(seed)
+        nlev, npos = 20, 300
+        pressures = np.sort(rng.uniform(1000, 105000, (nlev, npos)), axis=0)[::-1]
+        # non-monotonic columns, ties and exact matches
+        pressures[:, :20] = rng.uniform(1000, 105000, (nlev, 20))
+        pressures[5:7, 20:40] = 50000
+        pressures[:, 40:60] = np.round(pressures[:, 40:60], -4)
+        alts = rng.uniform(0, 110000, npos)
+        alts[20:60] = 50000
+        # invalid values, also on the first level
+        pressures[rng.uniform(size=pressures.shape) < 0.05] = np.nan
+        pressures[0, 60:70] = np.nan
+        pressures = np.ma.masked_invalid(pressures)
+        curtain = np.ma.masked_invalid(rng.normal(size=(nlev, npos)))
+        curtain[rng.uniform(size=curtain.shape) < 0.05] = np.ma.masked
+
+        with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+            # masked elements are converted to NaN
+            warnings.simplefilter("ignore")
+            reference = _vertical_interpolation_reference(curtain, pressures, alts)
+            reference_profile = _vertical_interpolation_reference(curtain, pressures[:, 100].filled(np.nan), alts)
+        result = coordinate.interpolate_vertical(
+            curtain, *coordinate.get_vertical_interpolation_factors(pressures, alts))
+        result_profile = coordinate.interpolate_vertical(
+            curtain, *coordinate.get_vertical_interpolation_factors(pressures[:, 100], alts))
+        np.testing.assert_allclose(result, reference, rtol=1e-12, equal_nan=True)
+        np.testing.assert_allclose(result_profile, reference_profile, rtol=1e-12, equal_nan=True)
+
+
+def _vertsec_interpolation_reference(data3D, data3D_lats, data3D_lons, lats, lons):
+    """
+    Former implementation of interpolate_vertsec with one map_coordinates call per level.
+    """
+    curtain = np.zeros([data3D.shape[0], len(lats)])
+    interp_lat = interp1d(data3D_lats, np.arange(len(data3D_lats)), bounds_error=False)
+    ind_lats = interp_lat(lats)
+    interp_lon = interp1d(data3D_lons, np.arange(len(data3D_lons)), bounds_error=False)
+    ind_lons = interp_lon(lons)
+    ind_coords = np.array([ind_lats, ind_lons])
+    for ml in range(data3D.shape[0]):
+        curtain[ml, :] = map_coordinates(data3D[ml, :, :].filled(np.nan), ind_coords, order=1)
+    curtain[:, np.isnan(ind_lats) | np.isnan(ind_lons)] = np.nan
+    return np.ma.masked_invalid(curtain)
+
+
+class TestInterpolateVertsec(object):
+    def _assert_equal(self, result, reference):
+        assert result.shape == reference.shape
+        assert (np.ma.getmaskarray(result) == np.ma.getmaskarray(reference)).all()
+        np.testing.assert_allclose(result.filled(np.nan), reference.filled(np.nan), rtol=1e-12, equal_nan=True)
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_against_reference(self, seed):
+        rng = np.random.default_rng(seed)
+        lats = np.sort(rng.uniform(30, 70, 40))
+        lons = np.sort(rng.uniform(-20, 40, 60))
+        data = np.ma.masked_invalid(rng.normal(size=(17, len(lats), len(lons))).astype("f4"))
+        data[rng.uniform(size=data.shape) < 0.02] = np.ma.masked
+        data[:, 3, 4] = np.nan
+        data.mask[:] = np.ma.getmaskarray(data) | np.isnan(data.data)
+        # points outside, on grid points and on the grid boundaries
+        path_lats = np.concatenate([rng.uniform(25, 75, 500), lats[[0, 3, 7, -1]], [lats[-1], lats[0]]])
+        path_lons = np.concatenate([rng.uniform(-25, 45, 500), lons[[0, 4, 9, -1]], [lons[0], lons[-1]]])
+        result = coordinate.interpolate_vertsec(data, lats, lons, path_lats, path_lons)
+        reference = _vertsec_interpolation_reference(data, lats, lons, path_lats, path_lons)
+        self._assert_equal(result, reference)
+        assert 0 < np.ma.getmaskarray(result).mean() < 1
+
+        # unsorted grid coordinates and descending latitudes
+        order_lats, order_lons = rng.permutation(len(lats)), rng.permutation(len(lons))
+        shuffled = data[:, order_lats][:, :, order_lons]
+        result = coordinate.interpolate_vertsec(
+            shuffled, lats[order_lats], lons[order_lons], path_lats, path_lons)
+        self._assert_equal(result, reference)
+        result = coordinate.interpolate_vertsec(data[:, ::-1], lats[::-1], lons, path_lats, path_lons)
+        self._assert_equal(result, reference)
+
+    def test_unmasked(self):
+        lats, lons = np.arange(5.), np.arange(10., 20.)
+        data = np.ma.masked_array(np.arange(2 * 5 * 10.).reshape(2, 5, 10))
+        assert data.mask is np.ma.nomask
+        path_lats, path_lons = np.array([0.5, 2.25, 4]), np.array([10, 14.5, 19])
+        result = coordinate.interpolate_vertsec(data, lats, lons, path_lats, path_lons)
+        assert result.tolist() == [[5., 27., 49.], [55., 77., 99.]]
+        self._assert_equal(result, _vertsec_interpolation_reference(data, lats, lons, path_lats, path_lons))
+
+    def test_dateline(self):
+        lats, lons = np.arange(-90, 91, 30.), np.arange(0, 360, 30.)
+        data = np.ma.masked_array(np.arange(len(lats) * len(lons), dtype=float).reshape(1, len(lats), len(lons)))
+        result = coordinate.interpolate_vertsec(
+            data, lats, lons, np.zeros(5), np.array([345., -15., 705., 0., 360.]))
+        first, last = data[0, 3, 0], data[0, 3, -1]
+        assert result[0].tolist() == [(first + last) / 2] * 3 + [first] * 2
+        # same for a grid from -180 to 180 including both ends
+        lons = np.arange(-180, 181, 30.)
+        data = np.ma.masked_array(np.tile(np.cos(np.deg2rad(lons)), (1, len(lats), 1)))
+        result = coordinate.interpolate_vertsec(data, lats, lons, np.zeros(3), np.array([170., 190., -170.]))
+        assert result[0].tolist() == pytest.approx([data[0, 0, -2] / 3 + data[0, 0, -1] * 2 / 3] + [
+            data[0, 0, 0] * 2 / 3 + data[0, 0, 1] / 3] * 2)
+
+    def test_regional_grid(self):
+        lats, lons = np.arange(40, 61, 5.), np.arange(-10, 31, 5.)
+        data = np.ma.masked_array(np.random.default_rng(0).normal(size=(3, len(lats), len(lons))))
+        path_lats, path_lons = np.array([45., 50., 55., 50.]), np.array([-7.5, 352.5, 712.5, 40.])
+        result = coordinate.interpolate_vertsec(data, lats, lons, path_lats, path_lons)
+        reference = _vertsec_interpolation_reference(data, lats, lons, path_lats, np.array([-7.5] * 3 + [40.]))
+        self._assert_equal(result, reference)
+        assert np.ma.getmaskarray(result).tolist() == [[False, False, False, True]] * 3
@@ -25,13 +25,16 @@
     limitations under the License.
 """
 
+import glob
 import os
 import pytest
 import datetime
+import numpy as np
 from netCDF4 import Dataset
 from mslib.utils.netCDF4tools import (
     identify_variable, identify_CF_lonlat,
-    identify_vertical_axis, identify_CF_time, num2date, get_latlon_data
+    identify_vertical_axis, identify_CF_time, num2date, get_latlon_data, get_variable_index,
+    share_variable_index, read_hyperslab, MFDatasetCommonDims, coordinate_hashes
 )
 from tests.constants import DATA_DIR
 
@@ -68,6 +71,60 @@ class Test_netCDF4tools(object):
             variable = identify_variable(self.ncfile_ml, standard_name)
             assert variable[0] == short_name
 
+    def test_identify_variable_check(self):
+        assert identify_variable(self.ncfile_ml, "unknown_quantity") == (None, None)
+        with pytest.raises(IOError):
+            identify_variable(self.ncfile_ml, "unknown_quantity", check=True)
+
+    def test_variable_index(self):
+        index = get_variable_index(self.ncfile_pl)
+        assert index.find("units", "K") == ["air_potential_temperature", "air_temperature"]
+        # the variables are returned in file order
+        assert index.find("units", ["Pa", "hPa"]) == ["isobaric", "air_pressure"]
+        assert index.find("standard_name", ["longitude", "latitude"]) == ["lat", "lon"]
+        assert index.find("standard_name", "unknown_quantity") == []
+        assert index.find("axis", "Z") == []
+
+    def test_variable_index_demodata(self):
+        # the index gives the same results as a scan of all variables
+        for filename in sorted(glob.glob(os.path.join(DATA_DIR, "*.nc"))):
+            with Dataset(filename) as ncfile:
+                standard_names = [variable.standard_name for variable in ncfile.variables.values()
+                                  if "standard_name" in variable.ncattrs()]
+                for standard_name in standard_names + [["latitude", "latitude_north"], "unknown_quantity"]:
+                    expected = next((_name for _name, _variable in ncfile.variables.items()
+                                     if getattr(_variable, "standard_name", None) in (
+                                         standard_name if isinstance(standard_name, list) else [standard_name])),
+                                    None)
+                    name, variable = identify_variable(ncfile, standard_name)
+                    assert name == expected
+                    assert variable is (ncfile.variables[name] if name else None)
+
+    def test_variable_index_new_variable(self, tmpdir):
+        with Dataset(os.path.join(tmpdir, "test.nc"), "w") as ncfile:
+            ncfile.createDimension("time", 1)
+            assert identify_variable(ncfile, "time") == (None, None)
+            time = ncfile.createVariable("time", "f8", ("time",))
+            time.standard_name = "time"
+            assert identify_variable(ncfile, "time")[0] == "time"
+            # attributes set after the first lookup are seen as well
+            ncfile.createVariable("lat", "f8", ("time",))
+            assert identify_variable(ncfile, "latitude") == (None, None)
+            ncfile.variables["lat"].standard_name = "latitude"
+            assert identify_variable(ncfile, "latitude")[0] == "lat"
+            time.standard_name = "forecast_reference_time"
+            assert identify_variable(ncfile, "time") == (None, None)
+
+    def test_variable_index_shared(self):
+        with MFDatasetCommonDims([DATA_FILE_PL]) as ncfile:
+            index = get_variable_index(ncfile)
+            assert get_variable_index(ncfile) is index
+        # plain datasets may be writable, their index is only shared on request
+        assert get_variable_index(self.ncfile_pl) is not get_variable_index(self.ncfile_pl)
+        index = share_variable_index(self.ncfile_pl)
+        assert get_variable_index(self.ncfile_pl) is index
+        assert get_variable_index(self.ncfile_ml) is not index
+
     def test_identify_CF_coordhybrid(self):
         lat_name, lat_var, lon_name, lon_var = identify_CF_lonlat(self.ncfile_ml)
         assert (lat_name, lon_name) == ('lat', 'lon')
@@ -131,3 +188,132 @@ class Test_netCDF4tools(object):
     def test_num2date(self):
         date = num2date(0, "hours since 2012-10-17T12:00:00.000Z", calendar='standard')
         assert date == datetime.datetime(2012, 10, 17, 12, 0)
+
+
+class Test_NetCDF4Chunks(object):
+    def setup_method(self):
+        self.data = np.ma.masked_greater(np.arange(2 * 3 * 40 * 50, dtype="f4").reshape(2, 3, 40, 50), 11990)
+
+    def _create(self, filename, file_format="NETCDF4", chunksizes=(1, 1, 16, 16)):
+        with Dataset(filename, "w", format=file_format) as ncfile:
+            for name, size in zip(["time", "level", "lat", "lon"], self.data.shape):
+                ncfile.createDimension(name, size)
+                ncfile.createVariable(name, "f8", (name,))[:] = np.arange(size)
+            contiguous = file_format != "NETCDF4"
+            var = ncfile.createVariable(
+                "air_temperature", "f4", ("time", "level", "lat", "lon"), zlib=not contiguous, fill_value=-999.,
+                chunksizes=None if contiguous else chunksizes, contiguous=contiguous)
+            var.standard_name = "air_temperature"
+            var[:] = self.data
+        return filename
+
+    @pytest.mark.parametrize("file_format", ["NETCDF4", "NETCDF4_CLASSIC", "NETCDF3_64BIT"])
+    def test_read_hyperslab(self, tmpdir, file_format):
+        filename = self._create(os.path.join(tmpdir, "chunked.nc"), file_format=file_format)
+        with Dataset(filename) as ncfile:
+            var = ncfile.variables["air_temperature"]
+            for index in [
+                    (0, 1, slice(None), slice(None)),
+                    (1, slice(None, None, -1), slice(None, None, -1), slice(None)),
+                    (1, slice(None), slice(3, 17), slice(40, 50)),
+                    (0, 2, slice(30, 2, -1), slice(15, 16)),
+                    (0, slice(2, None, -1), slice(17, 15, -1), slice(10, 47)),
+                    (0, slice(1, 3), slice(0, 40, 2), slice(None)),
+                    (-1, slice(None), slice(5, 5), slice(None)),
+                    (np.int64(1), 0, slice(-20, None), slice(None, -3)),
+                    (0, 0, 5, slice(None)),
+                    (1, Ellipsis)]:
+                expected = self.data[index]
+                data = read_hyperslab(var, index)
+                assert data.shape == expected.shape
+                assert (data.mask == expected.mask).all()
+                assert (data == expected).all()
+
+    def test_read_hyperslab_small_window(self, tmpdir):
+        filename = self._create(os.path.join(tmpdir, "chunked.nc"), chunksizes=(1, 3, 40, 50))
+        with Dataset(filename) as ncfile:
+            var = ncfile.variables["air_temperature"]
+            assert var.chunking() == [1, 3, 40, 50]
+            for index in [(0, slice(None), slice(10, 12), slice(10, 12)), (1, 2, slice(None), slice(1, None))]:
+                assert (read_hyperslab(var, index) == self.data[index]).all()
+
+    def test_mfdataset_netcdf4(self, tmpdir):
+        filename = self._create(os.path.join(tmpdir, "chunked.nc"))
+        with MFDatasetCommonDims([filename]) as ncfile:
+            assert ncfile._file_format == ["NETCDF4"]
+            assert ncfile.variables["air_temperature"].chunking() == [1, 1, 16, 16]
+            assert (ncfile.variables["air_temperature"][1, 2] == self.data[1, 2]).all()
+
+    def test_mfdataset_chunk_cache(self, tmpdir):
+        filename = self._create(os.path.join(tmpdir, "chunked.nc"))
+        with MFDatasetCommonDims([filename], chunk_cache=(2 ** 20, 101, 0.5)) as ncfile:
+            assert ncfile.variables["air_temperature"].get_var_chunk_cache() == (2 ** 20, 101, 0.5)
+            assert ncfile.variables["lat"].chunking() == "contiguous"
+        with MFDatasetCommonDims([filename], chunk_cache={"air_temperature": (2 ** 21, None, None)}) as ncfile:
+            size, nelems, preemption = ncfile.variables["air_temperature"].get_var_chunk_cache()
+            assert size == 2 ** 21
+            with Dataset(filename) as default:
+                assert (nelems, preemption) == default.variables["air_temperature"].get_var_chunk_cache()[1:]
+        with MFDatasetCommonDims([filename], chunk_cache={"air_pressure": (2 ** 21, None, None)}) as ncfile:
+            with Dataset(filename) as default:
+                assert ncfile.variables["air_temperature"].get_var_chunk_cache() == \
+                    default.variables["air_temperature"].get_var_chunk_cache()
+
+
+class Test_CoordinateHashes(object):
+    def _create(self, filename, lats, name="air_temperature"):
+        lats = np.asarray(lats)
+        with Dataset(filename, "w") as ncfile:
+            for dim, values in [("time", np.array([0., 6.])), ("lat", lats), ("lon", np.arange(5.))]:
+                ncfile.createDimension(dim, len(values))
+                ncfile.createVariable(dim, values.dtype, (dim,))[:] = values
+            ncfile.createVariable(name, "f4", ("time", "lat", "lon"))[:] = 0
+        return filename
+
+    def _files(self, tmpdir, lats):
+        return [self._create(os.path.join(tmpdir, "master.nc"), np.arange(4.)),
+                self._create(os.path.join(tmpdir, "part.nc"), lats, name="air_pressure")]
+
+    def _hashes(self, filenames):
+        result = {}
+        for filename in filenames:
+            with Dataset(filename) as ncfile:
+                result[filename] = coordinate_hashes(ncfile)
+        return result
+
+    def test_coordinate_hashes(self, tmpdir):
+        filenames = self._files(tmpdir, np.arange(4.))
+        hashes = self._hashes(filenames)
+        assert sorted(hashes[filenames[0]]) == ["lat", "lon", "time"]
+        assert hashes[filenames[0]] == hashes[filenames[1]]
+        for lats in [np.arange(4.) + 1e-9, np.arange(5.), np.arange(4, dtype="f4")]:
+            self._create(filenames[1], lats, name="air_pressure")
+            other = self._hashes(filenames[1:])[filenames[1]]
+            assert other["lat"] != hashes[filenames[0]]["lat"]
+            assert other["lon"] == hashes[filenames[0]]["lon"]
+
+    def test_matching_hashes(self, tmpdir):
+        filenames = self._files(tmpdir, np.arange(4.))
+        with MFDatasetCommonDims(filenames, coordinate_hashes=self._hashes(filenames)) as ncfile:
+            assert sorted(ncfile.variables) == ["air_pressure", "air_temperature", "lat", "lon", "time"]
+        # the element-wise comparison is skipped for matching hashes
+        hashes = self._hashes(filenames)
+        self._create(filenames[1], np.arange(4.) + 1, name="air_pressure")
+        with MFDatasetCommonDims(filenames, coordinate_hashes=hashes) as ncfile:
+            assert "air_pressure" in ncfile.variables
+
+    @pytest.mark.parametrize("lats", [np.arange(4.) + 0.5, np.arange(5.)])
+    def test_mismatched_files(self, tmpdir, lats):
+        filenames = self._files(tmpdir, lats)
+        hashes = self._hashes(filenames)
+        for known_hashes in [None, {}, hashes, {filenames[1]: hashes[filenames[1]]},
+                                   {filenames[0]: hashes[filenames[0]]}]:
+            with pytest.raises(IOError, match="dimension 'lat' differs"):
+                MFDatasetCommonDims(filenames, coordinate_hashes=known_hashes)
+
+    def test_equal_values_other_dtype(self, tmpdir):
+        filenames = self._files(tmpdir, np.arange(4, dtype="f4"))
+        hashes = self._hashes(filenames)
+        assert hashes[filenames[0]]["lat"] != hashes[filenames[1]]["lat"]
+        with MFDatasetCommonDims(filenames, coordinate_hashes=hashes) as ncfile:
+            assert "air_pressure" in ncfile.variables
@@ -94,3 +94,151 @@ class TestConverter(object):
         assert thermolib.convert_pressure_to_vertical_axis_measure('pressure', 10000) == 100
         assert thermolib.convert_pressure_to_vertical_axis_measure('flightlevel', 400) == 400
         assert thermolib.convert_pressure_to_vertical_axis_measure('pressure altitude', 75000) == pytest.approx(2.46618)
+
+
+def _flightlevel2pressure_reference(height):
+    """
+    Former implementation of flightlevel2pressure looping over the layers.
+    """
+    p = np.full_like(height.magnitude, np.nan, dtype=float) * units.Pa
+    for i, ((z0, t0, p0, gamma), (z1, t1, p1, _)) in enumerate(zip(thermolib._STANDARD_ATMOSPHERE[:-1],
+                                                                   thermolib._STANDARD_ATMOSPHERE[1:])):
+        indices = (height >= z0) & (height < z1)
+        if i == 0:
+            indices |= height < z0
+        if gamma != 0:
+            p[indices] = p0 * ((t0 - gamma * (height[indices] - z0)) / t0) ** (thermolib.g / (gamma * thermolib.Rd))
+        else:
+            p[indices] = p0 * np.exp(-thermolib.g * (height[indices] - z0) / (thermolib.Rd * t0))
+    return p
+
+
+def _pressure2flightlevel_reference(pressure):
+    """
+    Former implementation of pressure2flightlevel looping over the layers.
+    """
+    z = np.full_like(pressure.magnitude, np.nan, dtype=float) * units.hft
+    for i, ((z0, t0, p0, gamma), (z1, t1, p1, _)) in enumerate(zip(thermolib._STANDARD_ATMOSPHERE[:-1],
+                                                                   thermolib._STANDARD_ATMOSPHERE[1:])):
+        indices = (pressure > p1) & (pressure <= p0)
+        if i == 0:
+            indices |= (pressure >= p0)
+        if gamma != 0:
+            z[indices] = z0 + 1. / gamma * (
+                t0 - t0 * np.exp(gamma * thermolib.Rd / thermolib.g * np.log(pressure[indices] / p0)))
+        else:
+            z[indices] = z0 - (thermolib.Rd * t0) / thermolib.g * np.log(pressure[indices] / p0)
+    return z
+
+
+def _isa_temperature_reference(height):
+    """
+    Former scalar implementation of isa_temperature.
+    """
+    for i, ((z0, t0, p0, gamma), (z1, t1, p1, _)) in enumerate(zip(thermolib._STANDARD_ATMOSPHERE[:-1],
+                                                                   thermolib._STANDARD_ATMOSPHERE[1:])):
+        if ((i == 0) and (height < z0)) or (z0 <= height < z1):
+            return (t0 - gamma * (height - z0)).m_as(units.K)
+    return np.nan
+
+
+class TestStandardAtmosphere(object):
+    # heights from below the surface up to 80 km including all layer boundaries
+    heights = np.concatenate([
+        np.linspace(-1000, 80000, 8101), thermolib._ISA_HEIGHTS,
+        np.nextafter(thermolib._ISA_HEIGHTS, -np.inf), np.nextafter(thermolib._ISA_HEIGHTS, np.inf)]) * units.m
+
+    def test_flightlevel2pressure(self):
+        reference = _flightlevel2pressure_reference(self.heights).m_as(units.Pa)
+        valid = self.heights < 71 * units.km
+        assert np.isnan(reference).tolist() == (~valid).tolist()
+        result = thermolib.flightlevel2pressure(self.heights[valid])
+        assert result.units == units.Pa
+        np.testing.assert_allclose(result.magnitude, reference[valid], rtol=1e-12)
+        np.testing.assert_allclose(
+            thermolib._isa_pressure(self.heights.m_as(units.m)), reference, rtol=1e-12, equal_nan=True)
+        for height in self.heights[::97]:
+            if height < 71 * units.km:
+                assert thermolib.flightlevel2pressure(height).magnitude == pytest.approx(
+                    _flightlevel2pressure_reference(height[np.newaxis])[0].magnitude, rel=1e-12)
+            else:
+                with pytest.raises(ValueError):
+                    thermolib.flightlevel2pressure(height)
+
+    def test_pressure2flightlevel(self):
+        pressures = thermolib.flightlevel2pressure(self.heights[self.heights < 71 * units.km])
+        pressures = np.concatenate([pressures.magnitude, thermolib._ISA_PRESSURES, [0, -1, 3.9, 2e5]]) * units.Pa
+        reference = _pressure2flightlevel_reference(pressures).m_as(units.hft)
+        valid = pressures > thermolib._ISA_PRESSURES[-1] * units.Pa
+        assert np.isnan(reference).tolist() == (~valid).tolist()
+        result = thermolib.pressure2flightlevel(pressures[valid])
+        assert result.units == units.hft
+        np.testing.assert_allclose(result.magnitude, reference[valid], rtol=1e-12, atol=1e-9)
+        np.testing.assert_allclose(
+            thermolib._isa_height(pressures.m_as(units.Pa)), (reference * units.hft).m_as(units.m),
+            rtol=1e-12, atol=1e-9, equal_nan=True)
+        with pytest.raises(ValueError):
+            thermolib.pressure2flightlevel(pressures)
+
+    def test_isa_temperature(self):
+        reference = np.array([_isa_temperature_reference(_x) for _x in self.heights])
+        valid = self.heights < 71 * units.km
+        result = thermolib.isa_temperature(self.heights[valid])
+        assert result.units == units.K
+        np.testing.assert_allclose(result.magnitude, reference[valid], rtol=1e-12)
+        np.testing.assert_allclose(
+            thermolib._isa_temperature(self.heights.m_as(units.m)), reference, rtol=1e-12, equal_nan=True)
+        assert thermolib.isa_temperature(self.heights[0]).magnitude == pytest.approx(reference[0], rel=1e-12)
+        with pytest.raises(ValueError):
+            thermolib.isa_temperature(self.heights)
+
+    def test_nan(self):
+        for function, unit in [(thermolib.flightlevel2pressure, units.m),
+                               (thermolib.pressure2flightlevel, units.Pa),
+                               (thermolib.isa_temperature, units.m)]:
+            with pytest.raises(ValueError):
+                function(np.array([1000., np.nan]) * unit)
+
+
+class TestUnitFastPath(object):
+    @pytest.mark.parametrize("function, values", [
+        (thermolib.flightlevel2pressure, [np.linspace(-500, 70000, 1001) * units.m, np.arange(0, 2300, 10) * units.hft,
+                                          np.linspace(0, 70, 11).astype(np.float32) * units.km,
+                                          35000 * units.ft, 3.5 * units.km, 10 * units.m]),
+        (thermolib.pressure2flightlevel, [np.linspace(4, 105000, 1001) * units.Pa, np.arange(1, 1050) * units.hPa,
+                                          np.linspace(0.1, 30, 11) * units.inHg, 250 * units.mbar, 50000. * units.Pa]),
+        (thermolib.isa_temperature, [np.linspace(-500, 70000, 1001) * units.m, 300 * units.hft, 20. * units.km])])
+    def test_identical_to_pint_path(self, function, values):
+        for value in values:
+            for _ in range(2):
+                result = function(value)
+                reference = function.__wrapped__(value)
+                assert result.units == reference.units
+                assert type(result.magnitude) is type(reference.magnitude)
+                assert np.asarray(result.magnitude).tolist() == np.asarray(reference.magnitude).tolist()
+
+    def test_pint_path(self):
+        heights = units.Quantity(np.ma.masked_greater(np.linspace(0, 20, 5), 15), units.km)
+        pressures = thermolib.flightlevel2pressure(heights)
+        assert pressures.magnitude.tolist() == thermolib.flightlevel2pressure.__wrapped__(heights).magnitude.tolist()
+        xr = pytest.importorskip("xarray")
+        heights = xr.DataArray(np.linspace(0, 20, 5), dims=("x",), attrs={"units": "km"})
+        pressures = thermolib.flightlevel2pressure(heights)
+        assert isinstance(pressures, xr.DataArray)
+        np.testing.assert_array_equal(
+            pressures.values, thermolib.flightlevel2pressure(heights.values * units.km).magnitude)
+        assert thermolib.flightlevel2pressure([1, 2] * units.km).magnitude.tolist() == \
+            thermolib.flightlevel2pressure(np.array([1, 2]) * units.km).magnitude.tolist()
+
+    @pytest.mark.parametrize("function, value", [
+        (thermolib.flightlevel2pressure, 1000 * units.Pa),
+        (thermolib.flightlevel2pressure, 100 * units.km),
+        (thermolib.flightlevel2pressure, np.array([1, np.nan]) * units.km),
+        (thermolib.pressure2flightlevel, 1000 * units.m),
+        (thermolib.pressure2flightlevel, 1 * units.Pa),
+        (thermolib.isa_temperature, 20 * units.degC),
+        (thermolib.isa_temperature, 3000 * units.hft)])
+    def test_errors(self, function, value):
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                function(value)